@@ -0,0 +1,29 @@
+"""add_message_fts
+
+Revision ID: a4b5c6d7e8f9
+Revises: f3a4b5c6d7e8
+Create Date: 2026-02-13 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+from app.db.message_fts import drop_message_fts, rebuild_message_fts
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a4b5c6d7e8f9"
+down_revision: Union[str, Sequence[str], None] = "f3a4b5c6d7e8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # FTS5 表与同步触发器，并为已有消息建立索引
+    rebuild_message_fts(op.get_bind())
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    drop_message_fts(op.get_bind())
@@ -0,0 +1,36 @@
+"""add_message_stream_status
+
+Revision ID: d1e2f3a4b5c6
+Revises: 9c4b1a2d3e5f
+Create Date: 2026-02-10 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d1e2f3a4b5c6"
+down_revision: Union[str, Sequence[str], None] = "9c4b1a2d3e5f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("messages", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("status", sa.String(length=20), nullable=False, server_default="complete"))
+
+    with op.batch_alter_table("group_messages", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("status", sa.String(length=20), nullable=False, server_default="complete"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("group_messages", schema=None) as batch_op:
+        batch_op.drop_column("status")
+
+    with op.batch_alter_table("messages", schema=None) as batch_op:
+        batch_op.drop_column("status")
@@ -0,0 +1,52 @@
+"""add_context_window_columns
+
+Revision ID: e2f3a4b5c6d7
+Revises: d1e2f3a4b5c6
+Create Date: 2026-02-11 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e2f3a4b5c6d7"
+down_revision: Union[str, Sequence[str], None] = "d1e2f3a4b5c6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("messages", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("token_count", sa.Integer(), nullable=True))
+
+    with op.batch_alter_table("group_messages", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("token_count", sa.Integer(), nullable=True))
+
+    with op.batch_alter_table("chat_sessions", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("context_summary", sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column("context_summary_until_id", sa.Integer(), nullable=True))
+
+    with op.batch_alter_table("group_sessions", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("context_summary", sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column("context_summary_until_id", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("group_sessions", schema=None) as batch_op:
+        batch_op.drop_column("context_summary_until_id")
+        batch_op.drop_column("context_summary")
+
+    with op.batch_alter_table("chat_sessions", schema=None) as batch_op:
+        batch_op.drop_column("context_summary_until_id")
+        batch_op.drop_column("context_summary")
+
+    with op.batch_alter_table("group_messages", schema=None) as batch_op:
+        batch_op.drop_column("token_count")
+
+    with op.batch_alter_table("messages", schema=None) as batch_op:
+        batch_op.drop_column("token_count")
@@ -0,0 +1,60 @@
+"""add_generation_metrics
+
+Revision ID: f3a4b5c6d7e8
+Revises: e2f3a4b5c6d7
+Create Date: 2026-02-12 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from app.db.types import UTCDateTime
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f3a4b5c6d7e8"
+down_revision: Union[str, Sequence[str], None] = "e2f3a4b5c6d7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "generation_metrics",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=16), nullable=False),
+        sa.Column("message_id", sa.Integer(), nullable=False),
+        sa.Column("session_id", sa.Integer(), nullable=True),
+        sa.Column("friend_id", sa.Integer(), nullable=True),
+        sa.Column("provider", sa.String(length=50), nullable=True),
+        sa.Column("model", sa.String(length=100), nullable=True),
+        sa.Column("prompt_tokens", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("completion_tokens", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("cached_tokens", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("reasoning_tokens", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("usage_estimated", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("ttft_ms", sa.Integer(), nullable=True),
+        sa.Column("duration_ms", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("recall_ms", sa.Integer(), nullable=True),
+        sa.Column("recall_rounds", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("create_time", UTCDateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_generation_metrics")),
+    )
+    with op.batch_alter_table("generation_metrics", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_generation_metrics_id"), ["id"], unique=False)
+        batch_op.create_index(batch_op.f("ix_generation_metrics_message_id"), ["message_id"], unique=False)
+        batch_op.create_index("ix_generation_metrics_create_time", ["create_time"], unique=False)
+        batch_op.create_index("ix_generation_metrics_friend_time", ["friend_id", "create_time"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("generation_metrics", schema=None) as batch_op:
+        batch_op.drop_index("ix_generation_metrics_friend_time")
+        batch_op.drop_index("ix_generation_metrics_create_time")
+        batch_op.drop_index(batch_op.f("ix_generation_metrics_message_id"))
+        batch_op.drop_index(batch_op.f("ix_generation_metrics_id"))
+
+    op.drop_table("generation_metrics")
@@ -1,8 +1,10 @@
 from fastapi import APIRouter
-from app.api.endpoints import health, llm, friend, chat, friend_template, upload
+from app.api.endpoints import health, llm, friend, chat, friend_template, upload, metrics, diagnostics
 
 api_router = APIRouter()
 api_router.include_router(health.router, tags=["health"])
+api_router.include_router(metrics.router, tags=["metrics"])
+api_router.include_router(diagnostics.router, prefix="/diagnostics", tags=["diagnostics"])
 api_router.include_router(llm.router, prefix="/llm", tags=["llm"])
 api_router.include_router(friend.router, prefix="/friends", tags=["friends"])   
 api_router.include_router(friend_template.router, prefix="/friend-templates", tags=["friend-templates"])
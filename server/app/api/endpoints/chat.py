@@ -1,14 +1,17 @@
-import json
 import logging
 import traceback
-from fastapi import APIRouter, Depends, HTTPException, Body
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Body, Header, Query
 from sqlalchemy.orm import Session
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
 from app.api import deps
+from app.api.sse import sse_response
 from app.schemas import chat as chat_schemas
-from app.services import chat_service
+from app.services import chat_service, generation_metrics, message_search_service
+from app.services.stream_persister import stream_persister
+from app.services.stream_hub import parse_event_id, stream_hub
+from app.models.chat import Message
 
 logger = logging.getLogger(__name__)
 
@@ -118,18 +121,36 @@ async def send_message(
     """
     Send a message to a session and get the AI response via SSE.
     """
-    async def event_generator():
-        async for event_data in chat_service.send_message_stream(db, session_id=session_id, message_in=message_in):
-            # event_data is a dict with 'event' and 'data' keys
-            event_type = event_data.get("event", "message")
-            data_payload = event_data.get("data", {})
-            
-            # Serialize data to JSON
-            json_data = json.dumps(data_payload, ensure_ascii=False)
-            
-            yield f"event: {event_type}\ndata: {json_data}\n\n"
+    return sse_response(chat_service.send_message_stream(db, session_id=session_id, message_in=message_in))
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+@router.get("/search", response_model=chat_schemas.MessageSearchResult)
+def search_messages(
+    *,
+    db: Session = Depends(deps.get_db),
+    q: str = Query(..., min_length=1, max_length=200),
+    friend_id: Optional[int] = None,
+    group_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+):
+    """
+    Full-text search over chat and group chat history, newest first.
+    Values:
+    - q: whitespace-separated terms, all must match
+    - friend_id / group_id: restrict to one friend's chats or one group
+    - start / end: create_time range [start, end)
+    - cursor: next_cursor of the previous page
+    """
+    if friend_id is not None and group_id is not None:
+        raise HTTPException(status_code=400, detail="friend_id and group_id cannot be combined")
+    try:
+        return message_search_service.search_messages(
+            db, q, friend_id=friend_id, group_id=group_id, start=start, end=end, cursor=cursor, limit=limit
+        )
+    except message_search_service.SearchQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # --- Friend-centric APIs (WeChat-style) ---
 
@@ -185,14 +206,7 @@ async def send_message_to_friend(
     # Get or create a session for this friend
     session = chat_service.get_or_create_session_for_friend(db, friend_id=friend_id)
     
-    async def event_generator():
-        async for event_data in chat_service.send_message_stream(db, session_id=session.id, message_in=message_in):
-            event_type = event_data.get("event", "message")
-            data_payload = event_data.get("data", {})
-            json_data = json.dumps(data_payload, ensure_ascii=False)
-            yield f"event: {event_type}\ndata: {json_data}\n\n"
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    return sse_response(chat_service.send_message_stream(db, session_id=session.id, message_in=message_in))
 
 @router.post("/messages/{message_id}/recall")
 def recall_message(
@@ -209,6 +223,48 @@ def recall_message(
         raise HTTPException(status_code=400, detail="Recall failed. Check if message exists, is yours, and session is active.")
     return {"ok": True}
 
+@router.get("/metrics/generation", response_model=List[chat_schemas.GenerationMetricsBucket])
+def read_generation_metrics(
+    db: Session = Depends(deps.get_db),
+    group_by: str = Query(generation_metrics.GROUP_BY_DAY, pattern="^(friend|model|day)$"),
+    days: int = Query(7, ge=1, le=365),
+):
+    """
+    Token usage and latency of AI replies (chat, group and auto-drive).
+    Values:
+    - group_by: friend, model or day (UTC)
+    - days: look-back window
+    """
+    return generation_metrics.aggregate(db, group_by, days)
+
+@router.get("/messages/{message_id}/stream")
+async def resume_message_stream(
+    *,
+    db: Session = Depends(deps.get_db),
+    message_id: int,
+    offset: int = Query(0, ge=0),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Resume an AI reply after a dropped connection.
+    Values:
+    - offset: number of characters the client already has
+    - Last-Event-ID header: id of the last event received; while the reply's events
+      are still buffered they are replayed exactly (thinking and tool events included)
+    """
+    msg = db.query(Message).filter(Message.id == message_id).first()
+    if not msg:
+        raise HTTPException(status_code=404, detail="Message not found")
+
+    after_id = parse_event_id(last_event_id)
+    key = f"chat:{message_id}"
+    replay_from = 0 if after_id is None and offset == 0 else after_id
+    # 本进程的缓冲优先，其次是其它 worker 上仍在进行的流
+    replay = stream_hub.replay(key, replay_from) or await stream_hub.replay_remote(key, replay_from)
+    if replay is not None:
+        return sse_response(replay)
+    return sse_response(stream_persister.resume(db, Message, message_id, offset))
+
 @router.post("/sessions/{session_id}/messages/{message_id}/regenerate")
 async def regenerate_message(
     *,
@@ -222,11 +278,4 @@ async def regenerate_message(
     - session_id: ID of the chat session
     - message_id: ID of the AI message to regenerate
     """
-    async def event_generator():
-        async for event_data in chat_service.regenerate_message_stream(db, session_id=session_id, ai_message_id=message_id):
-            event_type = event_data.get("event", "message")
-            data_payload = event_data.get("data", {})
-            json_data = json.dumps(data_payload, ensure_ascii=False)
-            yield f"event: {event_type}\ndata: {json_data}\n\n"
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    return sse_response(chat_service.regenerate_message_stream(db, session_id=session_id, ai_message_id=message_id))
@@ -0,0 +1,71 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse
+
+from app.core import loop_monitor, sampling_profiler
+from app.core.config import settings
+
+router = APIRouter()
+
+
+def _monitor() -> loop_monitor.LoopMonitor:
+    monitor = loop_monitor.get_monitor()
+    if monitor is None:
+        raise HTTPException(status_code=404, detail="Event loop monitor is not running")
+    return monitor
+
+
+@router.get("/event-loop")
+async def read_event_loop_report(limit: int = Query(20, ge=1, le=200)):
+    """Loop lag percentiles and the call sites that blocked the loop, worst first."""
+    return _monitor().report(limit)
+
+
+@router.delete("/event-loop")
+async def reset_event_loop_report():
+    _monitor().reset()
+    return {"ok": True}
+
+
+def _require_profiler(request: Request) -> None:
+    if not settings.PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler is disabled")
+    if not sampling_profiler.is_local(request.client.host if request.client else None):
+        raise HTTPException(status_code=403, detail="Profiler is only available locally")
+
+
+@router.post("/profile")
+async def run_profile(
+    request: Request,
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+    format: str = Query(sampling_profiler.FORMAT_COLLAPSED, pattern="^(collapsed|speedscope)$"),
+    include_idle: bool = False,
+):
+    """Samples every thread of the process for ``seconds`` and returns the aggregated stacks."""
+    _require_profiler(request)
+    seconds = min(seconds, settings.PROFILER_MAX_SECONDS)
+    profiler = sampling_profiler.SamplingProfiler(interval_ms / 1000, include_idle=include_idle)
+    try:
+        profiler.start()
+    except sampling_profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+
+    body = profiler.render(format, name=f"WeAgentChat {seconds:g}s")
+    media_type = "application/json" if format == sampling_profiler.FORMAT_SPEEDSCOPE else "text/plain"
+    return Response(content=body, media_type=media_type, headers={"X-Profile-Samples": str(profiler.samples)})
+
+
+@router.get("/profiles/{profile_id}")
+async def read_saved_profile(request: Request, profile_id: str):
+    """Speedscope JSON of a request profiled with ``X-Profile: 1``."""
+    _require_profiler(request)
+    path = sampling_profiler.profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json")
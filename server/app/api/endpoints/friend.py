@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from typing import List
 
 from app.api import deps
+from app.api.sse import sse_response
 from app.schemas import friend as friend_schemas
 from app.services import friend_service
 
@@ -46,17 +47,7 @@ async def recommend_friends_stream(
     - **result**: 最终解析的推荐列表
     - **error**: 错误信息
     """
-    import json
-    from fastapi.responses import StreamingResponse
-    
-    async def event_generator():
-        async for event_data in friend_service.recommend_friends_by_topic_stream(db, request.topic, request.exclude_names):
-            event_type = event_data.get("event", "delta")
-            data_payload = event_data.get("data", {})
-            json_data = json.dumps(data_payload, ensure_ascii=False)
-            yield f"event: {event_type}\ndata: {json_data}\n\n"
-    
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    return sse_response(friend_service.recommend_friends_by_topic_stream(db, request.topic, request.exclude_names), default_event="delta")
 
 @router.get("/{friend_id}", response_model=friend_schemas.Friend)
 def read_friend(
@@ -1,11 +1,10 @@
-import json
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.api import deps
+from app.api.sse import sse_response
 from app.schemas import friend as friend_schemas
 from app.schemas import friend_template as friend_template_schemas
 from app.schemas import persona_generator as persona_schemas
@@ -82,11 +81,4 @@ async def generate_persona_stream(
     """
     根据描述自动生成 Persona 设定（SSE 流式）
     """
-    async def event_generator():
-        async for event_data in persona_generator_service.generate_persona_stream(db, payload):
-            event_type = event_data.get("event", "delta")
-            data_payload = event_data.get("data", {})
-            json_data = json.dumps(data_payload, ensure_ascii=False)
-            yield f"event: {event_type}\ndata: {json_data}\n\n"
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    return sse_response(persona_generator_service.generate_persona_stream(db, payload), default_event="delta")
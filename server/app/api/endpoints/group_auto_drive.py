@@ -1,11 +1,13 @@
-﻿from fastapi import APIRouter, Depends, HTTPException, Body, Query
-from fastapi.responses import StreamingResponse
+﻿from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Body, Header, Query
 from sqlalchemy.orm import Session
-import json
 
 from app.api import deps
+from app.api.sse import sse_response
 from app.schemas import group_auto_drive as ad_schemas
 from app.services.group_auto_drive_service import group_auto_drive_service
+from app.services.stream_hub import parse_event_id
 from app.services.memo.constants import DEFAULT_USER_ID
 from app.models.group import GroupMember
 
@@ -42,6 +44,7 @@ async def stream_auto_drive(
     *,
     db: Session = Depends(deps.get_db),
     group_id: int = Query(...),
+    last_event_id: Optional[str] = Header(None),
 ):
     member = db.query(GroupMember).filter(
         GroupMember.group_id == group_id,
@@ -51,14 +54,7 @@ async def stream_auto_drive(
     if not member:
         raise HTTPException(status_code=403, detail="Not a member of this group")
 
-    async def event_generator():
-        async for event_data in group_auto_drive_service.stream_auto_drive(group_id):
-            event_type = event_data.get("event", "message")
-            data_payload = event_data.get("data", {})
-            json_data = json.dumps(data_payload, ensure_ascii=False)
-            yield f"event: {event_type}\ndata: {json_data}\n\n"
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    return sse_response(group_auto_drive_service.stream_auto_drive(group_id, parse_event_id(last_event_id)))
 
 
 @router.post("/group/auto-drive/pause", response_model=ad_schemas.AutoDriveStateRead)
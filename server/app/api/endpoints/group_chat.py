@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
-from fastapi.responses import StreamingResponse
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Body, Header, Query
 from sqlalchemy.orm import Session
-import json
 
 from app.api import deps
+from app.api.sse import sse_response
 from app.schemas import group as group_schemas
 from app.services.group_chat_service import group_chat_service
 from app.services.memo.constants import DEFAULT_USER_ID
-from app.models.group import GroupMember
+from app.services.stream_persister import stream_persister
+from app.services.stream_hub import parse_event_id, stream_hub
+from app.models.group import GroupMember, GroupMessage
 
 router = APIRouter()
 
@@ -30,14 +33,38 @@ async def send_group_message_stream(
     if not member:
         raise HTTPException(status_code=403, detail="Not a member of this group")
 
-    async def event_generator():
-        async for event_data in group_chat_service.send_group_message_stream(db, group_id, message_in):
-            event_type = event_data.get("event", "message")
-            data_payload = event_data.get("data", {})
-            json_data = json.dumps(data_payload, ensure_ascii=False)
-            yield f"event: {event_type}\ndata: {json_data}\n\n"
+    return sse_response(group_chat_service.send_group_message_stream(db, group_id, message_in))
+
+@router.get("/group/messages/{message_id}/stream")
+async def resume_group_message_stream(
+    *,
+    db: Session = Depends(deps.get_db),
+    message_id: int,
+    offset: int = Query(0, ge=0),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    断线重连后从 offset（已收到的字符数）继续接收群成员的回复。
+    带 Last-Event-ID 且事件仍在缓冲中时，按事件 id 精确重放该成员的事件。
+    """
+    msg = db.query(GroupMessage).filter(GroupMessage.id == message_id).first()
+    if not msg:
+        raise HTTPException(status_code=404, detail="Message not found")
+
+    after_id = parse_event_id(last_event_id)
+    key = f"group_message:{message_id}"
+    replay_from = 0 if after_id is None and offset == 0 else after_id
+    # 群聊流包含所有成员的事件，只转发这条回复的
+    predicate = lambda event: event.get("data", {}).get("message_id") == message_id
+    replay = (
+        stream_hub.replay(key, replay_from, predicate)
+        or await stream_hub.replay_remote(key, replay_from, predicate)
+    )
+    if replay is not None:
+        return sse_response(replay)
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    extra = {"sender_id": str(msg.sender_id), "message_id": message_id}
+    return sse_response(stream_persister.resume(db, GroupMessage, message_id, offset, extra))
 
 @router.post("/group/{group_id}/sessions", response_model=group_schemas.GroupSessionRead)
 def create_group_session(
@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Response
+from sqlalchemy import func
+
+from app.core import metrics
+from app.db.session import engine
+from app.services.chat_service import memory_queue_stats
+from app.services.stream_hub import stream_hub
+from app.vendor.memobase_server import connectors
+from app.vendor.memobase_server.models.database import BufferZone
+
+router = APIRouter()
+
+
+def _memory_queue_families():
+    depth, age = memory_queue_stats()
+    depth_family = metrics.gauge_family("memory_queue_depth", "Sessions waiting for memory generation")
+    depth_family.add_metric([], depth)
+    age_family = metrics.gauge_family("memory_queue_oldest_age_seconds", "Age of the oldest queued session")
+    age_family.add_metric([], age)
+    return [depth_family, age_family]
+
+
+def _stream_hub_families():
+    streams, events = stream_hub.stats()
+    streams_family = metrics.gauge_family("stream_hub_streams", "SSE streams held for fan-out and replay")
+    streams_family.add_metric([], streams)
+    events_family = metrics.gauge_family("stream_hub_buffered_events", "Events buffered across SSE streams")
+    events_family.add_metric([], events)
+    return [streams_family, events_family]
+
+
+def _buffer_families():
+    # Memobase 尚未初始化时不输出
+    if connectors.DB_ENGINE is None:
+        return []
+    with connectors.Session() as session:
+        rows = (
+            session.query(BufferZone.status, func.count(BufferZone.id), func.sum(BufferZone.token_size))
+            .group_by(BufferZone.status)
+            .all()
+        )
+    buffers = metrics.gauge_family("memobase_buffers", "Memobase buffer entries by status", ["status"])
+    tokens = metrics.gauge_family("memobase_buffer_tokens", "Tokens held in Memobase buffers by status", ["status"])
+    for status, count, token_size in rows:
+        buffers.add_metric([status], count)
+        tokens.add_metric([status], token_size or 0)
+    return [buffers, tokens]
+
+
+def _pool_families():
+    return metrics.pool_families([engine, connectors.DB_ENGINE])
+
+
+metrics.register_scrape_callback(_memory_queue_families)
+metrics.register_scrape_callback(_stream_hub_families)
+metrics.register_scrape_callback(_buffer_families)
+metrics.register_scrape_callback(_pool_families)
+
+
+@router.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """Prometheus text exposition of app and Memobase metrics."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
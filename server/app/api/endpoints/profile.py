@@ -1,15 +1,18 @@
+from dataclasses import asdict
+from typing import Optional
 from fastapi import APIRouter, HTTPException, Path, Body
 from app.services.memo.bridge import MemoService, MemoServiceException
 from app.services.memo.constants import DEFAULT_USER_ID, DEFAULT_SPACE_ID
 from app.schemas.memory import (
     ProfileCreate, ProfileUpdate, ConfigUpdate, BatchDeleteRequest, StatusResponse, CreateProfileResponse,
-    EventGistUpdate
+    EventGistUpdate, GistCompactionResponse
 )
 from app.vendor.memobase_server.models.response import UserProfilesData, ProfileConfigData, UserEventGistsData
 
 router = APIRouter()
 
 # Flag to avoid redundant initialization checks
+# 每个 worker 各自缓存即可：ensure_user 幂等，多 worker 下各执行一次也无副作用
 _INITIALIZED = False
 
 async def ensure_defaults():
@@ -166,6 +169,45 @@ async def get_friend_event_gists(friend_id: int, limit: int = 50):
     except MemoServiceException as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+async def _compact_event_gists(friend_id: Optional[int], dry_run: bool, summarize: Optional[bool] = None) -> GistCompactionResponse:
+    await ensure_defaults()
+    try:
+        reports = await MemoService.compact_event_gists(
+            user_id=DEFAULT_USER_ID,
+            space_id=DEFAULT_SPACE_ID,
+            friend_id=friend_id,
+            dry_run=dry_run,
+            summarize=summarize,
+        )
+    except MemoServiceException as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return GistCompactionResponse(
+        dry_run=dry_run,
+        gists_before=sum(r.gists_before for r in reports),
+        gists_after=sum(r.gists_after for r in reports),
+        bytes_before=sum(r.bytes_before for r in reports),
+        bytes_after=sum(r.bytes_after for r in reports),
+        friends=[asdict(r) for r in reports if r.clusters or r.skipped],
+    )
+
+@router.get(
+    "/events_gists/compaction",
+    response_model=GistCompactionResponse,
+    summary="记忆点压缩预览",
+    description="按好友聚类相似的旧记忆点，返回合并后的条数、体积与召回扫描耗时估算，不做任何修改。"
+)
+async def preview_event_gist_compaction(friend_id: Optional[int] = None):
+    return await _compact_event_gists(friend_id, dry_run=True)
+
+@router.post(
+    "/events_gists/compaction",
+    response_model=GistCompactionResponse,
+    summary="执行记忆点压缩",
+    description="合并相似的旧记忆点（保留原文出处），不传 friend_id 时处理全部好友。"
+)
+async def run_event_gist_compaction(friend_id: Optional[int] = None, summarize: Optional[bool] = None):
+    return await _compact_event_gists(friend_id, dry_run=False, summarize=summarize)
+
 @router.put(
     "/events_gists/{gist_id}",
     response_model=StatusResponse,
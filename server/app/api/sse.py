@@ -0,0 +1,135 @@
+"""
+Shared SSE encoder for streaming endpoints.
+
+Services yield ``{"event": ..., "data": {...}}`` dicts; this module turns them into
+pre-encoded ``bytes`` frames; an ``id`` key becomes the frame's SSE id (sent back
+by clients as ``Last-Event-ID``). Consecutive ``message`` deltas that belong to the same
+message are merged within a short flush window (or until a byte budget is hit), so
+fast models don't produce one frame / one syscall per provider token. A comment
+frame is sent when the stream is idle to keep proxies from closing the connection.
+"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 为可选依赖
+    orjson = None
+
+KEEPALIVE_FRAME = b": keep-alive\n\n"
+COALESCE_EVENTS = ("message",)
+
+
+def dumps(data: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+def encode_event(event_type: str, data: Any, event_id: Any = None) -> bytes:
+    frame = b"event: " + event_type.encode("utf-8") + b"\ndata: " + dumps(data) + b"\n\n"
+    if event_id is None:
+        return frame
+    return b"id: " + str(event_id).encode("utf-8") + b"\n" + frame
+
+
+def _can_merge(pending: Dict[str, Any], event_type: str, data: Any) -> bool:
+    if event_type != pending["event"] or not isinstance(data, dict):
+        return False
+    pending_data = pending["data"]
+    if not isinstance(data.get("delta"), str) or data.keys() != pending_data.keys():
+        return False
+    # 只合并同一条消息的增量（群聊里 sender_id / message_id 需一致）
+    return all(data[k] == pending_data[k] for k in data if k != "delta")
+
+
+async def encode_stream(
+    events: AsyncIterator[Dict[str, Any]],
+    default_event: str = "message",
+    flush_interval: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+    keepalive: Optional[float] = None,
+) -> AsyncIterator[bytes]:
+    flush_interval = settings.SSE_FLUSH_INTERVAL_MS / 1000 if flush_interval is None else flush_interval
+    max_bytes = settings.SSE_COALESCE_MAX_BYTES if max_bytes is None else max_bytes
+    keepalive = settings.SSE_KEEPALIVE_SECONDS if keepalive is None else keepalive
+
+    loop = asyncio.get_running_loop()
+    iterator = events.__aiter__()
+    next_task: Optional[asyncio.Task] = None
+    pending: Optional[Dict[str, Any]] = None
+    pending_size = 0
+    pending_deadline = 0.0
+
+    try:
+        while True:
+            if next_task is None:
+                next_task = asyncio.ensure_future(iterator.__anext__())
+
+            if pending is not None:
+                timeout = max(0.0, pending_deadline - loop.time())
+            else:
+                timeout = keepalive if keepalive and keepalive > 0 else None
+
+            done, _ = await asyncio.wait({next_task}, timeout=timeout)
+            if not done:
+                if pending is not None:
+                    yield encode_event(pending["event"], pending["data"], pending["id"])
+                    pending = None
+                else:
+                    yield KEEPALIVE_FRAME
+                continue
+
+            task, next_task = next_task, None
+            try:
+                event_data = task.result()
+            except StopAsyncIteration:
+                break
+
+            event_type = event_data.get("event", default_event)
+            data_payload = event_data.get("data", {})
+            event_id = event_data.get("id")
+
+            if pending is not None:
+                if _can_merge(pending, event_type, data_payload):
+                    delta = data_payload["delta"]
+                    delta_size = len(delta.encode("utf-8"))
+                    if pending_size + delta_size <= max_bytes:
+                        pending["data"]["delta"] += delta
+                        pending_size += delta_size
+                        # 合并帧以最后一个增量的 id 为准，重连时不会重复收到
+                        pending["id"] = event_id
+                        continue
+                yield encode_event(pending["event"], pending["data"], pending["id"])
+                pending = None
+
+            if (
+                flush_interval > 0
+                and event_type in COALESCE_EVENTS
+                and isinstance(data_payload, dict)
+                and isinstance(data_payload.get("delta"), str)
+            ):
+                pending = {"event": event_type, "data": dict(data_payload), "id": event_id}
+                pending_size = len(data_payload["delta"].encode("utf-8"))
+                pending_deadline = loop.time() + flush_interval
+                continue
+
+            yield encode_event(event_type, data_payload, event_id)
+
+        if pending is not None:
+            yield encode_event(pending["event"], pending["data"], pending["id"])
+    finally:
+        if next_task is not None and not next_task.done():
+            next_task.cancel()
+
+
+def sse_response(events: AsyncIterator[Dict[str, Any]], default_event: str = "message") -> StreamingResponse:
+    return StreamingResponse(encode_stream(events, default_event=default_event), media_type="text/event-stream")
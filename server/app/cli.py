@@ -3,17 +3,54 @@ import os
 import uvicorn
 
 
+def rebuild_search_index() -> None:
+    # 延迟导入：数据目录需先由 --data-dir 写入环境变量
+    from app.db.message_fts import rebuild_message_fts
+    from app.db.session import engine
+
+    with engine.begin() as connection:
+        counts = rebuild_message_fts(connection)
+    for table, count in counts.items():
+        print(f"{table}: {count} messages indexed")
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="WeAgentChat backend runner")
     parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
     parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
     parser.add_argument("--data-dir", dest="data_dir", default=os.getenv("WeAgentChat_DATA_DIR"))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WORKERS", "1")),
+        help="Number of server processes; more than one shares state through the sqlite coordination backend",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Log import and startup phase timings",
+    )
+    parser.add_argument(
+        "--rebuild-search-index",
+        action="store_true",
+        help="Rebuild the chat message full-text index and exit",
+    )
     args = parser.parse_args()
 
     if args.data_dir:
         os.environ["WeAgentChat_DATA_DIR"] = args.data_dir
+    if args.profile_startup:
+        os.environ["WeAgentChat_STARTUP_PROFILE"] = "1"
+
+    if args.rebuild_search_index:
+        rebuild_search_index()
+        return
+
+    if args.workers > 1 and os.getenv("COORDINATION_BACKEND", "local").lower() == "local":
+        # 进程内状态无法跨 worker 共享，多 worker 时改用 SQLite 协调后端
+        os.environ["COORDINATION_BACKEND"] = "sqlite"
 
-    uvicorn.run("app.main:app", host=args.host, port=args.port, log_level="info")
+    uvicorn.run("app.main:app", host=args.host, port=args.port, log_level="info", workers=max(1, args.workers))
 
 
 if __name__ == "__main__":
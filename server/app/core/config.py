@@ -1,4 +1,5 @@
 import os
+from typing import Dict
 from pydantic_settings import BaseSettings
 
 
@@ -31,6 +32,100 @@ class Settings(BaseSettings):
     MEMOBASE_EMBEDDING_MODEL: str = "text-embedding-3-small"
     MEMOBASE_EMBEDDING_DIM: int = 1536
 
+    # LLM 限流（按 provider key 共享给聊天与记忆，0 表示不限制）
+    LLM_RPM_LIMIT: int = 0
+    LLM_TPM_LIMIT: int = 0
+    LLM_MAX_CONCURRENCY: int = 0
+
+    # SSE 输出：message 增量合并窗口 / 单帧字节上限 / 空闲保活间隔
+    SSE_FLUSH_INTERVAL_MS: int = 30
+    SSE_COALESCE_MAX_BYTES: int = 4096
+    SSE_KEEPALIVE_SECONDS: int = 15
+
+    # 生成中 AI 回复的检查点落库节奏（时间 / 累积字符数，先到先写）
+    STREAM_CHECKPOINT_INTERVAL_MS: int = 500
+    STREAM_CHECKPOINT_BYTES: int = 2048
+
+    # SSE 事件扇出：每个流保留最近的事件条数（多订阅者 / Last-Event-ID 重放），流结束后保留秒数
+    STREAM_HUB_BUFFER_EVENTS: int = 4096
+    STREAM_HUB_RETENTION_SECONDS: int = 60
+
+    # 用户画像注入：按与当前轮的相关度排序后填满 token 预算（0 表示全部注入）
+    PROFILE_TOKEN_BUDGET: int = 800
+    # 始终优先注入的画像 topic，逗号分隔
+    PROFILE_PINNED_TOPICS: str = "基本信息"
+
+    # 记忆召回：recall_memory 单次调用最多携带的检索词数量（批量向量化 + 并发检索）
+    RECALL_MAX_QUERIES: int = 4
+    # 检索方式：hybrid（向量 + BM25，RRF 融合）/ vector / lexical；
+    # hybrid 下向量检索失败或超时后，退避期内只走本地 BM25
+    RECALL_SEARCH_MODE: str = "hybrid"
+    RECALL_RRF_K: int = 60
+    RECALL_VECTOR_BACKOFF_SECONDS: float = 60.0
+
+    # 删除好友/会话记忆时每个事务删除的事件（及 blob）条数
+    MEMORY_DELETE_CHUNK_SIZE: int = 500
+
+    # 记忆点（gist）压缩：按好友把向量相似度超过阈值的旧 gist 合并为一条，保留原文出处；
+    # 默认关闭，可先用 GET /api/memory/events_gists/compaction 查看 dry-run 报告
+    GIST_COMPACTION_ENABLED: bool = False
+    GIST_COMPACTION_INTERVAL_HOURS: float = 24.0
+    GIST_COMPACTION_SIMILARITY: float = 0.92
+    # 最近 N 天内的 gist 不参与合并
+    GIST_COMPACTION_MIN_AGE_DAYS: int = 7
+    GIST_COMPACTION_MAX_CLUSTER: int = 8
+    # 开启后用 LLM 合并每组内容（每次调用处理 GIST_COMPACTION_SUMMARY_BATCH 组），否则取组内中心条目
+    GIST_COMPACTION_SUMMARIZE: bool = False
+    GIST_COMPACTION_SUMMARY_BATCH: int = 8
+
+    # prompt.log 采样：Memobase LLM 提示词按条采样，Agent trace 按 trace_id 整条采样（1 为全部记录）
+    # 单个字段的截断长度由环境变量 PROMPT_LOG_MAX_CHARS 控制（见 app/core/logging.py）
+    PROMPT_LOG_SAMPLE_RATE: float = 1.0
+    TRACE_LOG_SAMPLE_RATE: float = 1.0
+    TRACE_LOG_SPAN_START: bool = False
+
+    # 历史窗口：按 token 预算从新到旧填充，溢出部分由后台滚动摘要覆盖
+    CONTEXT_HISTORY_TOKEN_BUDGET: int = 3000
+    CONTEXT_HISTORY_MODEL_BUDGETS: Dict[str, int] = {}  # 按模型名前缀覆盖预算
+    CONTEXT_HISTORY_MAX_MESSAGES: int = 60
+    CONTEXT_SUMMARY_MIN_MESSAGES: int = 4  # 未摘要的溢出消息达到该数量才刷新摘要
+    CONTEXT_SUMMARY_INPUT_TOKENS: int = 4000
+
+    # 缓存友好的提示词布局：系统提示只放静态内容，时间 / 画像放到历史之后；
+    # 历史窗口起点尽量保持不动，超出预算时一次性前移到预算的该比例处
+    PROMPT_CACHE_LAYOUT: bool = True
+    CONTEXT_WINDOW_REANCHOR_RATIO: float = 0.7
+
+    # 每条 AI 回复的 token 用量与耗时（首 token、总耗时、召回）写入 generation_metrics
+    GENERATION_METRICS_ENABLED: bool = True
+
+    # /api/metrics：HTTP / SQL 计时开关与事件循环延迟采样间隔（秒，0 为关闭）
+    METRICS_ENABLED: bool = True
+    EVENT_LOOP_LAG_INTERVAL_SECONDS: float = 0.5
+    # 心跳超期超过该阈值即视为阻塞，由 watchdog 线程抓取事件循环线程的调用栈
+    EVENT_LOOP_STALL_THRESHOLD_MS: int = 100
+    # 调试模式：开启 asyncio debug，记录执行超过阈值的回调（有额外开销，仅排查时使用）
+    EVENT_LOOP_DEBUG: bool = False
+    # 采样 profiler：/api/diagnostics/profile 与请求头 X-Profile: 1（默认关闭，仅限本机访问）
+    PROFILER_ENABLED: bool = False
+    PROFILER_MAX_SECONDS: float = 60.0
+    PROFILER_INTERVAL_MS: float = 5.0
+
+    # 多进程协调（锁 / 队列 / 事件频道 / 运行登记）：local 为进程内（单 worker），
+    # sqlite 使用数据目录下的 coordination.db，供 cli.py --workers N 的多个 worker 共享
+    COORDINATION_BACKEND: str = "local"
+    COORDINATION_SQLITE_PATH: str = ""
+    COORDINATION_POLL_INTERVAL_MS: int = 50
+    COORDINATION_MESSAGE_RETENTION_SECONDS: int = 600
+    # 生成中的回复 / SSE 流由持有它的 worker 定期续期的占用标记有效期（秒），
+    # 其它 worker 据此判断断线重连时回复是否仍在生成（worker 崩溃后到期自动失效）
+    COORDINATION_LIVE_KEY_TTL_SECONDS: float = 15.0
+    # SQL 统计：慢查询阈值（毫秒）/ 同一请求内同形语句重复次数告警阈值（疑似 N+1），0 为关闭；
+    # 响应头 X-DB-Queries / X-DB-Time-Ms 返回本请求的语句数与耗时
+    DB_SLOW_QUERY_MS: int = 200
+    DB_REPEATED_QUERY_THRESHOLD: int = 10
+    DB_QUERY_HEADERS: bool = True
+
     class Config:
         case_sensitive = True
 
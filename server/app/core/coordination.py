@@ -0,0 +1,802 @@
+"""
+Shared runtime state for one or many server processes.
+
+Everything that must agree across uvicorn workers goes through a
+``CoordinationBackend``: expiring keys (locks, flags, run registries), lists (work
+queues) and channels (pub/sub of stream events with a short replay window).
+
+- ``local`` (default): in-process dictionaries, i.e. the single-worker behaviour.
+- ``sqlite``: a WAL-mode SQLite file (``<DATA_DIR>/coordination.db`` unless
+  ``COORDINATION_SQLITE_PATH`` is set) shared by every worker on the machine;
+  subscribers poll their channel every ``COORDINATION_POLL_INTERVAL_MS``.
+
+Key and list operations are synchronous (one short statement each) so sync code
+paths can use them. Async callers go through ``acall``, which moves the call to a
+worker thread on backends whose writes can wait for a file lock (``blocking``);
+``ChannelWriter`` batches the publishes of a stream the same way, and ``LiveKeys``
+keeps the keys that mark work in progress on this worker alive with a heartbeat.
+Values must be JSON-serializable.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+BACKEND_LOCAL = "local"
+BACKEND_SQLITE = "sqlite"
+
+# 本地后端每个频道保留的消息条数（供晚到的订阅者回放）
+LOCAL_CHANNEL_REPLAY = 2000
+SQLITE_READ_BATCH = 500
+SQLITE_PRUNE_EVERY = 200
+
+
+def worker_id() -> str:
+    """Identifies this process in run registries (host:pid)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LockTimeout(Exception):
+    pass
+
+
+class CoordinationBackend:
+    """Redis-like primitives shared by all workers that use the same backend."""
+
+    name = "base"
+    # 操作是否可能阻塞（等文件锁），是则异步调用方经 acall 放到线程里执行
+    blocking = True
+
+    async def acall(self, operation: str, *args, **kwargs) -> Any:
+        """Runs ``operation`` (a method name) without blocking the event loop."""
+        method = getattr(self, operation)
+        if not self.blocking:
+            return method(*args, **kwargs)
+        return await asyncio.to_thread(method, *args, **kwargs)
+
+    # ---- keys ------------------------------------------------------------
+    def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ex: Optional[float] = None, nx: bool = False) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> int:
+        raise NotImplementedError
+
+    def delete_if(self, key: str, value: Any) -> bool:
+        """Deletes ``key`` only while it still holds ``value`` (lock release)."""
+        raise NotImplementedError
+
+    def incrby(self, key: str, amount: int = 1) -> int:
+        raise NotImplementedError
+
+    def expire(self, key: str, seconds: float) -> bool:
+        raise NotImplementedError
+
+    # ---- lists -----------------------------------------------------------
+    def rpush(self, key: str, *values: Any) -> int:
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any) -> bool:
+        """Appends ``value`` unless the list already contains it."""
+        raise NotImplementedError
+
+    def lpop(self, key: str) -> Any:
+        raise NotImplementedError
+
+    def lrem(self, key: str, value: Any) -> int:
+        raise NotImplementedError
+
+    def llen(self, key: str) -> int:
+        raise NotImplementedError
+
+    def entries(self, key: str) -> List[Tuple[Any, float]]:
+        """(value, enqueued_at wall-clock seconds) of every item, oldest first."""
+        raise NotImplementedError
+
+    def drain(self, key: str) -> List[Any]:
+        """Atomically removes and returns every item."""
+        raise NotImplementedError
+
+    # ---- channels --------------------------------------------------------
+    def publish(self, channel: str, payload: Any) -> int:
+        """Appends a message and returns its id (increasing per backend)."""
+        raise NotImplementedError
+
+    def publish_many(self, channel: str, payloads: List[Any]) -> List[int]:
+        """Publishes ``payloads`` in order, in one write where the backend allows it."""
+        return [self.publish(channel, payload) for payload in payloads]
+
+    def last_id(self, channel: str) -> int:
+        raise NotImplementedError
+
+    def read(self, channel: str, after_id: int) -> List[Tuple[int, Any]]:
+        """Retained messages with an id greater than ``after_id``."""
+        raise NotImplementedError
+
+    async def _wait(self, channel: str, after_id: int) -> None:
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str, after_id: Optional[int] = None) -> AsyncIterator[Tuple[int, Any]]:
+        """
+        Yields ``(id, payload)`` of messages published after ``after_id``; with ``None``
+        only messages published from now on.
+        """
+        cursor = self.last_id(channel) if after_id is None else after_id
+        while True:
+            messages = self.read(channel, cursor)
+            if not messages:
+                await self._wait(channel, cursor)
+                continue
+            for message_id, payload in messages:
+                cursor = message_id
+                yield message_id, payload
+
+    # ---- locks -----------------------------------------------------------
+    def try_lock(self, name: str, ttl: float = 30.0) -> Optional[str]:
+        token = uuid.uuid4().hex
+        return token if self.set(f"lock:{name}", token, ex=ttl, nx=True) else None
+
+    def unlock(self, name: str, token: str) -> bool:
+        return self.delete_if(f"lock:{name}", token)
+
+    @asynccontextmanager
+    async def lock(self, name: str, ttl: float = 30.0, timeout: Optional[float] = None, poll: float = 0.05):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        token = await self.acall("try_lock", name, ttl)
+        while token is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise LockTimeout(f"Timed out waiting for lock {name}")
+            await asyncio.sleep(poll)
+            token = await self.acall("try_lock", name, ttl)
+        try:
+            yield token
+        finally:
+            await self.acall("unlock", name, token)
+
+    def close(self) -> None:
+        return
+
+
+# ---------------------------------------------------------------------------
+# 本地后端（单进程）
+# ---------------------------------------------------------------------------
+
+class LocalBackend(CoordinationBackend):
+    name = BACKEND_LOCAL
+    blocking = False
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._kv: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._lists: Dict[str, List[Tuple[Any, float]]] = {}
+        self._channels: Dict[str, Deque[Tuple[int, Any]]] = {}
+        self._last_ids: Dict[str, int] = {}
+        self._next_id = 0
+        self._waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+
+    def _live(self, key: str) -> bool:
+        entry = self._kv.get(key)
+        if entry is None:
+            return False
+        if entry[1] is not None and entry[1] <= time.time():
+            del self._kv[key]
+            return False
+        return True
+
+    def get(self, key):
+        with self._lock:
+            return self._kv[key][0] if self._live(key) else None
+
+    def set(self, key, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._live(key):
+                return False
+            self._kv[key] = (value, time.time() + ex if ex else None)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            existed = self._kv.pop(key, None) is not None
+            existed = (self._lists.pop(key, None) is not None) or existed
+            return int(existed)
+
+    def delete_if(self, key, value):
+        with self._lock:
+            if self._live(key) and self._kv[key][0] == value:
+                del self._kv[key]
+                return True
+            return False
+
+    def incrby(self, key, amount=1):
+        with self._lock:
+            value, expires_at = self._kv[key] if self._live(key) else (0, None)
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                value = 0
+            self._kv[key] = (value + amount, expires_at)
+            return value + amount
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if not self._live(key):
+                return False
+            self._kv[key] = (self._kv[key][0], time.time() + seconds)
+            return True
+
+    def rpush(self, key, *values):
+        with self._lock:
+            items = self._lists.setdefault(key, [])
+            now = time.time()
+            items.extend((value, now) for value in values)
+            return len(items)
+
+    def add(self, key, value):
+        with self._lock:
+            items = self._lists.setdefault(key, [])
+            if any(item == value for item, _ in items):
+                return False
+            items.append((value, time.time()))
+            return True
+
+    def lpop(self, key):
+        with self._lock:
+            items = self._lists.get(key)
+            return items.pop(0)[0] if items else None
+
+    def lrem(self, key, value):
+        with self._lock:
+            items = self._lists.get(key) or []
+            kept = [entry for entry in items if entry[0] != value]
+            self._lists[key] = kept
+            return len(items) - len(kept)
+
+    def llen(self, key):
+        with self._lock:
+            return len(self._lists.get(key) or [])
+
+    def entries(self, key):
+        with self._lock:
+            return list(self._lists.get(key) or [])
+
+    def drain(self, key):
+        with self._lock:
+            items = self._lists.pop(key, None) or []
+            return [value for value, _ in items]
+
+    def publish(self, channel, payload):
+        with self._lock:
+            self._next_id += 1
+            message_id = self._next_id
+            self._channels.setdefault(channel, deque(maxlen=LOCAL_CHANNEL_REPLAY)).append((message_id, payload))
+            self._last_ids[channel] = message_id
+            waiters = self._waiters.pop(channel, [])
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # 订阅者所在的事件循环已关闭
+        return message_id
+
+    def last_id(self, channel):
+        with self._lock:
+            return self._last_ids.get(channel, 0)
+
+    def read(self, channel, after_id):
+        with self._lock:
+            return [(mid, payload) for mid, payload in self._channels.get(channel, ()) if mid > after_id]
+
+    async def _wait(self, channel, after_id):
+        event = asyncio.Event()
+        with self._lock:
+            if self._last_ids.get(channel, 0) > after_id:
+                return
+            self._waiters.setdefault(channel, []).append((asyncio.get_running_loop(), event))
+        await event.wait()
+
+
+# ---------------------------------------------------------------------------
+# SQLite 后端（同机多进程）
+# ---------------------------------------------------------------------------
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+);
+CREATE TABLE IF NOT EXISTS list_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_list_items_key_id ON list_items (key, id);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_channel_id ON messages (channel, id);
+CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages (created_at);
+"""
+
+
+def _dump(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def _load(text: Optional[str]) -> Any:
+    return None if text is None else json.loads(text)
+
+
+class SqliteBackend(CoordinationBackend):
+    name = BACKEND_SQLITE
+
+    def __init__(self, path: str, poll_interval: float = 0.05, retention_seconds: float = 600.0) -> None:
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._local = threading.local()
+        self._publishes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript(_SQLITE_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 自动提交模式，写操作显式 BEGIN IMMEDIATE，避免读后升级写锁时死锁
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _tx(self) -> Iterator[sqlite3.Connection]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _purge(conn: sqlite3.Connection, key: str) -> None:
+        conn.execute("DELETE FROM kv WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?", (key, time.time()))
+
+    # ---- keys ------------------------------------------------------------
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return _load(row[0]) if row else None
+
+    def set(self, key, value, ex=None, nx=False):
+        expires_at = time.time() + ex if ex else None
+        with self._tx() as conn:
+            self._purge(conn, key)
+            verb = "INSERT OR IGNORE" if nx else "INSERT OR REPLACE"
+            cursor = conn.execute(f"{verb} INTO kv (key, value, expires_at) VALUES (?, ?, ?)", (key, _dump(value), expires_at))
+            return cursor.rowcount == 1
+
+    def delete(self, key):
+        with self._tx() as conn:
+            removed = conn.execute("DELETE FROM kv WHERE key = ?", (key,)).rowcount
+            removed += conn.execute("DELETE FROM list_items WHERE key = ?", (key,)).rowcount
+            return int(removed > 0)
+
+    def delete_if(self, key, value):
+        with self._tx() as conn:
+            self._purge(conn, key)
+            return conn.execute("DELETE FROM kv WHERE key = ? AND value = ?", (key, _dump(value))).rowcount == 1
+
+    def incrby(self, key, amount=1):
+        with self._tx() as conn:
+            self._purge(conn, key)
+            row = conn.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+            try:
+                current = int(_load(row[0])) if row else 0
+            except (TypeError, ValueError):
+                current = 0
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, _dump(current + amount), row[1] if row else None),
+            )
+            return current + amount
+
+    def expire(self, key, seconds):
+        with self._tx() as conn:
+            self._purge(conn, key)
+            return conn.execute(
+                "UPDATE kv SET expires_at = ? WHERE key = ?", (time.time() + seconds, key)
+            ).rowcount == 1
+
+    # ---- lists -----------------------------------------------------------
+    def rpush(self, key, *values):
+        now = time.time()
+        with self._tx() as conn:
+            conn.executemany(
+                "INSERT INTO list_items (key, value, created_at) VALUES (?, ?, ?)",
+                [(key, _dump(value), now) for value in values],
+            )
+            return conn.execute("SELECT COUNT(*) FROM list_items WHERE key = ?", (key,)).fetchone()[0]
+
+    def add(self, key, value):
+        encoded = _dump(value)
+        with self._tx() as conn:
+            if conn.execute("SELECT 1 FROM list_items WHERE key = ? AND value = ?", (key, encoded)).fetchone():
+                return False
+            conn.execute(
+                "INSERT INTO list_items (key, value, created_at) VALUES (?, ?, ?)", (key, encoded, time.time())
+            )
+            return True
+
+    def lpop(self, key):
+        with self._tx() as conn:
+            row = conn.execute("SELECT id, value FROM list_items WHERE key = ? ORDER BY id LIMIT 1", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM list_items WHERE id = ?", (row[0],))
+            return _load(row[1])
+
+    def lrem(self, key, value):
+        with self._tx() as conn:
+            return conn.execute("DELETE FROM list_items WHERE key = ? AND value = ?", (key, _dump(value))).rowcount
+
+    def llen(self, key):
+        return self._conn().execute("SELECT COUNT(*) FROM list_items WHERE key = ?", (key,)).fetchone()[0]
+
+    def entries(self, key):
+        rows = self._conn().execute(
+            "SELECT value, created_at FROM list_items WHERE key = ? ORDER BY id", (key,)
+        ).fetchall()
+        return [(_load(value), created_at) for value, created_at in rows]
+
+    def drain(self, key):
+        with self._tx() as conn:
+            rows = conn.execute("SELECT id, value FROM list_items WHERE key = ? ORDER BY id", (key,)).fetchall()
+            if rows:
+                conn.execute("DELETE FROM list_items WHERE key = ? AND id <= ?", (key, rows[-1][0]))
+            return [_load(value) for _, value in rows]
+
+    # ---- channels --------------------------------------------------------
+    def publish(self, channel, payload):
+        return self.publish_many(channel, [payload])[0]
+
+    def publish_many(self, channel, payloads):
+        now = time.time()
+        with self._tx() as conn:
+            message_ids = [
+                conn.execute(
+                    "INSERT INTO messages (channel, payload, created_at) VALUES (?, ?, ?)",
+                    (channel, _dump(payload), now),
+                ).lastrowid
+                for payload in payloads
+            ]
+            pruned_before = self._publishes // SQLITE_PRUNE_EVERY
+            self._publishes += len(payloads)
+            if self._publishes // SQLITE_PRUNE_EVERY != pruned_before:
+                conn.execute("DELETE FROM messages WHERE created_at < ?", (now - self.retention_seconds,))
+        return message_ids
+
+    def last_id(self, channel):
+        row = self._conn().execute("SELECT MAX(id) FROM messages WHERE channel = ?", (channel,)).fetchone()
+        return row[0] or 0
+
+    def read(self, channel, after_id):
+        rows = self._conn().execute(
+            "SELECT id, payload FROM messages WHERE channel = ? AND id > ? ORDER BY id LIMIT ?",
+            (channel, after_id, SQLITE_READ_BATCH),
+        ).fetchall()
+        return [(message_id, _load(payload)) for message_id, payload in rows]
+
+    async def _wait(self, channel, after_id):
+        await asyncio.sleep(self.poll_interval)
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# ---------------------------------------------------------------------------
+# 全局后端
+# ---------------------------------------------------------------------------
+
+_backend: Optional[CoordinationBackend] = None
+_backend_lock = threading.Lock()
+
+
+def sqlite_path() -> str:
+    return settings.COORDINATION_SQLITE_PATH or os.path.join(settings.DATA_DIR, "coordination.db")
+
+
+def create_backend(kind: Optional[str] = None) -> CoordinationBackend:
+    kind = (kind or settings.COORDINATION_BACKEND).lower()
+    if kind == BACKEND_SQLITE:
+        return SqliteBackend(
+            sqlite_path(),
+            poll_interval=settings.COORDINATION_POLL_INTERVAL_MS / 1000,
+            retention_seconds=settings.COORDINATION_MESSAGE_RETENTION_SECONDS,
+        )
+    if kind != BACKEND_LOCAL:
+        logger.warning(f"[Coordination] Unknown backend {kind!r}, falling back to local")
+    return LocalBackend()
+
+
+def is_shared() -> bool:
+    """True when other worker processes may share the backend (anything but ``local``)."""
+    return get_backend().name != BACKEND_LOCAL
+
+
+def get_backend() -> CoordinationBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+                logger.info(f"[Coordination] Using {_backend.name} backend (worker {worker_id()})")
+    return _backend
+
+
+def set_backend(backend: Optional[CoordinationBackend]) -> None:
+    """Replaces the process-wide backend (``None`` re-reads settings on next use)."""
+    global _backend
+    with _backend_lock:
+        if _backend is not None and _backend is not backend:
+            _backend.close()
+        _backend = backend
+
+
+class ChannelWriter:
+    """
+    ``asyncio.Queue``-style ``put`` that publishes to a backend channel. On a blocking
+    backend a single flusher task writes from a worker thread, and everything put
+    while a write is in flight goes out in the next one (one transaction per batch).
+    """
+
+    def __init__(self, channel: str) -> None:
+        self.channel = channel
+        self._pending: List[Any] = []
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def put(self, payload: Any) -> None:
+        self.put_nowait(payload)
+
+    def put_nowait(self, payload: Any) -> None:
+        backend = get_backend()
+        if not backend.blocking:
+            backend.publish(self.channel, payload)
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            backend.publish(self.channel, payload)
+            return
+        self._pending.append(payload)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = loop.create_task(self._flush())
+
+    async def _flush(self) -> None:
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await get_backend().acall("publish_many", self.channel, batch)
+            except Exception as e:
+                logger.error(f"[Coordination] Failed to publish {len(batch)} messages to {self.channel}: {e}")
+
+    async def flush(self) -> None:
+        """Waits until everything put so far has been written."""
+        while self._flusher is not None and not self._flusher.done():
+            await asyncio.shield(self._flusher)
+
+
+class LiveKeys:
+    """
+    Keys that tell other workers what this one is doing right now (a reply being
+    generated, an open stream). Each held key is written with a TTL of
+    ``COORDINATION_LIVE_KEY_TTL_SECONDS`` and refreshed by one heartbeat task, so the
+    keys of a crashed worker expire on their own. Writes happen in order, off the loop.
+    """
+
+    def __init__(self) -> None:
+        self._held: Dict[str, Any] = {}
+        self._pending: List[Tuple[str, Any]] = []
+        self._writing = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def hold(self, key: str, value: Any = None) -> None:
+        """Marks ``key`` (with ``value``, default this worker's id) until ``release``."""
+        value = worker_id() if value is None else value
+        self._held[key] = value
+        self._schedule(key, value)
+
+    def release(self, key: str) -> None:
+        if self._held.pop(key, None) is not None:
+            self._schedule(key, None)
+
+    @staticmethod
+    async def alive(key: str) -> Any:
+        """Value of ``key`` while some worker holds it, else ``None``."""
+        return await get_backend().acall("get", key)
+
+    def _schedule(self, key: str, value: Any) -> None:
+        self._pending.append((key, value))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(self._pending)
+            self._pending = []
+            return
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        else:
+            self._wakeup.set()
+
+    @staticmethod
+    def _write(ops: List[Tuple[str, Any]]) -> None:
+        backend = get_backend()
+        ttl = settings.COORDINATION_LIVE_KEY_TTL_SECONDS
+        for key, value in ops:
+            if value is None:
+                backend.delete(key)
+            else:
+                backend.set(key, value, ex=ttl)
+
+    async def _run(self) -> None:
+        interval = settings.COORDINATION_LIVE_KEY_TTL_SECONDS / 3
+        while self._held or self._pending:
+            if self._pending:
+                ops, self._pending = self._pending, []
+                self._writing = True
+                try:
+                    await asyncio.to_thread(self._write, ops)
+                except Exception as e:
+                    logger.warning(f"[Coordination] Failed to update {len(ops)} live keys: {e}")
+                finally:
+                    self._writing = False
+                continue
+            wakeup = self._wakeup
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                # 心跳：续期仍持有的全部 key
+                self._pending.extend(self._held.items())
+            wakeup.clear()
+
+    async def drain(self) -> None:
+        """Waits until every scheduled write has been made."""
+        while (self._pending or self._writing) and self._task is not None and not self._task.done():
+            await asyncio.sleep(0.005)
+
+
+live_keys = LiveKeys()
+
+
+class AsyncCacheClient:
+    """
+    Redis-style async client over the backend, for Memobase's ``get_redis_client``
+    (locks, buffer queues, counters and caches).
+    """
+
+    async def __aenter__(self) -> "AsyncCacheClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        return None
+
+    async def aclose(self) -> None:
+        return None
+
+    async def ping(self) -> bool:
+        return True
+
+    async def get(self, key):
+        return await get_backend().acall("get", key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        return await get_backend().acall("set", key, value, ex=ex, nx=nx)
+
+    async def delete(self, key):
+        return await get_backend().acall("delete", key)
+
+    async def expire(self, key, time_sec):
+        return await get_backend().acall("expire", key, time_sec)
+
+    async def incrby(self, key, value=1):
+        return await get_backend().acall("incrby", key, value)
+
+    async def rpush(self, key, *values):
+        return await get_backend().acall("rpush", key, *values)
+
+    async def lpop(self, key):
+        return await get_backend().acall("lpop", key)
+
+    async def llen(self, key):
+        return await get_backend().acall("llen", key)
+
+    async def eval(self, script, numkeys, *keys_and_args):
+        # Memobase 只用到“值相等才删除”的解锁脚本
+        keys, args = keys_and_args[:numkeys], keys_and_args[numkeys:]
+        if "redis.call" in script and "get" in script and "del" in script and keys and args:
+            return int(await get_backend().acall("delete_if", keys[0], args[0]))
+        return None
+
+
+class SharedList:
+    """
+    List-like view of a backend list, for module-level work queues.
+    Membership tests and ``len`` read the shared state on every call; coroutines use
+    the ``a``-prefixed methods, which go through ``acall``.
+    """
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+
+    def add(self, value: Any) -> bool:
+        return get_backend().add(self.key, value)
+
+    def append(self, value: Any) -> None:
+        get_backend().rpush(self.key, value)
+
+    def remove(self, value: Any) -> None:
+        get_backend().lrem(self.key, value)
+
+    def clear(self) -> None:
+        get_backend().delete(self.key)
+
+    def drain(self) -> List[Any]:
+        return get_backend().drain(self.key)
+
+    def ages(self) -> List[float]:
+        now = time.time()
+        return [max(0.0, now - enqueued_at) for _, enqueued_at in get_backend().entries(self.key)]
+
+    async def aadd(self, value: Any) -> bool:
+        return await get_backend().acall("add", self.key, value)
+
+    async def aremove(self, value: Any) -> None:
+        await get_backend().acall("lrem", self.key, value)
+
+    async def adrain(self) -> List[Any]:
+        return await get_backend().acall("drain", self.key)
+
+    async def alen(self) -> int:
+        return await get_backend().acall("llen", self.key)
+
+    def __contains__(self, value: Any) -> bool:
+        return any(item == value for item, _ in get_backend().entries(self.key))
+
+    def __iter__(self):
+        return iter([item for item, _ in get_backend().entries(self.key)])
+
+    def __len__(self) -> int:
+        return get_backend().llen(self.key)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __repr__(self) -> str:
+        return f"SharedList({self.key!r}, {list(self)!r})"
@@ -1,8 +1,104 @@
+import atexit
+import copy
+import json
 import logging
 import logging.config
 import os
+import queue
 import sys
-from typing import List
+import zlib
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Tuple
+
+# prompt.log 中单个字符串字段的最大长度（0 表示不截断）
+DEFAULT_PROMPT_LOG_MAX_CHARS = 8000
+
+_log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+_listener = None
+
+
+class _SinkQueueHandler(QueueHandler):
+    """
+    Enqueue records for the background listener instead of writing them here.
+    ``sinks`` are the real handlers dictConfig attached to the logger.
+    """
+
+    def __init__(self, sinks: Tuple[logging.Handler, ...]):
+        super().__init__(_log_queue)
+        self.sinks = sinks
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只在调用线程合并 %-参数；字典消息保持原样，序列化交给后台线程的 formatter
+        if record.args:
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.queue.put_nowait((record, self.sinks))
+
+
+class _SinkQueueListener(QueueListener):
+    """Formats and writes queued records to their sinks on a background thread."""
+
+    def handle(self, item) -> None:
+        record, sinks = item
+        for sink in sinks:
+            if record.levelno >= sink.level:
+                sink.handle(record)
+
+
+class JsonPayloadFormatter(logging.Formatter):
+    """
+    Serializes dict messages to JSON (on the listener thread) and truncates every
+    string field longer than ``max_chars``.
+    """
+
+    def __init__(self, fmt=None, datefmt=None, max_chars: int = DEFAULT_PROMPT_LOG_MAX_CHARS):
+        super().__init__(fmt, datefmt)
+        self.max_chars = max_chars
+
+    def _truncate(self, value):
+        if isinstance(value, str):
+            if self.max_chars and len(value) > self.max_chars:
+                return f"{value[:self.max_chars]}...[truncated {len(value) - self.max_chars} chars]"
+            return value
+        if isinstance(value, dict):
+            return {key: self._truncate(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._truncate(item) for item in value]
+        return value
+
+    def format(self, record: logging.LogRecord) -> str:
+        if isinstance(record.msg, (dict, list)):
+            record = copy.copy(record)
+            record.msg = json.dumps(self._truncate(record.msg), ensure_ascii=False, default=str)
+            record.args = None
+        elif isinstance(record.msg, str):
+            record = copy.copy(record)
+            record.msg = self._truncate(record.getMessage())
+            record.args = None
+        return super().format(record)
+
+
+def sampled(key, rate: float) -> bool:
+    """
+    Deterministic sampling: the same key (e.g. a trace id) is always kept or
+    always dropped, so a sampled trace keeps all of its spans.
+    """
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    return zlib.crc32(str(key).encode("utf-8")) % 10000 < rate * 10000
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
 
 def get_logging_config():
     """
@@ -41,6 +137,11 @@ def get_logging_config():
             "standard": {
                 "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
             },
+            "prompt": {
+                "()": JsonPayloadFormatter,
+                "fmt": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                "max_chars": _env_int("PROMPT_LOG_MAX_CHARS", DEFAULT_PROMPT_LOG_MAX_CHARS),
+            },
         },
         "handlers": {
             "console": {
@@ -59,7 +160,7 @@ def get_logging_config():
             },
             "prompt_file": {
                 "class": "logging.handlers.TimedRotatingFileHandler",
-                "formatter": "standard",
+                "formatter": "prompt",
                 "filename": prompt_log_file,
                 "when": "midnight",
                 "interval": 1,
@@ -75,7 +176,8 @@ def get_logging_config():
             },
             "openai": {
                 "handlers": ["console", "file"],
-                "level": "DEBUG",
+                # DEBUG 会记录每个请求的完整参数，需要时设置 OPENAI_LOG=debug
+                "level": os.getenv("OPENAI_LOG", "INFO").upper(),
                 "propagate": False,
             },
             "openai.agents": {
@@ -112,20 +214,59 @@ def get_logging_config():
         },
     }
 
-def setup_logging():
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _apply_config():
     """
-    初始设置日志系统
+    应用配置字典，然后把各 Logger 上的 handler 换成队列 handler：
+    调用方（事件循环）只负责入队，格式化与写文件都在后台线程完成。
     """
+    global _listener
+    # 旧 handler 会在 dictConfig 中被关闭，先让后台线程把队列写完
+    _stop_listener()
     config = get_logging_config()
     logging.config.dictConfig(config)
 
+    wrappers = {}
+    for name in [*config["loggers"], ""]:
+        logger_obj = logging.getLogger(name)
+        sinks = tuple(h for h in logger_obj.handlers if not isinstance(h, _SinkQueueHandler))
+        if not sinks:
+            continue
+        key = tuple(id(h) for h in sinks)
+        if key not in wrappers:
+            wrappers[key] = _SinkQueueHandler(sinks)
+        logger_obj.handlers = [h for h in logger_obj.handlers if h not in sinks] + [wrappers[key]]
+
+    if _listener is None:
+        _listener = _SinkQueueListener(_log_queue)
+        atexit.register(_stop_listener)
+    _listener.start()
+
+
+def flush_logging():
+    """Block until every queued record has been written (tests, shutdown)."""
+    _stop_listener()
+    if _listener is not None:
+        _listener.start()
+
+
+def setup_logging():
+    """
+    初始设置日志系统
+    """
+    _apply_config()
+
 def refresh_app_logging():
     """
     强制刷新 app 命名空间的日志状态。
     解决 Uvicorn 在启动或重载时可能禁用了 Logger 或重置了 Root 级别的问题。
     """
     # 1. 重新应用配置字典 (确保 Root 和命名空间级别/Handler 正确)
-    logging.config.dictConfig(get_logging_config())
+    _apply_config()
     
     # 2. 强力复活被 Uvicorn 禁用的 Logger (针对已经 import 的模块)
     # 这部分虽然看起来不优雅，但却是处理 Uvicorn disable_existing_loggers=True 最彻底的办法
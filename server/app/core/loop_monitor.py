@@ -0,0 +1,200 @@
+"""
+Event-loop lag monitor and blocking-call detector.
+
+A heartbeat coroutine wakes up every ``interval`` seconds and records how late it
+was. A watchdog thread watches the heartbeat: once it is overdue by more than
+``threshold``, the stack of the loop thread is captured, i.e. whatever is blocking
+the loop right now. Stalls are aggregated by call site (innermost ``app`` frame plus
+the innermost frame overall) and served by ``/api/diagnostics/event-loop``.
+
+With ``EVENT_LOOP_DEBUG`` the loop also runs in asyncio debug mode, which logs every
+callback slower than the threshold through the ``asyncio`` logger.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_OFFENDERS = 200
+STACK_LIMIT = 40
+RECENT_LAGS = 1200
+
+
+def _frame_label(frame: traceback.FrameSummary) -> str:
+    filename = frame.filename.replace("\\", "/")
+    if "/app/" in filename:
+        filename = "app/" + filename.rsplit("/app/", 1)[1]
+    return f"{filename}:{frame.lineno} in {frame.name}"
+
+
+def call_site(stack: List[traceback.FrameSummary]) -> Tuple[str, str]:
+    """(innermost app frame, innermost frame) of a captured loop-thread stack."""
+    if not stack:
+        return "unknown", "unknown"
+    leaf = _frame_label(stack[-1])
+    for frame in reversed(stack):
+        filename = frame.filename.replace("\\", "/")
+        if "/app/" in filename and not filename.endswith("/app/core/loop_monitor.py"):
+            return _frame_label(frame), leaf
+    return leaf, leaf
+
+
+class LoopMonitor:
+    """Heartbeat on the loop plus a watchdog thread that samples the loop thread while it is stuck."""
+
+    def __init__(self, interval: float, threshold: float) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = 0
+        self._lags: deque = deque(maxlen=RECENT_LAGS)
+        self._offenders: Dict[Tuple[str, str], dict] = {}
+        self._lock = threading.Lock()
+        self._loop_thread: Optional[int] = None
+        self._beat = 0
+        self._beat_at = time.monotonic()
+        # 本轮心跳内 watchdog 捕获到的调用点（心跳恢复后补记卡顿时长）
+        self._pending: Optional[Tuple[int, Tuple[str, str]]] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # 事件循环侧
+    # ------------------------------------------------------------------
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat_at = time.monotonic()
+        self._start_watchdog()
+        try:
+            while True:
+                expected = loop.time() + self.interval
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, loop.time() - expected)
+                self._on_beat(lag)
+        finally:
+            self._stop.set()
+
+    def _on_beat(self, lag: float) -> None:
+        metrics.EVENT_LOOP_LAG_SECONDS.observe(lag)
+        metrics.EVENT_LOOP_LAG_LAST.set(lag)
+        with self._lock:
+            self._lags.append(lag)
+            pending = self._pending
+            if pending is not None and pending[0] == self._beat:
+                self._offenders[pending[1]]["total_ms"] += lag * 1000
+                self._offenders[pending[1]]["max_ms"] = max(self._offenders[pending[1]]["max_ms"], lag * 1000)
+                self._pending = None
+            self._beat += 1
+            self._beat_at = time.monotonic()
+
+    # ------------------------------------------------------------------
+    # watchdog 线程
+    # ------------------------------------------------------------------
+
+    def _start_watchdog(self) -> None:
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def _watch(self) -> None:
+        poll = max(0.005, min(self.interval, self.threshold) / 2)
+        while not self._stop.wait(poll):
+            with self._lock:
+                beat = self._beat
+                overdue = time.monotonic() - self._beat_at - self.interval
+                captured = self._pending is not None and self._pending[0] == beat
+            if overdue < self.threshold or captured:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)[-STACK_LIMIT:]
+            self._record_stall(beat, stack, overdue)
+
+    def _record_stall(self, beat: int, stack: List[traceback.FrameSummary], overdue: float) -> None:
+        site, leaf = call_site(stack)
+        key = (site, leaf)
+        with self._lock:
+            if beat != self._beat:
+                return  # 心跳在采样期间已恢复
+            if key not in self._offenders and len(self._offenders) >= MAX_OFFENDERS:
+                key = ("other", "other")
+            entry = self._offenders.setdefault(key, {
+                "site": key[0],
+                "leaf": key[1],
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "stack": [],
+            })
+            entry["count"] += 1
+            entry["last_seen"] = time.time()
+            entry["stack"] = [_frame_label(frame) for frame in stack]
+            self.stalls += 1
+            self._pending = (beat, key)
+        logger.warning(f"[LoopMonitor] Event loop blocked for >{overdue * 1000:.0f}ms at {site} ({leaf})")
+
+    # ------------------------------------------------------------------
+    # 报告
+    # ------------------------------------------------------------------
+
+    def report(self, limit: int = 20) -> dict:
+        with self._lock:
+            lags = sorted(self._lags)
+            offenders = sorted(self._offenders.values(), key=lambda e: e["total_ms"], reverse=True)[:limit]
+            offenders = [dict(entry, total_ms=round(entry["total_ms"], 1), max_ms=round(entry["max_ms"], 1))
+                         for entry in offenders]
+            stalls = self.stalls
+
+        def _pct(p: float) -> Optional[float]:
+            if not lags:
+                return None
+            return round(lags[min(len(lags) - 1, int(p * len(lags)))] * 1000, 2)
+
+        return {
+            "interval_ms": round(self.interval * 1000, 1),
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "lag": {
+                "samples": len(lags),
+                "p50_ms": _pct(0.5),
+                "p99_ms": _pct(0.99),
+                "max_ms": round(lags[-1] * 1000, 2) if lags else None,
+            },
+            "stalls": stalls,
+            "offenders": offenders,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._lags.clear()
+            self._offenders.clear()
+            self._pending = None
+            self.stalls = 0
+
+
+_monitor: Optional[LoopMonitor] = None
+
+
+def get_monitor() -> Optional[LoopMonitor]:
+    return _monitor
+
+
+def start(interval: float, threshold: float, debug: bool = False) -> asyncio.Task:
+    """Starts the monitor on the running loop; cancel the returned task to stop it."""
+    global _monitor
+    loop = asyncio.get_running_loop()
+    if debug:
+        loop.set_debug(True)
+        loop.slow_callback_duration = threshold
+        logging.getLogger("asyncio").setLevel(logging.WARNING)
+    _monitor = LoopMonitor(interval, threshold)
+    return loop.create_task(_monitor.run())
@@ -0,0 +1,302 @@
+"""
+In-process Prometheus metrics, exposed at ``/api/metrics``.
+
+App metrics live in the default ``prometheus_client`` registry, which is also where
+Memobase's OpenTelemetry ``PrometheusMetricReader`` registers its LLM / embedding
+instruments, so one scrape returns both. Values that are cheap to read but costly
+to keep current (queue depth, buffer states, pool usage) are gathered at scrape time.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core import query_stats
+from app.core.query_stats import query_scope
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "weagentchat"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    f"{PREFIX}_http_request_duration_seconds",
+    "HTTP request latency until the response body is complete",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+STREAM_TTFT_SECONDS = Histogram(
+    f"{PREFIX}_stream_ttft_seconds",
+    "Time from the start of an AI reply to its first streamed token",
+    ["kind", "provider"],
+    buckets=LATENCY_BUCKETS,
+)
+STREAM_DURATION_SECONDS = Histogram(
+    f"{PREFIX}_stream_duration_seconds",
+    "Total duration of an AI reply",
+    ["kind", "provider"],
+    buckets=LATENCY_BUCKETS,
+)
+RECALL_SECONDS = Histogram(
+    f"{PREFIX}_recall_duration_seconds",
+    "Duration of the memory recall phase before a reply",
+    ["kind"],
+    buckets=LATENCY_BUCKETS,
+)
+RECALL_ROUNDS = Histogram(
+    f"{PREFIX}_recall_rounds",
+    "recall_memory tool calls made during the recall phase",
+    ["kind"],
+    buckets=(0, 1, 2, 3, 5, 8),
+)
+DB_STATEMENT_SECONDS = Histogram(
+    f"{PREFIX}_db_statement_duration_seconds",
+    "SQL statement execution time, SQLite busy waits included",
+    ["db"],
+    buckets=DB_BUCKETS,
+)
+DB_REPEATED_STATEMENTS = Counter(
+    f"{PREFIX}_db_repeated_statements",
+    "Statement shapes repeated past DB_REPEATED_QUERY_THRESHOLD within one request or job (likely N+1)",
+    ["db"],
+)
+SCOPE_DB_QUERIES = Histogram(
+    f"{PREFIX}_scope_db_queries",
+    "SQL statements issued per request (route template) or background job",
+    ["scope"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+SCOPE_DB_SECONDS = Histogram(
+    f"{PREFIX}_scope_db_seconds",
+    "SQL time per request (route template) or background job",
+    ["scope"],
+    buckets=DB_BUCKETS,
+)
+DB_LOCK_ERRORS = Counter(
+    f"{PREFIX}_db_lock_errors",
+    "Statements that failed because the SQLite database was locked",
+    ["db"],
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    f"{PREFIX}_event_loop_lag_seconds",
+    "How late the event loop woke up a periodic sleeper",
+    buckets=LAG_BUCKETS,
+)
+EVENT_LOOP_LAG_LAST = Gauge(
+    f"{PREFIX}_event_loop_lag_last_seconds",
+    "Most recent event loop lag sample",
+)
+
+
+def render() -> bytes:
+    return generate_latest(REGISTRY)
+
+
+# ---------------------------------------------------------------------------
+# 采集时计算的指标
+# ---------------------------------------------------------------------------
+
+class _ScrapeCollector:
+    """Runs the registered callbacks on every scrape; a failing callback only drops its own metric."""
+
+    def __init__(self) -> None:
+        self._callbacks: List[Callable[[], Iterable[GaugeMetricFamily]]] = []
+
+    def add(self, callback: Callable[[], Iterable[GaugeMetricFamily]]) -> None:
+        self._callbacks.append(callback)
+
+    def describe(self):
+        # 不在注册时调用 collect，避免导入阶段就访问数据库
+        return []
+
+    def collect(self):
+        for callback in list(self._callbacks):
+            try:
+                yield from callback()
+            except Exception as e:
+                logger.debug(f"[Metrics] Scrape callback {getattr(callback, '__name__', callback)} failed: {e}")
+
+
+_scrape_collector = _ScrapeCollector()
+REGISTRY.register(_scrape_collector)
+
+
+def register_scrape_callback(callback: Callable[[], Iterable[GaugeMetricFamily]]) -> None:
+    _scrape_collector.add(callback)
+
+
+def gauge_family(name: str, documentation: str, labels: Optional[List[str]] = None) -> GaugeMetricFamily:
+    return GaugeMetricFamily(f"{PREFIX}_{name}", documentation, labels=labels)
+
+
+# ---------------------------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------------------------
+
+def _route_templates(app) -> Dict[int, str]:
+    """Full path template of every route, keyed by ``id(route)``."""
+    try:
+        # 新版 FastAPI 不再展开 include_router，路由自身的 path 不带前缀
+        from fastapi.routing import iter_route_contexts
+    except ImportError:
+        return {id(route): route.path for route in app.routes if hasattr(route, "path")}
+    return {
+        id(context.original_route): context.path_format
+        for context in iter_route_contexts(app.routes)
+        if context.path_format
+    }
+
+
+class MetricsMiddleware:
+    """
+    Records request latency per route template. Streaming responses are timed until
+    their last body chunk, so for SSE endpoints this is the stream duration.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._templates: Optional[Dict[int, str]] = None
+
+    def _route_label(self, scope) -> str:
+        route = scope.get("route")
+        if route is None:
+            # 未匹配路由时不使用原始路径，防止标签基数失控
+            return "unmatched"
+        if self._templates is None and "app" in scope:
+            self._templates = _route_templates(scope["app"])
+        return (self._templates or {}).get(id(route)) or getattr(route, "path", "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        # 日志中先用原始路径，结束后换成路由模板作为指标标签
+        with query_scope(f"{scope.get('method', '')} {scope.get('path', '')}") as stats:
+            async def _send(message):
+                if message["type"] == "http.response.start":
+                    status["code"] = message["status"]
+                    if settings.DB_QUERY_HEADERS:
+                        # 流式响应在首帧前发送头部，此时只包含已执行的语句
+                        message["headers"] = list(message.get("headers") or []) + [
+                            (b"x-db-queries", str(stats.count).encode("latin-1")),
+                            (b"x-db-time-ms", f"{stats.ms:.1f}".encode("latin-1")),
+                        ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, _send)
+            finally:
+                route = self._route_label(scope)
+                stats.name = route
+                HTTP_REQUEST_SECONDS.labels(scope.get("method", ""), route, str(status["code"])).observe(
+                    time.perf_counter() - started
+                )
+                observe_scope(stats)
+
+
+def observe_scope(stats: query_stats.QueryStats) -> None:
+    SCOPE_DB_QUERIES.labels(stats.name).observe(stats.count)
+    SCOPE_DB_SECONDS.labels(stats.name).observe(stats.seconds)
+
+
+@contextmanager
+def job_scope(name: str):
+    """Attributes the SQL of one background job run to ``name``."""
+    with query_scope(name) as stats:
+        try:
+            yield stats
+        finally:
+            observe_scope(stats)
+
+
+# ---------------------------------------------------------------------------
+# 生成过程
+# ---------------------------------------------------------------------------
+
+def observe_generation(kind: str, provider: Optional[str], metrics: Dict[str, Optional[int]]) -> None:
+    provider = provider or "unknown"
+    if metrics.get("ttft_ms") is not None:
+        STREAM_TTFT_SECONDS.labels(kind, provider).observe(metrics["ttft_ms"] / 1000)
+    if metrics.get("duration_ms") is not None:
+        STREAM_DURATION_SECONDS.labels(kind, provider).observe(metrics["duration_ms"] / 1000)
+    if metrics.get("recall_ms") is not None:
+        RECALL_SECONDS.labels(kind).observe(metrics["recall_ms"] / 1000)
+        RECALL_ROUNDS.labels(kind).observe(metrics.get("recall_rounds") or 0)
+
+
+# ---------------------------------------------------------------------------
+# 数据库
+# ---------------------------------------------------------------------------
+
+_instrumented = False
+
+
+def _db_label(engine: Optional[Engine]) -> str:
+    """``doudou`` / ``memobase``: the SQLite file name without its extension."""
+    database = engine.url.database if engine is not None else None
+    if not database or database == ":memory:":
+        return "memory"
+    return os.path.splitext(os.path.basename(database))[0]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    db = _db_label(conn.engine)
+    DB_STATEMENT_SECONDS.labels(db).observe(elapsed)
+    if query_stats.record(db, statement, elapsed):
+        DB_REPEATED_STATEMENTS.labels(db).inc()
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    starts = conn.info.get("metrics_query_start") if conn is not None else None
+    if starts:
+        starts.pop()
+    if "database is locked" in str(exception_context.original_exception):
+        DB_LOCK_ERRORS.labels(_db_label(exception_context.engine)).inc()
+
+
+def instrument_engines() -> None:
+    """Times every statement on all engines (main and Memobase), attributes it to the bound scope and counts lock errors."""
+    global _instrumented
+    if _instrumented:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    _instrumented = True
+
+
+def pool_families(engines: List[Optional[Engine]]) -> Iterable[GaugeMetricFamily]:
+    checked_out = gauge_family("db_pool_checked_out", "Connections currently checked out of the pool", ["db"])
+    size = gauge_family("db_pool_size", "Configured pool size", ["db"])
+    for engine in engines:
+        if engine is None:
+            continue
+        name = _db_label(engine)
+        pool = engine.pool
+        if hasattr(pool, "checkedout"):
+            checked_out.add_metric([name], pool.checkedout())
+        if hasattr(pool, "size"):
+            size.add_metric([name], pool.size())
+    yield checked_out
+    yield size
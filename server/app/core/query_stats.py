@@ -0,0 +1,109 @@
+"""
+Per-request SQL accounting.
+
+``query_scope(name)`` binds a ``QueryStats`` to the current context; every statement
+executed on either engine (main or Memobase) while it is bound, including in threads
+and tasks spawned from it, adds to its count and time. Statements slower than
+``DB_SLOW_QUERY_MS`` are logged with the app frame that issued them, and a statement
+shape repeated ``DB_REPEATED_QUERY_THRESHOLD`` times in one scope is reported once
+as a likely N+1.
+"""
+import contextvars
+import logging
+import threading
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_PREVIEW_CHARS = 300
+
+_current: contextvars.ContextVar[Optional["QueryStats"]] = contextvars.ContextVar("query_stats", default=None)
+
+
+class QueryStats:
+    """Statement count, time and repeated shapes of one request or background job."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: Counter = Counter()
+        self.repeated: set = set()
+        self._lock = threading.Lock()
+
+    @property
+    def ms(self) -> float:
+        return round(self.seconds * 1000, 3)
+
+    def add(self, statement: str, seconds: float) -> bool:
+        """Adds one statement; True the first time its shape reaches the repeat threshold."""
+        threshold = settings.DB_REPEATED_QUERY_THRESHOLD
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+            if threshold <= 0:
+                return False
+            # 参数已绑定为占位符，语句文本即为其“形状”
+            self.shapes[statement] += 1
+            if self.shapes[statement] >= threshold and statement not in self.repeated:
+                self.repeated.add(statement)
+                return True
+        return False
+
+
+def current() -> Optional[QueryStats]:
+    return _current.get()
+
+
+@contextmanager
+def query_scope(name: str):
+    stats = QueryStats(name)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def _preview(statement: str) -> str:
+    text = " ".join(statement.split())
+    if len(text) > STATEMENT_PREVIEW_CHARS:
+        return text[:STATEMENT_PREVIEW_CHARS] + "..."
+    return text
+
+
+def origin() -> str:
+    """Innermost application frame outside the instrumentation (file:line in function)."""
+    for frame in reversed(traceback.extract_stack()):
+        filename = frame.filename.replace("\\", "/")
+        if "/app/" not in filename or "/app/core/" in filename:
+            continue
+        return f"app/{filename.rsplit('/app/', 1)[1]}:{frame.lineno} in {frame.name}"
+    return "unknown"
+
+
+def record(db: str, statement: str, seconds: float) -> bool:
+    """
+    Attributes one executed statement to the bound scope and reports slow / repeated ones.
+    Returns True when the statement was just flagged as repeated.
+    """
+    stats = _current.get()
+    repeated = stats.add(statement, seconds) if stats is not None else False
+    scope = stats.name if stats is not None else "-"
+
+    slow_ms = settings.DB_SLOW_QUERY_MS
+    if slow_ms > 0 and seconds * 1000 >= slow_ms:
+        logger.warning(
+            f"[SlowQuery] {seconds * 1000:.1f}ms db={db} scope={scope} at {origin()}: {_preview(statement)}"
+        )
+    if repeated:
+        logger.warning(
+            f"[RepeatedQuery] {settings.DB_REPEATED_QUERY_THRESHOLD}x db={db} scope={scope} "
+            f"at {origin()}: {_preview(statement)}"
+        )
+    return repeated
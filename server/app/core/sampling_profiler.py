@@ -0,0 +1,269 @@
+"""
+On-demand statistical profiler.
+
+``SamplingProfiler`` runs a thread that snapshots the stack of every other thread
+(event loop, threadpool workers, background threads) every ``interval`` seconds via
+``sys._current_frames()``. Stacks are aggregated per thread and function, so the
+overhead stays flat however long the profile runs, and can be exported as
+collapsed stacks (flamegraph.pl / speedscope import) or speedscope JSON.
+
+Threads parked in a wait (idle selector, empty work queue, ``Event.wait``) are
+dropped unless ``include_idle`` is set.
+
+Two entry points, both off unless ``PROFILER_ENABLED`` and only for local clients:
+``POST /api/diagnostics/profile`` profiles the process for a bounded time, and a
+request sent with ``X-Profile: 1`` is profiled until its response (stream included)
+has finished; the result is saved under ``<DATA_DIR>/profiles`` and its id returned
+in ``X-Profile-Id``.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+FORMAT_COLLAPSED = "collapsed"
+FORMAT_SPEEDSCOPE = "speedscope"
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+LOCAL_HOSTS = {"127.0.0.1", "::1", "localhost"}
+MAX_SAVED_PROFILES = 20
+MAX_STACK_DEPTH = 128
+
+# 叶子帧落在这些函数上的线程视为空闲（文件名后缀, 函数名）
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("handlers.py", "dequeue"),
+}
+
+Frame = Tuple[str, str, int]  # (函数名, 文件, 定义行)
+
+# 同一时间只允许一个采样器运行
+_active_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _short_path(filename: str) -> str:
+    filename = filename.replace("\\", "/")
+    for marker in ("/app/", "/site-packages/"):
+        if marker in filename:
+            prefix = "app/" if marker == "/app/" else ""
+            return prefix + filename.rsplit(marker, 1)[1]
+    return filename.rsplit("/", 2)[-1] if "/" in filename else filename
+
+
+def _walk(frame) -> List[Frame]:
+    stack: List[Frame] = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _is_idle(stack: List[Frame]) -> bool:
+    if not stack:
+        return True
+    name, filename, _ = stack[-1]
+    filename = filename.replace("\\", "/")
+    return any(filename.endswith(suffix) and name == func for suffix, func in IDLE_LEAVES)
+
+
+class SamplingProfiler:
+    """Samples all threads of the process until stopped."""
+
+    def __init__(self, interval: float = 0.005, include_idle: bool = False) -> None:
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self._counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        if not _active_lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        if self._thread is None:
+            return self
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.duration = time.perf_counter() - self.started_at
+        _active_lock.release()
+        return self
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = _walk(frame)
+                if not self.include_idle and _is_idle(stack):
+                    continue
+                self._counts[(names.get(ident, f"thread-{ident}"), tuple(stack))] += 1
+            self.samples += 1
+
+    # ------------------------------------------------------------------
+    # 导出
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _label(frame: Frame) -> str:
+        name, filename, line = frame
+        # collapsed 格式以分号分隔帧、以最后一个空格分隔计数
+        return f"{name} ({_short_path(filename)}:{line})".replace(";", ":")
+
+    def collapsed(self) -> str:
+        lines = []
+        for (thread, stack), count in sorted(self._counts.items(), key=lambda item: -item[1]):
+            frames = [thread.replace(";", ":").replace(" ", "_")] + [self._label(frame) for frame in stack]
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def speedscope(self, name: str = "WeAgentChat") -> dict:
+        frames: List[dict] = []
+        index: Dict[Frame, int] = {}
+        per_thread: Dict[str, Tuple[List[List[int]], List[float]]] = {}
+        interval_ms = self.interval * 1000
+        for (thread, stack), count in self._counts.items():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": _short_path(frame[1]), "line": frame[2]})
+                ids.append(index[frame])
+            samples, weights = per_thread.setdefault(thread, ([], []))
+            samples.append(ids)
+            weights.append(round(count * interval_ms, 3))
+        profiles = []
+        for thread, (samples, weights) in sorted(per_thread.items(), key=lambda item: -sum(item[1][1])):
+            profiles.append({
+                "type": "sampled",
+                "name": thread,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 3),
+                "samples": samples,
+                "weights": weights,
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "weagentchat-sampling-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def render(self, fmt: str, name: str = "WeAgentChat") -> str:
+        if fmt == FORMAT_SPEEDSCOPE:
+            return json.dumps(self.speedscope(name), ensure_ascii=False)
+        return self.collapsed()
+
+
+# ---------------------------------------------------------------------------
+# 保存的单请求 profile
+# ---------------------------------------------------------------------------
+
+def profiles_dir() -> str:
+    return os.path.join(settings.DATA_DIR, "profiles")
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    # profile_id 由服务端生成，只接受十六进制，防止路径穿越
+    if not profile_id or not all(c in "0123456789abcdef" for c in profile_id):
+        return None
+    path = os.path.join(profiles_dir(), f"{profile_id}.speedscope.json")
+    return path if os.path.exists(path) else None
+
+
+def save_profile(profiler: SamplingProfiler, name: str, profile_id: Optional[str] = None) -> str:
+    """Writes speedscope JSON to ``<DATA_DIR>/profiles``, keeping the newest MAX_SAVED_PROFILES."""
+    directory = profiles_dir()
+    os.makedirs(directory, exist_ok=True)
+    profile_id = profile_id or uuid.uuid4().hex
+    with open(os.path.join(directory, f"{profile_id}.speedscope.json"), "w", encoding="utf-8") as f:
+        f.write(profiler.render(FORMAT_SPEEDSCOPE, name))
+    saved = sorted(
+        (os.path.join(directory, entry) for entry in os.listdir(directory) if entry.endswith(".speedscope.json")),
+        key=os.path.getmtime,
+    )
+    for stale in saved[:-MAX_SAVED_PROFILES]:
+        try:
+            os.remove(stale)
+        except OSError:
+            pass
+    return profile_id
+
+
+def is_local(client_host: Optional[str]) -> bool:
+    return client_host in LOCAL_HOSTS
+
+
+class ProfileRequestMiddleware:
+    """Profiles requests that carry ``X-Profile: 1`` from start to the last body chunk."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.PROFILER_ENABLED:
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        client = scope.get("client")
+        if headers.get(PROFILE_HEADER) not in (b"1", b"true") or not is_local(client[0] if client else None):
+            return await self.app(scope, receive, send)
+
+        profiler = SamplingProfiler(settings.PROFILER_INTERVAL_MS / 1000)
+        try:
+            profiler.start()
+        except ProfilerBusy:
+            logger.warning(f"[Profiler] Busy, not profiling {scope.get('path')}")
+            return await self.app(scope, receive, send)
+
+        name = f"{scope.get('method', '')} {scope.get('path', '')}"
+        profile_id = uuid.uuid4().hex
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers") or []) + [
+                    (PROFILE_ID_HEADER, profile_id.encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            profiler.stop()
+            try:
+                await asyncio.to_thread(save_profile, profiler, name, profile_id)
+                logger.info(f"[Profiler] {name}: {profiler.samples} samples in {profiler.duration:.2f}s -> {profile_id}")
+            except OSError as e:
+                logger.warning(f"[Profiler] Failed to save profile for {name}: {e}")
@@ -0,0 +1,99 @@
+"""
+Startup timing.
+
+``phase(name)`` records how long each startup step takes (imports, migrations,
+Memobase initialization). With ``WeAgentChat_STARTUP_PROFILE=1`` (or
+``cli.py --profile-startup``) the first import of every third-party package and
+``app`` module is timed as well, and ``log_summary`` writes the phases and the
+slowest imports to the log once the server is ready.
+
+Import this module before anything heavy so the clock starts early.
+"""
+import builtins
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+ENV_FLAG = "WeAgentChat_STARTUP_PROFILE"
+TOP_IMPORTS = 15
+
+_started = time.perf_counter()
+_phases: List[Tuple[str, float]] = []
+_imports: Dict[str, float] = {}
+_original_import = None
+_owner_thread = None
+
+
+def enabled() -> bool:
+    return os.getenv(ENV_FLAG, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def elapsed() -> float:
+    """Seconds since this module was imported."""
+    return time.perf_counter() - _started
+
+
+@contextmanager
+def phase(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, time.perf_counter() - start))
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules or threading.get_ident() != _owner_thread:
+        return _original_import(name, globals, locals, fromlist, level)
+    # 第三方库按顶层包计（首次导入，含其依赖），app 内按模块计
+    key = name if name.startswith("app.") else name.partition(".")[0]
+    if key in _imports:
+        return _original_import(name, globals, locals, fromlist, level)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _imports[key] = time.perf_counter() - start
+
+
+def install() -> None:
+    """Start timing imports if profiling is enabled (idempotent)."""
+    global _original_import, _owner_thread
+    if not enabled() or _original_import is not None:
+        return
+    _original_import = builtins.__import__
+    _owner_thread = threading.get_ident()
+    builtins.__import__ = _timed_import
+
+
+def uninstall() -> None:
+    global _original_import
+    if _original_import is not None:
+        builtins.__import__ = _original_import
+        _original_import = None
+
+
+def report() -> dict:
+    slowest = sorted(_imports.items(), key=lambda item: item[1], reverse=True)[:TOP_IMPORTS]
+    return {
+        "total_s": round(elapsed(), 3),
+        "phases": [{"name": name, "seconds": round(seconds, 3)} for name, seconds in _phases],
+        "slowest_imports": [{"module": module, "seconds": round(seconds, 3)} for module, seconds in slowest],
+    }
+
+
+def log_summary(logger: logging.Logger) -> None:
+    """Log total startup time; with profiling on, also every phase and the slowest imports."""
+    uninstall()
+    logger.info(f"Startup finished in {elapsed():.2f}s")
+    if not enabled():
+        return
+    data = report()
+    for item in data["phases"]:
+        logger.info(f"[startup] {item['name']}: {item['seconds']:.3f}s")
+    for item in data["slowest_imports"]:
+        logger.info(f"[startup] import {item['module']}: {item['seconds']:.3f}s")
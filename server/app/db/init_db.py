@@ -1,46 +1,109 @@
 import sqlite3
 import os
+import re
 import logging
-from alembic import command
-from alembic.config import Config
+import configparser
 from app.core.config import settings
+from app.core.startup_profile import phase
 from app.vendor.memobase_server.connectors import init_db as init_memo_db, Session as MemoSession
 from app.vendor.memobase_server.models.database import Project as MemoProject
+from app.vendor.memobase_server.controllers.event_gist_fts import sync_event_gist_fts
 from app.services.memo.constants import DEFAULT_SPACE_ID
 from app.services.memo.default_profile_config import get_default_profile_config_yaml
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+_REVISION_RE = re.compile(r"^revision(?:\s*:[^=]*)?=\s*['\"](\w+)['\"]", re.MULTILINE)
+_DOWN_REVISION_RE = re.compile(r"^down_revision(?:\s*:[^=]*)?=(.*)$", re.MULTILINE)
+
+
+def _resolve_script_location(alembic_cfg_path: str, tag: str, base_dir: str | None) -> str | None:
+    """Absolute script_location from alembic.ini, read without importing Alembic."""
+    cfg_dir = os.path.dirname(alembic_cfg_path)
+    parser = configparser.ConfigParser(defaults={"here": cfg_dir})
+    parser.read(alembic_cfg_path, encoding="utf-8")
+    script_location = parser.get("alembic", "script_location", fallback=None)
+    if not script_location or os.path.isabs(script_location):
+        return script_location
+
+    candidates = [os.path.abspath(os.path.join(cfg_dir, script_location))]
+    if base_dir:
+        candidates.append(os.path.abspath(os.path.join(base_dir, script_location)))
+    absolute_script_location = next((path for path in candidates if os.path.exists(path)), None)
+    if not absolute_script_location:
+        logger.warning(
+            f"script_location '{script_location}' not found for [{tag}]. Tried: {candidates}"
+        )
+    return absolute_script_location
+
+
+def script_heads(script_location: str) -> set[str] | None:
+    """Head revisions of a migration directory, parsed from the version files; None if unreadable."""
+    versions_dir = os.path.join(script_location, "versions")
+    revisions: set[str] = set()
+    parents: set[str] = set()
+    try:
+        for name in os.listdir(versions_dir):
+            if not name.endswith(".py") or name.startswith("__"):
+                continue
+            with open(os.path.join(versions_dir, name), "r", encoding="utf-8") as f:
+                source = f.read()
+            revision = _REVISION_RE.search(source)
+            down_revision = _DOWN_REVISION_RE.search(source)
+            if not revision or not down_revision:
+                return None
+            revisions.add(revision.group(1))
+            parents.update(re.findall(r"['\"](\w+)['\"]", down_revision.group(1)))
+    except OSError:
+        return None
+    return (revisions - parents) or None
+
+
+def database_revisions(db_url: str | None) -> set[str] | None:
+    """Revisions stamped in a SQLite database's alembic_version table; None if unknown."""
+    if not db_url or not db_url.startswith("sqlite:///"):
+        return None
+    db_path = db_url[len("sqlite:///"):]
+    if not os.path.exists(db_path):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            return {row[0] for row in conn.execute("SELECT version_num FROM alembic_version")}
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+
 def run_migrations(
     alembic_cfg_path: str,
     db_url: str = None,
     tag: str = "main",
     base_dir: str | None = None,
 ):
-    """Generic function to run alembic migrations."""
-    logger.info(f"Running Alembic migrations for [{tag}]...")
+    """Generic function to run alembic migrations (skipped when the database is already at head)."""
     try:
         if not os.path.exists(alembic_cfg_path):
             logger.warning(f"alembic.ini not found at {alembic_cfg_path}. Skipping migrations for {tag}.")
             return
 
+        script_location = _resolve_script_location(alembic_cfg_path, tag, base_dir)
+        if script_location:
+            heads = script_heads(script_location)
+            if heads is not None and database_revisions(db_url) == heads:
+                logger.info(f"Database [{tag}] already at head {sorted(heads)}. Skipping Alembic.")
+                return
+
+        logger.info(f"Running Alembic migrations for [{tag}]...")
+        # Alembic 导入较重，仅在确需迁移时加载
+        from alembic import command
+        from alembic.config import Config
+
         alembic_cfg = Config(alembic_cfg_path)
-        script_location = alembic_cfg.get_main_option("script_location")
-        if script_location and not os.path.isabs(script_location):
-            candidates = []
-            cfg_dir = os.path.dirname(alembic_cfg_path)
-            candidates.append(os.path.abspath(os.path.join(cfg_dir, script_location)))
-            if base_dir:
-                candidates.append(os.path.abspath(os.path.join(base_dir, script_location)))
-
-            absolute_script_location = next((path for path in candidates if os.path.exists(path)), None)
-            if absolute_script_location:
-                alembic_cfg.set_main_option("script_location", absolute_script_location)
-            else:
-                logger.warning(
-                    f"script_location '{script_location}' not found for [{tag}]. Tried: {candidates}"
-                )
+        if script_location:
+            alembic_cfg.set_main_option("script_location", script_location)
         if db_url:
             alembic_cfg.set_main_option("sqlalchemy.url", db_url)
 
@@ -91,21 +154,23 @@ def init_db():
 
     # --- 2. Run Main Alembic Migrations ---
     main_alembic_cfg = os.path.join(base_dir, "alembic.ini")
-    run_migrations(
-        main_alembic_cfg,
-        settings.SQLALCHEMY_DATABASE_URI,
-        tag="main",
-        base_dir=base_dir,
-    )
+    with phase("init_db:migrations[main]"):
+        run_migrations(
+            main_alembic_cfg,
+            settings.SQLALCHEMY_DATABASE_URI,
+            tag="main",
+            base_dir=base_dir,
+        )
 
     # --- 3. Run Memobase SDK migrations ---
     memo_alembic_cfg = os.path.join(base_dir, "app", "vendor", "memobase_server", "alembic.ini")
-    run_migrations(
-        memo_alembic_cfg,
-        settings.MEMOBASE_DB_URL,
-        tag="memobase",
-        base_dir=base_dir,
-    )
+    with phase("init_db:migrations[memobase]"):
+        run_migrations(
+            memo_alembic_cfg,
+            settings.MEMOBASE_DB_URL,
+            tag="memobase",
+            base_dir=base_dir,
+        )
 
     # --- 4. Initialize Memobase Static Data ---
     logger.info("Initializing Memobase static data...")
@@ -121,6 +186,9 @@ def init_db():
             if root_project and not (root_project.profile_config or "").strip():
                 root_project.profile_config = get_default_profile_config_yaml()
                 session.commit()
+            # 补齐全文索引中缺失的 gist（索引表由迁移创建）
+            sync_event_gist_fts(session.connection())
+            session.commit()
         logger.info("Memobase static data initialized successfully.")
     except Exception as e:
         logger.error(f"Error initializing Memobase static data: {e}")
@@ -0,0 +1,80 @@
+"""
+Full-text indexes over chat and group chat messages (SQLite FTS5).
+
+``messages_fts`` / ``group_messages_fts`` are external-content tables backed by
+``messages`` / ``group_messages`` and use the trigram tokenizer, so Chinese text
+is searchable without a segmentation library. SQL triggers keep them in sync,
+which also covers the bulk ``query.update`` writes of the stream persister.
+Only searchable rows are indexed: finished (not streaming), not deleted and
+not recalled / system messages.
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+MESSAGES_FTS = "messages_fts"
+GROUP_MESSAGES_FTS = "group_messages_fts"
+
+# 可检索行的条件（{row} 为 new / old 或表名）
+_MESSAGE_SEARCHABLE = (
+    "{row}.deleted = 0 AND {row}.status = 'complete' AND {row}.role IN ('user', 'assistant')"
+)
+_GROUP_MESSAGE_SEARCHABLE = "{row}.status = 'complete' AND {row}.message_type != 'system'"
+
+_INDEXES = [
+    # (FTS 表, 内容表, 可检索条件, 触发 UPDATE 同步的列)
+    (MESSAGES_FTS, "messages", _MESSAGE_SEARCHABLE, "content, status, deleted, role"),
+    (GROUP_MESSAGES_FTS, "group_messages", _GROUP_MESSAGE_SEARCHABLE, "content, status, message_type"),
+]
+
+
+def _create_statements(fts: str, source: str, searchable: str, columns: str) -> list[str]:
+    old, new = searchable.format(row="old"), searchable.format(row="new")
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} "
+        f"USING fts5(content, content='{source}', content_rowid='id', tokenize='trigram')",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {source} WHEN {new} BEGIN
+            INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {source} WHEN {old} BEGIN
+            INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columns} ON {source} BEGIN
+            INSERT INTO {fts}({fts}, rowid, content) SELECT 'delete', old.id, old.content WHERE {old};
+            INSERT INTO {fts}(rowid, content) SELECT new.id, new.content WHERE {new};
+        END
+        """,
+    ]
+
+
+def ensure_message_fts(connection: Connection) -> None:
+    """Create the FTS tables and sync triggers if they are missing."""
+    for index in _INDEXES:
+        for statement in _create_statements(*index):
+            connection.execute(text(statement))
+
+
+def rebuild_message_fts(connection: Connection) -> dict[str, int]:
+    """Re-index every searchable message from scratch; returns indexed rows per table."""
+    ensure_message_fts(connection)
+    counts = {}
+    for fts, source, searchable, _ in _INDEXES:
+        connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('delete-all')"))
+        connection.execute(text(
+            f"INSERT INTO {fts}(rowid, content) "
+            f"SELECT id, content FROM {source} WHERE {searchable.format(row=source)}"
+        ))
+        connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('optimize')"))
+        counts[source] = connection.execute(text(f"SELECT count(*) FROM {fts}_docsize")).scalar()
+    return counts
+
+
+def drop_message_fts(connection: Connection) -> None:
+    for fts, _, _, _ in _INDEXES:
+        for suffix in ("ai", "ad", "au"):
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {fts}_{suffix}"))
+        connection.execute(text(f"DROP TABLE IF EXISTS {fts}"))
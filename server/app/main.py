@@ -1,29 +1,36 @@
+# 0. 启动计时（须先于其它导入）
+from app.core import startup_profile
+startup_profile.install()
+
 import asyncio
 import traceback
 import logging
-import json
 from pathlib import Path
 import sys
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-import os
 
-from agents import add_trace_processor, set_trace_processors
-from agents.tracing import Trace, Span, TracingProcessor
+with startup_profile.phase("import:framework"):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.staticfiles import StaticFiles
+    import os
+
+    from agents import add_trace_processor, set_trace_processors
+    from agents.tracing import Trace, Span, TracingProcessor
 
 # 1. 初始日志设置 (尽可能早地配置)
-from app.core.logging import setup_logging, refresh_app_logging
+from app.core.logging import setup_logging, refresh_app_logging, sampled
 setup_logging()
 
 # 安全地导入业务模块
-from app.core.config import settings
-from app.api.api import api_router
-from app.db.init_db import init_db
-from app.db.session import SessionLocal
-from app.services.chat_service import check_and_archive_expired_sessions
+with startup_profile.phase("import:app"):
+    from app.core.config import settings
+    from app.core import coordination, loop_monitor, metrics, sampling_profiler
+    from app.api.api import api_router
+    from app.db.init_db import init_db
+    from app.db.session import SessionLocal
+    from app.services.chat_service import check_and_archive_expired_sessions
 
 logger = logging.getLogger(__name__)
 trace_logger = logging.getLogger("openai.agents.tracing")
@@ -57,39 +64,56 @@ def _export_span(span: Span):
     return None
 
 class LocalTraceProcessor(TracingProcessor):
+    """
+    Writes agent traces to prompt.log. Payloads are handed to the logger as dicts
+    and serialized (and truncated) on the logging thread; traces are sampled by
+    trace_id so a kept trace keeps all of its spans.
+    """
+
+    def _log(self, trace_id, payload: dict) -> None:
+        if sampled(trace_id, settings.TRACE_LOG_SAMPLE_RATE):
+            trace_logger.info(payload)
+
     def on_trace_start(self, trace: Trace) -> None:
-        trace_logger.info(json.dumps({
+        trace_id = getattr(trace, "trace_id", None)
+        self._log(trace_id, {
             "event": "trace_start",
-            "trace_id": getattr(trace, "trace_id", None),
+            "trace_id": trace_id,
             "workflow_name": getattr(trace, "workflow_name", None),
-        }, ensure_ascii=False, default=str))
+        })
 
     def on_trace_end(self, trace: Trace) -> None:
-        trace_logger.info(json.dumps({
+        trace_id = getattr(trace, "trace_id", None)
+        self._log(trace_id, {
             "event": "trace_end",
-            "trace_id": getattr(trace, "trace_id", None),
+            "trace_id": trace_id,
             "workflow_name": getattr(trace, "workflow_name", None),
             "duration_ms": getattr(trace, "duration_ms", None),
-        }, ensure_ascii=False, default=str))
+        })
 
     def on_span_start(self, span: Span) -> None:
-        trace_logger.info(json.dumps({
+        # span_end 已包含完整的 span 内容，start 事件默认不记录
+        if not settings.TRACE_LOG_SPAN_START:
+            return
+        trace_id = getattr(span, "trace_id", None)
+        self._log(trace_id, {
             "event": "span_start",
-            "trace_id": getattr(span, "trace_id", None),
+            "trace_id": trace_id,
             "span_id": getattr(span, "span_id", None),
             "parent_id": getattr(span, "parent_id", None),
             "span": _export_span(span),
-        }, ensure_ascii=False, default=str))
+        })
 
     def on_span_end(self, span: Span) -> None:
-        trace_logger.info(json.dumps({
+        trace_id = getattr(span, "trace_id", None)
+        self._log(trace_id, {
             "event": "span_end",
-            "trace_id": getattr(span, "trace_id", None),
+            "trace_id": trace_id,
             "span_id": getattr(span, "span_id", None),
             "parent_id": getattr(span, "parent_id", None),
             "duration_ms": getattr(span, "duration_ms", None),
             "span": _export_span(span),
-        }, ensure_ascii=False, default=str))
+        })
 
     def shutdown(self) -> None:
         return
@@ -113,6 +137,14 @@ app.add_middleware(
     allow_headers=["*"],  # 允许所有请求头
 )
 
+# 请求耗时与 SQL 计时（/api/metrics）
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engines()
+
+# 带 X-Profile: 1 的请求全程采样（PROFILER_ENABLED 时生效）
+app.add_middleware(sampling_profiler.ProfileRequestMiddleware)
+
 # 挂载静态文件目录
 uploads_dir = os.path.join(settings.DATA_DIR, "uploads")
 os.makedirs(uploads_dir, exist_ok=True)
@@ -132,16 +164,19 @@ async def lifespan(app: FastAPI):
     refresh_app_logging()
     
     # Initialize database (SQLAlchemy models and Alembic migrations)
-    init_db()
+    with startup_profile.phase("init_db"):
+        init_db()
     
     # Initialize Memobase SDK
-    from app.services.memo import initialize_memo_sdk
-    memo_worker_task = await initialize_memo_sdk()
+    with startup_profile.phase("memo_sdk"):
+        from app.services.memo import initialize_memo_sdk
+        memo_worker_task = await initialize_memo_sdk()
     
     # 在第三方库初始化完成后再次确保日志配置生效
     refresh_app_logging()
     
     logger.info("Application startup complete. Logging system is active.")
+    startup_profile.log_summary(logger)
     
     # Start Session Archiver Task (Every 30 seconds)
     async def run_session_archiver():
@@ -151,15 +186,21 @@ async def lifespan(app: FastAPI):
         
         while True:
             try:
-                with SessionLocal() as db:
-                     # 1. 检查过期会话并标记（加入队列）
-                     count = check_and_archive_expired_sessions(db)
-                     if count > 0:
-                         logger.info(f"Session archiver: archived {count} expired sessions.")
-                     
-                     # 2. 消费队列中的记忆生成任务
-                     from app.services.chat_service import process_memory_queue
-                     await process_memory_queue(db)
+                # 多 worker 时同一时刻只有一个 worker 执行归档扫描
+                token = await coordination.get_backend().acall("try_lock", "session_archiver", ttl=600)
+                if token is not None:
+                    try:
+                        with metrics.job_scope("session_archiver"), SessionLocal() as db:
+                             # 1. 检查过期会话并标记（加入队列）
+                             count = check_and_archive_expired_sessions(db)
+                             if count > 0:
+                                 logger.info(f"Session archiver: archived {count} expired sessions.")
+                             
+                             # 2. 消费队列中的记忆生成任务
+                             from app.services.chat_service import process_memory_queue
+                             await process_memory_queue(db)
+                    finally:
+                        await coordination.get_backend().acall("unlock", "session_archiver", token)
                      
                 await asyncio.sleep(30)  # 每 30 秒运行一次，提高灵敏度
             except asyncio.CancelledError:
@@ -170,6 +211,49 @@ async def lifespan(app: FastAPI):
                 await asyncio.sleep(30)
 
     archiver_task = asyncio.create_task(run_session_archiver())
+
+    # 记忆点压缩：按好友合并相似的旧 gist，控制记忆体积与召回开销
+    async def run_gist_compaction():
+        from app.services.memo.bridge import MemoService
+        from app.services.memo.constants import DEFAULT_USER_ID, DEFAULT_SPACE_ID
+        interval = max(1.0, settings.GIST_COMPACTION_INTERVAL_HOURS * 3600)
+        # 避开启动高峰
+        await asyncio.sleep(300)
+
+        while True:
+            try:
+                token = await coordination.get_backend().acall("try_lock", "gist_compaction", ttl=3600)
+                if token is not None:
+                    try:
+                        with metrics.job_scope("gist_compaction"):
+                            reports = await MemoService.compact_event_gists(
+                                DEFAULT_USER_ID, DEFAULT_SPACE_ID, dry_run=False
+                            )
+                        merged = sum(r.merged for r in reports)
+                        if merged:
+                            logger.info(f"Gist compaction: merged {merged} gists across {len(reports)} friends.")
+                    finally:
+                        await coordination.get_backend().acall("unlock", "gist_compaction", token)
+
+                await asyncio.sleep(interval)
+            except asyncio.CancelledError:
+                logger.debug("Gist compaction task cancelled.")
+                break
+            except Exception as e:
+                logger.error(f"Error in gist compaction task: {e}")
+                await asyncio.sleep(interval)
+
+    compaction_task = None
+    if settings.GIST_COMPACTION_ENABLED:
+        compaction_task = asyncio.create_task(run_gist_compaction())
+
+    lag_task = None
+    if settings.EVENT_LOOP_LAG_INTERVAL_SECONDS > 0:
+        lag_task = loop_monitor.start(
+            settings.EVENT_LOOP_LAG_INTERVAL_SECONDS,
+            settings.EVENT_LOOP_STALL_THRESHOLD_MS / 1000,
+            debug=settings.EVENT_LOOP_DEBUG,
+        )
     
     yield
     
@@ -188,6 +272,20 @@ async def lifespan(app: FastAPI):
         except asyncio.CancelledError:
             pass
 
+    if compaction_task:
+        compaction_task.cancel()
+        try:
+            await compaction_task
+        except asyncio.CancelledError:
+            pass
+
+    if lag_task:
+        lag_task.cancel()
+        try:
+            await lag_task
+        except asyncio.CancelledError:
+            pass
+
 # 关联 lifespan
 app.router.lifespan_context = lifespan
 
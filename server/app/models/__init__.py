@@ -4,3 +4,4 @@ from .friend_template import FriendTemplate
 from .embedding import EmbeddingSetting  
 from .system_setting import SystemSetting
 from .group import Group, GroupMember, GroupMessage, GroupSession
+from .generation_metric import GenerationMetric
@@ -24,6 +24,9 @@ class ChatSession(Base):
     memory_error = Column(Text, nullable=True)
     # 最后一条消息的时间
     last_message_time = Column(UTCDateTime, nullable=True)
+    # 滚动摘要：覆盖 id <= context_summary_until_id 的、已滑出历史窗口的消息
+    context_summary = Column(Text, nullable=True)
+    context_summary_until_id = Column(Integer, nullable=True)
 
     # Relationships
     messages = relationship("Message", back_populates="session", cascade="all, delete-orphan")
@@ -38,6 +41,10 @@ class Message(Base):
     friend_id = Column(Integer, ForeignKey("friends.id"), nullable=True)
     role = Column(String(20), nullable=False)
     content = Column(Text, nullable=False)
+    # 生成状态: streaming = 正在生成（content 为最近一次检查点）, complete = 已完成
+    status = Column(String(20), default="complete", server_default="complete", nullable=False)
+    # 内容的 token 数，首次组装上下文时计算并缓存（仅 complete 状态）
+    token_count = Column(Integer, nullable=True)
     create_time = Column(UTCDateTime, default=utc_now, nullable=False)
     update_time = Column(UTCDateTime, default=utc_now, onupdate=utc_now, nullable=False)
     deleted = Column(Boolean, default=False, nullable=False)
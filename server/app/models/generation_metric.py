@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Index, Integer, String
+from app.db.base import Base
+from app.db.types import UTCDateTime, utc_now
+
+
+class GenerationMetric(Base):
+    """One row per AI reply: provider usage and latency of the generation."""
+    __tablename__ = "generation_metrics"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(16), nullable=False)  # chat, group
+    message_id = Column(Integer, nullable=False, index=True)
+    session_id = Column(Integer, nullable=True)
+    friend_id = Column(Integer, nullable=True)
+    provider = Column(String(50), nullable=True)
+    model = Column(String(100), nullable=True)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)
+    reasoning_tokens = Column(Integer, nullable=False, default=0)
+    usage_estimated = Column(Integer, nullable=False, default=0)  # 1 = 服务商未返回 usage，按本地分词估算
+    ttft_ms = Column(Integer, nullable=True)
+    duration_ms = Column(Integer, nullable=False, default=0)
+    recall_ms = Column(Integer, nullable=True)
+    recall_rounds = Column(Integer, nullable=False, default=0)
+    create_time = Column(UTCDateTime, default=utc_now, nullable=False)
+
+    __table_args__ = (
+        Index("ix_generation_metrics_create_time", "create_time"),
+        Index("ix_generation_metrics_friend_time", "friend_id", "create_time"),
+    )
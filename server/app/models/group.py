@@ -32,6 +32,9 @@ class GroupSession(Base):
     update_time = Column(UTCDateTime, default=utc_now, onupdate=utc_now, nullable=False)
     ended = Column(Boolean, default=False, nullable=False)
     last_message_time = Column(UTCDateTime, nullable=True)
+    # 滚动摘要：覆盖 id <= context_summary_until_id 的、已滑出历史窗口的消息
+    context_summary = Column(Text, nullable=True)
+    context_summary_until_id = Column(Integer, nullable=True)
 
     group = relationship("Group", back_populates="sessions")
     messages = relationship("GroupMessage", back_populates="session", cascade="all, delete-orphan")
@@ -66,6 +69,8 @@ class GroupMessage(Base):
     message_type = Column(String(20), default="text", nullable=False) # 'text', 'system', '@'
     mentions = Column(JSON, nullable=True) # List of member IDs
     debate_side = Column(String(20), nullable=True) # 'affirmative' / 'negative'
+    status = Column(String(20), default="complete", server_default="complete", nullable=False) # 'streaming' / 'complete'
+    token_count = Column(Integer, nullable=True) # 上下文组装时缓存的 token 数
     create_time = Column(UTCDateTime, default=utc_now, nullable=False)
     update_time = Column(UTCDateTime, default=utc_now, onupdate=utc_now, nullable=False)
 
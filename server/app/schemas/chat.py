@@ -15,6 +15,7 @@ class MessageCreate(BaseModel):
 class MessageRead(MessageBase):
     id: int
     session_id: int
+    status: str = "complete"
     create_time: datetime
     update_time: datetime
     deleted: bool
@@ -50,5 +51,37 @@ class ChatSessionReadWithStats(ChatSessionRead):
     last_message_preview: Optional[str] = None
     is_active: bool = False
 
+# --- Generation Metrics Schemas ---
+class GenerationMetricsBucket(BaseModel):
+    key: Optional[str] = None  # friend_id / 模型名 / 日期 (UTC)
+    label: Optional[str] = None  # 按好友分组时为好友名称
+    requests: int
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int
+    reasoning_tokens: int
+    cache_hit_rate: float
+    avg_ttft_ms: Optional[float] = None
+    avg_duration_ms: Optional[float] = None
+    avg_recall_ms: Optional[float] = None
+    recall_rounds: int
 
 
+
+
+
+class MessageSearchHit(BaseModel):
+    kind: str  # chat / group
+    id: int
+    session_id: int
+    friend_id: Optional[int] = None
+    group_id: Optional[int] = None
+    role: str
+    sender_id: Optional[str] = None  # 群聊发送者
+    snippet: str  # 命中片段，关键词以【】标出
+    create_time: datetime
+
+
+class MessageSearchResult(BaseModel):
+    items: List[MessageSearchHit]
+    next_cursor: Optional[str] = None
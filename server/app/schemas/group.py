@@ -7,6 +7,7 @@ MemberType = Literal["user", "friend"]
 MessageType = Literal["text", "system", "@"]
 SessionType = Literal["normal", "brainstorm", "decision", "debate"]
 DebateSide = Literal["affirmative", "negative"]
+MessageStatus = Literal["streaming", "complete"]
 
 # --- Group Member Schemas ---
 class GroupMemberBase(BaseModel):
@@ -44,6 +45,7 @@ class GroupMessageRead(GroupMessageBase):
     sender_id: str
     sender_type: MemberType
     session_type: Optional[SessionType] = None
+    status: MessageStatus = "complete"
     create_time: datetime
     update_time: datetime
 
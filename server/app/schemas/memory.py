@@ -28,3 +28,25 @@ class StatusResponse(BaseModel):
 
 class CreateProfileResponse(StatusResponse):
     ids: list[str]
+
+class GistCompactionFriendReport(BaseModel):
+    friend_id: str
+    gists_before: int
+    gists_after: int
+    clusters: int
+    merged: int
+    summarized: int
+    skipped: int
+    bytes_before: int
+    bytes_after: int
+    scan_ms_before: Optional[float] = None # 好友范围向量检索实测耗时（未加载 sqlite-vec 时为空）
+    scan_ms_after: Optional[float] = None # 按行数估算的压缩后耗时
+    applied: bool
+
+class GistCompactionResponse(BaseModel):
+    dry_run: bool
+    gists_before: int
+    gists_after: int
+    bytes_before: int
+    bytes_after: int
+    friends: list[GistCompactionFriendReport]
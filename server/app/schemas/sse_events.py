@@ -53,12 +53,23 @@ class UsageInfo(TypedDict):
     prompt_tokens: int
     completion_tokens: int
     total_tokens: int
+    cached_tokens: int
+    reasoning_tokens: int
+
+
+class GenerationMetricsInfo(TypedDict):
+    """本次生成的耗时统计（毫秒）"""
+    ttft_ms: Optional[int]  # 首 token 耗时，从任务开始计（含召回）
+    duration_ms: int
+    recall_ms: Optional[int]  # 未召回时为 None
+    recall_rounds: int
 
 
 class DoneEventData(TypedDict):
     """流结束事件数据"""
     finish_reason: Literal["stop", "length", "tool_calls", "error"]
     usage: Optional[UsageInfo]
+    metrics: Optional[GenerationMetricsInfo]
 
 
 class MetaParticipantsEventData(TypedDict):
@@ -1,3 +1,4 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import re
@@ -6,6 +7,7 @@ import time
 import logging
 import asyncio
 from asyncio import Queue
+from app.core.config import settings
 from app.models.chat import ChatSession, Message
 from app.models.friend import Friend
 from app.schemas import chat as chat_schemas
@@ -14,11 +16,21 @@ from app.services.recall_service import RecallService
 from app.services.settings_service import SettingsService
 from app.services import provider_rules
 from app.services.llm_service import llm_service
+from app.services.think_tag_parser import ThinkTagParser, MESSAGE
+from app.services.stream_persister import stream_persister
+from app.services.stream_hub import StreamWriter, stream_hub
+from app.services.context_window import KIND_CHAT, assemble_history, history_token_budget, summary_message
+from app.services.generation_metrics import GenerationTrace
+from app.services.prompt_layout import (
+    root_prompt_template,
+    turn_context_message,
+)
 from app.services.embedding_service import embedding_service
 from app.services.memo.bridge import MemoService
 from app.services.memo.constants import DEFAULT_USER_ID, DEFAULT_SPACE_ID
 from app.prompt import get_prompt
 from app.db.session import SessionLocal
+from app.core.coordination import SharedList
 import re
 
 def _strip_message_tags(content: Optional[str]) -> Optional[str]:
@@ -103,45 +115,44 @@ from agents.items import MessageOutputItem, ReasoningItem, ToolCallItem, ToolCal
 from agents.stream_events import RunItemStreamEvent
 
 # Global queue for memory generation tasks (processed by background worker)
-_memory_generation_queue: List[int] = []
+# 存放在协调后端中，多个 worker 共享同一队列
+_memory_generation_queue = SharedList("memory_generation_queue")
+
+
+def memory_queue_stats() -> tuple:
+    """(depth, age of the oldest entry in seconds) of the memory generation queue."""
+    ages = _memory_generation_queue.ages()
+    return len(ages), max(ages, default=0.0)
 
 def _schedule_memory_generation(db: Session, session_id: int):
     """
     调度一个会话的记忆生成任务。
-    由于在同步上下文中无法直接创建异步任务，这里将session_id添加到全局队列。
-    后台worker会定期检查队列并异步处理。
+    有运行中的事件循环时直接创建异步任务；否则将 session_id 添加到全局队列，
+    由后台 worker 定期检查队列并异步处理。
     """
-    if session_id not in _memory_generation_queue:
-        _memory_generation_queue.append(session_id)
-        logger.info(f"[Memory Queue] Session {session_id} added to memory generation queue. Queue size: {len(_memory_generation_queue)}")
-    
-    # 尝试直接调度异步任务（如果当前在主线程/有运行中的 loop）
     try:
         loop = asyncio.get_running_loop()
-        # 如果 loop 正在运行，尝试在该 loop 中创建任务
-        # 注意：此处准备数据以传递给异步函数
-        messages = db.query(Message).filter(Message.session_id == session_id, Message.deleted == False).order_by(Message.create_time.asc()).all()
-        session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
-        if not session: return
-        friend = db.query(Friend).filter(Friend.id == session.friend_id).first()
-        
-        openai_messages = [{"role": m.role, "content": m.content} for m in messages]
-        
-        # 使用 call_soon_threadsafe 或直接 create_task
-        # 如果在主线程，直接 create_task
-        loop.create_task(_archive_session_async(
-            session_id=session_id,
-            openai_messages=openai_messages,
-            friend_id=session.friend_id,
-            friend_name=friend.name if friend else "Unknown"
-        ))
-        logger.info(f"[Memory Queue] Session {session_id} async task created directly via running loop.")
-        # 从队列中移除，因为已经成功调度
-        if session_id in _memory_generation_queue:
-            _memory_generation_queue.remove(session_id)
     except RuntimeError:
-        # 没有运行中的循环，保留在队列中等待后台 worker
-        logger.info(f"[Memory Queue] No running loop. Session {session_id} stays in queue for background worker.")
+        # 没有运行中的循环（同步上下文），放入队列等待后台 worker
+        if _memory_generation_queue.add(session_id):
+            logger.info(f"[Memory Queue] Session {session_id} added to memory generation queue. Queue size: {len(_memory_generation_queue)}")
+        return
+
+    # 在事件循环上不读写协调后端的队列（SQLite 后端写入可能等文件锁），直接调度
+    messages = db.query(Message).filter(Message.session_id == session_id, Message.deleted == False).order_by(Message.create_time.asc()).all()
+    session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+    if not session: return
+    friend = db.query(Friend).filter(Friend.id == session.friend_id).first()
+
+    openai_messages = [{"role": m.role, "content": m.content} for m in messages]
+
+    loop.create_task(_archive_session_async(
+        session_id=session_id,
+        openai_messages=openai_messages,
+        friend_id=session.friend_id,
+        friend_name=friend.name if friend else "Unknown"
+    ))
+    logger.info(f"[Memory Queue] Session {session_id} async task created directly via running loop.")
 
 def get_sessions(db: Session, skip: int = 0, limit: int = 100) -> List[ChatSession]:
     """
@@ -244,36 +255,48 @@ def clear_friend_chat_history(db: Session, friend_id: int):
     清空与指定好友的所有聊天记录，并在清空前尝试归档现有记忆。
     同时删除 Memobase 中与该好友相关的 events 和 event_gists。
     """
-    # 1. 找到该好友所有未归档且未删除的会话
+    # 1. 找到该好友所有未删除的会话，并一次性统计各会话的消息数
     sessions = db.query(ChatSession).filter(
         ChatSession.friend_id == friend_id,
         ChatSession.deleted == False
     ).all()
-    
+    session_ids = [session.id for session in sessions]
+    msg_counts = dict(
+        db.query(Message.session_id, func.count(Message.id))
+        .filter(Message.session_id.in_(session_ids), Message.deleted == False)
+        .group_by(Message.session_id)
+        .all()
+    ) if session_ids else {}
+
+    skipped_ids = []
     for session in sessions:
         # 如果该会话尚未生成记忆，且包含至少2条消息，触发归档
-        if session.memory_generated == 0:
-            msg_count = db.query(Message).filter(
-                Message.session_id == session.id,
-                Message.deleted == False
-            ).count()
-            if msg_count >= 2:
-                logger.info(f"[Clear History] Archiving session {session.id} before deletion.")
-                archive_session(db, session.id)
-            else:
-                # 消息太少，直接标记为已生成记忆以便不再扫描
-                session.memory_generated = 1
-        
-        # 2. 标记会话为已删除
-        session.deleted = True
-        
-        # 3. 标记该会话下的所有消息为已删除
-        db.query(Message).filter(Message.session_id == session.id).update({"deleted": True})
+        if session.memory_generated != 0:
+            continue
+        if msg_counts.get(session.id, 0) >= 2:
+            logger.info(f"[Clear History] Archiving session {session.id} before deletion.")
+            archive_session(db, session.id)
+        else:
+            # 消息太少，直接标记为已生成记忆以便不再扫描
+            skipped_ids.append(session.id)
+
+    # 2. 批量标记会话与其下所有消息为已删除
+    if skipped_ids:
+        db.query(ChatSession).filter(ChatSession.id.in_(skipped_ids)).update(
+            {"memory_generated": 1}, synchronize_session=False
+        )
+    if session_ids:
+        db.query(ChatSession).filter(ChatSession.id.in_(session_ids)).update(
+            {"deleted": True}, synchronize_session=False
+        )
+        db.query(Message).filter(Message.session_id.in_(session_ids)).update(
+            {"deleted": True}, synchronize_session=False
+        )
     
     db.commit()
     logger.info(f"[Clear History] All chat history for friend {friend_id} has been cleared/archived.")
     
-    # 4. 调度 Memobase 记忆删除任务
+    # 3. 调度 Memobase 记忆删除任务
     _schedule_memory_deletion(friend_id)
 
 def _schedule_memory_deletion(friend_id: int):
@@ -683,13 +706,17 @@ async def _run_chat_generation_task(
     ai_msg_id: int,
     message_content: str,
     enable_thinking: bool,
-    queue: asyncio.Queue
+    queue: StreamWriter,
 ):
     """
     Background task to handle LLM generation and persistence.
     Decoupled from HTTP response to ensure completion even if client disconnects.
+    The profile injection stats are published as a ``profile`` event once the
+    profile section is chosen.
     """
     db = SessionLocal()
+    llm_lease = None
+    live_reply = None
     logger.info(f"[GenTask] Starting generation for Session {session_id}, AI Msg {ai_msg_id}")
     
     try:
@@ -703,6 +730,7 @@ async def _run_chat_generation_task(
             await queue.put({"event": "error", "data": {"code": "config_error", "detail": "LLM Config missing in background task"}})
             return
 
+        trace = GenerationTrace(KIND_CHAT, ai_msg_id, session_id, friend_id, llm_config)
         raw_model_name = llm_config.model_name
         model_name = llm_service.normalize_model_name(raw_model_name)
         force_thinking = provider_rules.is_gemini_model(llm_config, raw_model_name)
@@ -721,7 +749,7 @@ async def _run_chat_generation_task(
 
         show_thinking = enable_thinking
         
-        history = (
+        history_query = (
             db.query(Message)
             .filter(
                 Message.session_id == session_id, 
@@ -729,39 +757,34 @@ async def _run_chat_generation_task(
                 Message.id != user_msg_id,
                 Message.id != ai_msg_id
             )
-            .order_by(Message.create_time.desc())
-            .limit(10)
-            .all()
+            .order_by(Message.create_time.desc(), Message.id.desc())
+        )
+        history_window = assemble_history(
+            KIND_CHAT, chat_session, history_query, history_token_budget(raw_model_name)
         )
-        history.reverse()
+        history = history_window.messages
         
         profile_data = ""
         injected_recall_messages = []
         
         if enable_recall:
             try:
-                profiles = await MemoService.get_user_profiles(DEFAULT_USER_ID, DEFAULT_SPACE_ID)
-                if profiles and profiles.profiles:
-                    profile_lines = []
-                    for item in profiles.profiles:
-                        if not item or not item.content: continue
-                        attributes = item.attributes or {}
-                        topic = (attributes.get("topic") or "").strip()
-                        sub_topic = (attributes.get("sub_topic") or "").strip()
-                        if topic or sub_topic:
-                            profile_lines.append(f"- {topic}\t{sub_topic}\t{item.content.strip()}")
-                        else:
-                            profile_lines.append(f"- {item.content.strip()}")
-                    profile_data = "\n".join(profile_lines)
-                
                 messages_for_recall = [{"role": m.role, "content": m.content} for m in history]
                 messages_for_recall.append({"role": "user", "content": message_content})
                 
-                recall_result = await RecallService.perform_recall(
-                    db, DEFAULT_USER_ID, DEFAULT_SPACE_ID, messages_for_recall, friend_id
+                # 画像选择（查询向量往返）与召回并发，不再串行叠加在首 token 之前
+                trace.recall_started()
+                profile_selection, recall_result = await asyncio.gather(
+                    MemoService.select_profile_block(DEFAULT_USER_ID, DEFAULT_SPACE_ID, message_content),
+                    RecallService.perform_recall(
+                        db, DEFAULT_USER_ID, DEFAULT_SPACE_ID, messages_for_recall, friend_id
+                    ),
                 )
+                profile_data = profile_selection.text
+                await queue.put({"event": "profile", "data": profile_selection.stats()})
                 injected_recall_messages = recall_result.get("injected_messages", [])
                 footprints = recall_result.get("footprints", [])
+                trace.recall_finished(footprints)
                 
                 for fp in footprints:
                     if fp["type"] == "thinking" and show_thinking:
@@ -819,7 +842,7 @@ async def _run_chat_generation_task(
             pass
 
         try:
-            root_template = get_prompt("chat/root_system_prompt.txt")
+            root_template = root_prompt_template()
             final_instructions = root_template.replace("{{role-play-prompt}}", persona_prompt)
             final_instructions = final_instructions.replace("{{script-expression}}", f"\n\n{script_prompt}" if script_prompt else "")
             final_instructions = final_instructions.replace("{{user-profile}}", f"\n\n【用户信息】\n{profile_data}" if profile_data else "")
@@ -828,9 +851,10 @@ async def _run_chat_generation_task(
         except Exception:
             final_instructions = persona_prompt
             if script_prompt: final_instructions += f"\n\n{script_prompt}"
-            if profile_data: final_instructions += f"\n\n【用户信息】\n{profile_data}"
+            # 缓存布局下画像与时间由 turn_context_message 放在历史之后，这里不再重复
+            if profile_data and not settings.PROMPT_CACHE_LAYOUT: final_instructions += f"\n\n【用户信息】\n{profile_data}"
             if segment_prompt: final_instructions += f"\n\n{segment_prompt}"
-            final_instructions += f"\n\n【当前时间】\n{current_time}"
+            if not settings.PROMPT_CACHE_LAYOUT: final_instructions += f"\n\n【当前时间】\n{current_time}"
 
         tool_description = ""
         try:
@@ -839,24 +863,26 @@ async def _run_chat_generation_task(
             pass
 
         @function_tool(name_override="recall_memory", description_override=tool_description)
-        async def tool_recall(query: str):
+        async def tool_recall(queries: List[str]):
             if not enable_recall:
                 return {"events": []}
             if not embedding_service.get_active_setting(db):
                 return {"events": []}
             event_topk = SettingsService.get_setting(db, "memory", "event_topk", 5)
             threshold = SettingsService.get_setting(db, "memory", "similarity_threshold", 0.5)
-            return await MemoService.recall_memory(
-                user_id=DEFAULT_USER_ID,
-                space_id=DEFAULT_SPACE_ID,
-                query=query,
-                friend_id=friend_id,
-                topk_event=event_topk,
-                threshold=threshold,
+            return await RecallService.recall_queries(
+                DEFAULT_USER_ID, DEFAULT_SPACE_ID, queries, friend_id, event_topk, threshold
             )
 
         # 4. Run LLM
         agent_messages = [{"role": m.role, "content": m.content} for m in history]
+        summary_msg = summary_message(history_window.summary)
+        if summary_msg:
+            agent_messages.insert(0, summary_msg)
+        # 易变内容（时间 / 画像）放在历史之后，保证前缀跨轮稳定以命中供应商的前缀缓存
+        turn_context = turn_context_message(profile_data, current_time)
+        if turn_context:
+            agent_messages.append(turn_context)
         inject_as_tool = any(
             isinstance(msg, dict) and msg.get("type") in ("function_call", "function_call_output")
             for msg in injected_recall_messages
@@ -875,7 +901,7 @@ async def _run_chat_generation_task(
         top_p = friend.top_p if friend and friend.top_p is not None else 0.9
 
         use_litellm = provider_rules.should_use_litellm(llm_config, raw_model_name)
-        model_settings_kwargs = {}
+        model_settings_kwargs = {"include_usage": True}
         if _supports_sampling(model_name):
             model_settings_kwargs["temperature"] = temperature
             model_settings_kwargs["top_p"] = top_p
@@ -912,23 +938,22 @@ async def _run_chat_generation_task(
 
         full_ai_content = ""
         saved_content = ""
-        usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
         finish_reason = "stop"
         
-        buffer = ""
-        is_thinking_tag = False
+        think_parser = ThinkTagParser()
         has_reasoning_item = False
         think_fallback_buffer = ""
         tool_call_names = {}
-        THINK_START = "<think>"
-        THINK_END = "</think>"
         
+        llm_lease = await llm_service.acquire_slot(llm_config, final_instructions, agent_messages)
+        live_reply = stream_persister.begin(Message, ai_msg_id, db)
         result = Runner.run_streamed(
             agent,
             agent_messages,
             run_config=RunConfig(trace_include_sensitive_data=True),
         )
         async for event in result.stream_events():
+            trace.observe(event)
             if isinstance(event, RunItemStreamEvent) and event.name == "reasoning_item_created":
                 if enable_thinking and isinstance(event.item, ReasoningItem):
                     has_reasoning_item = True
@@ -981,55 +1006,29 @@ async def _run_chat_generation_task(
                 delta = event.data.delta
                 if delta:
                     full_ai_content += delta
-                    buffer += delta
-                    while buffer:
-                        if not is_thinking_tag:
-                            start_idx = buffer.find(THINK_START)
-                            if start_idx != -1:
-                                if start_idx > 0:
-                                    msg_delta = buffer[:start_idx]
-                                    saved_content += msg_delta
-                                    await queue.put({"event": "message", "data": {"delta": msg_delta}})
-                                buffer = buffer[start_idx + len(THINK_START):]
-                                is_thinking_tag = True
-                            else:
-                                if "<" not in buffer:
-                                    saved_content += buffer
-                                    await queue.put({"event": "message", "data": {"delta": buffer}})
-                                    buffer = ""
-                                else:
-                                    break
-                        else:
-                            end_idx = buffer.find(THINK_END)
-                            if end_idx != -1:
-                                if end_idx > 0 and enable_thinking and not has_reasoning_item:
-                                    think_fallback_buffer += buffer[:end_idx]
-                                buffer = buffer[end_idx + len(THINK_END):]
-                                is_thinking_tag = False
-                            else:
-                                if "</" not in buffer:
-                                    if enable_thinking and not has_reasoning_item:
-                                        think_fallback_buffer += buffer
-                                    buffer = ""
-                                else:
-                                    break
+                    for kind, span in think_parser.feed(delta):
+                        if kind == MESSAGE:
+                            saved_content += span
+                            stream_persister.append(live_reply, span)
+                            await queue.put({"event": "message", "data": {"delta": span}})
+                        elif enable_thinking and not has_reasoning_item:
+                            think_fallback_buffer += span
         
-        if buffer:
-            if is_thinking_tag and enable_thinking and not has_reasoning_item:
-                think_fallback_buffer += buffer
-            elif not is_thinking_tag:
-                saved_content += buffer
-                await queue.put({"event": "message", "data": {"delta": buffer}})
+        for kind, span in think_parser.flush():
+            if kind == MESSAGE:
+                saved_content += span
+                stream_persister.append(live_reply, span)
+                await queue.put({"event": "message", "data": {"delta": span}})
+            elif enable_thinking and not has_reasoning_item:
+                think_fallback_buffer += span
 
         if think_fallback_buffer and enable_thinking and not has_reasoning_item:
             await queue.put({"event": "model_thinking", "data": {"delta": think_fallback_buffer}})
 
-        # 5. Save to DB
-        ai_msg = db.query(Message).filter(Message.id == ai_msg_id).first()
-        if ai_msg:
-            ai_msg.content = saved_content if saved_content else "[No response]"
-            db.commit()
-            chat_session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+        # 5. Save to DB：最终内容与完成状态由 stream_persister.end 一次写入
+        stream_persister.end(live_reply, saved_content if saved_content else "[No response]")
+        chat_session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+        if chat_session:
             chat_session.update_time = datetime.now(timezone.utc)
             chat_session.last_message_time = datetime.now(timezone.utc)
             if chat_session.memory_generated != 0:
@@ -1037,12 +1036,14 @@ async def _run_chat_generation_task(
                 chat_session.memory_error = None
             db.commit()
 
-        usage["completion_tokens"] = len(full_ai_content)
+        usage, metrics = trace.finish(result, full_ai_content)
+        llm_service.release_slot(llm_lease, result, full_ai_content)
         await queue.put({
             "event": "done",
             "data": {
                 "finish_reason": finish_reason,
                 "usage": usage,
+                "metrics": metrics,
                 "message_id": ai_msg_id
             }
         })
@@ -1051,6 +1052,10 @@ async def _run_chat_generation_task(
         logger.error(f"[GenTask] Error: {e}", exc_info=True)
         await queue.put({"event": "error", "data": {"code": "task_error", "detail": str(e)}})
     finally:
+        if llm_lease:
+            llm_lease.release()
+        if live_reply:
+            stream_persister.end(live_reply)
         await queue.put(None)
         db.close()
 
@@ -1087,7 +1092,8 @@ async def send_message_stream(db: Session, session_id: int, message_in: chat_sch
     db.refresh(ai_msg)
 
     # 3. Start Background Generation Task
-    queue = asyncio.Queue()
+    # 事件经 stream_hub 扇出，断线重连 / 多标签页可按 Last-Event-ID 续接
+    stream = stream_hub.open(f"chat:{ai_msg.id}")
     asyncio.create_task(_run_chat_generation_task(
         session_id=session_id,
         friend_id=db_session.friend_id,
@@ -1095,10 +1101,10 @@ async def send_message_stream(db: Session, session_id: int, message_in: chat_sch
         ai_msg_id=ai_msg.id,
         message_content=message_in.content,
         enable_thinking=effective_enable_thinking,
-        queue=queue
+        queue=stream_hub.writer(stream),
     ))
 
-    # 4. Stream events from the queue
+    # 4. Stream events from the hub
     yield {
         "event": "start",
         "data": {
@@ -1107,14 +1113,11 @@ async def send_message_stream(db: Session, session_id: int, message_in: chat_sch
             "user_message_id": user_msg.id,
             "model": llm_config.model_name,
             "friend_id": db_session.friend_id,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc).isoformat(),
         }
     }
 
-    while True:
-        event = await queue.get()
-        if event is None: # Sentinel
-            break
+    async for event in stream_hub.subscribe(stream):
         yield event
 
 
@@ -1186,8 +1189,8 @@ async def regenerate_message_stream(db: Session, session_id: int, ai_message_id:
     db.refresh(new_ai_msg)
 
     # 6. Start Background Generation Task
-    queue = asyncio.Queue()
-    
+    stream = stream_hub.open(f"chat:{new_ai_msg.id}")
+
     # Get thinking mode from global settings (frontend handles UI toggle state)
     enable_thinking = SettingsService.get_setting(db, "chat", "enable_thinking", False)
     model_name = llm_config.model_name
@@ -1202,7 +1205,7 @@ async def regenerate_message_stream(db: Session, session_id: int, ai_message_id:
         ai_msg_id=new_ai_msg.id,
         message_content=last_user_msg.content, # Reuse last user content
         enable_thinking=enable_thinking, 
-        queue=queue
+        queue=stream_hub.writer(stream),
     ))
 
     # 7. Stream events
@@ -1214,14 +1217,11 @@ async def regenerate_message_stream(db: Session, session_id: int, ai_message_id:
             "user_message_id": last_user_msg.id,
             "model": llm_config.model_name,
             "friend_id": db_session.friend_id,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc).isoformat(),
         }
     }
 
-    while True:
-        event = await queue.get()
-        if event is None:
-            break
+    async for event in stream_hub.subscribe(stream):
         yield event
 
 
@@ -1269,14 +1269,11 @@ async def process_memory_queue(db: Session):
     处理全局记忆生成队列中的任务。
     由后台定时任务调用。
     """
-    global _memory_generation_queue
-    if not _memory_generation_queue:
+    # 原子地取出并清空队列，多个 worker 不会领到同一会话
+    batch = await _memory_generation_queue.adrain()
+    if not batch:
         return
     
-    # 拷贝当前队列并清空原队列
-    batch = list(_memory_generation_queue)
-    _memory_generation_queue.clear()
-    
     logger.info(f"[Memory Worker] Processing {len(batch)} sessions from queue: {batch}")
     
     for session_id in batch:
@@ -0,0 +1,312 @@
+"""
+Token-budgeted history window with a rolling per-session summary.
+
+History is filled newest → oldest until the per-model token budget is spent (token
+counts are cached on the message rows). Whatever falls out of the window is folded
+into ``context_summary`` on the session by a background task, so long sessions keep
+their gist while the prompt stays bounded.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy.orm import Query, Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.chat import ChatSession, Message
+from app.models.friend import Friend
+from app.models.group import GroupMessage, GroupSession
+from app.prompt import get_prompt
+from app.services import provider_rules
+from app.services.llm_service import llm_service
+from app.vendor.memobase_server.llms.rate_limiter import LLMPriority
+from app.vendor.memobase_server.utils import get_encoded_tokens
+
+from openai import AsyncOpenAI
+from agents import Agent, RunConfig, Runner, set_default_openai_api, set_default_openai_client
+
+logger = logging.getLogger(__name__)
+
+KIND_CHAT = "chat"
+KIND_GROUP = "group"
+SUMMARY_PREFIX = "【早前对话摘要】"
+
+_PAGE_SIZE = 20
+# (kind, session_id) 正在生成摘要的会话，避免同一会话并发刷新
+_summary_tasks: Set[Tuple[str, int]] = set()
+# (kind, session_id) -> 当前历史窗口起点消息 id（缓存友好布局下尽量保持不动）；
+# 只保留最近使用的会话，被淘汰的会话下次溢出时重新定位起点
+_window_starts: "OrderedDict[Tuple[str, int], int]" = OrderedDict()
+_WINDOW_START_CACHE_SIZE = 1024
+
+
+class HistoryWindow(NamedTuple):
+    """Messages (oldest first) that fit the budget, plus the summary of older ones."""
+    messages: list
+    token_count: int
+    summary: str
+    overflow_until_id: Optional[int]
+
+
+def message_token_count(msg) -> int:
+    """Token count of a message, cached on the row once the message is complete."""
+    if msg.token_count is not None:
+        return msg.token_count
+    count = len(get_encoded_tokens(msg.content)) if msg.content else 0
+    if msg.status == "complete":
+        msg.token_count = count
+    return count
+
+
+def history_token_budget(model_name: Optional[str]) -> int:
+    """History budget for a model: longest matching prefix override, else the default."""
+    name = (model_name or "").lower()
+    best_prefix, best_budget = "", settings.CONTEXT_HISTORY_TOKEN_BUDGET
+    for prefix, budget in settings.CONTEXT_HISTORY_MODEL_BUDGETS.items():
+        if name.startswith(prefix.lower()) and len(prefix) > len(best_prefix):
+            best_prefix, best_budget = prefix, budget
+    return best_budget
+
+
+def _iter_newest_first(query: Query, limit: int) -> Iterator:
+    offset = 0
+    while offset < limit:
+        page = query.offset(offset).limit(min(_PAGE_SIZE, limit - offset)).all()
+        if not page:
+            return
+        yield from page
+        offset += len(page)
+
+
+def _anchor_window(
+    kind: str,
+    session_id: int,
+    candidates: List[Tuple[object, int]],
+    overflow_until_id: int,
+    budget: int,
+) -> Tuple[List[Tuple[object, int]], int]:
+    """
+    Keep the window's first message fixed across turns so the prompt prefix stays
+    cacheable. Only when the old start no longer fits is it moved, in one jump, to
+    leave (1 - CONTEXT_WINDOW_REANCHOR_RATIO) of the budget free for the next turns.
+    """
+    key = (kind, session_id)
+    start_id = _window_starts.get(key)
+    if start_id is not None:
+        _window_starts.move_to_end(key)
+    if start_id is None or start_id < candidates[-1][0].id:
+        reduced = max(1, int(budget * settings.CONTEXT_WINDOW_REANCHOR_RATIO))
+        kept = 0
+        used = 0
+        for msg, tokens in candidates:
+            if kept and used + tokens > reduced:
+                break
+            kept += 1
+            used += tokens
+        start_id = candidates[kept - 1][0].id
+        _window_starts[key] = start_id
+        _window_starts.move_to_end(key)
+        while len(_window_starts) > _WINDOW_START_CACHE_SIZE:
+            _window_starts.popitem(last=False)
+
+    while len(candidates) > 1 and candidates[-1][0].id < start_id:
+        overflow_until_id = candidates.pop()[0].id
+    return candidates, overflow_until_id
+
+
+def assemble_history(
+    kind: str,
+    owner,
+    query: Query,
+    budget: int,
+    max_messages: Optional[int] = None,
+) -> HistoryWindow:
+    """
+    Fill ``budget`` tokens from ``query`` (newest-first history of ``owner``'s session).
+    The newest message is always kept. When older messages overflow and enough of them
+    are not yet summarised, a background summary refresh is scheduled. Token counts
+    cached on the rows are left pending on the caller's session for it to commit.
+    """
+    max_messages = max_messages or settings.CONTEXT_HISTORY_MAX_MESSAGES
+    candidates: List[Tuple[object, int]] = []  # newest first
+    used = 0
+    overflow_until_id = None
+
+    for msg in _iter_newest_first(query, max_messages + 1):
+        tokens = message_token_count(msg)
+        if len(candidates) >= max_messages or (candidates and used + tokens > budget):
+            overflow_until_id = msg.id
+            break
+        candidates.append((msg, tokens))
+        used += tokens
+
+    if owner is not None and overflow_until_id is not None and settings.PROMPT_CACHE_LAYOUT:
+        candidates, overflow_until_id = _anchor_window(kind, owner.id, candidates, overflow_until_id, budget)
+        used = sum(tokens for _, tokens in candidates)
+    window = [msg for msg, _ in reversed(candidates)]
+
+    summary = (owner.context_summary or "") if owner is not None else ""
+    if owner is not None and overflow_until_id is not None:
+        summarized_until = owner.context_summary_until_id or 0
+        if overflow_until_id > summarized_until:
+            model = query.column_descriptions[0]["entity"]
+            pending = query.filter(model.id > summarized_until, model.id <= overflow_until_id).count()
+            if pending >= settings.CONTEXT_SUMMARY_MIN_MESSAGES:
+                schedule_summary_refresh(kind, owner.id, overflow_until_id)
+
+    return HistoryWindow(window, used, summary, overflow_until_id)
+
+
+def summary_message(summary: str) -> Optional[dict]:
+    if not summary:
+        return None
+    return {"role": "system", "content": f"{SUMMARY_PREFIX}\n{summary}"}
+
+
+# --- Rolling summary -------------------------------------------------------
+
+def _chat_lines(db: Session, owner: ChatSession, after_id: int, until_id: int, limit: int) -> List[Tuple[int, str]]:
+    friend = db.query(Friend).filter(Friend.id == owner.friend_id).first()
+    friend_name = friend.name if friend else "AI"
+    msgs = (
+        db.query(Message)
+        .filter(
+            Message.session_id == owner.id,
+            Message.deleted == False,
+            Message.id > after_id,
+            Message.id <= until_id,
+        )
+        .order_by(Message.id.asc())
+        .limit(limit)
+        .all()
+    )
+    return [(m.id, f"{'我' if m.role == 'user' else friend_name}: {m.content}") for m in msgs if m.content]
+
+
+def _group_lines(db: Session, owner: GroupSession, after_id: int, until_id: int, limit: int) -> List[Tuple[int, str]]:
+    msgs = (
+        db.query(GroupMessage)
+        .filter(
+            GroupMessage.session_id == owner.id,
+            GroupMessage.id > after_id,
+            GroupMessage.id <= until_id,
+        )
+        .order_by(GroupMessage.id.asc())
+        .limit(limit)
+        .all()
+    )
+    friend_ids = set()
+    for m in msgs:
+        if m.sender_type == "friend":
+            try:
+                friend_ids.add(int(m.sender_id))
+            except (ValueError, TypeError):
+                continue
+    names: Dict[str, str] = {}
+    if friend_ids:
+        for f in db.query(Friend).filter(Friend.id.in_(friend_ids)).all():
+            names[str(f.id)] = f.name
+    return [
+        (m.id, f"{'我' if m.sender_type == 'user' else names.get(m.sender_id, '未知')}: {m.content}")
+        for m in msgs
+        if m.content
+    ]
+
+
+_KINDS: Dict[str, Tuple[type, Callable]] = {
+    KIND_CHAT: (ChatSession, _chat_lines),
+    KIND_GROUP: (GroupSession, _group_lines),
+}
+
+
+def schedule_summary_refresh(kind: str, session_id: int, until_id: int) -> None:
+    key = (kind, session_id)
+    if key in _summary_tasks:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        logger.warning("[ContextWindow] No running loop; skip summary refresh")
+        return
+    _summary_tasks.add(key)
+    loop.create_task(_refresh_summary(kind, session_id, until_id))
+
+
+async def _summarize(llm_config, previous: str, lines: List[str]) -> str:
+    instructions = get_prompt("chat/context_summary.txt").strip()
+    user_input = f"【已有摘要】\n{previous or '(无)'}\n\n【新增对话】\n" + "\n".join(lines)
+
+    client = AsyncOpenAI(base_url=llm_config.base_url, api_key=llm_config.api_key)
+    set_default_openai_client(client, use_for_tracing=True)
+    set_default_openai_api("chat_completions")
+
+    raw_model_name = llm_config.model_name
+    if provider_rules.should_use_litellm(llm_config, raw_model_name):
+        from agents.extensions.models.litellm_model import LitellmModel
+        agent_model = LitellmModel(
+            model=provider_rules.normalize_gemini_model_name(raw_model_name),
+            base_url=provider_rules.normalize_gemini_base_url(llm_config.base_url),
+            api_key=llm_config.api_key,
+        )
+    else:
+        agent_model = llm_service.normalize_model_name(raw_model_name)
+
+    agent = Agent(name="ContextSummarizer", instructions=instructions, model=agent_model)
+    lease = await llm_service.acquire_slot(
+        llm_config, instructions, [{"role": "user", "content": user_input}], priority=LLMPriority.BACKGROUND
+    )
+    result = None
+    try:
+        result = await Runner.run(agent, user_input, run_config=RunConfig(trace_include_sensitive_data=True))
+    finally:
+        llm_service.release_slot(lease, result)
+    return (result.final_output or "").strip()
+
+
+async def _refresh_summary(kind: str, session_id: int, until_id: int) -> None:
+    owner_model, load_lines = _KINDS[kind]
+    try:
+        with SessionLocal() as db:
+            owner = db.query(owner_model).filter(owner_model.id == session_id).first()
+            llm_config = llm_service.get_active_config(db)
+            if owner is None or llm_config is None:
+                return
+            after_id = owner.context_summary_until_id or 0
+            if after_id >= until_id:
+                return
+            previous = owner.context_summary or ""
+            rows = load_lines(db, owner, after_id, until_id, settings.CONTEXT_HISTORY_MAX_MESSAGES)
+
+        # 单次摘要的输入也受 token 上限约束，剩下的留给下一轮
+        lines: List[str] = []
+        used = 0
+        covered_until = after_id
+        for msg_id, line in rows:
+            tokens = len(get_encoded_tokens(line))
+            if lines and used + tokens > settings.CONTEXT_SUMMARY_INPUT_TOKENS:
+                break
+            lines.append(line)
+            used += tokens
+            covered_until = msg_id
+        if len(rows) < settings.CONTEXT_HISTORY_MAX_MESSAGES and len(lines) == len(rows):
+            covered_until = until_id
+
+        summary = await _summarize(llm_config, previous, lines) if lines else previous
+        if lines and not summary:
+            return
+
+        with SessionLocal() as db:
+            owner = db.query(owner_model).filter(owner_model.id == session_id).first()
+            # 期间被别的刷新推进过就放弃本次结果
+            if owner is None or (owner.context_summary_until_id or 0) != after_id:
+                return
+            owner.context_summary = summary
+            owner.context_summary_until_id = covered_until
+            db.commit()
+        logger.info(f"[ContextWindow] {kind} session {session_id} summarized up to message {covered_until}")
+    except Exception as e:
+        logger.warning(f"[ContextWindow] Summary refresh failed for {kind} session {session_id}: {e}")
+    finally:
+        _summary_tasks.discard((kind, session_id))
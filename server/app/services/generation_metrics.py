@@ -0,0 +1,200 @@
+"""
+Per-reply usage and latency accounting.
+
+A ``GenerationTrace`` is opened when an AI reply starts (chat, group or auto-drive).
+It notes the recall phase and the first streamed token; ``finish`` resolves the
+provider usage of the run and hands one ``generation_metrics`` row to a worker
+thread, so the stream never waits on the write.
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core import metrics as app_metrics
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.db.types import utc_now
+from app.models.friend import Friend
+from app.models.generation_metric import GenerationMetric
+from app.services.prompt_layout import usage_from_result
+from app.vendor.memobase_server.utils import get_encoded_tokens
+
+logger = logging.getLogger(__name__)
+
+GROUP_BY_FRIEND = "friend"
+GROUP_BY_MODEL = "model"
+GROUP_BY_DAY = "day"
+
+# 尚未落库的写入任务，持有引用以免被 GC 回收
+_pending_writes: Set[asyncio.Task] = set()
+
+
+def _ms(seconds: float) -> int:
+    return int(round(seconds * 1000))
+
+
+def is_token_event(event: Any) -> bool:
+    """First streamed output of any kind: text, reasoning or tool-call arguments."""
+    if getattr(event, "type", None) != "raw_response_event":
+        return False
+    return str(getattr(event.data, "type", "")).endswith(".delta")
+
+
+class GenerationTrace:
+    """Timing marks of one AI reply (monotonic clock, reported in milliseconds)."""
+
+    def __init__(
+        self,
+        kind: str,
+        message_id: int,
+        session_id: Optional[int],
+        friend_id: Optional[int],
+        llm_config: Any = None,
+    ) -> None:
+        self.kind = kind
+        self.message_id = message_id
+        self.session_id = session_id
+        self.friend_id = friend_id
+        self.provider = getattr(llm_config, "provider", None)
+        self.model = getattr(llm_config, "model_name", None)
+        self.started_at = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.recall_ms: Optional[int] = None
+        self.recall_rounds = 0
+        self._recall_started_at: Optional[float] = None
+
+    def recall_started(self) -> None:
+        self._recall_started_at = time.monotonic()
+
+    def recall_finished(self, footprints: List[dict]) -> None:
+        if self._recall_started_at is None:
+            return
+        self.recall_ms = _ms(time.monotonic() - self._recall_started_at)
+        self.recall_rounds = sum(1 for fp in footprints if fp.get("type") == "tool_call")
+
+    def observe(self, event: Any) -> None:
+        if self.first_token_at is None and is_token_event(event):
+            self.first_token_at = time.monotonic()
+
+    def metrics(self) -> Dict[str, Optional[int]]:
+        return {
+            "ttft_ms": _ms(self.first_token_at - self.started_at) if self.first_token_at is not None else None,
+            "duration_ms": _ms(time.monotonic() - self.started_at),
+            "recall_ms": self.recall_ms,
+            "recall_rounds": self.recall_rounds,
+        }
+
+    def finish(self, result: Any, content: str) -> Tuple[Dict[str, int], Dict[str, Optional[int]]]:
+        """
+        Resolve usage and timings of the finished run and record them.
+        Without provider usage the completion is counted with the local tokenizer.
+        """
+        usage = usage_from_result(result)
+        estimated = not usage["total_tokens"]
+        if estimated:
+            completion = len(get_encoded_tokens(content)) if content else 0
+            usage["completion_tokens"] = completion
+            usage["total_tokens"] = completion
+        metrics = self.metrics()
+        app_metrics.observe_generation(self.kind, self.provider, metrics)
+        record_metric({
+            "kind": self.kind,
+            "message_id": self.message_id,
+            "session_id": self.session_id,
+            "friend_id": self.friend_id,
+            "provider": self.provider,
+            "model": self.model,
+            "prompt_tokens": usage["prompt_tokens"],
+            "completion_tokens": usage["completion_tokens"],
+            "cached_tokens": usage["cached_tokens"],
+            "reasoning_tokens": usage["reasoning_tokens"],
+            "usage_estimated": int(estimated),
+            **metrics,
+        })
+        return usage, metrics
+
+
+def _write_metric(row: Dict[str, Any]) -> None:
+    try:
+        with SessionLocal() as db:
+            db.add(GenerationMetric(**row))
+            db.commit()
+    except Exception as e:
+        logger.warning(f"[GenerationMetrics] Failed to record message {row.get('message_id')}: {e}")
+
+
+def record_metric(row: Dict[str, Any]) -> None:
+    if not settings.GENERATION_METRICS_ENABLED:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _write_metric(row)
+        return
+    task = loop.create_task(asyncio.to_thread(_write_metric, row))
+    _pending_writes.add(task)
+    task.add_done_callback(_pending_writes.discard)
+
+
+async def flush_pending() -> None:
+    """Wait for metric rows that are still being written."""
+    if _pending_writes:
+        await asyncio.gather(*list(_pending_writes), return_exceptions=True)
+
+
+def aggregate(db: Session, group_by: str, days: int = 7) -> List[Dict[str, Any]]:
+    """Totals and averages over the last ``days`` days, bucketed by friend, model or UTC day."""
+    columns = {
+        GROUP_BY_FRIEND: GenerationMetric.friend_id,
+        GROUP_BY_MODEL: GenerationMetric.model,
+        GROUP_BY_DAY: func.date(GenerationMetric.create_time),
+    }
+    key = columns[group_by].label("key")
+    rows = (
+        db.query(
+            key,
+            func.count(GenerationMetric.id),
+            func.sum(GenerationMetric.prompt_tokens),
+            func.sum(GenerationMetric.completion_tokens),
+            func.sum(GenerationMetric.cached_tokens),
+            func.sum(GenerationMetric.reasoning_tokens),
+            func.avg(GenerationMetric.ttft_ms),
+            func.avg(GenerationMetric.duration_ms),
+            func.avg(GenerationMetric.recall_ms),
+            func.sum(GenerationMetric.recall_rounds),
+        )
+        .filter(GenerationMetric.create_time >= utc_now() - timedelta(days=days))
+        .group_by(key)
+        .order_by(key)
+        .all()
+    )
+
+    names: Dict[int, str] = {}
+    if group_by == GROUP_BY_FRIEND:
+        friend_ids = [row[0] for row in rows if row[0] is not None]
+        if friend_ids:
+            names = {f.id: f.name for f in db.query(Friend).filter(Friend.id.in_(friend_ids)).all()}
+
+    buckets = []
+    for bucket, count, prompt, completion, cached, reasoning, ttft, duration, recall, rounds in rows:
+        prompt = prompt or 0
+        buckets.append({
+            "key": None if bucket is None else str(bucket),
+            "label": names.get(bucket) if group_by == GROUP_BY_FRIEND else None,
+            "requests": count,
+            "prompt_tokens": prompt,
+            "completion_tokens": completion or 0,
+            "cached_tokens": cached or 0,
+            "reasoning_tokens": reasoning or 0,
+            "cache_hit_rate": round((cached or 0) / prompt, 4) if prompt else 0.0,
+            "avg_ttft_ms": None if ttft is None else round(ttft, 1),
+            "avg_duration_ms": None if duration is None else round(duration, 1),
+            "avg_recall_ms": None if recall is None else round(recall, 1),
+            "recall_rounds": rounds or 0,
+        })
+    return buckets
@@ -7,6 +7,7 @@ from typing import Dict, List, Optional, AsyncGenerator, Tuple
 
 from sqlalchemy.orm import Session
 
+from app.core.coordination import ChannelWriter, get_backend, worker_id
 from app.db.session import SessionLocal
 from app.models.friend import Friend
 from app.models.group import GroupMember, GroupMessage, GroupSession, GroupAutoDriveRun
@@ -14,6 +15,9 @@ from app.prompt import get_prompt
 from app.schemas import group_auto_drive as ad_schemas
 from app.services import group_chat_shared, provider_rules
 from app.services.llm_service import llm_service
+from app.services.context_window import KIND_GROUP
+from app.services.generation_metrics import GenerationTrace
+from app.services.prompt_layout import root_prompt_template, turn_context_message
 from app.services.memo.constants import DEFAULT_USER_ID
 
 from openai import AsyncOpenAI
@@ -22,6 +26,25 @@ from agents import Agent, ModelSettings, function_tool, set_default_openai_clien
 
 logger = logging.getLogger(__name__)
 
+# 运行登记的过期时间：持有运行的 worker 异常退出时，登记最终自动失效
+RUN_REGISTRY_TTL_SECONDS = 24 * 3600
+
+COMMAND_PAUSE = "pause"
+COMMAND_RESUME = "resume"
+COMMAND_STOP = "stop"
+
+
+def _event_channel(group_id: int) -> str:
+    return f"auto_drive:events:{group_id}"
+
+
+def _control_channel(group_id: int) -> str:
+    return f"auto_drive:control:{group_id}"
+
+
+def _registry_key(group_id: int) -> str:
+    return f"auto_drive:run:{group_id}"
+
 
 def _model_base_name(model_name: Optional[str]) -> str:
     if not model_name:
@@ -39,11 +62,13 @@ class AutoDriveRuntime:
     group_id: int
     session_id: int
     enable_thinking: bool
-    queue: asyncio.Queue
+    # 事件发布到协调后端的频道，任意 worker 上的 SSE 连接都能订阅
+    queue: ChannelWriter
     pause_event: asyncio.Event
     stop_event: asyncio.Event
     pause_requested: bool = False
     task: Optional[asyncio.Task] = None
+    control_task: Optional[asyncio.Task] = None
 
 
 class GroupAutoDriveService:
@@ -318,34 +343,83 @@ class GroupAutoDriveService:
         db.commit()
         db.refresh(run)
 
+        backend = get_backend()
         runtime = AutoDriveRuntime(
             run_id=run.id,
             group_id=group_id,
             session_id=session.id,
             enable_thinking=enable_thinking,
-            queue=asyncio.Queue(),
+            queue=ChannelWriter(_event_channel(group_id)),
             pause_event=asyncio.Event(),
             stop_event=asyncio.Event(),
         )
         runtime.pause_event.set()
-        runtime.task = asyncio.create_task(self._run_auto_drive_loop(run.id))
+        # 登记本次运行：SSE 从 after_id 之后回放，其它 worker 的暂停 / 停止请求经控制频道转发
+        after_id = await backend.acall("last_id", _event_channel(group_id))
+        await backend.acall(
+            "set",
+            _registry_key(group_id),
+            {"run_id": run.id, "worker": worker_id(), "after_id": after_id},
+            ex=RUN_REGISTRY_TTL_SECONDS,
+        )
         self._runtimes[group_id] = runtime
+        runtime.control_task = asyncio.create_task(self._listen_control(runtime))
+        runtime.task = asyncio.create_task(self._run_auto_drive_loop(run.id))
 
         await runtime.queue.put({"event": "auto_drive_state", "data": self._state_payload(run)})
 
         return self._to_state_read(run)
 
-    async def stream_auto_drive(self, group_id: int) -> AsyncGenerator[dict, None]:
-        runtime = self._runtimes.get(group_id)
-        if not runtime:
+    async def stream_auto_drive(self, group_id: int, last_event_id: Optional[int] = None) -> AsyncGenerator[dict, None]:
+        """
+        Events of the group's active run, from its start or after ``last_event_id``
+        (channel message ids double as SSE ids). Any number of clients can follow a run.
+        """
+        backend = get_backend()
+        registration = await backend.acall("get", _registry_key(group_id))
+        if not registration:
             yield {"event": "auto_drive_error", "data": {"detail": "No active auto-drive"}}
             return
 
-        while True:
-            event = await runtime.queue.get()
+        after_id = registration["after_id"]
+        if last_event_id is not None and last_event_id > after_id:
+            after_id = last_event_id
+        async for message_id, event in backend.subscribe(_event_channel(group_id), after_id=after_id):
             if event is None:
                 break
-            yield event
+            yield {**event, "id": message_id}
+
+    @staticmethod
+    def _apply_command(runtime: AutoDriveRuntime, command: Optional[str]) -> None:
+        if command == COMMAND_PAUSE:
+            runtime.pause_requested = True
+        elif command == COMMAND_RESUME:
+            # 清掉挂起的暂停请求，避免恢复后再次被下一次检查拉回暂停态
+            runtime.pause_requested = False
+            runtime.pause_event.set()
+        elif command == COMMAND_STOP:
+            runtime.stop_event.set()
+            runtime.pause_event.set()
+
+    async def _listen_control(self, runtime: AutoDriveRuntime) -> None:
+        """Applies commands issued on other workers to the run owned by this one."""
+        async for _, message in get_backend().subscribe(_control_channel(runtime.group_id)):
+            self._apply_command(runtime, (message or {}).get("command"))
+
+    async def _signal(self, group_id: int, command: str, run: GroupAutoDriveRun) -> None:
+        backend = get_backend()
+        if not await backend.acall("get", _registry_key(group_id)):
+            return
+        runtime = self._runtimes.get(group_id)
+        if runtime:
+            self._apply_command(runtime, command)
+            # 经本 worker 的 writer 发出，保持与运行中事件的顺序
+            await runtime.queue.put({"event": "auto_drive_state", "data": self._state_payload(run)})
+            return
+        await backend.acall("publish", _control_channel(group_id), {"command": command})
+        await backend.acall(
+            "publish", _event_channel(group_id), {"event": "auto_drive_state", "data": self._state_payload(run)}
+        )
 
     async def pause_auto_drive(self, db: Session, group_id: int) -> ad_schemas.AutoDriveStateRead:
         run = self._get_active_run(db, group_id)
@@ -358,10 +432,7 @@ class GroupAutoDriveService:
         db.commit()
         db.refresh(run)
 
-        runtime = self._runtimes.get(group_id)
-        if runtime:
-            runtime.pause_requested = True
-            await runtime.queue.put({"event": "auto_drive_state", "data": self._state_payload(run)})
+        await self._signal(group_id, COMMAND_PAUSE, run)
 
         return self._to_state_read(run)
 
@@ -376,12 +447,7 @@ class GroupAutoDriveService:
         db.commit()
         db.refresh(run)
 
-        runtime = self._runtimes.get(group_id)
-        if runtime:
-            # 清掉挂起的暂停请求，避免恢复后再次被下一次检查拉回暂停态
-            runtime.pause_requested = False
-            runtime.pause_event.set()
-            await runtime.queue.put({"event": "auto_drive_state", "data": self._state_payload(run)})
+        await self._signal(group_id, COMMAND_RESUME, run)
 
         return self._to_state_read(run)
 
@@ -402,11 +468,7 @@ class GroupAutoDriveService:
             session.update_time = run.ended_at
             db.commit()
 
-        runtime = self._runtimes.get(group_id)
-        if runtime:
-            runtime.stop_event.set()
-            runtime.pause_event.set()
-            await runtime.queue.put({"event": "auto_drive_state", "data": self._state_payload(run)})
+        await self._signal(group_id, COMMAND_STOP, run)
 
         return self._to_state_read(run)
 
@@ -822,16 +884,18 @@ class GroupAutoDriveService:
             await runtime.queue.put({"event": "auto_drive_error", "data": {"detail": "LLM Config missing"}})
             return
 
+        trace = GenerationTrace(KIND_GROUP, ai_msg_id, run.session_id, friend.id, llm_config)
         raw_model_name = llm_config.model_name
         model_name = llm_service.normalize_model_name(raw_model_name)
 
-        history_msgs = group_chat_shared.fetch_group_history(
+        history_window = group_chat_shared.fetch_group_history_window(
             db=db,
             group_id=run.group_id,
             session_id=run.session_id,
             before_id=user_msg_id,
-            limit=15,
+            model_name=raw_model_name,
         )
+        history_msgs = history_window.messages
 
         name_map = group_chat_shared.build_name_map(
             db=db,
@@ -873,7 +937,7 @@ class GroupAutoDriveService:
             pass
 
         try:
-            root_template = get_prompt("chat/root_system_prompt.txt")
+            root_template = root_prompt_template()
             final_instructions = group_chat_shared.build_system_prompt(
                 root_template=root_template,
                 persona_prompt=persona_prompt,
@@ -905,6 +969,8 @@ class GroupAutoDriveService:
             current_other_members=current_other_members,
             mention_result=mention_result,
             injected_recall_messages=None,
+            summary=history_window.summary,
+            turn_context=turn_context_message("", current_time),
         )
 
         logger.info(
@@ -927,7 +993,7 @@ class GroupAutoDriveService:
         temperature = friend.temperature if friend.temperature is not None else 0.8
         top_p = friend.top_p if friend.top_p is not None else 0.9
 
-        model_settings_kwargs = {}
+        model_settings_kwargs = {"include_usage": True}
         if _supports_sampling(model_name):
             model_settings_kwargs["temperature"] = temperature
             model_settings_kwargs["top_p"] = top_p
@@ -957,16 +1023,22 @@ class GroupAutoDriveService:
             ),
         )
 
-        await group_chat_shared.stream_llm_to_queue(
-            agent=agent,
-            agent_messages=agent_messages,
-            queue=runtime.queue,
-            enable_thinking=enable_thinking,
-            sender_id=friend.id,
-            message_id=ai_msg_id,
-            session_id=run.session_id,
-            db=db,
-        )
+        lease = await llm_service.acquire_slot(llm_config, final_instructions, agent_messages)
+        try:
+            await group_chat_shared.stream_llm_to_queue(
+                agent=agent,
+                agent_messages=agent_messages,
+                queue=runtime.queue,
+                enable_thinking=enable_thinking,
+                sender_id=friend.id,
+                message_id=ai_msg_id,
+                session_id=run.session_id,
+                db=db,
+                trace=trace,
+                lease=lease,
+            )
+        finally:
+            lease.release()
 
     async def _update_state(
         self,
@@ -1034,6 +1106,14 @@ class GroupAutoDriveService:
                 break
         if runtime:
             await runtime.queue.put(None)
+            # 结束标记写入频道后再注销，晚到的订阅者不会错过它
+            await runtime.queue.flush()
+            if runtime.control_task:
+                runtime.control_task.cancel()
+            backend = get_backend()
+            registration = await backend.acall("get", _registry_key(runtime.group_id))
+            if registration and registration.get("run_id") == run_id:
+                await backend.acall("delete", _registry_key(runtime.group_id))
 
     async def _ensure_run_closed(self, run_id: int) -> None:
         try:
@@ -14,6 +14,10 @@ from app.services.settings_service import SettingsService
 from app.services.embedding_service import embedding_service
 from app.services import provider_rules
 from app.services import group_chat_shared
+from app.services.context_window import KIND_GROUP
+from app.services.generation_metrics import GenerationTrace
+from app.services.stream_hub import StreamWriter, stream_hub
+from app.services.prompt_layout import root_prompt_template, turn_context_message
 from app.prompt import get_prompt
 from app.db.session import SessionLocal
 from app.services.memo.constants import DEFAULT_USER_ID, DEFAULT_SPACE_ID
@@ -311,12 +315,18 @@ class GroupChatService:
 
         agent = Agent(name="GroupManager", instructions=manager_prompt, model=agent_model, model_settings=model_settings)
 
+        manager_messages = few_shots + [{"role": "user", "content": user_prompt}]
         try:
-            result = await Runner.run(
-                agent,
-                few_shots + [{"role": "user", "content": user_prompt}],
-                run_config=RunConfig(trace_include_sensitive_data=True),
-            )
+            lease = await llm_service.acquire_slot(llm_config, manager_prompt, manager_messages)
+            result = None
+            try:
+                result = await Runner.run(
+                    agent,
+                    manager_messages,
+                    run_config=RunConfig(trace_include_sensitive_data=True),
+                )
+            finally:
+                llm_service.release_slot(lease, result)
             raw_output = (result.final_output or "").strip()
         except Exception as e:
             logger.error(f"[GroupManager] LLM call failed: {e}")
@@ -373,6 +383,17 @@ class GroupChatService:
         llm_config = llm_service.get_active_config(db)
         model_name = llm_config.model_name if llm_config else "unknown"
 
+        # 画像按本条消息挑选，各成员的生成任务会命中同一份 query 向量缓存
+        profile_stats = None
+        if SettingsService.get_setting(db, "memory", "recall_enabled", True) and embedding_service.get_active_setting(db):
+            try:
+                profile_selection = await MemoService.select_profile_block(
+                    DEFAULT_USER_ID, DEFAULT_SPACE_ID, message_in.content, style="content"
+                )
+                profile_stats = profile_selection.stats()
+            except Exception as e:
+                logger.warning(f"[GroupChat] Profile selection failed: {e}")
+
         # 发送起始事件 (FE expects group_id and message_id)
         yield {
             "event": "start", 
@@ -380,7 +401,8 @@ class GroupChatService:
                 "message_id": db_message.id, 
                 "group_id": group_id,
                 "session_id": session.id,
-                "model": model_name
+                "model": model_name,
+                "profile": profile_stats,
             }
         }
 
@@ -427,8 +449,6 @@ class GroupChatService:
         yield {"event": "meta_participants", "data": meta_payload}
 
         # 3. 为每个参与回复的 AI 创建任务
-        queue = asyncio.Queue()
-        
         # 获取思考模式设置
         enable_thinking = message_in.enable_thinking
         if llm_config and enable_thinking and not llm_config.capability_reasoning:
@@ -437,18 +457,27 @@ class GroupChatService:
              if not force_thinking:
                  enable_thinking = False
 
-        active_tasks = []
-        for friend in participants:
-            # 为 AI 创建消息占位符
-            db_ai_msg = group_chat_shared.create_ai_placeholder(
+        # 为 AI 创建消息占位符
+        placeholders = [
+            group_chat_shared.create_ai_placeholder(
                 db=db,
                 group_id=group_id,
                 session_id=session.id,
                 friend_id=friend.id,
                 message_type="text",
             )
-            
-            task = asyncio.create_task(GroupChatService._run_group_ai_generation_task(
+            for friend in participants
+        ]
+
+        # 所有成员的事件汇入同一个流，每个任务结束时写入 None；
+        # 按各条 AI 消息 id 注册别名，供单条回复断线续接
+        stream = stream_hub.open(
+            f"group:{db_message.id}",
+            producers=len(participants),
+            aliases=[f"group_message:{msg.id}" for msg in placeholders],
+        )
+        for friend, db_ai_msg in zip(participants, placeholders):
+            asyncio.create_task(GroupChatService._run_group_ai_generation_task(
                 group_id=group_id,
                 session_id=session.id,
                 friend_id=friend.id,
@@ -456,17 +485,11 @@ class GroupChatService:
                 ai_msg_id=db_ai_msg.id,
                 message_content=message_in.content,
                 enable_thinking=enable_thinking,
-                queue=queue
+                queue=stream_hub.writer(stream)
             ))
-            active_tasks.append(task)
-
-        # 4. 消费队列中的事件
-        completed_count = 0
-        while completed_count < len(active_tasks):
-            event = await queue.get()
-            if event is None: # We use None as a completion signal for ONE task
-                completed_count += 1
-                continue
+
+        # 4. 消费流中的事件
+        async for event in stream_hub.subscribe(stream):
             yield event
 
     @staticmethod
@@ -478,7 +501,7 @@ class GroupChatService:
         ai_msg_id: int,
         message_content: str,
         enable_thinking: bool,
-        queue: asyncio.Queue
+        queue: StreamWriter
     ):
         """
         后台任务：处理单个 AI 在群聊中的生成。
@@ -499,18 +522,20 @@ class GroupChatService:
                     await queue.put(None)
                     return
 
+                trace = GenerationTrace(KIND_GROUP, ai_msg_id, session_id, friend_id, llm_config)
                 raw_model_name = llm_config.model_name
                 model_name = llm_service.normalize_model_name(raw_model_name)
                 
                 # 2. 准备历史记录与召回
-                # 获取最近 15 条消息
-                history_msgs = group_chat_shared.fetch_group_history(
+                # 按 token 预算取历史，溢出部分由会话滚动摘要覆盖
+                history_window = group_chat_shared.fetch_group_history_window(
                     db=db,
                     group_id=group_id,
                     session_id=session_id,
                     before_id=user_msg_id,
-                    limit=15,
+                    model_name=raw_model_name,
                 )
+                history_msgs = history_window.messages
 
                 # 姓名映射 (用于让 AI 区分谁在说话)
                 name_map = group_chat_shared.build_name_map(
@@ -527,14 +552,7 @@ class GroupChatService:
                 
                 if enable_recall and embedding_service.get_active_setting(db):
                     try:
-                        # 获取用户画像
                         from app.services.memo.bridge import MemoService
-                        profiles = await MemoService.get_user_profiles(DEFAULT_USER_ID, DEFAULT_SPACE_ID)
-                        if profiles and profiles.profiles:
-                            profile_lines = [f"- {p.content.strip()}" for p in profiles.profiles if p and p.content]
-                            profile_data = "\n".join(profile_lines)
-                        
-                        # 执行召回
                         from app.services.recall_service import RecallService
                         messages_for_recall = []
                         for m in history_msgs:
@@ -544,10 +562,19 @@ class GroupChatService:
                         # 增加当前收到的消息参与召回
                         messages_for_recall.append({"role": "user", "content": message_content})
 
-                        recall_result = await RecallService.perform_recall(
-                            db, DEFAULT_USER_ID, DEFAULT_SPACE_ID, messages_for_recall, friend_id
+                        # 用户画像与召回并发执行
+                        trace.recall_started()
+                        profile_selection, recall_result = await asyncio.gather(
+                            MemoService.select_profile_block(
+                                DEFAULT_USER_ID, DEFAULT_SPACE_ID, message_content, style="content"
+                            ),
+                            RecallService.perform_recall(
+                                db, DEFAULT_USER_ID, DEFAULT_SPACE_ID, messages_for_recall, friend_id
+                            ),
                         )
+                        profile_data = profile_selection.text
                         injected_recall_messages = recall_result.get("injected_messages", [])
+                        trace.recall_finished(recall_result.get("footprints", []))
                         
                         # 推送召回的心路历程
                         for fp in recall_result.get("footprints", []):
@@ -626,7 +653,7 @@ class GroupChatService:
                 except Exception: pass
                 
                 try:
-                    root_template = get_prompt("chat/root_system_prompt.txt")
+                    root_template = root_prompt_template()
                     final_instructions = group_chat_shared.build_system_prompt(
                         root_template=root_template,
                         persona_prompt=persona_prompt,
@@ -648,20 +675,16 @@ class GroupChatService:
                 mention_result = "被提及，需要发言"
 
                 @function_tool(name_override="recall_memory", description_override=tool_description)
-                async def tool_recall(query: str):
+                async def tool_recall(queries: List[str]):
                     if not enable_recall:
                         return {"events": []}
                     if not embedding_service.get_active_setting(db):
                         return {"events": []}
+                    from app.services.recall_service import RecallService
                     event_topk = SettingsService.get_setting(db, "memory", "event_topk", 5)
                     threshold = SettingsService.get_setting(db, "memory", "similarity_threshold", 0.5)
-                    return await MemoService.recall_memory(
-                        user_id=DEFAULT_USER_ID,
-                        space_id=DEFAULT_SPACE_ID,
-                        query=query,
-                        friend_id=friend_id,
-                        topk_event=event_topk,
-                        threshold=threshold,
+                    return await RecallService.recall_queries(
+                        DEFAULT_USER_ID, DEFAULT_SPACE_ID, queries, friend_id, event_topk, threshold
                     )
 
                 @function_tool(name_override="get_other_members_messages", description_override="")
@@ -682,6 +705,8 @@ class GroupChatService:
                     current_other_members=current_other_members,
                     mention_result=mention_result,
                     injected_recall_messages=injected_recall_messages,
+                    summary=history_window.summary,
+                    turn_context=turn_context_message(profile_data, current_time),
                 )
 
                 # AC-4: 后端日志中可确认 AI Context 包含格式化的 Tool Result 消息
@@ -696,7 +721,7 @@ class GroupChatService:
                 top_p = friend.top_p if friend.top_p is not None else 0.9
                 
                 use_litellm = provider_rules.should_use_litellm(llm_config, raw_model_name)
-                model_settings_kwargs = {}
+                model_settings_kwargs = {"include_usage": True}
                 if _supports_sampling(model_name):
                     model_settings_kwargs["temperature"] = temperature
                     model_settings_kwargs["top_p"] = top_p
@@ -726,16 +751,22 @@ class GroupChatService:
                     ),
                 )
                 
-                await group_chat_shared.stream_llm_to_queue(
-                    agent=agent,
-                    agent_messages=agent_messages,
-                    queue=queue,
-                    enable_thinking=enable_thinking,
-                    sender_id=friend_id,
-                    message_id=ai_msg_id,
-                    session_id=session_id,
-                    db=db,
-                )
+                lease = await llm_service.acquire_slot(llm_config, final_instructions, agent_messages)
+                try:
+                    await group_chat_shared.stream_llm_to_queue(
+                        agent=agent,
+                        agent_messages=agent_messages,
+                        queue=queue,
+                        enable_thinking=enable_thinking,
+                        sender_id=friend_id,
+                        message_id=ai_msg_id,
+                        session_id=session_id,
+                        db=db,
+                        trace=trace,
+                        lease=lease,
+                    )
+                finally:
+                    lease.release()
 
 
 
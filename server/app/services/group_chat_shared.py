@@ -3,9 +3,23 @@ from typing import Dict, List, Optional
 
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.models.friend import Friend
 from app.models.group import GroupMessage, GroupSession
 from app.services.memo.constants import DEFAULT_USER_ID
+from app.services.think_tag_parser import ThinkTagParser, MESSAGE, THINK_START, THINK_END
+from app.services.stream_persister import stream_persister, LiveReply
+from app.services.generation_metrics import GenerationTrace
+from app.services.llm_service import llm_service
+from app.services.context_window import (
+    KIND_GROUP,
+    HistoryWindow,
+    assemble_history,
+    history_token_budget,
+    summary_message,
+)
+
+from app.vendor.memobase_server.llms.rate_limiter import LLMLease
 
 from agents import RunConfig, Runner
 from agents.items import ReasoningItem, ToolCallItem, ToolCallOutputItem
@@ -106,21 +120,26 @@ def touch_session_by_id(db: Session, session_id: int) -> Optional[GroupSession]:
     return session
 
 
-def fetch_group_history(
+def fetch_group_history_window(
     db: Session,
     group_id: int,
     session_id: Optional[int],
-    before_id: Optional[int] = None,
-    limit: int = 15,
-) -> List[GroupMessage]:
+    before_id: Optional[int],
+    model_name: Optional[str],
+) -> HistoryWindow:
+    """
+    Token-budgeted group history (see context_window); the session's rolling summary
+    covers what no longer fits.
+    """
     query = db.query(GroupMessage).filter(GroupMessage.group_id == group_id)
+    owner = None
     if session_id is not None:
         query = query.filter(GroupMessage.session_id == session_id)
+        owner = db.query(GroupSession).filter(GroupSession.id == session_id).first()
     if before_id is not None:
         query = query.filter(GroupMessage.id < before_id)
-    history_msgs = query.order_by(GroupMessage.create_time.desc()).limit(limit).all()
-    history_msgs.reverse()
-    return history_msgs
+    query = query.order_by(GroupMessage.create_time.desc(), GroupMessage.id.desc())
+    return assemble_history(KIND_GROUP, owner, query, history_token_budget(model_name))
 
 
 def build_name_map(
@@ -184,8 +203,13 @@ def build_group_context(
     mention_result: str,
     injected_recall_messages: Optional[List[dict]] = None,
     ctrl_no_reply: str = CTRL_NO_REPLY,
+    summary: str = "",
+    turn_context: Optional[dict] = None,
 ) -> List[dict]:
     agent_messages: List[dict] = []
+    summary_msg = summary_message(summary)
+    if summary_msg:
+        agent_messages.append(summary_msg)
     rounds = split_rounds(history_msgs, self_id)
 
     for r in rounds:
@@ -211,6 +235,9 @@ def build_group_context(
         else:
             agent_messages.append({"role": "assistant", "content": ctrl_no_reply})
 
+    if turn_context:
+        agent_messages.append(turn_context)
+
     if injected_recall_messages:
         agent_messages.extend(injected_recall_messages)
 
@@ -270,6 +297,9 @@ def build_system_prompt(
         final_instructions = final_instructions.replace("{{current-time}}", current_time)
         return final_instructions
     except Exception:
+        # 缓存布局下时间由 turn_context_message 放在历史之后
+        if settings.PROMPT_CACHE_LAYOUT:
+            return f"{persona_prompt}\n\n{script_prompt}"
         return f"{persona_prompt}\n\n{script_prompt}\n\n{current_time}"
 
 
@@ -299,6 +329,39 @@ def _extract_reasoning_text(raw: object) -> str:
     )
 
 
+async def _emit_span(
+    queue,
+    kind: str,
+    span: str,
+    saved_content: str,
+    emit_thinking: bool,
+    sender_id: int,
+    message_id: int,
+    live_reply: LiveReply,
+) -> str:
+    if kind == MESSAGE:
+        stream_persister.append(live_reply, span)
+        await queue.put({
+            "event": "message",
+            "data": {
+                "sender_id": str(sender_id),
+                "delta": span,
+                "message_id": message_id,
+            },
+        })
+        return saved_content + span
+    if emit_thinking:
+        await queue.put({
+            "event": "model_thinking",
+            "data": {
+                "sender_id": str(sender_id),
+                "delta": span,
+                "message_id": message_id,
+            },
+        })
+    return saved_content
+
+
 async def stream_llm_to_queue(
     agent,
     agent_messages: List[dict],
@@ -308,184 +371,123 @@ async def stream_llm_to_queue(
     message_id: int,
     session_id: int,
     db: Session,
+    trace: Optional[GenerationTrace] = None,
+    lease: Optional[LLMLease] = None,
 ) -> str:
+    """
+    Stream one member's reply into ``queue`` and persist it. ``trace`` carries the
+    timings collected before the call (recall); without it only the stream is timed.
+    ``lease`` is released with the run's actual token usage once it finishes.
+    """
     content_buffer = ""
     has_reasoning_item = False
     tool_call_names: Dict[str, str] = {}
-    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    if trace is None:
+        trace = GenerationTrace(KIND_GROUP, message_id, session_id, sender_id)
 
     result = Runner.run_streamed(agent, agent_messages, run_config=RunConfig(trace_include_sensitive_data=True))
 
-    buffer = ""
-    is_thinking_tag = False
-    THINK_START = "<think>"
-    THINK_END = "</think>"
+    think_parser = ThinkTagParser()
     saved_content = ""
 
-    async for event in result.stream_events():
-        if isinstance(event, RunItemStreamEvent) and event.name == "reasoning_item_created":
-            if enable_thinking and isinstance(event.item, ReasoningItem):
-                has_reasoning_item = True
-                raw = event.item.raw_item
-                text = _extract_reasoning_text(raw)
-                if text:
+    live_reply = stream_persister.begin(GroupMessage, message_id, db)
+    try:
+        async for event in result.stream_events():
+            trace.observe(event)
+            if isinstance(event, RunItemStreamEvent) and event.name == "reasoning_item_created":
+                if enable_thinking and isinstance(event.item, ReasoningItem):
+                    has_reasoning_item = True
+                    raw = event.item.raw_item
+                    text = _extract_reasoning_text(raw)
+                    if text:
+                        await queue.put({
+                            "event": "model_thinking",
+                            "data": {
+                                "sender_id": str(sender_id),
+                                "delta": text,
+                                "message_id": message_id,
+                            },
+                        })
+                continue
+
+            if isinstance(event, RunItemStreamEvent) and event.name == "tool_called":
+                if isinstance(event.item, ToolCallItem):
+                    raw = event.item.raw_item
+                    if isinstance(raw, dict):
+                        name = raw.get("name")
+                        call_id = raw.get("call_id")
+                        arguments = raw.get("arguments")
+                    else:
+                        name = getattr(raw, "name", None)
+                        call_id = getattr(raw, "call_id", None)
+                        arguments = getattr(raw, "arguments", None)
+
+                    if call_id and name:
+                        tool_call_names[call_id] = name
+
                     await queue.put({
-                        "event": "model_thinking",
+                        "event": "tool_call",
                         "data": {
                             "sender_id": str(sender_id),
-                            "delta": text,
+                            "tool_name": name or "tool",
+                            "arguments": arguments,
+                            "call_id": call_id,
                             "message_id": message_id,
                         },
                     })
-            continue
+                continue
 
-        if isinstance(event, RunItemStreamEvent) and event.name == "tool_called":
-            if isinstance(event.item, ToolCallItem):
-                raw = event.item.raw_item
-                if isinstance(raw, dict):
-                    name = raw.get("name")
-                    call_id = raw.get("call_id")
-                    arguments = raw.get("arguments")
-                else:
-                    name = getattr(raw, "name", None)
-                    call_id = getattr(raw, "call_id", None)
-                    arguments = getattr(raw, "arguments", None)
-
-                if call_id and name:
-                    tool_call_names[call_id] = name
-
-                await queue.put({
-                    "event": "tool_call",
-                    "data": {
-                        "sender_id": str(sender_id),
-                        "tool_name": name or "tool",
-                        "arguments": arguments,
-                        "call_id": call_id,
-                        "message_id": message_id,
-                    },
-                })
-            continue
+            if isinstance(event, RunItemStreamEvent) and event.name == "tool_output":
+                if isinstance(event.item, ToolCallOutputItem):
+                    raw = event.item.raw_item
+                    if isinstance(raw, dict):
+                        call_id = raw.get("call_id")
+                    else:
+                        call_id = getattr(raw, "call_id", None)
 
-        if isinstance(event, RunItemStreamEvent) and event.name == "tool_output":
-            if isinstance(event.item, ToolCallOutputItem):
-                raw = event.item.raw_item
-                if isinstance(raw, dict):
-                    call_id = raw.get("call_id")
-                else:
-                    call_id = getattr(raw, "call_id", None)
+                    if call_id:
+                        name = tool_call_names.get(call_id, "tool")
+                    else:
+                        name = "tool"
 
-                if call_id:
-                    name = tool_call_names.get(call_id, "tool")
-                else:
-                    name = "tool"
-
-                await queue.put({
-                    "event": "tool_result",
-                    "data": {
-                        "sender_id": str(sender_id),
-                        "tool_name": name,
-                        "result": event.item.output,
-                        "call_id": call_id,
-                        "message_id": message_id,
-                    },
-                })
-            continue
+                    await queue.put({
+                        "event": "tool_result",
+                        "data": {
+                            "sender_id": str(sender_id),
+                            "tool_name": name,
+                            "result": event.item.output,
+                            "call_id": call_id,
+                            "message_id": message_id,
+                        },
+                    })
+                continue
+
+            if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                delta = event.data.delta
+                if delta:
+                    content_buffer += delta
+                    for kind, span in think_parser.feed(delta):
+                        saved_content = await _emit_span(
+                            queue, kind, span, saved_content, enable_thinking and not has_reasoning_item, sender_id, message_id, live_reply
+                        )
+
+        for kind, span in think_parser.flush():
+            saved_content = await _emit_span(
+                queue, kind, span, saved_content, enable_thinking and not has_reasoning_item, sender_id, message_id, live_reply
+            )
+
+        final_content = saved_content if saved_content else content_buffer
+        final_content = final_content.replace(THINK_START, "").replace(THINK_END, "")
+        # 最终内容与完成状态一次写入，续接方不会读到 complete + 旧检查点
+        stream_persister.end(live_reply, final_content)
+    finally:
+        # 出错 / 取消时保存已生成的部分；正常结束时为空操作
+        stream_persister.end(live_reply)
 
-        if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
-            delta = event.data.delta
-            if delta:
-                content_buffer += delta
-                buffer += delta
-
-                while buffer:
-                    if not is_thinking_tag:
-                        start_idx = buffer.find(THINK_START)
-                        if start_idx != -1:
-                            if start_idx > 0:
-                                msg_delta = buffer[:start_idx]
-                                saved_content += msg_delta
-                                await queue.put({
-                                    "event": "message",
-                                    "data": {
-                                        "sender_id": str(sender_id),
-                                        "delta": msg_delta,
-                                        "message_id": message_id,
-                                    },
-                                })
-                            buffer = buffer[start_idx + len(THINK_START):]
-                            is_thinking_tag = True
-                        else:
-                            if "<" not in buffer:
-                                saved_content += buffer
-                                await queue.put({
-                                    "event": "message",
-                                    "data": {
-                                        "sender_id": str(sender_id),
-                                        "delta": buffer,
-                                        "message_id": message_id,
-                                    },
-                                })
-                                buffer = ""
-                            else:
-                                break
-                    else:
-                        end_idx = buffer.find(THINK_END)
-                        if end_idx != -1:
-                            if end_idx > 0 and enable_thinking and not has_reasoning_item:
-                                think_chunk = buffer[:end_idx]
-                                await queue.put({
-                                    "event": "model_thinking",
-                                    "data": {
-                                        "sender_id": str(sender_id),
-                                        "delta": think_chunk,
-                                        "message_id": message_id,
-                                    },
-                                })
-
-                            buffer = buffer[end_idx + len(THINK_END):]
-                            is_thinking_tag = False
-                        else:
-                            if "</" not in buffer:
-                                if enable_thinking and not has_reasoning_item:
-                                    await queue.put({
-                                        "event": "model_thinking",
-                                        "data": {
-                                            "sender_id": str(sender_id),
-                                            "delta": buffer,
-                                            "message_id": message_id,
-                                        },
-                                    })
-                                buffer = ""
-                            else:
-                                break
-
-    if buffer:
-        if is_thinking_tag:
-            if enable_thinking and not has_reasoning_item:
-                await queue.put({
-                    "event": "model_thinking",
-                    "data": {
-                        "sender_id": str(sender_id),
-                        "delta": buffer,
-                        "message_id": message_id,
-                    },
-                })
-        else:
-            saved_content += buffer
-            await queue.put({
-                "event": "message",
-                "data": {
-                    "sender_id": str(sender_id),
-                    "delta": buffer,
-                    "message_id": message_id,
-                },
-            })
-
-    final_content = saved_content if saved_content else content_buffer
-    final_content = final_content.replace(THINK_START, "").replace(THINK_END, "")
-
-    persist_final_content(db, message_id, final_content, session_id)
-    usage["completion_tokens"] = len(content_buffer)
+    touch_session_by_id(db, session_id)
+    usage, metrics = trace.finish(result, content_buffer)
+    if lease is not None:
+        llm_service.release_slot(lease, result, content_buffer)
 
     await queue.put({
         "event": "done",
@@ -495,16 +497,10 @@ async def stream_llm_to_queue(
             "session_id": session_id,
             "content": final_content,
             "usage": usage,
+            "metrics": metrics,
         },
     })
 
     return final_content
 
 
-def persist_final_content(db: Session, ai_msg_id: int, final_content: str, session_id: int) -> None:
-    db_msg = db.query(GroupMessage).filter(GroupMessage.id == ai_msg_id).first()
-    if db_msg:
-        db_msg.content = final_content
-        db.commit()
-
-    touch_session_by_id(db, session_id)
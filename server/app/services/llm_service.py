@@ -1,9 +1,18 @@
-from typing import List, Optional
+import json
+from typing import Any, List, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from app.models.llm import LLMConfig
 from app.schemas.llm import LLMConfigUpdate, LLMConfigCreate
+from app.services.prompt_layout import usage_from_result
 from app.services.settings_service import SettingsService
+from app.vendor.memobase_server.llms.rate_limiter import (
+    LLMLease,
+    LLMPriority,
+    estimate_tokens,
+    llm_rate_limiter,
+    provider_key,
+)
 
 class LLMService:
     _provider_labels = {
@@ -96,6 +105,43 @@ class LLMService:
             return None
         return LLMService.get_config_by_id(db, active_id)
 
+    @staticmethod
+    async def acquire_slot(
+        llm_config: LLMConfig,
+        instructions: Optional[str] = None,
+        messages: Optional[list] = None,
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+    ) -> LLMLease:
+        """
+        Reserve a call on the shared per-provider rate limiter (same buckets as memobase).
+        Caller must release the lease once the run finishes.
+        """
+        tokens = estimate_tokens(
+            instructions,
+            json.dumps(messages, ensure_ascii=False, default=str) if messages else None,
+        )
+        return await llm_rate_limiter.acquire(
+            provider_key(llm_config.base_url, llm_config.api_key),
+            priority,
+            tokens,
+        )
+
+    @staticmethod
+    def release_slot(lease: LLMLease, result: Any = None, output: Optional[str] = None) -> None:
+        """
+        Release a lease and charge what the run used to the TPM bucket: the provider's
+        total, else the reserved input estimate plus the output (``output`` or the
+        result's final output) counted locally. A run that produced nothing keeps the
+        reservation.
+        """
+        actual = usage_from_result(result)["total_tokens"] if result is not None else 0
+        if not actual:
+            if output is None and result is not None:
+                output = str(getattr(result, "final_output", None) or "")
+            if output:
+                actual = lease.tokens + estimate_tokens(output)
+        lease.release(actual_tokens=actual or None)
+
     @staticmethod
     def create_config(db: Session, config_in: LLMConfigCreate) -> LLMConfig:
         data = config_in.model_dump()
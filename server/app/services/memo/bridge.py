@@ -1,34 +1,45 @@
 import asyncio
 import logging
-from typing import List, Optional, Dict, Any
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Dict, Any
 from app.core.config import settings
 from app.db.session import SessionLocal
 from app.models.llm import LLMConfig
 from app.models.embedding import EmbeddingSetting
 from app.services.settings_service import SettingsService
 from app.prompt.loader import load_prompt
-from app.vendor.memobase_server.connectors import init_db, Session
+from app.core.coordination import BACKEND_LOCAL, AsyncCacheClient, get_backend
+from app.vendor.memobase_server.connectors import init_db, Session, set_redis_client_factory
 from app.vendor.memobase_server.env import reinitialize_config, CONFIG
 from app.vendor.memobase_server.controllers.buffer_background import start_memobase_worker
 from app.vendor.memobase_server.models.database import UserEvent, UserEventGist
-from app.vendor.memobase_server.utils import to_uuid
+from app.vendor.memobase_server.utils import to_uuid, get_encoded_tokens, fts_match_query
 from app.vendor.memobase_server.llms.embeddings import get_embedding
-from sqlalchemy import text, desc, select, func, case
+from sqlalchemy import text, desc, select, func, case, column, literal_column, table
+from typing import NamedTuple
 from datetime import datetime, timedelta, timezone
 
 # SDK Controllers
 from app.vendor.memobase_server.controllers.user import get_user, create_user, delete_user
 from app.vendor.memobase_server.controllers.profile import (
-    get_user_profiles, add_user_profiles, update_user_profiles, delete_user_profiles
+    get_user_profiles, add_user_profiles, update_user_profiles, delete_user_profiles,
+    get_user_profile_version, set_profile_version_store
 )
 from app.vendor.memobase_server.controllers.event import (
     get_user_events, append_user_event, update_user_event, delete_user_event, search_user_events,
     get_and_clear_embedding_error, set_embedding_error
 )
+from app.vendor.memobase_server.controllers.profile_relevance import select_relevant_profiles
 from app.vendor.memobase_server.controllers.context import get_user_context
 from app.vendor.memobase_server.controllers.blob import insert_blob
 from app.vendor.memobase_server.controllers.event_gist import search_user_event_gists, get_user_event_gists
 from app.vendor.memobase_server.controllers.event_gist import serialize_embedding
+from app.vendor.memobase_server.controllers.event_gist_fts import FTS_TABLE as EVENT_GIST_FTS_TABLE
+from app.vendor.memobase_server.controllers.event_purge import PurgeProgress, purge_tagged_memories
+from app.vendor.memobase_server.controllers.event_gist_compaction import (
+    CompactionReport, compact_friend_gists, tagged_friend_ids
+)
 from app.vendor.memobase_server.controllers.buffer import flush_buffer, insert_blob_to_buffer
 from app.vendor.memobase_server.controllers.project import (
     get_project_profile_config_string, 
@@ -50,6 +61,30 @@ class MemoServiceException(Exception):
     pass
 
 
+class ProfileBlock(NamedTuple):
+    """Rendered user-profile section for prompts, cached per profile version."""
+    text: str
+    token_count: int
+    version: int
+
+
+class ProfileSelection(NamedTuple):
+    """Profile section selected for one turn, with injected vs. available stats."""
+    text: str
+    token_count: int
+    injected: int
+    available: int
+    available_tokens: int
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "injected": self.injected,
+            "available": self.available,
+            "injected_tokens": self.token_count,
+            "available_tokens": self.available_tokens,
+        }
+
+
 # SDK LLM/Embedding Sanity Checks
 from app.vendor.memobase_server.llms import llm_sanity_check
 from app.vendor.memobase_server.llms.embeddings import check_embedding_sanity
@@ -145,6 +180,10 @@ def reload_sdk_config():
         "embedding_model": embedding_model,
         "embedding_dim": embedding_dim,
         "event_theme_requirement": event_theme_requirement,
+        "llm_rpm_limit": settings.LLM_RPM_LIMIT,
+        "llm_tpm_limit": settings.LLM_TPM_LIMIT,
+        "llm_max_concurrency": settings.LLM_MAX_CONCURRENCY,
+        "prompt_log_sample_rate": settings.PROMPT_LOG_SAMPLE_RATE,
     }
 
     if embedding_provider == "ollama" and embedding_base_url:
@@ -169,9 +208,15 @@ async def initialize_memo_sdk():
     
     # 2. Initialize Database
     init_db(settings.MEMOBASE_DB_URL)
+
+    # 3. 多 worker 时 Memobase 的锁与缓冲队列改走协调后端，避免同一用户的 buffer 被并发处理
+    # 画像版本号同样放到协调后端，画像抽取只在一个 worker 上执行，其余 worker 靠版本号失效本地缓存
+    if get_backend().name != BACKEND_LOCAL:
+        set_redis_client_factory(AsyncCacheClient)
+        set_profile_version_store(get_backend())
     
     # 4. Start background worker
-    worker_task = asyncio.create_task(start_memobase_worker(interval_s=60))
+    worker_task = asyncio.create_task(start_memobase_worker())
     
     return worker_task
 
@@ -182,6 +227,9 @@ class MemoService:
     Map project_id to space_id for consistency with the main app.
     """
 
+    # hybrid 检索下向量检索失败后的退避截止时间（monotonic），期间只走 BM25
+    _vector_backoff_until: float = 0.0
+
     @staticmethod
     def _unwrap(promise):
         """Unwrap Promise object and raise MemoServiceException on failure."""
@@ -226,6 +274,109 @@ class MemoService:
         promise = await get_user_profiles(user_id=user_id, project_id=space_id)
         return cls._unwrap(promise)
 
+    # (user_id, space_id, style) -> ProfileBlock
+    _profile_block_cache: Dict[tuple, ProfileBlock] = {}
+    # (user_id, space_id, style, query, budget, pinned) -> (version, ProfileSelection)
+    _profile_selection_cache: "OrderedDict[tuple, tuple[int, ProfileSelection]]" = OrderedDict()
+    _PROFILE_SELECTION_CACHE_SIZE = 256
+
+    @staticmethod
+    def _render_profile_lines(profiles: UserProfilesData, style: str) -> str:
+        profile_lines = []
+        for item in profiles.profiles:
+            if not item or not item.content:
+                continue
+            content = item.content.strip()
+            if style == "content":
+                profile_lines.append(f"- {content}")
+                continue
+            attributes = item.attributes or {}
+            topic = (attributes.get("topic") or "").strip()
+            sub_topic = (attributes.get("sub_topic") or "").strip()
+            if topic or sub_topic:
+                profile_lines.append(f"- {topic}\t{sub_topic}\t{content}")
+            else:
+                profile_lines.append(f"- {content}")
+        return "\n".join(profile_lines)
+
+    @classmethod
+    async def get_profile_block(cls, user_id: str, space_id: str, style: str = "full") -> ProfileBlock:
+        """
+        Returns the rendered profile section used in system prompts.
+        style="full" renders `- topic\tsub_topic\tcontent`, style="content" renders `- content`.
+        The block is re-rendered only when the profile version changes.
+        """
+        cache_key = (user_id, space_id, style)
+        version = get_user_profile_version(user_id, space_id)
+        cached = cls._profile_block_cache.get(cache_key)
+        if cached is not None and cached.version == version:
+            return cached
+
+        profiles = await cls.get_user_profiles(user_id, space_id)
+        text_block = cls._render_profile_lines(profiles, style) if profiles else ""
+        block = ProfileBlock(
+            text=text_block,
+            token_count=len(get_encoded_tokens(text_block)) if text_block else 0,
+            version=version,
+        )
+        if get_user_profile_version(user_id, space_id) == version:
+            cls._profile_block_cache[cache_key] = block
+        return block
+
+    @classmethod
+    async def select_profile_block(
+        cls, user_id: str, space_id: str, query: Optional[str], style: str = "full"
+    ) -> ProfileSelection:
+        """
+        Returns the profile section for one turn: entries ranked by relevance to
+        ``query`` (pinned topics first) within settings.PROFILE_TOKEN_BUDGET.
+        With a budget of 0 every profile is injected, as before.
+        The selection is cached per (profile version, query).
+        """
+        full_block = await cls.get_profile_block(user_id, space_id, style=style)
+        cache_key = (
+            user_id, space_id, style, query, settings.PROFILE_TOKEN_BUDGET, settings.PROFILE_PINNED_TOPICS
+        )
+        cached = cls._profile_selection_cache.get(cache_key)
+        if cached is not None and cached[0] == full_block.version:
+            cls._profile_selection_cache.move_to_end(cache_key)
+            return cached[1]
+
+        profiles = await cls.get_user_profiles(user_id, space_id)
+        available = len(profiles.profiles) if profiles else 0
+        if not available or settings.PROFILE_TOKEN_BUDGET <= 0:
+            return ProfileSelection(
+                text=full_block.text,
+                token_count=full_block.token_count,
+                injected=available,
+                available=available,
+                available_tokens=full_block.token_count,
+            )
+
+        pinned_topics = [t.strip() for t in settings.PROFILE_PINNED_TOPICS.split(",") if t.strip()]
+        selected = cls._unwrap(await select_relevant_profiles(
+            user_id,
+            space_id,
+            profiles,
+            query,
+            max_token_size=settings.PROFILE_TOKEN_BUDGET,
+            pinned_topics=pinned_topics,
+        ))
+        text_block = cls._render_profile_lines(selected, style)
+        selection = ProfileSelection(
+            text=text_block,
+            token_count=len(get_encoded_tokens(text_block)) if text_block else 0,
+            injected=len(selected.profiles),
+            available=available,
+            available_tokens=full_block.token_count,
+        )
+        # 选择期间画像被写入时不缓存，下一轮按新版本重选
+        if get_user_profile_version(user_id, space_id) == full_block.version:
+            cls._profile_selection_cache[cache_key] = (full_block.version, selection)
+            while len(cls._profile_selection_cache) > cls._PROFILE_SELECTION_CACHE_SIZE:
+                cls._profile_selection_cache.popitem(last=False)
+        return selection
+
     @classmethod
     async def add_user_profiles(
         cls, user_id: str, space_id: str, contents: List[str], attributes: List[dict]
@@ -545,53 +696,22 @@ class MemoService:
 
     # --- Recall / Search Extensions ---
 
-    @classmethod
-    async def search_memories_with_tags(
-        cls,
-        user_id: str,
+    @staticmethod
+    def _search_gists_by_embedding(
+        user_id_uuid,
         space_id: str,
-        query: str,
+        query_embedding,
         friend_id: int,
-        topk: int = 5,
-        similarity_threshold: float = 0.5
+        topk: int,
+        similarity_threshold: float,
     ) -> UserEventGistsData:
-        """
-        Search event gists using vector similarity with friend_id tag filtering.
-        
-        Args:
-            user_id: User identifier
-            space_id: Space/project identifier
-            query: Query string to search
-            friend_id: Friend ID to filter by (tag-based filtering)
-            topk: Maximum number of results to return
-            similarity_threshold: Minimum similarity score (0-1)
-            
-        Returns:
-            UserEventGistsData with filtered event gists
-        """
-        logger = logging.getLogger(__name__)
-        user_id_uuid = to_uuid(user_id)
-        
-        # 1. Check if event embedding is enabled
-        if not CONFIG.enable_event_embedding:
-            logger.warning("Event embedding is not enabled, falling back to filter_friend_event_gists")
-            return await cls.filter_friend_event_gists(user_id, space_id, friend_id, topk)
-        
-        # 2. Get query embedding
-        query_embeddings = await get_embedding(
-            space_id, [query], phase="query", model=CONFIG.embedding_model
-        )
-        if not query_embeddings.ok():
-            logger.error(f"Failed to get query embedding: {query_embeddings.msg()}")
-            raise MemoServiceException(f"Failed to get query embedding: {query_embeddings.msg()}")
-        
-        query_embedding = query_embeddings.data()[0]
+        """Vector search over one friend's event gists (blocking; run it in a worker thread)."""
         query_embedding_bytes = serialize_embedding(query_embedding)
-        
-        # 3. Calculate time cutoff (365 days)
+
+        # Calculate time cutoff (365 days)
         days_ago = datetime.now(timezone.utc) - timedelta(days=365)
-        
-        # 4. Build SQL query with friend_id tag filter and vector similarity
+
+        # Build SQL query with friend_id tag filter and vector similarity
         # sqlite-vec uses vec_distance_cosine
         # Use case() to prevent calling vec_distance_cosine on NULL embeddings
         distance_expr = case(
@@ -641,10 +761,241 @@ class MemoService:
                         similarity=similarity,
                     )
                 )
-        
-        logger.debug(f"search_memories_with_tags returned {len(result_gists)} gists for friend {friend_id}")
         return UserEventGistsData(gists=result_gists, events=[])
 
+    @staticmethod
+    def _search_gists_lexical(
+        user_id_uuid,
+        space_id: str,
+        queries: List[str],
+        friend_id: int,
+        topk: int,
+    ) -> List[UserEventGistsData]:
+        """BM25 search over the event gist FTS index, one result per query (blocking)."""
+        fts = table(EVENT_GIST_FTS_TABLE, column("gist_id"))
+        rank_expr = literal_column(f"bm25({EVENT_GIST_FTS_TABLE})")
+        days_ago = datetime.now(timezone.utc) - timedelta(days=365)
+        results = []
+        with Session() as session:
+            for query in queries:
+                match = fts_match_query(query)
+                if match is None:
+                    results.append(UserEventGistsData(gists=[], events=[]))
+                    continue
+                stmt = (
+                    select(UserEventGist)
+                    .select_from(fts)
+                    .join(UserEventGist, UserEventGist.id == fts.c.gist_id)
+                    .join(
+                        UserEvent,
+                        (UserEventGist.event_id == UserEvent.id)
+                        & (UserEventGist.project_id == UserEvent.project_id),
+                    )
+                    .where(
+                        text(f"{EVENT_GIST_FTS_TABLE} MATCH :match").bindparams(match=match),
+                        # 按 gist 的用户过滤，事件走主键；按事件用户过滤会让每个命中都扫一遍该用户的全部事件
+                        UserEventGist.user_id == user_id_uuid,
+                        UserEventGist.project_id == space_id,
+                        UserEvent.created_at >= days_ago,
+                    )
+                    .where(text("""
+                        EXISTS (
+                            SELECT 1 
+                            FROM json_each(json_extract(user_events.event_data, '$.event_tags')) 
+                            WHERE json_extract(value, '$.tag') = 'friend_id' 
+                            AND json_extract(value, '$.value') = :friend_id
+                        )
+                    """).bindparams(friend_id=str(friend_id)))
+                    .order_by(rank_expr)  # bm25 越小越相关
+                    .limit(topk)
+                )
+                gists = session.execute(stmt).scalars().all()
+                results.append(UserEventGistsData(gists=[
+                    UserEventGistData(
+                        id=gist.id,
+                        gist_data=EventGistData(**gist.gist_data),
+                        created_at=gist.created_at,
+                        updated_at=gist.updated_at,
+                    )
+                    for gist in gists
+                ], events=[]))
+        return results
+
+    @classmethod
+    async def search_memories_with_tags(
+        cls,
+        user_id: str,
+        space_id: str,
+        query: str,
+        friend_id: int,
+        topk: int = 5,
+        similarity_threshold: float = 0.5
+    ) -> UserEventGistsData:
+        """
+        Search event gists using vector similarity with friend_id tag filtering.
+        
+        Args:
+            user_id: User identifier
+            space_id: Space/project identifier
+            query: Query string to search
+            friend_id: Friend ID to filter by (tag-based filtering)
+            topk: Maximum number of results to return
+            similarity_threshold: Minimum similarity score (0-1)
+            
+        Returns:
+            UserEventGistsData with filtered event gists
+        """
+        results = await cls.search_memories_with_tags_batch(
+            user_id, space_id, [query], friend_id, topk, similarity_threshold
+        )
+        return results[0]
+
+    @classmethod
+    async def search_memories_with_tags_batch(
+        cls,
+        user_id: str,
+        space_id: str,
+        queries: List[str],
+        friend_id: int,
+        topk: int = 5,
+        similarity_threshold: float = 0.5
+    ) -> List[UserEventGistsData]:
+        """
+        Multi-query variant of search_memories_with_tags: all queries are embedded in
+        one provider call, then searched concurrently. Results keep the order of queries.
+        """
+        logger = logging.getLogger(__name__)
+        if not queries:
+            return []
+        user_id_uuid = to_uuid(user_id)
+        
+        # 1. Check if event embedding is enabled
+        if not CONFIG.enable_event_embedding:
+            logger.warning("Event embedding is not enabled, falling back to filter_friend_event_gists")
+            fallback = await cls.filter_friend_event_gists(user_id, space_id, friend_id, topk)
+            return [fallback for _ in queries]
+        
+        # 2. Get query embeddings (one batched call)
+        query_embeddings = await get_embedding(
+            space_id, list(queries), phase="query", model=CONFIG.embedding_model
+        )
+        if not query_embeddings.ok():
+            logger.error(f"Failed to get query embedding: {query_embeddings.msg()}")
+            raise MemoServiceException(f"Failed to get query embedding: {query_embeddings.msg()}")
+        
+        # 3. One vector search per query, in worker threads
+        results = await asyncio.gather(*(
+            asyncio.to_thread(
+                cls._search_gists_by_embedding,
+                user_id_uuid, space_id, embedding, friend_id, topk, similarity_threshold,
+            )
+            for embedding in query_embeddings.data()
+        ))
+        
+        logger.debug(
+            f"search_memories_with_tags_batch returned {[len(r.gists) for r in results]} gists "
+            f"for {len(queries)} queries of friend {friend_id}"
+        )
+        return list(results)
+
+    @staticmethod
+    def _fuse_rrf(rankings: List[UserEventGistsData], topk: int) -> UserEventGistsData:
+        """
+        Reciprocal-rank fusion: score = Σ 1 / (RECALL_RRF_K + rank). The first ranking
+        wins when the same gist appears twice, so vector similarity is kept.
+        """
+        k = settings.RECALL_RRF_K
+        scores: Dict[Any, float] = {}
+        gists: Dict[Any, UserEventGistData] = {}
+        for ranking in rankings:
+            for rank, gist in enumerate(ranking.gists, start=1):
+                scores[gist.id] = scores.get(gist.id, 0.0) + 1.0 / (k + rank)
+                gists.setdefault(gist.id, gist)
+        ordered = sorted(scores, key=lambda gist_id: scores[gist_id], reverse=True)
+        if topk > 0:
+            ordered = ordered[:topk]
+        return UserEventGistsData(
+            gists=[gists[gist_id].model_copy(update={"score": scores[gist_id]}) for gist_id in ordered],
+            events=[],
+        )
+
+    @classmethod
+    async def search_memories_hybrid(
+        cls,
+        user_id: str,
+        space_id: str,
+        queries: List[str],
+        friend_id: int,
+        topk: int = 5,
+        similarity_threshold: float = 0.5,
+        timeout: float = 10.0,
+    ) -> List[UserEventGistsData]:
+        """
+        Search event gists according to settings.RECALL_SEARCH_MODE, one result per query.
+
+        hybrid: local BM25 first (milliseconds), then vector search within ``timeout``,
+        fused with RRF. If the vector path fails or times out, the BM25 results are
+        returned and vector search is skipped for RECALL_VECTOR_BACKOFF_SECONDS.
+        Raises asyncio.TimeoutError / the vector error only when no path produced results.
+        """
+        logger = logging.getLogger(__name__)
+        mode = settings.RECALL_SEARCH_MODE
+
+        lexical: Optional[List[UserEventGistsData]] = None
+        if mode != "vector":
+            try:
+                lexical = await asyncio.to_thread(
+                    cls._search_gists_lexical, to_uuid(user_id), space_id, queries, friend_id, topk
+                )
+            except Exception as e:
+                logger.warning(f"Lexical gist search unavailable: {e}")
+        if lexical is not None:
+            # 只有 BM25 时也按名次给出 RRF 分数，与融合结果的 score 同一量纲
+            lexical = [cls._fuse_rrf([l], topk) for l in lexical]
+            if mode == "lexical":
+                return lexical
+            if time.monotonic() < cls._vector_backoff_until:
+                logger.info("Vector recall backing off; answering from BM25 only")
+                return lexical
+
+        async def vector_search() -> List[UserEventGistsData]:
+            if len(queries) == 1:
+                return [await cls.search_memories_with_tags(
+                    user_id, space_id, queries[0], friend_id, topk, similarity_threshold
+                )]
+            return await cls.search_memories_with_tags_batch(
+                user_id, space_id, queries, friend_id, topk, similarity_threshold
+            )
+
+        try:
+            vector = await asyncio.wait_for(vector_search(), timeout=timeout)
+        except Exception as e:
+            if lexical is None:
+                raise
+            if mode == "hybrid":
+                cls._vector_backoff_until = time.monotonic() + settings.RECALL_VECTOR_BACKOFF_SECONDS
+            logger.warning(f"Vector recall failed ({type(e).__name__}: {e}); degraded to BM25 only")
+            return lexical
+
+        if lexical is None:
+            return vector
+        return [cls._fuse_rrf([v, l], topk) for v, l in zip(vector, lexical)]
+
+    @staticmethod
+    def _format_recall_events(events_data: UserEventGistsData) -> List[Dict[str, Any]]:
+        events_result = []
+        for gist in events_data.gists:
+            gist_data = gist.gist_data if isinstance(gist.gist_data, dict) else gist.gist_data.model_dump()
+            event = {
+                "date": gist.created_at.isoformat() if gist.created_at else None,
+                "content": gist_data.get("summary", gist_data.get("content", "")),
+                "similarity": getattr(gist, 'similarity', None)
+            }
+            if getattr(gist, "score", None) is not None:
+                event["score"] = gist.score
+            events_result.append(event)
+        return events_result
+
     @classmethod
     async def recall_memory(
         cls,
@@ -676,15 +1027,9 @@ class MemoService:
         """
         logger = logging.getLogger(__name__)
         
-        events_result = []
-        
         try:
-            events_task = cls.search_memories_with_tags(
-                user_id, space_id, query, friend_id, topk_event, threshold
-            )
-            events_data = await asyncio.wait_for(
-                asyncio.gather(events_task),
-                timeout=timeout
+            events_data = await cls.search_memories_hybrid(
+                user_id, space_id, [query], friend_id, topk_event, threshold, timeout
             )
         except asyncio.TimeoutError:
             logger.warning(f"recall_memory timed out after {timeout}s")
@@ -694,15 +1039,7 @@ class MemoService:
             raise MemoServiceException(f"Memory recall failed: {e}") from e
         
         events_data = events_data[0] if events_data else UserEventGistsData(gists=[], events=[])
-
-        # Format events
-        for gist in events_data.gists:
-            gist_data = gist.gist_data if isinstance(gist.gist_data, dict) else gist.gist_data.model_dump()
-            events_result.append({
-                "date": gist.created_at.isoformat() if gist.created_at else None,
-                "content": gist_data.get("summary", gist_data.get("content", "")),
-                "similarity": getattr(gist, 'similarity', None)
-            })
+        events_result = cls._format_recall_events(events_data)
         
         logger.info(f"recall_memory: {len(events_result)} events for query: {query[:30]}...")
         
@@ -710,105 +1047,160 @@ class MemoService:
             "events": events_result
         }
 
+    @classmethod
+    async def recall_memories(
+        cls,
+        user_id: str,
+        space_id: str,
+        queries: List[str],
+        friend_id: int,
+        topk_event: int = 5,
+        threshold: float = 0.5,
+        timeout: float = 10.0
+    ) -> List[Dict[str, Any]]:
+        """
+        recall_memory for several queries at once (one batched embedding call,
+        concurrent searches). Returns one {"query": ..., "events": [...]} per query;
+        all empty on timeout.
+        """
+        logger = logging.getLogger(__name__)
+        
+        try:
+            results = await cls.search_memories_hybrid(
+                user_id, space_id, queries, friend_id, topk_event, threshold, timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"recall_memories timed out after {timeout}s")
+            return [{"query": query, "events": []} for query in queries]
+        except Exception as e:
+            logger.error(f"recall_memories failed: {e}")
+            raise MemoServiceException(f"Memory recall failed: {e}") from e
+        
+        outputs = [
+            {"query": query, "events": cls._format_recall_events(events_data)}
+            for query, events_data in zip(queries, results)
+        ]
+        logger.info(f"recall_memories: {[len(o['events']) for o in outputs]} events for {len(queries)} queries")
+        return outputs
+
+    @classmethod
+    async def _purge_tagged_memories(
+        cls,
+        user_id: str,
+        space_id: str,
+        tag: str,
+        value: Any,
+        on_progress: Optional[Callable[[PurgeProgress], None]] = None,
+    ) -> int:
+        """Chunked set-based purge off the event loop; returns the number of events deleted."""
+        logger = logging.getLogger(__name__)
+
+        def report(progress: PurgeProgress) -> None:
+            logger.info(
+                f"[delete_memories] {tag}={value}: events {progress.events}/{progress.total_events}, "
+                f"blobs {progress.blobs}/{progress.total_blobs}"
+            )
+            if on_progress:
+                on_progress(progress)
+
+        progress = await asyncio.to_thread(
+            purge_tagged_memories,
+            to_uuid(user_id),
+            space_id,
+            tag,
+            str(value),
+            settings.MEMORY_DELETE_CHUNK_SIZE,
+            report,
+        )
+        return progress.events
+
     @classmethod
     async def delete_friend_memories(
-        cls, user_id: str, space_id: str, friend_id: int
+        cls,
+        user_id: str,
+        space_id: str,
+        friend_id: int,
+        on_progress: Optional[Callable[[PurgeProgress], None]] = None,
     ) -> int:
         """
-        Delete all events and event_gists for a specific friend_id.
+        Delete all events, event_gists and pending chat blobs for a specific friend_id.
         
         Args:
             user_id: User identifier
             space_id: Space/project identifier
             friend_id: Friend ID to filter by (from event_tags)
+            on_progress: Optional callback invoked after every committed chunk
             
         Returns:
-            Number of events deleted (gists are cascade deleted)
+            Number of events deleted
         """
-        logger = logging.getLogger(__name__)
-        user_id_uuid = to_uuid(user_id)
-        
-        with Session() as session:
-            # Find all UserEvents with the friend_id tag
-            query = (
-                session.query(UserEvent)
-                .filter(
-                    UserEvent.user_id == user_id_uuid,
-                    UserEvent.project_id == space_id,
-                )
-                .filter(text(
-                    """
-                    EXISTS (
-                        SELECT 1 
-                        FROM json_each(json_extract(user_events.event_data, '$.event_tags')) 
-                        WHERE json_extract(value, '$.tag') = 'friend_id' 
-                        AND json_extract(value, '$.value') = :friend_id
-                    )
-                    """
-                ).params(friend_id=str(friend_id)))
-            )
-            
-            events = query.all()
-            count = len(events)
-            
-            # Delete each event - gists will be cascade deleted
-            for event in events:
-                session.delete(event)
-            
-            session.commit()
-            logger.info(f"[delete_friend_memories] Deleted {count} events for friend {friend_id}")
-            
-            return count
+        return await cls._purge_tagged_memories(user_id, space_id, "friend_id", friend_id, on_progress)
 
     @classmethod
     async def delete_session_memories(
-        cls, user_id: str, space_id: str, session_id: int
+        cls,
+        user_id: str,
+        space_id: str,
+        session_id: int,
+        on_progress: Optional[Callable[[PurgeProgress], None]] = None,
     ) -> int:
         """
-        Delete all events and event_gists for a specific session_id.
+        Delete all events, event_gists and pending chat blobs for a specific session_id.
         
         Args:
             user_id: User identifier
             space_id: Space/project identifier
             session_id: Session ID to filter by (from event_tags)
+            on_progress: Optional callback invoked after every committed chunk
             
         Returns:
-            Number of events deleted (gists are cascade deleted)
+            Number of events deleted
+        """
+        return await cls._purge_tagged_memories(user_id, space_id, "session_id", session_id, on_progress)
+
+    @classmethod
+    async def compact_event_gists(
+        cls,
+        user_id: str,
+        space_id: str,
+        friend_id: Optional[int] = None,
+        dry_run: bool = True,
+        summarize: Optional[bool] = None,
+    ) -> List[CompactionReport]:
+        """
+        Merge near-duplicate event gists of one friend (or of every friend), one report
+        per friend. ``dry_run`` only plans and reports; ``summarize`` defaults to
+        ``GIST_COMPACTION_SUMMARIZE``.
         """
         logger = logging.getLogger(__name__)
         user_id_uuid = to_uuid(user_id)
-        
-        with Session() as session:
-            # Find all UserEvents with the session_id tag
-            query = (
-                session.query(UserEvent)
-                .filter(
-                    UserEvent.user_id == user_id_uuid,
-                    UserEvent.project_id == space_id,
-                )
-                .filter(text(
-                    """
-                    EXISTS (
-                        SELECT 1 
-                        FROM json_each(json_extract(user_events.event_data, '$.event_tags')) 
-                        WHERE json_extract(value, '$.tag') = 'session_id' 
-                        AND json_extract(value, '$.value') = :session_id
-                    )
-                    """
-                ).params(session_id=str(session_id)))
+        if friend_id is None:
+            friend_ids = await asyncio.to_thread(tagged_friend_ids, user_id_uuid, space_id)
+        else:
+            friend_ids = [str(friend_id)]
+        if summarize is None:
+            summarize = settings.GIST_COMPACTION_SUMMARIZE
+
+        reports = []
+        for fid in friend_ids:
+            report = await compact_friend_gists(
+                user_id_uuid,
+                space_id,
+                fid,
+                similarity=settings.GIST_COMPACTION_SIMILARITY,
+                min_age_days=settings.GIST_COMPACTION_MIN_AGE_DAYS,
+                max_cluster=settings.GIST_COMPACTION_MAX_CLUSTER,
+                summarize=summarize,
+                summary_batch=settings.GIST_COMPACTION_SUMMARY_BATCH,
+                dry_run=dry_run,
             )
-            
-            events = query.all()
-            count = len(events)
-            
-            # Delete each event - gists will be cascade deleted
-            for event in events:
-                session.delete(event)
-            
-            session.commit()
-            logger.info(f"[delete_session_memories] Deleted {count} events for session {session_id}")
-            
-            return count
+            if report.clusters:
+                logger.info(
+                    f"[Gist Compaction] friend={fid} dry_run={dry_run}: gists {report.gists_before} -> "
+                    f"{report.gists_after}, bytes {report.bytes_before} -> {report.bytes_after}"
+                )
+            reports.append(report)
+        return reports
 
     # --- Event Gist Management ---
 
@@ -0,0 +1,217 @@
+"""
+Full-text search over chat and group chat history.
+
+Terms of three or more characters are matched through the trigram FTS5 indexes
+(``app.db.message_fts``); shorter terms, which trigrams cannot match, fall back to
+LIKE on the already-filtered rows. Results are newest first and paginated with a
+keyset cursor ``<create_time>,<kind>,<id>`` so deep pages cost the same as the first.
+"""
+import re
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, literal, or_, text
+from sqlalchemy.orm import Session
+
+from app.db.message_fts import GROUP_MESSAGES_FTS, MESSAGES_FTS
+from app.models.chat import ChatSession, Message
+from app.models.group import GroupMessage
+
+KIND_CHAT = "chat"
+KIND_GROUP = "group"
+# 同一时间戳下的排序先后（倒序分页时 group 在前）
+_KIND_RANK = {KIND_CHAT: 0, KIND_GROUP: 1}
+
+SNIPPET_CHARS = 32
+_MIN_TRIGRAM_CHARS = 3
+
+
+class SearchQueryError(ValueError):
+    pass
+
+
+def _split_terms(query: str) -> List[str]:
+    terms = []
+    for term in query.split():
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def _match_expression(terms: List[str]) -> Optional[str]:
+    """FTS5 MATCH expression requiring every trigram-searchable term (AND of phrases)."""
+    long_terms = [t for t in terms if len(t) >= _MIN_TRIGRAM_CHARS]
+    if not long_terms:
+        return None
+    return " AND ".join('"{}"'.format(t.replace('"', '""')) for t in long_terms)
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def encode_cursor(create_time: datetime, kind: str, message_id: int) -> str:
+    return f"{create_time.astimezone(timezone.utc).isoformat()},{kind},{message_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int, int]:
+    try:
+        created, kind, message_id = cursor.rsplit(",", 2)
+        create_time = datetime.fromisoformat(created)
+        return create_time, _KIND_RANK[kind], int(message_id)
+    except (ValueError, KeyError) as e:
+        raise SearchQueryError(f"Invalid cursor: {cursor}") from e
+
+
+def make_snippet(content: str, terms: List[str], width: int = SNIPPET_CHARS) -> str:
+    """Window of ``width`` characters around the first hit, with hits wrapped in 【】."""
+    lowered = content.lower()
+    hits = [(lowered.find(t.lower()), t) for t in terms]
+    hits = [(pos, t) for pos, t in hits if pos >= 0]
+    if hits:
+        first = min(pos for pos, _ in hits)
+        start = max(0, first - width // 2)
+    else:
+        start = 0
+    end = min(len(content), start + width)
+    window = content[start:end]
+    if terms:
+        pattern = re.compile("|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+        window = pattern.sub(lambda m: f"【{m.group(0)}】", window)
+    return ("…" if start > 0 else "") + window + ("…" if end < len(content) else "")
+
+
+def _keyset_filter(model, kind: str, cursor: Optional[Tuple[datetime, int, int]]):
+    if cursor is None:
+        return None
+    create_time, kind_rank, message_id = cursor
+    own_rank = _KIND_RANK[kind]
+    if own_rank < kind_rank:
+        same_time = literal(True)
+    elif own_rank > kind_rank:
+        same_time = literal(False)
+    else:
+        same_time = model.id < message_id
+    return or_(model.create_time < create_time, and_(model.create_time == create_time, same_time))
+
+
+def _text_filters(model, fts: str, terms: List[str]):
+    filters = []
+    match = _match_expression(terms)
+    if match is not None:
+        filters.append(text(
+            f"{model.__tablename__}.id IN (SELECT rowid FROM {fts} WHERE {fts} MATCH :match_{fts})"
+        ).bindparams(**{f"match_{fts}": match}))
+    for term in terms:
+        if len(term) < _MIN_TRIGRAM_CHARS:
+            filters.append(model.content.like(_like_pattern(term), escape="\\"))
+    return filters
+
+
+def _search_chat(db: Session, terms, friend_id, start, end, cursor, limit) -> List[dict]:
+    query = (
+        db.query(Message, ChatSession.friend_id)
+        .join(ChatSession, Message.session_id == ChatSession.id)
+        .filter(
+            ChatSession.deleted == False,
+            Message.deleted == False,
+            Message.status == "complete",
+            Message.role.in_(("user", "assistant")),
+            *_text_filters(Message, MESSAGES_FTS, terms),
+        )
+    )
+    if friend_id is not None:
+        query = query.filter(ChatSession.friend_id == friend_id)
+    if start is not None:
+        query = query.filter(Message.create_time >= start)
+    if end is not None:
+        query = query.filter(Message.create_time < end)
+    keyset = _keyset_filter(Message, KIND_CHAT, cursor)
+    if keyset is not None:
+        query = query.filter(keyset)
+    rows = query.order_by(Message.create_time.desc(), Message.id.desc()).limit(limit).all()
+    return [
+        {
+            "kind": KIND_CHAT,
+            "id": message.id,
+            "session_id": message.session_id,
+            "friend_id": session_friend_id,
+            "group_id": None,
+            "role": message.role,
+            "sender_id": None,
+            "content": message.content,
+            "create_time": message.create_time,
+        }
+        for message, session_friend_id in rows
+    ]
+
+
+def _search_group(db: Session, terms, group_id, start, end, cursor, limit) -> List[dict]:
+    query = db.query(GroupMessage).filter(
+        GroupMessage.status == "complete",
+        GroupMessage.message_type != "system",
+        *_text_filters(GroupMessage, GROUP_MESSAGES_FTS, terms),
+    )
+    if group_id is not None:
+        query = query.filter(GroupMessage.group_id == group_id)
+    if start is not None:
+        query = query.filter(GroupMessage.create_time >= start)
+    if end is not None:
+        query = query.filter(GroupMessage.create_time < end)
+    keyset = _keyset_filter(GroupMessage, KIND_GROUP, cursor)
+    if keyset is not None:
+        query = query.filter(keyset)
+    rows = query.order_by(GroupMessage.create_time.desc(), GroupMessage.id.desc()).limit(limit).all()
+    return [
+        {
+            "kind": KIND_GROUP,
+            "id": message.id,
+            "session_id": message.session_id,
+            "friend_id": None,
+            "group_id": message.group_id,
+            "role": "user" if message.sender_type == "user" else "assistant",
+            "sender_id": message.sender_id,
+            "content": message.content,
+            "create_time": message.create_time,
+        }
+        for message in rows
+    ]
+
+
+def search_messages(
+    db: Session,
+    query: str,
+    friend_id: Optional[int] = None,
+    group_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+) -> dict:
+    """
+    Search chat and group messages containing every whitespace-separated term.
+    A friend_id restricts the search to that friend's chats, a group_id to that
+    group; with neither, both kinds are searched and merged newest first.
+    """
+    terms = _split_terms(query or "")
+    if not terms:
+        raise SearchQueryError("Search query is empty")
+    after = decode_cursor(cursor) if cursor else None
+
+    # 多取一条用于判断是否还有下一页
+    hits: List[dict] = []
+    if group_id is None:
+        hits += _search_chat(db, terms, friend_id, start, end, after, limit + 1)
+    if friend_id is None:
+        hits += _search_group(db, terms, group_id, start, end, after, limit + 1)
+    hits.sort(key=lambda h: (h["create_time"], _KIND_RANK[h["kind"]], h["id"]), reverse=True)
+
+    page = hits[:limit]
+    next_cursor = None
+    if len(hits) > limit:
+        last = page[-1]
+        next_cursor = encode_cursor(last["create_time"], last["kind"], last["id"])
+    for hit in page:
+        hit["snippet"] = make_snippet(hit.pop("content"), terms)
+    return {"items": page, "next_cursor": next_cursor}
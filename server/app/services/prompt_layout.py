@@ -0,0 +1,49 @@
+"""
+Prompt layout that keeps the provider-side prefix cache warm.
+
+With ``settings.PROMPT_CACHE_LAYOUT`` the system prompt only carries static content
+(persona, script rules, segment rules, recall rules). Per-turn content — current time
+and the selected user profile — moves into a system message placed after the history,
+right before the recall results and the user's message, so everything up to the
+history stays byte-identical between turns. Provider usage (including
+``cached_tokens``) goes into generation_metrics, which reports the hit rate per friend.
+"""
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.prompt import get_prompt
+
+ROOT_PROMPT = "chat/root_system_prompt.txt"
+ROOT_PROMPT_STATIC = "chat/root_system_prompt_static.txt"
+
+
+def root_prompt_template() -> str:
+    return get_prompt(ROOT_PROMPT_STATIC if settings.PROMPT_CACHE_LAYOUT else ROOT_PROMPT)
+
+
+def turn_context_message(profile_data: str, current_time: str) -> Optional[dict]:
+    """Volatile per-turn context; None when the legacy layout splices it into the system prompt."""
+    if not settings.PROMPT_CACHE_LAYOUT:
+        return None
+    parts = [f"【当前时间】\n{current_time}"]
+    if profile_data:
+        parts.append(f"【用户信息】\n{profile_data}")
+    return {"role": "system", "content": "\n\n".join(parts)}
+
+
+def _int(value: Any) -> int:
+    return value if isinstance(value, int) else 0
+
+
+def usage_from_result(result: Any) -> Dict[str, int]:
+    """Provider-reported usage of a finished run (zeros when the provider sent none)."""
+    usage = getattr(getattr(result, "context_wrapper", None), "usage", None)
+    details = getattr(usage, "input_tokens_details", None)
+    output_details = getattr(usage, "output_tokens_details", None)
+    return {
+        "prompt_tokens": _int(getattr(usage, "input_tokens", 0)),
+        "completion_tokens": _int(getattr(usage, "output_tokens", 0)),
+        "total_tokens": _int(getattr(usage, "total_tokens", 0)),
+        "cached_tokens": _int(getattr(details, "cached_tokens", 0)),
+        "reasoning_tokens": _int(getattr(output_details, "reasoning_tokens", 0)),
+    }
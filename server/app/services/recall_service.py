@@ -11,6 +11,7 @@ from openai import AsyncOpenAI
 from openai.types.shared import Reasoning
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.services.memo.bridge import MemoService
 from app.services.llm_service import llm_service
 from app.services.settings_service import SettingsService
@@ -20,6 +21,9 @@ from app.prompt import get_prompt
 
 logger = logging.getLogger(__name__)
 
+RECALL_MODE_AGENT = "agent"
+RECALL_MODE_SINGLE_SHOT = "single_shot"
+
 
 class RecallService:
     """
@@ -74,12 +78,24 @@ class RecallService:
         arguments = getattr(raw, "arguments", None)
         return name, call_id, arguments
 
+    @staticmethod
+    def _event_rank(event: Dict[str, Any]) -> Tuple[bool, float]:
+        """
+        记忆事件的排序键：有 RRF 融合分数（score）时按分数，否则按向量相似度。
+        带分数的事件排在前面，避免两种量纲直接比较。
+        """
+        score = event.get("score")
+        if score is not None:
+            return True, score
+        return False, event.get("similarity") or 0
+
     @staticmethod
     def _merge_events(outputs: Iterable[Dict[str, Any]], max_events: int) -> List[Dict[str, Any]]:
         """
         合并多次召回产生的记忆事件。
-        根据日期和内容进行去重，并保留相似度最高的记录。
+        根据日期和内容进行去重，并保留排序分最高的记录。
         """
+        rank = RecallService._event_rank
         merged: Dict[Tuple[Optional[str], Optional[str]], Dict[str, Any]] = {}
         for output in outputs:
             for event in output.get("events", []) or []:
@@ -87,94 +103,64 @@ class RecallService:
                     continue
                 key = (event.get("date"), event.get("content"))
                 existing = merged.get(key)
-                if not existing:
-                    merged[key] = event
-                    continue
-                # 如果同一事件出现多次，保留相似度更高的那个
-                existing_similarity = existing.get("similarity") or 0
-                new_similarity = event.get("similarity") or 0
-                if new_similarity > existing_similarity:
+                # 如果同一事件出现多次，保留分数更高的那个
+                if not existing or rank(event) > rank(existing):
                     merged[key] = event
         merged_events = list(merged.values())
-        # 按相似度降序排列
-        merged_events.sort(key=lambda item: item.get("similarity") or 0, reverse=True)
+        # 按 RRF 分数（无分数时按相似度）降序排列，只命中 BM25 的事件没有相似度也不会沉底
+        merged_events.sort(key=rank, reverse=True)
         if max_events > 0:
             return merged_events[:max_events]
         return merged_events
 
+    @staticmethod
+    def _normalize_queries(queries: Iterable[Any]) -> List[str]:
+        """
+        清洗检索词列表：去空白、去重（保序），并截断到 RECALL_MAX_QUERIES 个。
+        """
+        if isinstance(queries, str):
+            queries = [queries]
+        normalized: List[str] = []
+        for query in queries or []:
+            if not isinstance(query, str):
+                continue
+            query = query.strip()
+            if query and query not in normalized:
+                normalized.append(query)
+        return normalized[: max(1, settings.RECALL_MAX_QUERIES)]
+
     @classmethod
-    async def perform_recall(
+    async def recall_queries(
         cls,
-        db: Session,
         user_id: str,
         space_id: str,
-        messages: Iterable[Any],
+        queries: Iterable[Any],
         friend_id: int,
+        event_topk: int,
+        threshold: float,
     ) -> Dict[str, Any]:
         """
-        执行记忆召回逻辑。
-        
-        该方法启动一个 RecallAgent，模拟 Function Calling 过程去召回记忆。
-        
-        返回:
-            {
-                "injected_messages": [mock_tool_call, mock_tool_result], # 用于注入到主对话历史中的伪造消息
-                "footprints": [ # 执行过程中的足迹，用于前端展示
-                    {"type": "thinking", "content": "..."},
-                    {"type": "tool_call", "name": "...", "arguments": "..."},
-                    {"type": "tool_result", "name": "...", "result": "..."},
-                ]
-            }
+        recall_memory 工具的实现：多个检索词一次批量向量化、并发检索，结果经 _merge_events 合并去重。
         """
-        # 1. 获取 LLM 配置和系统设置
-        llm_config = llm_service.get_active_config(db)
-        if not llm_config:
-            raise Exception("LLM configuration not found in database")
-
-        search_rounds = SettingsService.get_setting(db, "memory", "search_rounds", 3)
-        event_topk = SettingsService.get_setting(db, "memory", "event_topk", 5)
-        threshold = SettingsService.get_setting(db, "memory", "similarity_threshold", 0.5)
-
-        messages_list = list(messages)
-        raw_model_name = llm_config.model_name
-
-        # 2. 定义 Agent 手里的“召回工具”
-        tool_description = get_prompt("recall/recall_tool_description.txt").strip()
-
-        @function_tool(
-            name_override="recall_memory",
-            description_override=tool_description,
+        normalized = cls._normalize_queries(queries)
+        if not normalized:
+            return {"events": []}
+        outputs = await MemoService.recall_memories(
+            user_id=user_id,
+            space_id=space_id,
+            queries=normalized,
+            friend_id=friend_id,
+            topk_event=event_topk,
+            threshold=threshold,
         )
-        async def tool_recall(query: str) -> Dict[str, Any]:
-            # 工具逻辑：调用向量检索服务
-            return await MemoService.recall_memory(
-                user_id=user_id,
-                space_id=space_id,
-                query=query,
-                friend_id=friend_id,
-                topk_event=event_topk,
-                threshold=threshold,
-            )
-
-        # 3. 设置 OpenAI 客户端
-        client = AsyncOpenAI(
-            base_url=llm_config.base_url,
-            api_key=llm_config.api_key,
-        )
-        set_default_openai_client(client, use_for_tracing=True)
-        set_default_openai_api("chat_completions")
-
-        # 4. 初始化 RecallAgent
-        # 内部逻辑使用 UTC，但给 RecallAgent 的指示词建议使用北京时间以便更好地进行相对时间检索
-        beijing_tz = timezone(timedelta(hours=8))
-        now_time = datetime.now(timezone.utc).astimezone(beijing_tz)
-        weekday_map = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
-        current_time = f"{now_time:%Y-%m-%d 约%H}点 {weekday_map[now_time.weekday()]}"
-        instructions = get_prompt("recall/recall_instructions.txt").format(
-            search_rounds=search_rounds,
-            current_time=current_time,
-        ).strip()
+        return {"events": cls._merge_events(outputs, event_topk)}
 
+    @staticmethod
+    def _build_agent_model(llm_config: Any) -> Tuple[Any, ModelSettings]:
+        """
+        根据当前 LLM 配置构造 Agent 使用的模型对象与 ModelSettings。
+        """
+        raw_model_name = llm_config.model_name
         model_name = llm_service.normalize_model_name(raw_model_name)
         use_litellm = provider_rules.should_use_litellm(llm_config, raw_model_name)
         model_settings_kwargs: Dict[str, Any] = {}
@@ -199,6 +185,49 @@ class RecallService:
             )
         else:
             agent_model = model_name
+        return agent_model, model_settings
+
+    @staticmethod
+    def _parse_planned_queries(raw: str) -> List[str]:
+        """
+        解析单次规划输出的检索词：优先取 JSON 数组（或 {"queries": [...]}），否则按行切分。
+        """
+        text = (raw or "").strip()
+        start, end = text.find("["), text.rfind("]")
+        if start != -1 and end > start:
+            try:
+                parsed = json.loads(text[start:end + 1])
+                if isinstance(parsed, list):
+                    return [q for q in parsed if isinstance(q, str)]
+            except json.JSONDecodeError:
+                pass
+        try:
+            parsed = json.loads(text)
+            if isinstance(parsed, dict) and isinstance(parsed.get("queries"), list):
+                return [q for q in parsed["queries"] if isinstance(q, str)]
+        except json.JSONDecodeError:
+            pass
+        return [line.strip(" -*\t") for line in text.splitlines() if line.strip(" -*\t")]
+
+    @classmethod
+    async def _run_agent_recall(
+        cls,
+        llm_config: Any,
+        agent_messages: List[Dict[str, str]],
+        tool_recall: Any,
+        search_rounds: int,
+        current_time: str,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Optional[str], Optional[str]]:
+        """
+        多轮模式：RecallAgent 自主调用 recall_memory（每次可带多个检索词），最多 search_rounds 次。
+        返回 (tool_outputs, footprints, last_tool_call_id, last_tool_call_args)。
+        """
+        instructions = get_prompt("recall/recall_instructions.txt").format(
+            search_rounds=search_rounds,
+            max_queries=settings.RECALL_MAX_QUERIES,
+            current_time=current_time,
+        ).strip()
+        agent_model, model_settings = cls._build_agent_model(llm_config)
         agent = Agent(
             name="RecallAgent",
             instructions=instructions,
@@ -207,19 +236,19 @@ class RecallService:
             model_settings=model_settings,
         )
 
-        # 5. 准备对话上下文并运行 Agent
-        agent_messages = cls._normalize_messages(messages_list)
-        if not agent_messages:
-            return {"injected_messages": [], "footprints": []}
-
-        # 执行 Agent 逻辑
-        result = await Runner.run(
-            agent,
-            agent_messages,
-            run_config=RunConfig(trace_include_sensitive_data=True),
-        )
+        # 执行 Agent 逻辑（与聊天共用限流桶，按交互优先级排队）
+        lease = await llm_service.acquire_slot(llm_config, instructions, agent_messages)
+        result = None
+        try:
+            result = await Runner.run(
+                agent,
+                agent_messages,
+                run_config=RunConfig(trace_include_sensitive_data=True),
+            )
+        finally:
+            llm_service.release_slot(lease, result)
 
-        # 6. 处理 Agent 运行结果，提取足迹和召回的事件
+        # 处理 Agent 运行结果，提取足迹和召回的事件
         tool_outputs: List[Dict[str, Any]] = []
         footprints: List[Dict[str, Any]] = []
         
@@ -255,11 +284,147 @@ class RecallService:
                         "type": "thinking",
                         "content": reasoning
                     })
+        return tool_outputs, footprints, last_tool_call_id, last_tool_call_args
+
+    @classmethod
+    async def _run_single_shot_recall(
+        cls,
+        llm_config: Any,
+        agent_messages: List[Dict[str, str]],
+        recall: Any,
+        current_time: str,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Optional[str], Optional[str]]:
+        """
+        单次模式：一次 LLM 调用直接生成检索词集合，再一次性批量检索，省去工具往返。
+        规划失败时退回用最后一句用户消息检索。
+        """
+        instructions = get_prompt("recall/recall_query_planner.txt").format(
+            max_queries=settings.RECALL_MAX_QUERIES,
+            current_time=current_time,
+        ).strip()
+        agent_model, model_settings = cls._build_agent_model(llm_config)
+        agent = Agent(
+            name="RecallQueryPlanner",
+            instructions=instructions,
+            model=agent_model,
+            model_settings=model_settings,
+        )
+
+        queries: List[str] = []
+        lease = await llm_service.acquire_slot(llm_config, instructions, agent_messages)
+        result = None
+        try:
+            result = await Runner.run(
+                agent,
+                agent_messages,
+                run_config=RunConfig(trace_include_sensitive_data=True),
+            )
+            queries = cls._normalize_queries(cls._parse_planned_queries(str(result.final_output or "")))
+        except Exception as e:
+            logger.warning("RecallService single-shot planning failed: %s", e)
+        finally:
+            llm_service.release_slot(lease, result)
+
+        if not queries:
+            last_user = next(
+                (msg["content"] for msg in reversed(agent_messages) if msg.get("role") == "user"),
+                "",
+            )
+            queries = cls._normalize_queries([last_user])
+        if not queries:
+            return [], [], None, None
+
+        arguments = json.dumps({"queries": queries}, ensure_ascii=False)
+        output = await recall(queries)
+        footprints = [
+            {"type": "tool_call", "name": "recall_memory", "arguments": arguments},
+            {"type": "tool_result", "name": "recall_memory", "result": output},
+        ]
+        return [output], footprints, None, arguments
+
+    @classmethod
+    async def perform_recall(
+        cls,
+        db: Session,
+        user_id: str,
+        space_id: str,
+        messages: Iterable[Any],
+        friend_id: int,
+    ) -> Dict[str, Any]:
+        """
+        执行记忆召回逻辑。
+        
+        默认启动一个 RecallAgent，模拟 Function Calling 过程去召回记忆；
+        recall_mode 为 single_shot 时改为一次生成检索词集合后批量检索。
+        
+        返回:
+            {
+                "injected_messages": [mock_tool_call, mock_tool_result], # 用于注入到主对话历史中的伪造消息
+                "footprints": [ # 执行过程中的足迹，用于前端展示
+                    {"type": "thinking", "content": "..."},
+                    {"type": "tool_call", "name": "...", "arguments": "..."},
+                    {"type": "tool_result", "name": "...", "result": "..."},
+                ]
+            }
+        """
+        # 1. 获取 LLM 配置和系统设置
+        llm_config = llm_service.get_active_config(db)
+        if not llm_config:
+            raise Exception("LLM configuration not found in database")
+
+        search_rounds = SettingsService.get_setting(db, "memory", "search_rounds", 3)
+        event_topk = SettingsService.get_setting(db, "memory", "event_topk", 5)
+        threshold = SettingsService.get_setting(db, "memory", "similarity_threshold", 0.5)
+        recall_mode = SettingsService.get_setting(db, "memory", "recall_mode", RECALL_MODE_AGENT)
+
+        messages_list = list(messages)
+        model_name = llm_service.normalize_model_name(llm_config.model_name)
+
+        # 2. 召回工具：多个检索词批量向量化、并发检索
+        async def recall(queries: List[str]) -> Dict[str, Any]:
+            return await cls.recall_queries(user_id, space_id, queries, friend_id, event_topk, threshold)
+
+        tool_description = get_prompt("recall/recall_tool_description.txt").strip()
+
+        @function_tool(
+            name_override="recall_memory",
+            description_override=tool_description,
+        )
+        async def tool_recall(queries: List[str]) -> Dict[str, Any]:
+            return await recall(queries)
+
+        # 3. 设置 OpenAI 客户端
+        client = AsyncOpenAI(
+            base_url=llm_config.base_url,
+            api_key=llm_config.api_key,
+        )
+        set_default_openai_client(client, use_for_tracing=True)
+        set_default_openai_api("chat_completions")
+
+        # 内部逻辑使用 UTC，但给 RecallAgent 的指示词建议使用北京时间以便更好地进行相对时间检索
+        beijing_tz = timezone(timedelta(hours=8))
+        now_time = datetime.now(timezone.utc).astimezone(beijing_tz)
+        weekday_map = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+        current_time = f"{now_time:%Y-%m-%d 约%H}点 {weekday_map[now_time.weekday()]}"
+
+        # 4. 准备对话上下文并执行召回
+        agent_messages = cls._normalize_messages(messages_list)
+        if not agent_messages:
+            return {"injected_messages": [], "footprints": []}
+
+        if recall_mode == RECALL_MODE_SINGLE_SHOT:
+            tool_outputs, footprints, last_tool_call_id, last_tool_call_args = await cls._run_single_shot_recall(
+                llm_config, agent_messages, recall, current_time
+            )
+        else:
+            tool_outputs, footprints, last_tool_call_id, last_tool_call_args = await cls._run_agent_recall(
+                llm_config, agent_messages, tool_recall, search_rounds, current_time
+            )
 
-        # 7. 对多次搜索的结果进行合并去重
+        # 5. 对多次搜索的结果进行合并去重
         merged_events = cls._merge_events(tool_outputs, event_topk)
 
-        # 8. 构造“伪造消息对”用于注入主对话历史
+        # 6. 构造“伪造消息对”用于注入主对话历史
         # 即使 Agent 没调工具或出错，我们也确保有一个基本的注入结构
         if not last_tool_call_id:
             last_tool_call_id = f"recall_{uuid.uuid4().hex}"
@@ -270,7 +435,7 @@ class RecallService:
                 (msg["content"] for msg in reversed(agent_messages) if msg.get("role") == "user"),
                 "",
             )
-            last_tool_call_args = json.dumps({"query": last_user or ""}, ensure_ascii=False)
+            last_tool_call_args = json.dumps({"queries": [last_user or ""]}, ensure_ascii=False)
 
         # 伪造模型的一次 Function Call 动作
         tool_call_item = {
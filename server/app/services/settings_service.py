@@ -100,6 +100,7 @@ class SettingsService:
                 ("system", "auto_launch", False, "bool", "是否开机自启并最小化"),
                 ("memory", "recall_enabled", True, "bool", "是否启用记忆召回功能"),
                 ("memory", "search_rounds", 3, "int", "记忆检索的最大轮数"),
+                ("memory", "recall_mode", "agent", "string", "记忆召回模式：agent 多轮检索 / single_shot 单次生成检索词"),
                 ("memory", "event_topk", 5, "int", "事件记忆召回的数量"),
                 ("memory", "similarity_threshold", 0.5, "float", "语义检索的相似度阈值"),
             ]
@@ -0,0 +1,284 @@
+"""
+Fan-out of generation events to any number of SSE subscribers.
+
+A generation opens a stream under a key (``chat:<ai message id>``,
+``group:<user message id>``) and publishes its events through a ``StreamWriter``,
+which keeps the ``asyncio.Queue`` interface the generation tasks already use. The
+stream numbers its events and keeps the newest ``STREAM_HUB_BUFFER_EVENTS`` in a
+ring buffer; subscribers follow it from any id still in the buffer, so a second tab
+or a reconnect carrying ``Last-Event-ID`` replays exactly what it missed. Closed
+streams are kept for ``STREAM_HUB_RETENTION_SECONDS`` for late reconnects, then
+dropped.
+
+The ring buffer is per process. When the coordination backend is shared between
+workers, every event is also published to the channel ``stream:<key>`` and the
+stream's keys are held in ``live_keys`` while it is open, so a client reconnecting
+to another worker is served from the channel (``replay_remote``). After the stream
+closes, or when no worker holds it, clients fall back to the persisted content.
+"""
+import asyncio
+import itertools
+import logging
+from collections import deque
+from typing import AsyncGenerator, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+from app.core import coordination
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _channel(key: str) -> str:
+    return f"stream:{key}"
+
+
+def _owner_key(name: str) -> str:
+    return f"stream_owner:{name}"
+
+
+class HubStream:
+    __slots__ = ("key", "aliases", "events", "last_id", "producers", "closed", "changed", "channel")
+
+    def __init__(self, key: str, capacity: int, producers: int, aliases: Tuple[str, ...]) -> None:
+        self.key = key
+        self.aliases = aliases
+        self.events: Deque[Tuple[int, Dict]] = deque(maxlen=max(1, capacity))
+        self.last_id = 0
+        self.producers = producers
+        self.closed = False
+        self.changed = asyncio.Event()
+        # 多 worker 时同步发布到协调后端的频道，供其它 worker 上的重连订阅
+        self.channel: Optional[coordination.ChannelWriter] = None
+
+    def covers(self, after_id: int) -> bool:
+        """True when every event after ``after_id`` is still in the buffer."""
+        first_id = self.events[0][0] if self.events else self.last_id + 1
+        return after_id >= first_id - 1
+
+    def _notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class StreamWriter:
+    """Queue-style producer handle: ``put(event)`` publishes, ``put(None)`` ends this producer."""
+
+    def __init__(self, hub: "StreamHub", stream: HubStream) -> None:
+        self.hub = hub
+        self.stream = stream
+        self.done = False
+
+    async def put(self, event: Optional[Dict]) -> None:
+        self.put_nowait(event)
+
+    def put_nowait(self, event: Optional[Dict]) -> None:
+        if self.done:
+            return
+        if event is None:
+            # 每个 writer 只计一次结束，重复的 None 不会提前关闭其它生产者的流
+            self.done = True
+            self.hub.finish(self.stream)
+        else:
+            self.hub.publish(self.stream, event)
+
+
+class StreamHub:
+    def __init__(self) -> None:
+        self._streams: Dict[str, HubStream] = {}
+
+    def open(self, key: str, producers: int = 1, aliases: Iterable[str] = ()) -> HubStream:
+        """
+        Register a stream fed by ``producers`` writers; it closes once each has put ``None``.
+        ``aliases`` are extra keys resolving to the same stream.
+        """
+        stream = HubStream(key, settings.STREAM_HUB_BUFFER_EVENTS, producers, tuple(aliases))
+        for name in (key, *stream.aliases):
+            self._streams[name] = stream
+        if coordination.is_shared():
+            stream.channel = coordination.ChannelWriter(_channel(key))
+            # 别名也指向主 key，其它 worker 按任一 key 都能找到频道
+            for name in (key, *stream.aliases):
+                coordination.live_keys.hold(_owner_key(name), key)
+        return stream
+
+    def get(self, key: str) -> Optional[HubStream]:
+        return self._streams.get(key)
+
+    def writer(self, stream: HubStream) -> StreamWriter:
+        return StreamWriter(self, stream)
+
+    def publish(self, stream: HubStream, event: Dict) -> int:
+        if stream.closed:
+            return stream.last_id
+        stream.last_id += 1
+        stream.events.append((stream.last_id, event))
+        stream._notify()
+        if stream.channel is not None:
+            stream.channel.put_nowait({"id": stream.last_id, "event": event})
+        return stream.last_id
+
+    def finish(self, stream: HubStream) -> None:
+        stream.producers -= 1
+        if stream.producers <= 0:
+            self.close(stream)
+
+    def close(self, stream: HubStream) -> None:
+        if stream.closed:
+            return
+        stream.closed = True
+        stream._notify()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if stream.channel is not None:
+            # None 为结束标记；写出后才释放占用标记，远端订阅者不会把正常结束当成中断
+            stream.channel.put_nowait(None)
+            if loop is not None:
+                loop.create_task(self._release(stream))
+            else:
+                self._release_keys(stream)
+        if loop is not None:
+            loop.call_later(settings.STREAM_HUB_RETENTION_SECONDS, self._remove, stream)
+        else:
+            self._remove(stream)
+
+    @staticmethod
+    def _release_keys(stream: HubStream) -> None:
+        for name in (stream.key, *stream.aliases):
+            coordination.live_keys.release(_owner_key(name))
+
+    async def _release(self, stream: HubStream) -> None:
+        await stream.channel.flush()
+        self._release_keys(stream)
+
+    def _remove(self, stream: HubStream) -> None:
+        for name in (stream.key, *stream.aliases):
+            # 同名 key 可能已被新的流占用
+            if self._streams.get(name) is stream:
+                del self._streams[name]
+
+    async def subscribe(
+        self,
+        stream: HubStream,
+        after_id: int = 0,
+        predicate: Optional[Callable[[Dict], bool]] = None,
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        Events published after ``after_id`` (each with its ``id``, optionally only those
+        matching ``predicate``) until the stream closes. A subscriber that falls more than
+        a buffer behind gets a ``stream_lagged`` error and should resume from the
+        persisted content.
+        """
+        cursor = after_id
+        while True:
+            changed = stream.changed
+            if stream.last_id > cursor:
+                if not stream.covers(cursor):
+                    logger.warning(f"[StreamHub] Subscriber of {stream.key} fell behind at id {cursor}")
+                    yield {"event": "error", "data": {"code": "stream_lagged", "detail": "Stream buffer overrun, resume from offset"}}
+                    return
+                # 先同步拷出待发事件：yield 期间生产者可能继续写入（deque 迭代中不能被修改），
+                # 下一轮再检查 covers()
+                first_id = stream.events[0][0]
+                pending = list(itertools.islice(stream.events, cursor - first_id + 1, None))
+                for event_id, event in pending:
+                    cursor = event_id
+                    if predicate is None or predicate(event):
+                        yield {**event, "id": event_id}
+                continue
+            if stream.closed:
+                return
+            await changed.wait()
+
+    def replay(
+        self,
+        key: str,
+        after_id: Optional[int],
+        predicate: Optional[Callable[[Dict], bool]] = None,
+    ) -> Optional[AsyncGenerator[Dict, None]]:
+        """
+        Subscription for a reconnecting client, or ``None`` when the stream is gone or
+        no longer holds everything after ``after_id``.
+        """
+        stream = self.get(key)
+        if stream is None or after_id is None or after_id > stream.last_id or not stream.covers(after_id):
+            return None
+        return self.subscribe(stream, after_id, predicate)
+
+    async def replay_remote(
+        self,
+        key: str,
+        after_id: Optional[int],
+        predicate: Optional[Callable[[Dict], bool]] = None,
+    ) -> Optional[AsyncGenerator[Dict, None]]:
+        """
+        Like ``replay`` for a stream open on any worker sharing the coordination
+        backend; ``None`` when the backend is local or no worker holds the stream.
+        """
+        if after_id is None or not coordination.is_shared():
+            return None
+        primary = await coordination.live_keys.alive(_owner_key(key))
+        if primary is None:
+            return None
+        return self._subscribe_remote(primary, after_id, predicate)
+
+    async def _subscribe_remote(
+        self,
+        key: str,
+        after_id: int,
+        predicate: Optional[Callable[[Dict], bool]],
+    ) -> AsyncGenerator[Dict, None]:
+        backend = coordination.get_backend()
+        poll = settings.COORDINATION_POLL_INTERVAL_MS / 1000
+        cursor = 0
+        idle = 0.0
+        while True:
+            messages = await backend.acall("read", _channel(key), cursor)
+            if not messages:
+                # 长时间没有新事件时确认持有者还在（崩溃的 worker 不会写结束标记）
+                idle += poll
+                if idle >= settings.COORDINATION_LIVE_KEY_TTL_SECONDS / 3:
+                    idle = 0.0
+                    if await coordination.live_keys.alive(_owner_key(key)) is None:
+                        if not await backend.acall("read", _channel(key), cursor):
+                            logger.warning(f"[StreamHub] Owner of {key} went away without closing the stream")
+                            yield {"event": "error", "data": {"code": "stream_interrupted", "detail": "Stream owner stopped, resume from offset"}}
+                            return
+                        continue
+                await asyncio.sleep(poll)
+                continue
+            idle = 0.0
+            for cursor, payload in messages:
+                if payload is None:
+                    return
+                event_id = payload["id"]
+                if event_id <= after_id:
+                    continue
+                if event_id > after_id + 1:
+                    # 频道的保留窗口已不包含断点之后的全部事件
+                    yield {"event": "error", "data": {"code": "stream_lagged", "detail": "Stream buffer overrun, resume from offset"}}
+                    return
+                after_id = event_id
+                event = payload["event"]
+                if predicate is None or predicate(event):
+                    yield {**event, "id": event_id}
+
+    def stats(self) -> Tuple[int, int]:
+        """(streams, buffered events) currently held."""
+        streams = {id(stream): stream for stream in self._streams.values()}
+        return len(streams), sum(len(stream.events) for stream in streams.values())
+
+
+def parse_event_id(value: Optional[str]) -> Optional[int]:
+    """Integer ``Last-Event-ID`` header value, ``None`` when absent or malformed."""
+    if value is None:
+        return None
+    try:
+        event_id = int(value.strip())
+    except ValueError:
+        return None
+    return event_id if event_id >= 0 else None
+
+
+stream_hub = StreamHub()
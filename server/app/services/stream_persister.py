@@ -0,0 +1,266 @@
+"""
+Write-behind persistence for AI replies that are still being generated.
+
+Generation tasks register the placeholder row with ``begin`` and hand every visible
+span to ``append`` (a string concat, nothing else on the token path). A single
+background coroutine checkpoints dirty replies to their rows on a time / byte
+cadence, batching all dirty rows of a database into one commit made in a worker
+thread. While a reply is live, reconnecting clients can tail it from any character
+offset via ``follow``.
+
+With a coordination backend shared between workers, the worker generating a reply
+holds ``live_reply:<table>:<id>`` in ``live_keys`` and also publishes each span with
+its offset to the channel ``reply:<table>:<id>``; ``resume`` on another worker tails
+that channel, and reports ``interrupted`` only when no worker holds the reply.
+"""
+import asyncio
+import logging
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core import coordination
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+STATUS_STREAMING = "streaming"
+STATUS_COMPLETE = "complete"
+
+
+def _live_name(model, message_id: int) -> str:
+    return f"{model.__tablename__}:{message_id}"
+
+
+class LiveReply:
+    __slots__ = ("model", "message_id", "bind", "content", "done", "dirty_bytes", "changed", "channel")
+
+    def __init__(self, model, message_id: int, bind) -> None:
+        self.model = model
+        self.message_id = message_id
+        self.bind = bind
+        self.content = ""
+        self.done = False
+        self.dirty_bytes = 0
+        self.changed = asyncio.Event()
+        self.channel: Optional[coordination.ChannelWriter] = None
+
+    def _notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class StreamPersister:
+    def __init__(self) -> None:
+        self._live: Dict[Tuple[str, int], LiveReply] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _key(model, message_id: int) -> Tuple[str, int]:
+        return model.__tablename__, message_id
+
+    def get(self, model, message_id: int) -> Optional[LiveReply]:
+        return self._live.get(self._key(model, message_id))
+
+    def begin(self, model, message_id: int, db: Session) -> LiveReply:
+        """
+        Mark the placeholder row as streaming and register it.
+        Checkpoints use a fresh session on the same bind as ``db``.
+        """
+        reply = LiveReply(model, message_id, db.get_bind())
+        db.query(model).filter(model.id == message_id).update(
+            {"status": STATUS_STREAMING}, synchronize_session=False
+        )
+        db.commit()
+        self._live[self._key(model, message_id)] = reply
+        if coordination.is_shared():
+            name = _live_name(model, message_id)
+            reply.channel = coordination.ChannelWriter(f"reply:{name}")
+            coordination.live_keys.hold(f"live_reply:{name}")
+        if self._task is None or self._task.done() or self._task.get_loop() is not asyncio.get_running_loop():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        return reply
+
+    def append(self, reply: LiveReply, text: str) -> None:
+        if not text:
+            return
+        if reply.channel is not None:
+            reply.channel.put_nowait({"offset": len(reply.content), "text": text})
+        reply.content += text
+        reply.dirty_bytes += len(text)
+        reply._notify()
+        if reply.dirty_bytes >= settings.STREAM_CHECKPOINT_BYTES and self._wakeup is not None:
+            self._wakeup.set()
+
+    def end(self, reply: LiveReply, content: Optional[str] = None) -> None:
+        """
+        Finalize and unregister a reply: ``content`` (the streamed text when omitted,
+        e.g. on error / cancellation) and the complete status are written in one
+        statement. Later calls for the same reply are no-ops.
+        """
+        if reply.done:
+            return
+        if content is None:
+            content = reply.content
+        elif content.startswith(reply.content):
+            # 最终内容的补充部分（如占位文本）也推给正在续接的客户端
+            self.append(reply, content[len(reply.content):])
+        reply.done = True
+        self._live.pop(self._key(reply.model, reply.message_id), None)
+        try:
+            with Session(bind=reply.bind) as session:
+                session.query(reply.model).filter(
+                    reply.model.id == reply.message_id,
+                    reply.model.status == STATUS_STREAMING,
+                ).update(
+                    {"content": content, "status": STATUS_COMPLETE},
+                    synchronize_session=False,
+                )
+                session.commit()
+        except Exception as e:
+            logger.warning(f"[StreamPersist] Finalize {reply.model.__tablename__}#{reply.message_id} failed: {e}")
+        reply._notify()
+        if reply.channel is not None:
+            # 结束标记写出后再释放占用标记
+            reply.channel.put_nowait(None)
+            try:
+                asyncio.get_running_loop().create_task(self._release(reply))
+            except RuntimeError:
+                coordination.live_keys.release(f"live_reply:{_live_name(reply.model, reply.message_id)}")
+
+    @staticmethod
+    async def _release(reply: LiveReply) -> None:
+        await reply.channel.flush()
+        coordination.live_keys.release(f"live_reply:{_live_name(reply.model, reply.message_id)}")
+
+    async def follow(self, reply: LiveReply, offset: int = 0) -> AsyncGenerator[str, None]:
+        """Yield content from ``offset`` onwards until the reply ends."""
+        sent = max(0, offset)
+        while True:
+            changed = reply.changed
+            if len(reply.content) > sent:
+                chunk = reply.content[sent:]
+                sent += len(chunk)
+                yield chunk
+                continue
+            if reply.done:
+                return
+            await changed.wait()
+
+    async def resume(
+        self, db: Session, model, message_id: int, offset: int = 0, extra: Optional[Dict] = None
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        SSE events for a reconnecting client: tail the live reply if it is still
+        generating, otherwise replay the persisted content after ``offset``.
+        A row left as ``streaming`` with no live reply was cut off by a restart.
+        """
+        extra = extra or {}
+        reply = self.get(model, message_id)
+        if reply is not None:
+            async for chunk in self.follow(reply, offset):
+                yield {"event": "message", "data": {**extra, "delta": chunk}}
+            finish_reason = "stop"
+        else:
+            row = db.query(model).filter(model.id == message_id).first()
+            if row is None:
+                yield {"event": "error", "data": {"code": "message_not_found", "detail": "Message not found"}}
+                return
+            content = row.content or ""
+            if len(content) > offset:
+                yield {"event": "message", "data": {**extra, "delta": content[max(0, offset):]}}
+            finish_reason = "interrupted" if row.status == STATUS_STREAMING else "stop"
+            if finish_reason == "interrupted" and coordination.is_shared():
+                name = _live_name(model, message_id)
+                if await coordination.live_keys.alive(f"live_reply:{name}") is not None:
+                    # 回复仍在其它 worker 上生成：检查点之后的内容从频道续接
+                    finish_reason = "stop"
+                    async for chunk in self._follow_remote(name, max(offset, len(content))):
+                        if chunk is None:
+                            finish_reason = "interrupted"
+                            break
+                        yield {"event": "message", "data": {**extra, "delta": chunk}}
+        yield {"event": "done", "data": {**extra, "message_id": message_id, "finish_reason": finish_reason}}
+
+    @staticmethod
+    async def _follow_remote(name: str, sent: int) -> AsyncGenerator[Optional[str], None]:
+        """
+        Text after offset ``sent`` of a reply generated on another worker, until it
+        ends; yields ``None`` if that worker stops holding the reply without ending it.
+        """
+        backend = coordination.get_backend()
+        channel = f"reply:{name}"
+        poll = settings.COORDINATION_POLL_INTERVAL_MS / 1000
+        cursor = 0
+        idle = 0.0
+        while True:
+            messages = await backend.acall("read", channel, cursor)
+            if not messages:
+                idle += poll
+                if idle >= settings.COORDINATION_LIVE_KEY_TTL_SECONDS / 3:
+                    idle = 0.0
+                    if await coordination.live_keys.alive(f"live_reply:{name}") is None:
+                        if not await backend.acall("read", channel, cursor):
+                            yield None
+                            return
+                        continue
+                await asyncio.sleep(poll)
+                continue
+            idle = 0.0
+            for cursor, payload in messages:
+                if payload is None:
+                    return
+                start, text = payload["offset"], payload["text"]
+                if start + len(text) > sent:
+                    yield text[max(0, sent - start):]
+                    sent = start + len(text)
+
+    def _collect_dirty(self) -> Dict[object, List[Tuple[LiveReply, str]]]:
+        """Snapshot of dirty live replies per bind; their dirty counters are reset."""
+        by_bind: Dict[object, List[Tuple[LiveReply, str]]] = {}
+        for reply in list(self._live.values()):
+            if reply.dirty_bytes and not reply.done:
+                by_bind.setdefault(reply.bind, []).append((reply, reply.content))
+                reply.dirty_bytes = 0
+        return by_bind
+
+    @staticmethod
+    def _write(by_bind: Dict[object, List[Tuple[LiveReply, str]]]) -> int:
+        written = 0
+        for bind, replies in by_bind.items():
+            try:
+                with Session(bind=bind) as session:
+                    for reply, content in replies:
+                        # 只覆盖仍在生成中的行，避免旧检查点盖掉最终内容
+                        session.query(reply.model).filter(
+                            reply.model.id == reply.message_id,
+                            reply.model.status == STATUS_STREAMING,
+                        ).update({"content": content}, synchronize_session=False)
+                    session.commit()
+                    written += len(replies)
+            except Exception as e:
+                logger.warning(f"[StreamPersist] Checkpoint failed: {e}")
+        return written
+
+    def checkpoint(self) -> int:
+        """Write every dirty live reply, one commit per database. Returns rows written."""
+        return self._write(self._collect_dirty())
+
+    async def _run(self) -> None:
+        interval = settings.STREAM_CHECKPOINT_INTERVAL_MS / 1000
+        while self._live:
+            wakeup = self._wakeup
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+            # 内容快照在事件循环上取，提交放到线程里，不阻塞 token 流
+            by_bind = self._collect_dirty()
+            if by_bind:
+                await asyncio.to_thread(self._write, by_bind)
+
+
+stream_persister = StreamPersister()
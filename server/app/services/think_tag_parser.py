@@ -0,0 +1,66 @@
+"""
+Incremental parser splitting streamed model output into message / thinking spans.
+
+Some providers inline their reasoning as ``<think>...</think>`` inside the content
+stream. The parser is fed provider deltas as they arrive and returns the spans that
+can be emitted right away. Only a trailing fragment that could still become a tag
+(at most ``len("</think>") - 1`` characters) is held back, so other markup such as
+the ``<message>`` segment tags requested by persona prompts flows through without
+waiting for more text.
+"""
+from typing import List, Tuple
+
+THINK_START = "<think>"
+THINK_END = "</think>"
+
+MESSAGE = "message"
+THINKING = "thinking"
+
+
+class ThinkTagParser:
+    __slots__ = ("in_think", "_pending")
+
+    def __init__(self) -> None:
+        self.in_think = False
+        self._pending = ""
+
+    def feed(self, delta: str) -> List[Tuple[str, str]]:
+        """Consume a delta and return the ``(kind, text)`` spans that are final."""
+        if not delta:
+            return []
+        text = self._pending + delta if self._pending else delta
+        self._pending = ""
+        spans: List[Tuple[str, str]] = []
+        start = 0
+        pos = 0
+        length = len(text)
+
+        while True:
+            tag = THINK_END if self.in_think else THINK_START
+            idx = text.find("<", pos)
+            if idx == -1:
+                break
+            if text.startswith(tag, idx):
+                if idx > start:
+                    spans.append((THINKING if self.in_think else MESSAGE, text[start:idx]))
+                self.in_think = not self.in_think
+                start = pos = idx + len(tag)
+                continue
+            if length - idx < len(tag) and tag.startswith(text[idx:]):
+                # 可能是被切断的标签，留到下一个 delta 再判断
+                if idx > start:
+                    spans.append((THINKING if self.in_think else MESSAGE, text[start:idx]))
+                self._pending = text[idx:]
+                return spans
+            pos = idx + 1
+
+        if start < length:
+            spans.append((THINKING if self.in_think else MESSAGE, text[start:]))
+        return spans
+
+    def flush(self) -> List[Tuple[str, str]]:
+        """Return whatever is still held back once the stream has ended."""
+        if not self._pending:
+            return []
+        pending, self._pending = self._pending, ""
+        return [(THINKING if self.in_think else MESSAGE, pending)]
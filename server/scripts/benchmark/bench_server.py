@@ -0,0 +1,102 @@
+"""
+Backend runner for load tests: ``app.main`` plus per-request database timing.
+
+Requests carrying ``X-Bench-Request-Id`` accumulate the time spent executing SQL on
+both databases, including background tasks and threads the request spawns (they
+inherit the context). Totals are read back after the stream has finished with
+``GET /__bench__/db-time/{request_id}``.
+
+Usage (from the server directory):
+    python scripts/benchmark/bench_server.py --port 8100 --data-dir /tmp/bench-data
+"""
+import argparse
+import contextvars
+import os
+import sys
+import threading
+import time
+
+SERVER_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if SERVER_ROOT not in sys.path:
+    sys.path.insert(0, SERVER_ROOT)
+
+REQUEST_HEADER = b"x-bench-request-id"
+
+_current_request = contextvars.ContextVar("bench_request_id", default=None)
+_totals = {}
+_lock = threading.Lock()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("bench_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("bench_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    request_id = _current_request.get()
+    if request_id is None:
+        return
+    with _lock:
+        total = _totals.setdefault(request_id, {"seconds": 0.0, "statements": 0})
+        total["seconds"] += elapsed
+        total["statements"] += 1
+
+
+class BenchRequestMiddleware:
+    """Binds the bench request id for the whole request, streaming body included."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = dict(scope.get("headers") or []).get(REQUEST_HEADER)
+        if request_id is None:
+            return await self.app(scope, receive, send)
+        token = _current_request.set(request_id.decode("latin-1"))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_request.reset(token)
+
+
+def create_app():
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    from app.main import app
+
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.get("/__bench__/db-time/{request_id}", include_in_schema=False)
+    def read_db_time(request_id: str):
+        with _lock:
+            total = _totals.pop(request_id, {"seconds": 0.0, "statements": 0})
+        return {"db_ms": round(total["seconds"] * 1000, 3), "statements": total["statements"]}
+
+    app.add_middleware(BenchRequestMiddleware)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="WeAgentChat backend with per-request DB timing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--data-dir", dest="data_dir", required=True)
+    args = parser.parse_args()
+
+    # 与 app/cli.py 一致：数据目录须在导入 app 之前写入环境变量
+    os.environ["WeAgentChat_DATA_DIR"] = args.data_dir
+
+    import uvicorn
+
+    uvicorn.run(create_app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
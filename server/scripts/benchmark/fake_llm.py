@@ -0,0 +1,213 @@
+"""
+Deterministic OpenAI-compatible stand-in for load tests and offline benchmarks.
+
+- ``POST /v1/chat/completions``: streaming and non-streaming replies whose text is
+  derived from the last user message. The first token arrives after ``ttft_ms``,
+  the rest at ``tokens_per_second``. ``response_format=json_object`` returns ``{}``.
+- ``POST /v1/embeddings``: hashed character uni/bigram vectors, L2-normalized, so the
+  same text always gets the same vector and texts sharing words are close.
+- ``GET /stats``: request counters, reset with ``DELETE /stats``.
+
+Usage (from the server directory):
+    python scripts/benchmark/fake_llm.py --port 9100 --ttft-ms 300 --tps 40
+"""
+import argparse
+import asyncio
+import json
+import time
+import zlib
+from collections import Counter
+from typing import List, Optional
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_EMBEDDING_DIM = 1024
+VOCABULARY = (
+    "今天 天气 不错 我们 一起 去 吃 火锅 吧 ， 最近 工作 有点 忙 ， 不过 周末 可以 休息 。 "
+    "你 说 的 对 ， 我 也 这么 觉得 ！ 听 起来 很 有意思 ， 下次 带 上 我 。"
+).split()
+
+
+def embed_vector(text: str, dim: int = DEFAULT_EMBEDDING_DIM) -> np.ndarray:
+    """Signed feature hashing of character unigrams and bigrams (float32, unit length)."""
+    vec = np.zeros(dim, dtype=np.float32)
+    chars = "".join(text.lower().split())
+    grams = list(chars) + [chars[i:i + 2] for i in range(len(chars) - 1)]
+    for gram in grams:
+        h = zlib.crc32(gram.encode("utf-8"))
+        vec[h % dim] += 1.0 if (h // dim) % 2 == 0 else -1.0
+    norm = float(np.linalg.norm(vec))
+    if norm == 0:
+        vec[0] = 1.0
+        norm = 1.0
+    return vec / norm
+
+
+def embed_text(text: str, dim: int = DEFAULT_EMBEDDING_DIM) -> List[float]:
+    return embed_vector(text, dim).tolist()
+
+
+def reply_tokens(messages: List[dict], count: int) -> List[str]:
+    """Same conversation in, same reply out."""
+    last_user = next((m for m in reversed(messages) if m.get("role") == "user"), {})
+    content = last_user.get("content") or ""
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False)
+    seed = zlib.crc32(content.encode("utf-8"))
+    tokens = []
+    for _ in range(count):
+        seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+        tokens.append(VOCABULARY[seed % len(VOCABULARY)])
+    return tokens
+
+
+def create_app(
+    ttft_ms: float = 300.0,
+    tokens_per_second: float = 40.0,
+    reply_length: int = 60,
+    embedding_dim: int = DEFAULT_EMBEDDING_DIM,
+    embedding_latency_ms: float = 0.0,
+) -> FastAPI:
+    app = FastAPI(title="Fake LLM")
+    stats: Counter = Counter()
+    token_interval = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+
+    def _completion_id() -> str:
+        return f"chatcmpl-fake-{stats['chat_completions']}"
+
+    def _usage(messages: List[dict], completion_tokens: int) -> dict:
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "fake-chat", "object": "model", "owned_by": "benchmark"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["chat_completions"] += 1
+        model = body.get("model") or "fake-chat"
+        messages = body.get("messages") or []
+        json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+        tokens = ["{}"] if json_mode else reply_tokens(messages, reply_length)
+        completion_id = _completion_id()
+        created = int(time.time())
+
+        if not body.get("stream"):
+            stats["chat_completions_sync"] += 1
+            await asyncio.sleep(ttft_ms / 1000 + token_interval * (len(tokens) - 1))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": _usage(messages, len(tokens)),
+            }
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        def _chunk(delta: dict, finish_reason: Optional[str] = None) -> bytes:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        async def _stream():
+            await asyncio.sleep(ttft_ms / 1000)
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(token_interval)
+                delta = {"content": token}
+                if i == 0:
+                    delta["role"] = "assistant"
+                yield _chunk(delta)
+            yield _chunk({}, "stop")
+            if include_usage:
+                usage = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": _usage(messages, len(tokens)),
+                }
+                yield f"data: {json.dumps(usage)}\n\n".encode("utf-8")
+            yield b"data: [DONE]\n\n"
+
+        stats["chat_completions_stream"] += 1
+        return StreamingResponse(_stream(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        stats["embeddings"] += 1
+        texts = body.get("input") or []
+        if isinstance(texts, str):
+            texts = [texts]
+        stats["embedding_inputs"] += len(texts)
+        dim = int(body.get("dimensions") or embedding_dim)
+        if embedding_latency_ms:
+            await asyncio.sleep(embedding_latency_ms / 1000)
+        return {
+            "object": "list",
+            "model": body.get("model") or "fake-embedding",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": embed_text(str(text), dim)}
+                for i, text in enumerate(texts)
+            ],
+            "usage": {"prompt_tokens": sum(len(str(t)) for t in texts), "total_tokens": sum(len(str(t)) for t in texts)},
+        }
+
+    @app.get("/stats")
+    async def read_stats():
+        return dict(stats)
+
+    @app.delete("/stats")
+    async def reset_stats():
+        stats.clear()
+        return JSONResponse({"ok": True})
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Deterministic OpenAI-compatible fake LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="Delay before the first streamed token")
+    parser.add_argument("--tps", type=float, default=40.0, help="Streamed tokens per second after the first")
+    parser.add_argument("--reply-length", type=int, default=60, help="Tokens per reply")
+    parser.add_argument("--embedding-dim", type=int, default=DEFAULT_EMBEDDING_DIM)
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = create_app(
+        ttft_ms=args.ttft_ms,
+        tokens_per_second=args.tps,
+        reply_length=args.reply_length,
+        embedding_dim=args.embedding_dim,
+        embedding_latency_ms=args.embedding_latency_ms,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,486 @@
+"""
+End-to-end load test of the backend against the deterministic fake LLM.
+
+Starts ``fake_llm.py`` and ``bench_server.py`` on free ports with a fresh data
+directory, configures the fake provider through the API, then drives each scenario
+at the requested concurrency:
+
+- ``chat``: ``POST /chat/friends/{id}/messages`` (one friend per worker)
+- ``group``: ``POST /chat/group/{id}/messages`` (one group per worker)
+- ``auto_drive``: start a brainstorm run and read ``/group/auto-drive/stream`` to the end
+- ``archive``: one chat turn, ``POST /chat/sessions/{id}/archive``, then wait for memory generation
+
+Per request it records TTFT (first ``message`` delta), inter-token latency between
+``message`` frames (after server-side coalescing, i.e. what the UI sees), total time
+and the SQL time spent by the request, and reports count / mean / p50 / p95 / p99 / max.
+Archive timing includes waiting for the memory worker, but its SQL time covers only
+the archive request itself (the worker is not bound to any request).
+
+Usage (from the server directory):
+    python scripts/benchmark/load_test.py --scenarios chat,group --concurrency 4 --requests 40 --output results.json
+    python scripts/benchmark/load_test.py --compare baseline.json results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_ROOT = os.path.dirname(os.path.dirname(BENCH_DIR))
+SCENARIOS = ("chat", "group", "auto_drive", "archive")
+METRICS = ("ttft_ms", "itl_ms", "total_ms", "db_ms", "db_statements")
+EMBEDDING_DIM = 256
+
+
+@dataclass
+class Sample:
+    scenario: str
+    ok: bool = True
+    error: Optional[str] = None
+    ttft_ms: Optional[float] = None
+    itl_ms: List[float] = field(default_factory=list)
+    total_ms: Optional[float] = None
+    db_ms: Optional[float] = None
+    db_statements: Optional[int] = None
+    frames: int = 0
+
+
+def percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    arr = np.asarray(values, dtype=np.float64)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        "count": int(arr.size),
+        "mean": round(float(arr.mean()), 3),
+        "p50": round(float(p50), 3),
+        "p95": round(float(p95), 3),
+        "p99": round(float(p99), 3),
+        "max": round(float(arr.max()), 3),
+    }
+
+
+def summarize(samples: List[Sample], wall_s: float) -> Dict[str, Any]:
+    ok = [s for s in samples if s.ok]
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(ok) / wall_s, 3) if wall_s > 0 else None,
+        "ttft_ms": percentiles([s.ttft_ms for s in ok if s.ttft_ms is not None]),
+        "itl_ms": percentiles([gap for s in ok for gap in s.itl_ms]),
+        "total_ms": percentiles([s.total_ms for s in ok if s.total_ms is not None]),
+        "db_ms": percentiles([s.db_ms for s in ok if s.db_ms is not None]),
+        "db_statements": percentiles([s.db_statements for s in ok if s.db_statements is not None]),
+        "error_samples": [s.error for s in samples if not s.ok][:5],
+    }
+
+
+async def iter_sse(response: httpx.Response) -> AsyncIterator[Tuple[str, Any]]:
+    event, data_lines = "message", []
+    async for line in response.aiter_lines():
+        if not line:
+            if data_lines:
+                raw = "\n".join(data_lines)
+                try:
+                    data = json.loads(raw)
+                except ValueError:
+                    data = raw
+                yield event, data
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[5:].strip())
+
+
+class Bench:
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.client = httpx.AsyncClient(base_url=f"{self.base_url}/api", timeout=timeout)
+        self.db_timing = True
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    async def _db_time(self, sample: Sample, bench_id: str) -> None:
+        if not self.db_timing:
+            return
+        resp = await self.client.get(f"{self.base_url}/__bench__/db-time/{bench_id}")
+        if resp.status_code == 404:
+            # 连接的是普通后端（--server-url），没有计时接口
+            self.db_timing = False
+            return
+        body = resp.json()
+        sample.db_ms = body["db_ms"]
+        sample.db_statements = body["statements"]
+
+    async def stream(
+        self, sample: Sample, method: str, path: str, done_events=("done",), bench_id: Optional[str] = None, **kwargs
+    ) -> Sample:
+        bench_id = bench_id or uuid.uuid4().hex
+        headers = {"X-Bench-Request-Id": bench_id}
+        start = time.perf_counter()
+        last_frame = None
+        try:
+            async with self.client.stream(method, path, headers=headers, **kwargs) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+                async for event, data in iter_sse(response):
+                    now = time.perf_counter()
+                    if event in ("error", "auto_drive_error"):
+                        raise RuntimeError(f"{event}: {data}")
+                    if event == "message" and isinstance(data, dict) and data.get("delta"):
+                        sample.frames += 1
+                        if sample.ttft_ms is None:
+                            sample.ttft_ms = (now - start) * 1000
+                        else:
+                            sample.itl_ms.append((now - last_frame) * 1000)
+                        last_frame = now
+                    if event in done_events:
+                        break
+            sample.total_ms = (time.perf_counter() - start) * 1000
+            await self._db_time(sample, bench_id)
+        except Exception as e:
+            sample.ok = False
+            sample.error = str(e) or type(e).__name__
+        return sample
+
+    async def request(self, sample: Sample, method: str, path: str, **kwargs) -> httpx.Response:
+        bench_id = uuid.uuid4().hex
+        start = time.perf_counter()
+        resp = await self.client.request(method, path, headers={"X-Bench-Request-Id": bench_id}, **kwargs)
+        resp.raise_for_status()
+        sample.total_ms = (time.perf_counter() - start) * 1000
+        await self._db_time(sample, bench_id)
+        return resp
+
+    # --- 准备数据 ---
+
+    async def configure_provider(self, fake_url: str) -> None:
+        resp = await self.client.post("/llm/configs", json={
+            "provider": "openai",
+            "config_name": "bench",
+            "base_url": f"{fake_url}/v1",
+            "api_key": "sk-bench",
+            "model_name": "fake-chat",
+            "is_verified": True,
+        })
+        resp.raise_for_status()
+        resp = await self.client.post("/embedding-settings/", json={
+            "config_name": "bench",
+            "embedding_provider": "openai",
+            "embedding_api_key": "sk-bench",
+            "embedding_base_url": f"{fake_url}/v1",
+            "embedding_dim": EMBEDDING_DIM,
+            "embedding_model": "fake-embedding",
+            "is_verified": True,
+        })
+        resp.raise_for_status()
+
+    async def create_friends(self, count: int) -> List[int]:
+        ids = []
+        for i in range(count):
+            resp = await self.client.post("/friends/", json={
+                "name": f"bench-{i}",
+                "system_prompt": "你是用户的朋友，说话简短。",
+                "script_expression": False,
+            })
+            resp.raise_for_status()
+            ids.append(resp.json()["id"])
+        return ids
+
+    async def create_group(self, name: str, friend_ids: List[int]) -> int:
+        resp = await self.client.post("/group/create", json={
+            "name": name,
+            "member_ids": [str(fid) for fid in friend_ids],
+        })
+        resp.raise_for_status()
+        return resp.json()["id"]
+
+    # --- 场景 ---
+
+    async def chat(self, worker: int, n: int, ctx: Dict[str, Any]) -> Sample:
+        friend_id = ctx["friends"][worker]
+        return await self.stream(
+            Sample("chat"), "POST", f"/chat/friends/{friend_id}/messages",
+            json={"content": f"第{n}条消息：周末一起去吃火锅吗？"},
+        )
+
+    async def group(self, worker: int, n: int, ctx: Dict[str, Any]) -> Sample:
+        group_id = ctx["groups"][worker]
+        return await self.stream(
+            Sample("group"), "POST", f"/chat/group/{group_id}/messages",
+            json={"content": f"第{n}条群消息：大家周末有什么安排？"},
+        )
+
+    async def auto_drive(self, worker: int, n: int, ctx: Dict[str, Any]) -> Sample:
+        group_id = ctx["groups"][worker]
+        members = [str(fid) for fid in ctx["group_members"][group_id]]
+        sample = Sample("auto_drive")
+        # 运行任务由 start 请求创建，与 stream 共用同一个计时 id
+        bench_id = uuid.uuid4().hex
+        try:
+            await self.client.post("/group/auto-drive/stop", json={"group_id": group_id})
+            resp = await self.client.post("/group/auto-drive/start", headers={"X-Bench-Request-Id": bench_id}, json={
+                "group_id": group_id,
+                "config": {
+                    "mode": "brainstorm",
+                    "topic": {"theme": f"周末活动 {n}", "goal": "列出三个方案", "constraints": "预算 500 元以内"},
+                    "roles": {"participants": members},
+                    "turn_limit": ctx["turn_limit"],
+                    "end_action": "summary",
+                    "summary_by": members[0],
+                },
+            })
+            resp.raise_for_status()
+        except Exception as e:
+            sample.ok = False
+            sample.error = f"start: {e}"
+            return sample
+        return await self.stream(
+            sample, "GET", "/group/auto-drive/stream",
+            params={"group_id": group_id}, done_events=("auto_drive_done",), bench_id=bench_id,
+        )
+
+    async def archive(self, worker: int, n: int, ctx: Dict[str, Any]) -> Sample:
+        friend_id = ctx["friends"][worker]
+        sample = Sample("archive")
+        turn = await self.chat(worker, n, ctx)
+        if not turn.ok:
+            sample.ok, sample.error = False, f"chat: {turn.error}"
+            return sample
+        try:
+            sessions = (await self.client.get(f"/chat/friends/{friend_id}/sessions")).json()
+            session_id = next(s["id"] for s in sessions if s.get("memory_generated") == 0)
+            await self.request(sample, "POST", f"/chat/sessions/{session_id}/archive")
+            # 等待后台记忆生成结束（1 成功 / 2 失败）
+            start = time.perf_counter()
+            deadline = start + ctx["archive_wait"]
+            while time.perf_counter() < deadline:
+                sessions = (await self.client.get(f"/chat/friends/{friend_id}/sessions")).json()
+                status = next((s["memory_generated"] for s in sessions if s["id"] == session_id), None)
+                if status in (1, 2):
+                    sample.total_ms += (time.perf_counter() - start) * 1000
+                    if status == 2:
+                        raise RuntimeError("memory generation failed")
+                    return sample
+                await asyncio.sleep(0.2)
+            raise RuntimeError(f"memory not generated within {ctx['archive_wait']}s")
+        except Exception as e:
+            sample.ok = False
+            sample.error = str(e) or type(e).__name__
+        return sample
+
+
+async def run_scenario(bench: Bench, name: str, concurrency: int, requests: int, ctx: Dict[str, Any]):
+    runner = getattr(bench, name)
+    samples: List[Sample] = []
+    counter = iter(range(requests))
+
+    async def worker(index: int):
+        for n in counter:
+            samples.append(await runner(index, n, ctx))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _spawn(args: List[str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w", encoding="utf-8")
+    return subprocess.Popen([sys.executable, *args], cwd=SERVER_ROOT, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def _wait_ready(url: str, proc: subprocess.Popen, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(timeout=1) as client:
+        while time.perf_counter() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"process exited with {proc.returncode} before {url} was ready")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} not ready within {timeout}s")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="weagentchat-bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    processes = []
+    try:
+        fake_port = _free_port()
+        fake_url = f"http://127.0.0.1:{fake_port}"
+        processes.append(_spawn([
+            os.path.join(BENCH_DIR, "fake_llm.py"), "--port", str(fake_port),
+            "--ttft-ms", str(args.ttft_ms), "--tps", str(args.tps),
+            "--reply-length", str(args.reply_length), "--embedding-dim", str(EMBEDDING_DIM),
+        ], os.path.join(data_dir, "fake_llm.out")))
+        await _wait_ready(f"{fake_url}/stats", processes[-1], 30)
+
+        server_url = args.server_url
+        if not server_url:
+            port = _free_port()
+            server_url = f"http://127.0.0.1:{port}"
+            processes.append(_spawn([
+                os.path.join(BENCH_DIR, "bench_server.py"), "--port", str(port), "--data-dir", data_dir,
+            ], os.path.join(data_dir, "server.out")))
+            await _wait_ready(f"{server_url}/api/health", processes[-1], 60)
+
+        bench = Bench(server_url, args.timeout)
+        try:
+            await bench.configure_provider(fake_url)
+            friends = await bench.create_friends(args.concurrency * 2)
+            ctx: Dict[str, Any] = {
+                "friends": friends[:args.concurrency],
+                "groups": [],
+                "group_members": {},
+                "turn_limit": args.turn_limit,
+                "archive_wait": args.archive_wait,
+            }
+            if {"group", "auto_drive"} & set(scenarios):
+                for i in range(args.concurrency):
+                    members = [friends[i], friends[args.concurrency + i]]
+                    group_id = await bench.create_group(f"bench-group-{i}", members)
+                    ctx["groups"].append(group_id)
+                    ctx["group_members"][group_id] = members
+
+            results: Dict[str, Any] = {}
+            for name in scenarios:
+                samples, wall_s = await run_scenario(bench, name, args.concurrency, args.requests, ctx)
+                results[name] = summarize(samples, wall_s)
+                if args.samples:
+                    results[name]["samples"] = [asdict(s) for s in samples]
+                print(_format_summary(name, results[name]))
+            async with httpx.AsyncClient(timeout=5) as client:
+                fake_stats = (await client.get(f"{fake_url}/stats")).json()
+        finally:
+            await bench.close()
+    finally:
+        for proc in processes:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "data_dir": data_dir,
+            "server_url": args.server_url,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "ttft_ms": args.ttft_ms,
+            "tps": args.tps,
+            "reply_length": args.reply_length,
+        },
+        "scenarios": results,
+        "fake_llm": fake_stats,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_ROOT, capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _format_summary(name: str, summary: Dict[str, Any]) -> str:
+    parts = [f"[{name}] {summary['requests']} requests, {summary['errors']} errors, {summary['throughput_rps']} req/s"]
+    for metric in METRICS:
+        stats = summary.get(metric)
+        if stats:
+            parts.append(f"  {metric:<14} p50 {stats['p50']:>9.1f}  p95 {stats['p95']:>9.1f}  p99 {stats['p99']:>9.1f}")
+    for error in summary["error_samples"]:
+        parts.append(f"  error: {error}")
+    return "\n".join(parts)
+
+
+def compare(baseline_path: str, current_path: str) -> str:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["scenarios"]
+    with open(current_path, encoding="utf-8") as f:
+        current = json.load(f)["scenarios"]
+    lines = [f"{'scenario':<12} {'metric':<14} {'pct':<4} {'baseline':>10} {'current':>10} {'change':>8}"]
+    for name in current:
+        if name not in baseline:
+            continue
+        for metric in METRICS:
+            old, new = baseline[name].get(metric), current[name].get(metric)
+            if not old or not new:
+                continue
+            for pct in ("p50", "p95", "p99"):
+                change = (new[pct] - old[pct]) / old[pct] * 100 if old[pct] else 0.0
+                lines.append(
+                    f"{name:<12} {metric:<14} {pct:<4} {old[pct]:>10.1f} {new[pct]:>10.1f} {change:>+7.1f}%"
+                )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end load test against the fake LLM")
+    parser.add_argument("--scenarios", default="chat,group,auto_drive,archive",
+                        help=f"Comma separated: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=20, help="Requests per scenario")
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="Fake LLM time to first token")
+    parser.add_argument("--tps", type=float, default=40.0, help="Fake LLM tokens per second")
+    parser.add_argument("--reply-length", type=int, default=60, help="Fake LLM tokens per reply")
+    parser.add_argument("--turn-limit", type=int, default=2, help="Auto-drive turns per run")
+    parser.add_argument("--archive-wait", type=float, default=60.0, help="Seconds to wait for memory generation")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--data-dir", help="Backend data directory (default: a new temp dir)")
+    parser.add_argument("--server-url", help="Use a running backend instead of starting one (no DB timing)")
+    parser.add_argument("--samples", action="store_true", help="Include every sample in the output")
+    parser.add_argument("--output", help="Write results JSON to this path")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        print(compare(*args.compare))
+        return
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+"""
+Recall quality and latency benchmark over synthetic memory corpora.
+
+For every corpus size a child process gets its own data directory, runs the normal
+migrations, and bulk-loads one synthetic user into memobase.db. The user has
+``size`` event gists spread over ``--friends`` friends. Every gist is "<person>
+<time> at <place> <activity>, <extra>". Timestamps fall within the last 300 days and
+each gist carries a ``friend_id`` tag. Embeddings come from the deterministic
+hashed n-gram embedder of ``fake_llm.py``. Each query asks about one
+(person, place, activity) of a friend; the ground truth is every gist of that friend
+with the same triple.
+
+Backends measured per query:
+
+- ``vector``: sqlite-vec cosine scan (``MemoService._search_gists_by_embedding``)
+- ``lexical``: FTS5 BM25 (``MemoService._search_gists_lexical``)
+- ``hybrid``: both, fused with RRF (``MemoService._fuse_rrf``)
+- ``numpy``: in-memory exact cosine over per-friend float32 matrices (reference)
+- ``recall_memory:<mode>`` (unless ``--no-end-to-end``): ``MemoService.recall_memory``
+  under each RECALL_SEARCH_MODE, with query embeddings served by an in-process fake
+  embedding endpoint
+
+Reported per size: load / index time, DB size, RSS, and per backend the latency
+distribution and recall@k. Runs fully offline.
+
+Usage (from the server directory):
+    python scripts/benchmark/recall_bench.py --sizes 1000,10000,100000 --output recall.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+SERVER_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if SERVER_ROOT not in sys.path:
+    sys.path.insert(0, SERVER_ROOT)
+
+from scripts.benchmark.fake_llm import create_app, embed_vector  # noqa: E402
+from scripts.benchmark.load_test import percentiles  # noqa: E402
+
+PERSONS = [
+    "小王", "小李", "阿杰", "老张", "小美", "阿强", "莉莉", "大刘", "小陈", "阿芳",
+    "老周", "小赵", "明明", "婷婷", "老孙", "小吴", "阿辉", "佳佳", "小郑", "老何",
+]
+PLACES = [
+    "成都", "西湖", "公司楼下", "健身房", "图书馆", "海边", "老家", "商场", "咖啡馆", "大学",
+    "机场", "山顶", "夜市", "医院", "游乐园", "博物馆", "菜市场", "电影院", "公园", "酒吧",
+]
+ACTIVITIES = [
+    "吃火锅", "爬山", "看电影", "打羽毛球", "喝咖啡", "唱歌", "钓鱼", "拍照", "学做饭", "逛街",
+    "跑步", "看展览", "打游戏", "聊创业", "复习考试", "露营", "骑车", "听音乐会", "吵了一架", "过生日",
+]
+EXTRAS = [
+    "心情很好", "有点累", "花了不少钱", "下雨了", "遇到了老同学", "约好下次再去", "迟到了半小时",
+    "拍了很多照片", "聊到很晚", "觉得很值得", "排了很久的队", "被朋友放鸽子",
+]
+WHEN = ["周末", "上周", "前天", "昨晚", "假期里", "下班后", "一大早", "中午"]
+
+SPACE_ID = "__root__"
+BACKENDS = ("vector", "lexical", "hybrid", "numpy")
+RECALL_MODES = ("vector", "lexical", "hybrid")
+
+
+def build_corpus(size: int, friends: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    corpus = []
+    for i in range(size):
+        key = (rng.choice(PERSONS), rng.choice(PLACES), rng.choice(ACTIVITIES))
+        person, place, activity = key
+        content = f"{person}{rng.choice(WHEN)}和用户在{place}{activity}，{rng.choice(EXTRAS)}（#{i}）"
+        corpus.append({
+            "friend_id": i % friends + 1,
+            "key": key,
+            "content": content,
+            "created_at": now - timedelta(days=rng.uniform(0, 300)),
+        })
+    return corpus
+
+
+def build_queries(corpus: List[Dict[str, Any]], count: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed + 1)
+    by_key: Dict[tuple, List[int]] = {}
+    for index, item in enumerate(corpus):
+        by_key.setdefault((item["friend_id"], item["key"]), []).append(index)
+    queries = []
+    for _ in range(count):
+        target = corpus[rng.randrange(len(corpus))]
+        person, place, activity = target["key"]
+        queries.append({
+            "friend_id": target["friend_id"],
+            "text": f"还记得{person}在{place}{activity}那次吗",
+            "relevant": by_key[(target["friend_id"], target["key"])],
+        })
+    return queries
+
+
+def recall_at_k(retrieved: List[int], relevant: List[int], k: int) -> float:
+    hits = len(set(retrieved[:k]) & set(relevant))
+    return hits / min(k, len(relevant))
+
+
+def _rss_mb() -> Dict[str, Optional[float]]:
+    values = {"rss_mb": None, "peak_rss_mb": None}
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    values["rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+                elif line.startswith("VmHWM:"):
+                    values["peak_rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 以字节为单位，Linux 以 KB 为单位
+        values["peak_rss_mb"] = round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    return values
+
+
+def _db_size_mb(db_path: str) -> float:
+    total = sum(os.path.getsize(p) for p in (db_path, f"{db_path}-wal") if os.path.exists(p))
+    return round(total / (1024 * 1024), 2)
+
+
+def load_corpus(user_uuid: uuid.UUID, corpus: List[Dict[str, Any]], vectors: np.ndarray, batch: int = 5000) -> List[uuid.UUID]:
+    """Bulk insert events and gists (embeddings included); returns gist ids in corpus order."""
+    from sqlalchemy import insert
+
+    from app.vendor.memobase_server.connectors import Session
+    from app.vendor.memobase_server.models.database import UserEvent, UserEventGist
+
+    gist_ids = []
+    for start in range(0, len(corpus), batch):
+        events, gists = [], []
+        for offset, item in enumerate(corpus[start:start + batch]):
+            event_id, gist_id = uuid.uuid4(), uuid.uuid4()
+            gist_ids.append(gist_id)
+            events.append({
+                "id": event_id,
+                "user_id": user_uuid,
+                "project_id": SPACE_ID,
+                "event_data": {
+                    "event_tip": item["content"],
+                    "event_tags": [{"tag": "friend_id", "value": str(item["friend_id"])}],
+                },
+                "created_at": item["created_at"],
+                "updated_at": item["created_at"],
+            })
+            gists.append({
+                "id": gist_id,
+                "event_id": event_id,
+                "user_id": user_uuid,
+                "project_id": SPACE_ID,
+                "gist_data": {"content": item["content"]},
+                "embedding": vectors[start + offset].tobytes(),
+                "created_at": item["created_at"],
+                "updated_at": item["created_at"],
+            })
+        with Session() as session:
+            session.execute(insert(UserEvent), events)
+            session.execute(insert(UserEventGist), gists)
+            session.commit()
+    return gist_ids
+
+
+class NumpyIndex:
+    """Exact cosine search over per-friend float32 matrices held in memory."""
+
+    def __init__(self, corpus: List[Dict[str, Any]], vectors: np.ndarray):
+        rows: Dict[int, List[int]] = {}
+        for index, item in enumerate(corpus):
+            rows.setdefault(item["friend_id"], []).append(index)
+        self.rows = {fid: np.asarray(idx) for fid, idx in rows.items()}
+        self.matrices = {fid: np.ascontiguousarray(vectors[idx]) for fid, idx in self.rows.items()}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(m.nbytes + self.rows[f].nbytes for f, m in self.matrices.items())
+
+    def search(self, friend_id: int, query: np.ndarray, topk: int, threshold: float) -> List[int]:
+        matrix = self.matrices.get(friend_id)
+        if matrix is None:
+            return []
+        scores = matrix @ query
+        k = min(topk, scores.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [int(self.rows[friend_id][i]) for i in top if scores[i] > threshold]
+
+
+class _EmbeddingServer:
+    """Fake embedding endpoint on a background thread (for the recall_memory path)."""
+
+    def __init__(self, dim: int):
+        import uvicorn
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        config = uvicorn.Config(create_app(embedding_dim=dim), host="127.0.0.1", port=self.port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def _measure(name: str, queries: List[Dict[str, Any]], search, topk: int, warmup: int = 3) -> Dict[str, Any]:
+    for query in queries[:warmup]:
+        search(query)
+    latencies, recalls = [], []
+    for query in queries:
+        start = time.perf_counter()
+        retrieved = search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(recall_at_k(retrieved, query["relevant"], topk))
+    return {
+        "backend": name,
+        "latency_ms": percentiles(latencies),
+        f"recall@{topk}": round(float(np.mean(recalls)), 4),
+    }
+
+
+def run_child(args: argparse.Namespace) -> Dict[str, Any]:
+    """Generate, load and measure one corpus size (runs in its own process)."""
+    # 数据目录须在导入 app 之前写入环境变量
+    os.environ["WeAgentChat_DATA_DIR"] = args.data_dir
+    from app.core.config import settings
+    from app.db.init_db import init_db
+    from app.services.memo.bridge import MemoService
+    from app.vendor.memobase_server.controllers.event_gist_fts import sync_event_gist_fts
+    from app.vendor.memobase_server.env import reinitialize_config
+
+    init_db()
+    from app.vendor.memobase_server import connectors
+
+    size, topk, threshold = args.size, args.topk, args.threshold
+    corpus = build_corpus(size, args.friends, args.seed)
+    queries = build_queries(corpus, args.queries, args.seed)
+    result: Dict[str, Any] = {"size": size, "friends": args.friends, "queries": len(queries), "dim": args.dim}
+
+    start = time.perf_counter()
+    vectors = np.stack([embed_vector(item["content"], args.dim) for item in corpus])
+    query_vectors = np.stack([embed_vector(q["text"], args.dim) for q in queries])
+    result["embed_s"] = round(time.perf_counter() - start, 3)
+
+    user_id = str(uuid.uuid4())
+    asyncio.run(MemoService.ensure_user(user_id, SPACE_ID))
+    user_uuid = uuid.UUID(user_id)
+    start = time.perf_counter()
+    gist_ids = load_corpus(user_uuid, corpus, vectors)
+    result["load_s"] = round(time.perf_counter() - start, 3)
+    start = time.perf_counter()
+    with connectors.DB_ENGINE.begin() as connection:
+        sync_event_gist_fts(connection)
+    result["fts_index_s"] = round(time.perf_counter() - start, 3)
+    with connectors.DB_ENGINE.begin() as connection:
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    result["db_size_mb"] = _db_size_mb(settings.MEMOBASE_DB_URL.replace("sqlite:///", ""))
+
+    index_of = {gist_id: i for i, gist_id in enumerate(gist_ids)}
+    for i, query in enumerate(queries):
+        query["vector"] = query_vectors[i]
+
+    def vector(query):
+        found = MemoService._search_gists_by_embedding(
+            user_uuid, SPACE_ID, query["vector"].tolist(), query["friend_id"], topk, threshold
+        )
+        return [index_of[g.id] for g in found.gists]
+
+    def lexical(query):
+        found = MemoService._search_gists_lexical(user_uuid, SPACE_ID, [query["text"]], query["friend_id"], topk)[0]
+        return [index_of[g.id] for g in found.gists]
+
+    def hybrid(query):
+        v = MemoService._search_gists_by_embedding(
+            user_uuid, SPACE_ID, query["vector"].tolist(), query["friend_id"], topk, threshold
+        )
+        l = MemoService._search_gists_lexical(user_uuid, SPACE_ID, [query["text"]], query["friend_id"], topk)[0]
+        return [index_of[g.id] for g in MemoService._fuse_rrf([v, l], topk).gists]
+
+    start = time.perf_counter()
+    numpy_index = NumpyIndex(corpus, vectors)
+    numpy_build_s = time.perf_counter() - start
+
+    def numpy_search(query):
+        return numpy_index.search(query["friend_id"], query["vector"], topk, threshold)
+
+    searches = {"vector": vector, "lexical": lexical, "hybrid": hybrid, "numpy": numpy_search}
+    result["backends"] = []
+    for name in args.backends:
+        try:
+            measured = _measure(name, queries, searches[name], topk)
+        except Exception as e:
+            # 例如 Python 的 sqlite3 不支持加载扩展时，sqlite-vec 不可用
+            result["backends"].append({"backend": name, "error": f"{type(e).__name__}: {e}".splitlines()[0]})
+            continue
+        if name == "numpy":
+            measured["build_s"] = round(numpy_build_s, 3)
+            measured["memory_mb"] = round(numpy_index.nbytes / (1024 * 1024), 2)
+        result["backends"].append(measured)
+
+    if args.end_to_end:
+        content_index = {item["content"]: i for i, item in enumerate(corpus)}
+        with _EmbeddingServer(args.dim) as embedding_url:
+            reinitialize_config({
+                "enable_event_embedding": True,
+                "embedding_provider": "openai",
+                "embedding_api_key": "sk-bench",
+                "embedding_base_url": embedding_url,
+                "embedding_model": "fake-embedding",
+                "embedding_dim": args.dim,
+            })
+
+            async def measure_recall_memory(mode: str) -> Dict[str, Any]:
+                settings.RECALL_SEARCH_MODE = mode
+                latencies, recalls = [], []
+                for i, query in enumerate(queries):
+                    start = time.perf_counter()
+                    found = await MemoService.recall_memory(
+                        user_id, SPACE_ID, query["text"], query["friend_id"], topk, threshold
+                    )
+                    if i >= 3:  # 前几次作为预热
+                        latencies.append((time.perf_counter() - start) * 1000)
+                    retrieved = [content_index[e["content"]] for e in found["events"]]
+                    recalls.append(recall_at_k(retrieved, query["relevant"], topk))
+                return {
+                    "backend": f"recall_memory:{mode}",
+                    "latency_ms": percentiles(latencies),
+                    f"recall@{topk}": round(float(np.mean(recalls)), 4),
+                }
+
+            for mode in RECALL_MODES:
+                try:
+                    result["backends"].append(asyncio.run(measure_recall_memory(mode)))
+                except Exception as e:
+                    result["backends"].append({
+                        "backend": f"recall_memory:{mode}",
+                        "error": f"{type(e).__name__}: {e}".splitlines()[0],
+                    })
+
+    result.update(_rss_mb())
+    return result
+
+
+def _format_result(result: Dict[str, Any], topk: int) -> str:
+    lines = [
+        f"[{result['size']} gists / {result['friends']} friends] load {result['load_s']}s, "
+        f"fts {result['fts_index_s']}s, db {result['db_size_mb']} MB, peak rss {result['peak_rss_mb']} MB"
+    ]
+    for backend in result["backends"]:
+        if "error" in backend:
+            lines.append(f"  {backend['backend']:<24} unavailable: {backend['error']}")
+            continue
+        latency = backend["latency_ms"] or {}
+        lines.append(
+            f"  {backend['backend']:<24} p50 {latency.get('p50', 0):>8.2f}ms  p95 {latency.get('p95', 0):>8.2f}ms  "
+            f"p99 {latency.get('p99', 0):>8.2f}ms  recall@{topk} {backend[f'recall@{topk}']:.3f}"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall latency / quality benchmark on synthetic corpora")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma separated gist counts")
+    parser.add_argument("--friends", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimension")
+    parser.add_argument("--topk", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.3, help="Vector similarity threshold")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backends", default=",".join(BACKENDS), help=f"Comma separated: {', '.join(BACKENDS)}")
+    parser.add_argument("--no-end-to-end", dest="end_to_end", action="store_false",
+                        help="Skip recall_memory measurements")
+    parser.add_argument("--data-dir", help="Parent directory for the per-size data directories")
+    parser.add_argument("--output", help="Write results JSON to this path")
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = set(args.backends) - set(BACKENDS)
+    if unknown:
+        raise SystemExit(f"Unknown backends: {', '.join(sorted(unknown))}")
+
+    if args.size is not None:
+        result = run_child(args)
+        with open(args.child_output, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    base_dir = args.data_dir or tempfile.mkdtemp(prefix="weagentchat-recall-")
+    results = []
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        data_dir = os.path.join(base_dir, str(size))
+        os.makedirs(data_dir, exist_ok=True)
+        child_output = os.path.join(data_dir, "result.json")
+        command = [
+            sys.executable, os.path.abspath(__file__),
+            "--size", str(size), "--data-dir", data_dir, "--child-output", child_output,
+            "--friends", str(args.friends), "--queries", str(args.queries), "--dim", str(args.dim),
+            "--topk", str(args.topk), "--threshold", str(args.threshold), "--seed", str(args.seed),
+            "--backends", ",".join(args.backends),
+        ]
+        if not args.end_to_end:
+            command.append("--no-end-to-end")
+        with open(os.path.join(data_dir, "bench.out"), "w", encoding="utf-8") as log:
+            subprocess.run(command, cwd=SERVER_ROOT, stdout=log, stderr=subprocess.STDOUT, check=True)
+        with open(child_output, encoding="utf-8") as f:
+            result = json.load(f)
+        results.append(result)
+        print(_format_result(result, args.topk))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "data_dir": base_dir,
+                    "friends": args.friends,
+                    "queries": args.queries,
+                    "dim": args.dim,
+                    "topk": args.topk,
+                    "threshold": args.threshold,
+                    "seed": args.seed,
+                },
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import json
+
+import httpx
+import numpy as np
+import pytest
+from openai import AsyncOpenAI
+
+from scripts.benchmark.fake_llm import create_app, embed_text, embed_vector
+from scripts.benchmark.load_test import compare, percentiles
+
+
+def _client(**kwargs) -> AsyncOpenAI:
+    transport = httpx.ASGITransport(app=create_app(**kwargs))
+    return AsyncOpenAI(
+        base_url="http://fake/v1",
+        api_key="sk-test",
+        http_client=httpx.AsyncClient(transport=transport, base_url="http://fake/v1"),
+    )
+
+
+@pytest.mark.asyncio
+async def test_fake_llm_streams_deterministic_replies():
+    client = _client(ttft_ms=0, tokens_per_second=0, reply_length=8)
+    messages = [{"role": "user", "content": "周末去吃火锅吗"}]
+
+    replies = []
+    for _ in range(2):
+        stream = await client.chat.completions.create(
+            model="fake-chat", messages=messages, stream=True, stream_options={"include_usage": True},
+        )
+        text, usage = "", None
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                text += chunk.choices[0].delta.content
+            usage = chunk.usage or usage
+        replies.append(text)
+    assert replies[0] == replies[1] and replies[0]
+    assert usage.completion_tokens == 8
+
+    result = await client.chat.completions.create(
+        model="fake-chat", messages=messages, response_format={"type": "json_object"},
+    )
+    assert json.loads(result.choices[0].message.content) == {}
+
+
+@pytest.mark.asyncio
+async def test_fake_llm_embeddings_are_deterministic_and_similar_for_shared_words():
+    client = _client(embedding_dim=64)
+    resp = await client.embeddings.create(model="fake-embedding", input=["喜欢吃火锅", "喜欢吃火锅"], dimensions=32)
+    assert len(resp.data[0].embedding) == 32
+    assert resp.data[0].embedding == resp.data[1].embedding
+
+    def cosine(a, b):
+        return sum(x * y for x, y in zip(embed_text(a), embed_text(b)))
+
+    assert cosine("我喜欢吃火锅", "周末吃火锅") > cosine("我喜欢吃火锅", "明天要加班")
+
+
+def test_percentiles_and_compare(tmp_path):
+    stats = percentiles([float(v) for v in range(1, 101)])
+    assert stats["count"] == 100 and stats["p50"] == 50.5 and stats["max"] == 100
+
+    baseline, current = tmp_path / "a.json", tmp_path / "b.json"
+    baseline.write_text(json.dumps({"scenarios": {"chat": {"ttft_ms": {"p50": 100, "p95": 200, "p99": 300}}}}))
+    current.write_text(json.dumps({"scenarios": {"chat": {"ttft_ms": {"p50": 110, "p95": 200, "p99": 300}}}}))
+    assert "+10.0%" in compare(str(baseline), str(current))
+
+
+def test_recall_bench_corpus_is_deterministic_with_ground_truth():
+    from scripts.benchmark.recall_bench import NumpyIndex, build_corpus, build_queries, recall_at_k
+
+    corpus = build_corpus(300, friends=5, seed=7)
+    assert [item["content"] for item in corpus] == [item["content"] for item in build_corpus(300, 5, 7)]
+    queries = build_queries(corpus, 20, seed=7)
+    for query in queries:
+        assert all(corpus[i]["friend_id"] == query["friend_id"] for i in query["relevant"])
+
+    vectors = np.stack([embed_vector(item["content"], 64) for item in corpus])
+    index = NumpyIndex(corpus, vectors)
+    query = queries[0]
+    found = index.search(query["friend_id"], embed_vector(query["text"], 64), topk=5, threshold=0.0)
+    assert all(corpus[i]["friend_id"] == query["friend_id"] for i in found)
+    assert recall_at_k([1, 2, 3], [3, 9], k=5) == 0.5
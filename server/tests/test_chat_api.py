@@ -217,3 +217,42 @@ def test_send_message_llm_error(client: TestClient, db: Session):
         assert "start" in events
         assert "error" in events
         assert "LLM API Error" in error_detail
+
+
+def test_start_event_is_sent_before_generation_finishes(client: TestClient, db: Session):
+    """With recall disabled the start event must not wait for the reply to complete."""
+    import asyncio
+    from app.models.llm import LLMConfig
+    from app.schemas.chat import MessageCreate
+    from app.services import chat_service
+
+    activate_llm_config(db, LLMConfig(base_url="https://mock.url", api_key="mock_key", model_name="mock-model"))
+    friend_id = client.post("/api/friends/", json={"name": "Test Friend", "is_preset": False}).json()["id"]
+    session_id = client.post("/api/chat/sessions", json={"friend_id": friend_id}).json()["id"]
+
+    async def never_finishing_stream():
+        await asyncio.Event().wait()
+        yield  # pragma: no cover
+
+    mock_runner_result = MagicMock()
+    mock_runner_result.stream_events = never_finishing_stream
+
+    async def first_event():
+        events = chat_service.send_message_stream(db, session_id, MessageCreate(content="Hi"))
+        try:
+            return await asyncio.wait_for(events.__anext__(), 2)
+        finally:
+            await events.aclose()
+            for task in asyncio.all_tasks() - {asyncio.current_task()}:
+                task.cancel()
+
+    with patch("app.services.chat_service.Runner.run_streamed", return_value=mock_runner_result), \
+         patch("app.services.chat_service.SessionLocal", MockSessionLocal):
+        event = asyncio.run(first_event())
+
+    assert event["event"] == "start"
+    assert "profile" not in event["data"]
+
+def test_resume_unknown_message_returns_404(client: TestClient, db: Session):
+    response = client.get("/api/chat/messages/999999/stream")
+    assert response.status_code == 404
@@ -0,0 +1,148 @@
+from collections import OrderedDict
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.core.config import settings
+from app.models.chat import ChatSession, Message
+from app.models.friend import Friend
+from app.services import context_window
+from app.services.context_window import (
+    KIND_CHAT,
+    assemble_history,
+    history_token_budget,
+    message_token_count,
+)
+from tests.conftest import TestingSessionLocal
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+@pytest.fixture
+def chat(db):
+    friend = Friend(name="Window Friend")
+    db.add(friend)
+    db.commit()
+    session = ChatSession(friend_id=friend.id, title="window")
+    db.add(session)
+    db.commit()
+    return session
+
+
+def _add(db, session, role, content):
+    msg = Message(session_id=session.id, friend_id=session.friend_id, role=role, content=content)
+    db.add(msg)
+    db.commit()
+    return msg
+
+
+def _history_query(db, session):
+    return (
+        db.query(Message)
+        .filter(Message.session_id == session.id, Message.deleted == False)
+        .order_by(Message.create_time.desc(), Message.id.desc())
+    )
+
+
+class TestContextWindow:
+    def test_model_budget_uses_longest_prefix(self, monkeypatch):
+        monkeypatch.setattr(settings, "CONTEXT_HISTORY_TOKEN_BUDGET", 1000)
+        monkeypatch.setattr(settings, "CONTEXT_HISTORY_MODEL_BUDGETS", {"gpt-4": 2000, "gpt-4o": 8000})
+        assert history_token_budget("gpt-4o-mini") == 8000
+        assert history_token_budget("GPT-4-turbo") == 2000
+        assert history_token_budget("deepseek-chat") == 1000
+
+    def test_window_fills_budget_newest_first(self, db, chat, monkeypatch):
+        monkeypatch.setattr(settings, "CONTEXT_SUMMARY_MIN_MESSAGES", 100)
+        monkeypatch.setattr(settings, "PROMPT_CACHE_LAYOUT", False)
+        msgs = [_add(db, chat, "user" if i % 2 == 0 else "assistant", f"第{i}条消息" * (i + 1)) for i in range(6)]
+        newest_two = sum(message_token_count(m) for m in msgs[-2:])
+
+        window = assemble_history(KIND_CHAT, chat, _history_query(db, chat), newest_two)
+
+        assert [m.id for m in window.messages] == [m.id for m in msgs[-2:]]
+        assert window.token_count == newest_two
+        assert window.overflow_until_id == msgs[-3].id
+        db.commit()
+        db.expire_all()
+        assert all(m.token_count is not None for m in msgs[-3:])
+
+    def test_window_leaves_commit_to_caller(self, db, chat):
+        _add(db, chat, "user", "消息")
+        chat.title = "未提交的标题"
+
+        assemble_history(KIND_CHAT, chat, _history_query(db, chat), 1000)
+
+        db.rollback()
+        assert chat.title == "window"
+
+    def test_cache_layout_keeps_window_start_until_it_overflows(self, db, chat, monkeypatch):
+        monkeypatch.setattr(settings, "CONTEXT_SUMMARY_MIN_MESSAGES", 100)
+        monkeypatch.setattr(settings, "PROMPT_CACHE_LAYOUT", True)
+        monkeypatch.setattr(settings, "CONTEXT_WINDOW_REANCHOR_RATIO", 0.5)
+        msgs = [_add(db, chat, "user", "固定长度的消息") for _ in range(6)]
+        per_msg = message_token_count(msgs[0])
+        budget = per_msg * 4
+
+        first = assemble_history(KIND_CHAT, chat, _history_query(db, chat), budget)
+        # 首次溢出时前移到预算的一半，留出后续追加的空间
+        assert [m.id for m in first.messages] == [m.id for m in msgs[-2:]]
+
+        msgs.append(_add(db, chat, "assistant", "固定长度的消息"))
+        second = assemble_history(KIND_CHAT, chat, _history_query(db, chat), budget)
+        assert second.messages[0].id == first.messages[0].id
+        assert len(second.messages) == 3
+
+        msgs.extend(_add(db, chat, "user", "固定长度的消息") for _ in range(2))
+        third = assemble_history(KIND_CHAT, chat, _history_query(db, chat), budget)
+        assert third.messages[0].id == msgs[-2].id
+        assert third.overflow_until_id == msgs[-3].id
+
+    def test_window_starts_keep_only_recent_sessions(self, db, chat, monkeypatch):
+        monkeypatch.setattr(settings, "CONTEXT_SUMMARY_MIN_MESSAGES", 100)
+        monkeypatch.setattr(settings, "PROMPT_CACHE_LAYOUT", True)
+        monkeypatch.setattr(context_window, "_window_starts", OrderedDict())
+        monkeypatch.setattr(context_window, "_WINDOW_START_CACHE_SIZE", 1)
+        other = ChatSession(friend_id=chat.friend_id, title="other")
+        db.add(other)
+        db.commit()
+        for session in (chat, other):
+            for _ in range(3):
+                _add(db, session, "user", "固定长度的消息")
+            assemble_history(KIND_CHAT, session, _history_query(db, session), 1)
+
+        assert list(context_window._window_starts) == [(KIND_CHAT, other.id)]
+
+    def test_newest_message_kept_even_if_over_budget(self, db, chat):
+        msg = _add(db, chat, "user", "很长的消息" * 50)
+        window = assemble_history(KIND_CHAT, chat, _history_query(db, chat), 1)
+        assert window.messages[-1].id == msg.id
+
+    def test_overflow_schedules_summary(self, db, chat, monkeypatch):
+        monkeypatch.setattr(settings, "CONTEXT_SUMMARY_MIN_MESSAGES", 2)
+        for i in range(5):
+            _add(db, chat, "user", f"消息{i}")
+        with patch.object(context_window, "schedule_summary_refresh") as schedule:
+            window = assemble_history(KIND_CHAT, chat, _history_query(db, chat), 1)
+        schedule.assert_called_once_with(KIND_CHAT, chat.id, window.overflow_until_id)
+
+    @pytest.mark.asyncio
+    async def test_refresh_summary_folds_overflow(self, db, chat, monkeypatch):
+        msgs = [_add(db, chat, "user", f"消息{i}") for i in range(4)]
+        chat.context_summary = "旧摘要"
+        chat.context_summary_until_id = msgs[0].id
+        db.commit()
+
+        summarize = AsyncMock(return_value="新摘要")
+        monkeypatch.setattr(context_window, "SessionLocal", TestingSessionLocal)
+        monkeypatch.setattr(context_window, "_summarize", summarize)
+        monkeypatch.setattr(context_window.llm_service, "get_active_config", lambda db: object())
+
+        await context_window._refresh_summary(KIND_CHAT, chat.id, msgs[2].id)
+
+        _, previous, lines = summarize.await_args.args
+        assert previous == "旧摘要"
+        assert lines == ["我: 消息1", "我: 消息2"]
+        db.expire_all()
+        assert chat.context_summary == "新摘要"
+        assert chat.context_summary_until_id == msgs[2].id
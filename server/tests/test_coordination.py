@@ -0,0 +1,271 @@
+import asyncio
+import multiprocessing
+import time
+
+import pytest
+
+from app.core.coordination import AsyncCacheClient, LocalBackend, SharedList, SqliteBackend, set_backend
+
+WORKERS = 4
+ITEMS_PER_WORKER = 50
+
+
+@pytest.fixture(params=["local", "sqlite"])
+def backend(request, tmp_path):
+    instance = LocalBackend() if request.param == "local" else SqliteBackend(str(tmp_path / "coordination.db"), poll_interval=0.01)
+    set_backend(instance)
+    yield instance
+    set_backend(None)
+
+
+def test_keys_expire_and_honour_nx(backend):
+    assert backend.set("k", {"a": 1}, nx=True)
+    assert not backend.set("k", "other", nx=True)
+    assert backend.get("k") == {"a": 1}
+    assert backend.incrby("n", 2) == 2 and backend.incrby("n") == 3
+
+    backend.set("short", 1, ex=0.01)
+    time.sleep(0.05)
+    assert backend.get("short") is None
+    assert backend.set("short", 2, nx=True)
+
+
+def test_locks_are_exclusive_and_owner_checked(backend):
+    token = backend.try_lock("job", ttl=30)
+    assert token and backend.try_lock("job") is None
+    assert not backend.unlock("job", "someone-else")
+    assert backend.unlock("job", token)
+    assert backend.try_lock("job") is not None
+
+
+def test_shared_list_deduplicates_and_drains_once(backend):
+    queue = SharedList("queue")
+    assert queue.add(1) and queue.add(2) and not queue.add(1)
+    assert 2 in queue and len(queue) == 2 and len(queue.ages()) == 2
+    queue.remove(2)
+    assert queue.drain() == [1]
+    assert not queue and queue.drain() == []
+
+
+def test_subscribe_replays_from_id_and_receives_live_messages(backend):
+    async def _run():
+        start = backend.last_id("events")
+        backend.publish("events", {"n": 1})
+        received = []
+
+        async def _consume():
+            async for _, payload in backend.subscribe("events", after_id=start):
+                if payload is None:
+                    return
+                received.append(payload["n"])
+
+        consumer = asyncio.create_task(_consume())
+        await asyncio.sleep(0.05)
+        backend.publish("events", {"n": 2})
+        backend.publish("events", None)
+        await asyncio.wait_for(consumer, 2)
+        return received
+
+    assert asyncio.run(_run()) == [1, 2]
+
+
+def test_cache_client_unlock_script_only_releases_own_lock(backend):
+    async def _run():
+        async with AsyncCacheClient() as client:
+            assert await client.set("lock", "mine", ex=30, nx=True)
+            script = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end"
+            assert await client.eval(script, 1, "lock", "theirs") == 0
+            assert await client.eval(script, 1, "lock", "mine") == 1
+            await client.rpush("buffers", "1,2")
+            assert await client.llen("buffers") == 1 and await client.lpop("buffers") == "1,2"
+
+    asyncio.run(_run())
+
+
+def test_channel_writer_batches_publishes_off_the_loop(tmp_path):
+    """On the SQLite backend a burst of puts is written from a worker thread in a few transactions, in order."""
+    import threading
+    from app.core.coordination import ChannelWriter
+
+    backend = SqliteBackend(str(tmp_path / "coordination.db"), poll_interval=0.01)
+    set_backend(backend)
+    calls = []
+    publish_many = backend.publish_many
+
+    def _recording_publish_many(channel, payloads):
+        calls.append((threading.get_ident(), len(payloads)))
+        return publish_many(channel, payloads)
+
+    backend.publish_many = _recording_publish_many
+    try:
+        async def _run():
+            writer = ChannelWriter("stream")
+            for n in range(50):
+                await writer.put({"n": n})
+            await writer.flush()
+
+        asyncio.run(_run())
+        assert [payload["n"] for _, payload in backend.read("stream", 0)] == list(range(50))
+        assert len(calls) < 50 and sum(size for _, size in calls) == 50
+        assert all(ident != threading.get_ident() for ident, _ in calls)
+    finally:
+        set_backend(None)
+
+
+def test_cache_client_runs_sqlite_writes_off_the_loop(tmp_path):
+    import threading
+
+    backend = SqliteBackend(str(tmp_path / "coordination.db"))
+    set_backend(backend)
+    threads = []
+    original_set = backend.set
+
+    def _recording_set(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return original_set(*args, **kwargs)
+
+    backend.set = _recording_set
+    try:
+        async def _run():
+            async with AsyncCacheClient() as client:
+                assert await client.set("k", "v", ex=30)
+                assert await client.get("k") == "v"
+
+        asyncio.run(_run())
+        assert threads and threading.get_ident() not in threads
+    finally:
+        set_backend(None)
+
+
+def test_shared_list_async_methods_run_off_the_loop(tmp_path):
+    import threading
+
+    backend = SqliteBackend(str(tmp_path / "coordination.db"))
+    set_backend(backend)
+    threads = []
+    original_add, original_drain = backend.add, backend.drain
+
+    def _recording(method):
+        def _call(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return method(*args, **kwargs)
+        return _call
+
+    backend.add, backend.drain = _recording(original_add), _recording(original_drain)
+    try:
+        async def _run():
+            queue = SharedList("queue")
+            assert await queue.aadd(1) and not await queue.aadd(1)
+            assert await queue.alen() == 1
+            assert await queue.adrain() == [1]
+
+        asyncio.run(_run())
+        assert len(threads) == 3 and threading.get_ident() not in threads
+    finally:
+        set_backend(None)
+
+
+def _worker(path, index, results):
+    backend = SqliteBackend(path, poll_interval=0.005)
+    for item in range(ITEMS_PER_WORKER):
+        backend.incrby("counter")
+        backend.rpush("jobs", f"{index}:{item}")
+    claimed = []
+    while True:
+        job = backend.lpop("jobs")
+        if job is None:
+            if backend.get("producers_done") == WORKERS:
+                break
+            continue
+        claimed.append(job)
+    results.put(claimed)
+
+
+def test_sqlite_backend_is_safe_across_processes(tmp_path):
+    """N processes increment one counter and consume one queue: no lost updates, no job taken twice."""
+    path = str(tmp_path / "coordination.db")
+    backend = SqliteBackend(path)
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=_worker, args=(path, index, results)) for index in range(WORKERS)]
+    for process in processes:
+        process.start()
+
+    # 生产者全部写完后再放行空队列退出
+    deadline = time.monotonic() + 30
+    while backend.get("counter") != WORKERS * ITEMS_PER_WORKER and time.monotonic() < deadline:
+        time.sleep(0.01)
+    backend.set("producers_done", WORKERS)
+
+    claimed = [job for _ in processes for job in results.get(timeout=30)]
+    for process in processes:
+        process.join(timeout=30)
+
+    assert backend.get("counter") == WORKERS * ITEMS_PER_WORKER
+    assert len(claimed) == len(set(claimed)) == WORKERS * ITEMS_PER_WORKER
+
+
+def _use_shared_memobase_state(coordination_path, memobase_url):
+    """Wire the vendor profile controller to the shared backend, as initialize_memo_sdk does for N workers."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.core.coordination import get_backend
+    from app.vendor.memobase_server.connectors import set_redis_client_factory
+    from app.vendor.memobase_server.controllers import profile
+
+    set_backend(SqliteBackend(coordination_path, poll_interval=0.01))
+    set_redis_client_factory(AsyncCacheClient)
+    profile.set_profile_version_store(get_backend())
+    profile.Session = sessionmaker(bind=create_engine(memobase_url))
+    return profile
+
+
+def _update_profile(coordination_path, memobase_url, user_id, profile_id, content):
+    profile = _use_shared_memobase_state(coordination_path, memobase_url)
+    asyncio.run(profile.update_user_profiles(user_id, "space-1", [profile_id], [content], [None]))
+
+
+def test_profile_update_on_one_worker_is_seen_by_another(tmp_path):
+    """Profile extraction runs on one worker; the others must not keep serving their cached profile."""
+    import uuid
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.vendor.memobase_server.connectors import set_redis_client_factory
+    from app.vendor.memobase_server.controllers import profile as profile_module
+    from app.vendor.memobase_server.models.database import REG, User, UserProfile
+
+    coordination_path = str(tmp_path / "coordination.db")
+    memobase_url = f"sqlite:///{tmp_path / 'memobase.db'}"
+    engine = create_engine(memobase_url)
+    REG.metadata.create_all(engine)
+    user_id = uuid.uuid4()
+    with sessionmaker(bind=engine)() as session:
+        user = User(project_id="space-1")
+        user.id = user_id
+        session.add(user)
+        entry = UserProfile(user_id=user_id, project_id="space-1", content="likes tea", attributes={"topic": "t", "sub_topic": "s"})
+        session.add(entry)
+        session.commit()
+        profile_id = str(entry.id)
+
+    original_session = profile_module.Session
+    try:
+        profile = _use_shared_memobase_state(coordination_path, memobase_url)
+        before = asyncio.run(profile.get_user_profiles(str(user_id), "space-1")).data()
+        assert before.profiles[0].content == "likes tea"
+
+        context = multiprocessing.get_context("spawn")
+        process = context.Process(
+            target=_update_profile, args=(coordination_path, memobase_url, str(user_id), profile_id, "likes coffee")
+        )
+        process.start()
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+        after = asyncio.run(profile.get_user_profiles(str(user_id), "space-1")).data()
+        assert after.profiles[0].content == "likes coffee"
+    finally:
+        profile_module.set_profile_version_store(None)
+        profile_module.Session = original_session
+        set_redis_client_factory(None)
+        set_backend(None)
@@ -0,0 +1,145 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.models.friend import Friend
+from app.models.generation_metric import GenerationMetric
+from app.services import generation_metrics
+from app.services.generation_metrics import GenerationTrace, aggregate, is_token_event
+from app.vendor.memobase_server.utils import get_encoded_tokens
+from tests.conftest import TestingSessionLocal
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+def _raw_event(data_type):
+    return SimpleNamespace(type="raw_response_event", data=SimpleNamespace(type=data_type))
+
+
+def _result(input_tokens=0, output_tokens=0, cached=0, reasoning=0):
+    usage = SimpleNamespace(
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        total_tokens=input_tokens + output_tokens,
+        input_tokens_details=SimpleNamespace(cached_tokens=cached),
+        output_tokens_details=SimpleNamespace(reasoning_tokens=reasoning),
+    )
+    return SimpleNamespace(context_wrapper=SimpleNamespace(usage=usage))
+
+
+@pytest.fixture
+def metrics_db(db, monkeypatch):
+    monkeypatch.setattr(generation_metrics, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(settings, "GENERATION_METRICS_ENABLED", True)
+    db.query(GenerationMetric).delete()
+    db.commit()
+    return db
+
+
+class TestGenerationTrace:
+    def test_token_events(self):
+        assert not is_token_event(_raw_event("response.created"))
+        assert is_token_event(_raw_event("response.output_text.delta"))
+        assert is_token_event(_raw_event("response.reasoning_summary_text.delta"))
+        assert not is_token_event(SimpleNamespace(type="run_item_stream_event"))
+
+    def test_metrics_capture_ttft_and_recall(self):
+        trace = GenerationTrace("chat", 1, 1, 1)
+        assert trace.metrics()["ttft_ms"] is None
+
+        trace.recall_started()
+        trace.recall_finished([
+            {"type": "thinking", "content": "..."},
+            {"type": "tool_call", "name": "recall_memory", "arguments": "{}"},
+            {"type": "tool_result", "name": "recall_memory", "result": {}},
+            {"type": "tool_call", "name": "recall_memory", "arguments": "{}"},
+        ])
+        trace.observe(_raw_event("response.created"))
+        assert trace.first_token_at is None
+        trace.observe(_raw_event("response.output_text.delta"))
+        first = trace.first_token_at
+        trace.observe(_raw_event("response.output_text.delta"))
+
+        metrics = trace.metrics()
+        assert trace.first_token_at == first
+        assert metrics["recall_rounds"] == 2
+        assert metrics["recall_ms"] is not None
+        assert 0 <= metrics["ttft_ms"] <= metrics["duration_ms"]
+
+    @pytest.mark.asyncio
+    async def test_finish_records_provider_usage(self, metrics_db):
+        llm_config = SimpleNamespace(provider="openai", model_name="gpt-4o-mini")
+        trace = GenerationTrace("chat", 42, 7, 3, llm_config)
+
+        usage, metrics = trace.finish(_result(1200, 80, cached=1024, reasoning=30), "回复")
+        await generation_metrics.flush_pending()
+
+        assert usage["cached_tokens"] == 1024
+        assert usage["reasoning_tokens"] == 30
+        row = metrics_db.query(GenerationMetric).filter(GenerationMetric.message_id == 42).one()
+        assert (row.kind, row.session_id, row.friend_id) == ("chat", 7, 3)
+        assert (row.provider, row.model) == ("openai", "gpt-4o-mini")
+        assert (row.prompt_tokens, row.completion_tokens, row.cached_tokens, row.reasoning_tokens) == (1200, 80, 1024, 30)
+        assert row.usage_estimated == 0
+        assert row.duration_ms == metrics["duration_ms"]
+
+    @pytest.mark.asyncio
+    async def test_finish_estimates_tokens_without_provider_usage(self, metrics_db):
+        trace = GenerationTrace("group", 43, 8, 3)
+        content = "这是一段没有 usage 的回复"
+
+        usage, _ = trace.finish(object(), content)
+        await generation_metrics.flush_pending()
+
+        assert usage["prompt_tokens"] == 0
+        assert usage["completion_tokens"] == len(get_encoded_tokens(content))
+        row = metrics_db.query(GenerationMetric).filter(GenerationMetric.message_id == 43).one()
+        assert row.usage_estimated == 1
+        assert row.completion_tokens == usage["completion_tokens"]
+
+    def test_disabled_records_nothing(self, metrics_db, monkeypatch):
+        monkeypatch.setattr(settings, "GENERATION_METRICS_ENABLED", False)
+        GenerationTrace("chat", 44, 1, 1).finish(_result(10, 5), "ok")
+        assert metrics_db.query(GenerationMetric).count() == 0
+
+
+class TestGenerationMetricsAggregate:
+    @pytest.fixture
+    def rows(self, metrics_db):
+        friend = Friend(name="Metrics Friend")
+        metrics_db.add(friend)
+        metrics_db.commit()
+        for model, prompt, cached, ttft in [("gpt-4o", 1000, 800, 100), ("gpt-4o", 1000, 0, 300), ("deepseek-chat", 500, 0, None)]:
+            metrics_db.add(GenerationMetric(
+                kind="chat", message_id=1, friend_id=friend.id, model=model,
+                prompt_tokens=prompt, completion_tokens=50, cached_tokens=cached,
+                ttft_ms=ttft, duration_ms=1000, recall_rounds=1,
+            ))
+        metrics_db.commit()
+        return friend
+
+    def test_group_by_model(self, metrics_db, rows):
+        buckets = {b["key"]: b for b in aggregate(metrics_db, "model")}
+        assert buckets["gpt-4o"]["requests"] == 2
+        assert buckets["gpt-4o"]["cache_hit_rate"] == 0.4
+        assert buckets["gpt-4o"]["avg_ttft_ms"] == 200
+        assert buckets["deepseek-chat"]["avg_ttft_ms"] is None
+
+    def test_group_by_friend_and_day(self, metrics_db, rows):
+        (friend_bucket,) = aggregate(metrics_db, "friend")
+        assert friend_bucket["key"] == str(rows.id)
+        assert friend_bucket["label"] == "Metrics Friend"
+        assert friend_bucket["prompt_tokens"] == 2500
+        assert friend_bucket["cache_hit_rate"] == 0.32
+        assert friend_bucket["recall_rounds"] == 3
+
+        (day_bucket,) = aggregate(metrics_db, "day")
+        assert day_bucket["requests"] == 3
+
+    def test_endpoint(self, client, rows):
+        response = client.get("/api/chat/metrics/generation", params={"group_by": "model"})
+        assert response.status_code == 200
+        assert {b["key"] for b in response.json()} == {"gpt-4o", "deepseek-chat"}
+
+        assert client.get("/api/chat/metrics/generation", params={"group_by": "session"}).status_code == 422
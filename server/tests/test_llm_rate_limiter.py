@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import pytest
+
+from app.vendor.memobase_server.env import CONFIG
+from app.vendor.memobase_server.llms.rate_limiter import (
+    LLMPriority,
+    LLMRateLimiter,
+    provider_key,
+)
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+@pytest.fixture
+def limits():
+    original = (CONFIG.llm_rpm_limit, CONFIG.llm_tpm_limit, CONFIG.llm_max_concurrency)
+    yield CONFIG
+    CONFIG.llm_rpm_limit, CONFIG.llm_tpm_limit, CONFIG.llm_max_concurrency = original
+
+
+class TestLLMRateLimiter:
+    def test_provider_key_separates_api_keys(self):
+        assert provider_key("https://api.openai.com/v1/", "a") == provider_key("https://API.openai.com/v1", "a")
+        assert provider_key("https://api.openai.com/v1", "a") != provider_key("https://api.openai.com/v1", "b")
+
+    @pytest.mark.asyncio
+    async def test_unlimited_by_default(self, limits):
+        limits.llm_rpm_limit = limits.llm_tpm_limit = limits.llm_max_concurrency = 0
+        limiter = LLMRateLimiter()
+        leases = [await limiter.acquire("k", tokens=10_000) for _ in range(20)]
+        assert limiter.stats()["k"]["in_flight"] == 20
+        for lease in leases:
+            lease.release()
+        assert limiter.stats()["k"]["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_interactive_served_before_background(self, limits):
+        limits.llm_rpm_limit = limits.llm_tpm_limit = 0
+        limits.llm_max_concurrency = 1
+        limiter = LLMRateLimiter()
+        order = []
+
+        holder = await limiter.acquire("k", LLMPriority.BACKGROUND)
+
+        async def worker(name, priority):
+            lease = await limiter.acquire("k", priority)
+            order.append(name)
+            lease.release()
+
+        background = asyncio.create_task(worker("background", LLMPriority.BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(worker("interactive", LLMPriority.INTERACTIVE))
+        await asyncio.sleep(0)
+        assert limiter.stats()["k"]["queue_depth"] == 2
+
+        holder.release()
+        await asyncio.wait_for(asyncio.gather(background, interactive), timeout=1)
+        assert order == ["interactive", "background"]
+
+    @pytest.mark.asyncio
+    async def test_tpm_bucket_delays_until_refill(self, limits):
+        limits.llm_rpm_limit = limits.llm_max_concurrency = 0
+        limits.llm_tpm_limit = 6000  # 100 tokens / s
+        limiter = LLMRateLimiter()
+
+        (await limiter.acquire("k", tokens=6000)).release()
+        start = time.monotonic()
+        (await limiter.acquire("k", tokens=30)).release()
+        assert time.monotonic() - start >= 0.25
+
+    @pytest.mark.asyncio
+    async def test_release_slot_charges_provider_usage(self, limits):
+        from types import SimpleNamespace
+        from app.services.llm_service import LLMService
+
+        limits.llm_rpm_limit = limits.llm_max_concurrency = 0
+        limits.llm_tpm_limit = 6000
+        limiter = LLMRateLimiter()
+
+        lease = await limiter.acquire("k", tokens=100)
+        usage = SimpleNamespace(input_tokens=120, output_tokens=880, total_tokens=1000)
+        LLMService.release_slot(lease, SimpleNamespace(context_wrapper=SimpleNamespace(usage=usage), final_output="ok"))
+        # 预留 100，按实际 1000 补扣
+        assert limiter._states["k"].tokens.level == pytest.approx(5000, abs=5)
+
+        failed = await limiter.acquire("k", tokens=100)
+        LLMService.release_slot(failed, None)
+        assert limiter._states["k"].tokens.level == pytest.approx(4900, abs=5)
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_queue(self, limits):
+        limits.llm_rpm_limit = limits.llm_tpm_limit = 0
+        limits.llm_max_concurrency = 1
+        limiter = LLMRateLimiter()
+
+        holder = await limiter.acquire("k")
+        waiter = asyncio.create_task(limiter.acquire("k"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert limiter.stats()["k"]["queue_depth"] == 0
+
+        holder.release()
+        lease = await asyncio.wait_for(limiter.acquire("k"), timeout=1)
+        lease.release()
@@ -0,0 +1,65 @@
+import json
+import logging
+import threading
+
+import pytest
+
+from app.core import logging as app_logging
+from app.core.logging import JsonPayloadFormatter, flush_logging, sampled
+
+
+@pytest.fixture
+def log_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("WeAgentChat_DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("PROMPT_LOG_MAX_CHARS", "10")
+    app_logging.setup_logging()
+    yield tmp_path / "logs"
+    monkeypatch.delenv("WeAgentChat_DATA_DIR")
+    monkeypatch.delenv("PROMPT_LOG_MAX_CHARS")
+    app_logging.setup_logging()
+
+
+def test_records_are_written_by_the_listener_thread(log_dir):
+    writers = []
+
+    class _Recorder(logging.Handler):
+        def emit(self, record):
+            writers.append(threading.get_ident())
+
+    recorder = _Recorder()
+    app_logging._listener.stop()
+    for handler in logging.getLogger("app").handlers:
+        if isinstance(handler, app_logging._SinkQueueHandler):
+            handler.sinks += (recorder,)
+    app_logging._listener.start()
+
+    logging.getLogger("app.test").info("hello %s", "queue")
+    logging.getLogger("prompt_trace").info({"prompt": "x" * 50, "nested": [{"content": "short"}]})
+    flush_logging()
+
+    assert writers and threading.get_ident() not in writers
+    assert "hello queue" in (log_dir / "app.log").read_text(encoding="utf-8")
+    line = (log_dir / "prompt.log").read_text(encoding="utf-8").strip().splitlines()[-1]
+    payload = json.loads(line.split(" - INFO - ", 1)[1])
+    assert payload["prompt"] == "x" * 10 + "...[truncated 40 chars]"
+    assert payload["nested"] == [{"content": "short"}]
+
+
+def test_openai_logger_defaults_to_info(log_dir):
+    assert logging.getLogger("openai").level == logging.INFO
+
+
+def test_sampling_is_deterministic_per_key():
+    keys = [f"trace_{i}" for i in range(2000)]
+    kept = [key for key in keys if sampled(key, 0.25)]
+    assert kept == [key for key in keys if sampled(key, 0.25)]
+    assert 350 < len(kept) < 650
+    assert all(sampled(key, 1) for key in keys[:10])
+    assert not any(sampled(key, 0) for key in keys[:10])
+
+
+def test_formatter_leaves_short_messages_untouched():
+    formatter = JsonPayloadFormatter("%(message)s", max_chars=0)
+    record = logging.LogRecord("prompt_trace", logging.INFO, __file__, 1, {"a": "中文"}, None, None)
+    assert formatter.format(record) == '{"a": "中文"}'
+    assert record.msg == {"a": "中文"}
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+from app.core import loop_monitor
+
+
+def _block(seconds):
+    time.sleep(seconds)
+
+
+def test_watchdog_attributes_a_blocking_call_to_its_call_site():
+    async def _run():
+        task = loop_monitor.start(interval=0.01, threshold=0.03)
+        await asyncio.sleep(0.05)
+        _block(0.2)
+        await asyncio.sleep(0.05)
+        report = loop_monitor.get_monitor().report()
+        task.cancel()
+        return report
+
+    report = asyncio.run(_run())
+    assert report["stalls"] >= 1
+    assert report["lag"]["samples"] > 0 and report["lag"]["max_ms"] >= 150
+    worst = report["offenders"][0]
+    # 测试文件不在 app/ 下，调用点退化为最内层帧
+    assert worst["site"] == worst["leaf"] and worst["leaf"].endswith("in _block")
+    assert worst["total_ms"] >= 150
+    assert any(frame.endswith("in _run") for frame in worst["stack"])
+
+
+def test_call_site_prefers_the_innermost_app_frame():
+    import traceback
+
+    stack = [
+        traceback.FrameSummary("/srv/server/app/services/chat_service.py", 10, "send_message"),
+        traceback.FrameSummary("/srv/server/app/vendor/memobase_server/utils.py", 20, "get_encoded_tokens"),
+        traceback.FrameSummary("/usr/lib/python3/site-packages/tiktoken/core.py", 30, "encode"),
+    ]
+    site, leaf = loop_monitor.call_site(stack)
+    assert site == "app/vendor/memobase_server/utils.py:20 in get_encoded_tokens"
+    assert leaf == "/usr/lib/python3/site-packages/tiktoken/core.py:30 in encode"
+
+
+def test_report_endpoint(client):
+    response = client.get("/api/diagnostics/event-loop")
+    assert response.status_code == 200
+    assert {"lag", "stalls", "offenders"} <= set(response.json())
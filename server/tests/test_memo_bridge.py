@@ -263,6 +263,604 @@ class TestMemoServiceRecallExtensions:
                 )
 
 
+    @pytest.mark.asyncio
+    async def test_batch_search_embeds_all_queries_in_one_call(self):
+        """Multi-query search makes a single embedding call and keeps query order."""
+        from app.services.memo.bridge import MemoService
+        from app.vendor.memobase_server.env import CONFIG
+        from app.vendor.memobase_server.models.utils import Promise
+        from types import SimpleNamespace
+        import numpy as np
+
+        def fake_search(user_id_uuid, space_id, embedding, friend_id, topk, threshold):
+            return SimpleNamespace(gists=[], marker=float(embedding[0]))
+
+        with patch.object(CONFIG, "enable_event_embedding", True), \
+             patch("app.services.memo.bridge.get_embedding", new_callable=AsyncMock) as mock_embed, \
+             patch.object(MemoService, "_search_gists_by_embedding", side_effect=fake_search) as mock_search:
+            mock_embed.return_value = Promise.resolve(np.array([[1.0, 0.0], [2.0, 0.0], [3.0, 0.0]]))
+
+            results = await MemoService.search_memories_with_tags_batch(
+                str(uuid.uuid4()), "space-1", ["q1", "q2", "q3"], friend_id=1
+            )
+
+        mock_embed.assert_awaited_once()
+        assert mock_embed.await_args.args[1] == ["q1", "q2", "q3"]
+        assert mock_search.call_count == 3
+        assert [r.marker for r in results] == [1.0, 2.0, 3.0]
+
+    @pytest.mark.asyncio
+    async def test_recall_memories_returns_one_output_per_query(self):
+        """recall_memories formats each query's gists and returns empty lists on timeout."""
+        from app.services.memo.bridge import MemoService
+        from app.vendor.memobase_server.models.response import UserEventGistsData, UserEventGistData, EventGistData
+        from datetime import datetime
+        import asyncio
+
+        gist = UserEventGistData(
+            id=uuid.uuid4(),
+            gist_data=EventGistData(content="User likes Python"),
+            created_at=datetime.utcnow(),
+            updated_at=datetime.utcnow(),
+            similarity=0.8,
+        )
+        with patch.object(MemoService, "search_memories_with_tags_batch", new_callable=AsyncMock) as mock_batch:
+            mock_batch.return_value = [
+                UserEventGistsData(gists=[gist], events=[]),
+                UserEventGistsData(gists=[], events=[]),
+            ]
+            outputs = await MemoService.recall_memories("user-123", "space-1", ["a", "b"], friend_id=1)
+
+        assert [o["query"] for o in outputs] == ["a", "b"]
+        assert outputs[0]["events"][0]["content"] == "User likes Python"
+        assert outputs[1]["events"] == []
+
+        async def slow_batch(*args, **kwargs):
+            await asyncio.sleep(10)
+
+        with patch.object(MemoService, "search_memories_with_tags_batch", side_effect=slow_batch):
+            outputs = await MemoService.recall_memories("user-123", "space-1", ["a"], friend_id=1, timeout=0.1)
+        assert outputs == [{"query": "a", "events": []}]
+
+
+class TestMemoServiceProfileBlock:
+    """Tests for the versioned profile block cache."""
+
+    @pytest.mark.asyncio
+    async def test_profile_block_cached_until_version_bumps(self):
+        """Profile block is rendered once per profile version and re-rendered after a write."""
+        from app.services.memo.bridge import MemoService
+        from app.vendor.memobase_server.controllers.profile import refresh_user_profile_cache
+        from app.vendor.memobase_server.models.response import UserProfilesData
+        from datetime import datetime
+
+        now = datetime.utcnow()
+        profiles = UserProfilesData(profiles=[
+            {
+                "id": uuid.uuid4(),
+                "content": "喜欢喝咖啡",
+                "attributes": {"topic": "兴趣", "sub_topic": "饮品"},
+                "created_at": now,
+                "updated_at": now,
+            }
+        ])
+        user_id = f"user-{uuid.uuid4()}"
+
+        with patch.object(MemoService, 'get_user_profiles', new_callable=AsyncMock) as mock_get:
+            mock_get.return_value = profiles
+
+            block = await MemoService.get_profile_block(user_id, "space-1")
+            again = await MemoService.get_profile_block(user_id, "space-1")
+            assert block.text == "- 兴趣\t饮品\t喜欢喝咖啡"
+            assert block.token_count > 0
+            assert again is block
+            assert mock_get.await_count == 1
+
+            content_block = await MemoService.get_profile_block(user_id, "space-1", style="content")
+            assert content_block.text == "- 喜欢喝咖啡"
+
+            await refresh_user_profile_cache(user_id, "space-1")
+            refreshed = await MemoService.get_profile_block(user_id, "space-1")
+            assert refreshed.version == block.version + 1
+            assert mock_get.await_count == 3
+
+
+class TestMemoServiceProfileSelection:
+    """Tests for relevance-ranked, token-budgeted profile injection."""
+
+    @staticmethod
+    def _profiles():
+        from app.vendor.memobase_server.models.response import UserProfilesData
+        from datetime import datetime
+
+        now = datetime.utcnow()
+        rows = [
+            ("基本信息", "用户姓名", "小明"),
+            ("兴趣", "饮品", "喜欢喝咖啡"),
+            ("工作", "职业", "后端工程师"),
+        ]
+        return UserProfilesData(profiles=[
+            {
+                "id": uuid.uuid4(),
+                "content": content,
+                "attributes": {"topic": topic, "sub_topic": sub_topic},
+                "created_at": now,
+                "updated_at": now,
+            }
+            for topic, sub_topic, content in rows
+        ])
+
+    @pytest.mark.asyncio
+    async def test_pinned_first_then_relevance_within_budget(self):
+        """Pinned topics lead, the most similar entry follows, the rest is cut by the budget."""
+        import numpy as np
+        from app.core.config import settings
+        from app.services.memo.bridge import MemoService
+        from app.vendor.memobase_server.controllers import profile_relevance
+        from app.vendor.memobase_server.models.utils import Promise
+
+        from app.vendor.memobase_server.utils import get_encoded_tokens
+
+        matrix = np.array([[0.0, 0.0, 1.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]], dtype=np.float32)
+        query = np.array([0.0, 1.0, 0.0], dtype=np.float32)
+        pinned, _, relevant = self._profiles().profiles
+        budget = sum(
+            len(get_encoded_tokens(profile_relevance.profile_embedding_str(p))) for p in (pinned, relevant)
+        )
+
+        with patch.object(MemoService, 'get_user_profiles', new_callable=AsyncMock) as mock_get, \
+                patch.object(profile_relevance, 'get_profile_matrix', new_callable=AsyncMock) as mock_matrix, \
+                patch.object(profile_relevance, 'get_query_embedding', new_callable=AsyncMock) as mock_query, \
+                patch.object(settings, 'PROFILE_TOKEN_BUDGET', budget), \
+                patch.object(settings, 'PROFILE_PINNED_TOPICS', "基本信息"):
+            mock_get.side_effect = lambda *args, **kwargs: self._profiles()
+            mock_matrix.return_value = Promise.resolve(matrix)
+            mock_query.return_value = Promise.resolve(query)
+
+            selection = await MemoService.select_profile_block(
+                f"user-{uuid.uuid4()}", "space-1", "今天加班写接口", style="content"
+            )
+
+        assert selection.text == "- 小明\n- 后端工程师"
+        assert selection.stats()["injected"] == 2
+        assert selection.stats()["available"] == 3
+        assert selection.token_count < selection.available_tokens
+
+    @pytest.mark.asyncio
+    async def test_selection_cached_per_version_and_query(self):
+        """The same query reuses the selection until the profile version changes."""
+        from app.core.config import settings
+        from app.services.memo import bridge
+        from app.services.memo.bridge import MemoService
+        from app.vendor.memobase_server.controllers.profile import refresh_user_profile_cache
+        from app.vendor.memobase_server.models.utils import Promise
+
+        user_id = f"user-{uuid.uuid4()}"
+        selected = self._profiles()
+        selected.profiles = selected.profiles[:1]
+
+        with patch.object(MemoService, 'get_user_profiles', new_callable=AsyncMock) as mock_get, \
+                patch.object(bridge, 'select_relevant_profiles', new_callable=AsyncMock) as mock_select, \
+                patch.object(settings, 'PROFILE_TOKEN_BUDGET', 64):
+            mock_get.side_effect = lambda *args, **kwargs: self._profiles()
+            mock_select.return_value = Promise.resolve(selected)
+
+            first = await MemoService.select_profile_block(user_id, "space-1", "喝什么")
+            again = await MemoService.select_profile_block(user_id, "space-1", "喝什么")
+            assert again is first
+            assert mock_select.await_count == 1
+
+            await MemoService.select_profile_block(user_id, "space-1", "今天加班")
+            assert mock_select.await_count == 2
+
+            await refresh_user_profile_cache(user_id, "space-1")
+            await MemoService.select_profile_block(user_id, "space-1", "喝什么")
+            assert mock_select.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_zero_budget_injects_everything(self):
+        """A budget of 0 keeps the previous behaviour of injecting every profile."""
+        from app.core.config import settings
+        from app.services.memo.bridge import MemoService
+
+        with patch.object(MemoService, 'get_user_profiles', new_callable=AsyncMock) as mock_get, \
+                patch.object(settings, 'PROFILE_TOKEN_BUDGET', 0):
+            mock_get.side_effect = lambda *args, **kwargs: self._profiles()
+            selection = await MemoService.select_profile_block(f"user-{uuid.uuid4()}", "space-1", "hi")
+
+        assert selection.injected == selection.available == 3
+        assert selection.token_count == selection.available_tokens
+
+
+class TestMemoServiceHybridRecall:
+    """Tests for BM25 + vector recall fused with reciprocal-rank fusion."""
+
+    @staticmethod
+    def _gists(*contents):
+        from app.vendor.memobase_server.models.response import UserEventGistsData, UserEventGistData, EventGistData
+        from datetime import datetime
+
+        return UserEventGistsData(gists=[
+            UserEventGistData(
+                id=uuid.uuid5(uuid.NAMESPACE_OID, content),
+                gist_data=EventGistData(content=content),
+                created_at=datetime.utcnow(),
+                updated_at=datetime.utcnow(),
+            )
+            for content in contents
+        ], events=[])
+
+    def test_fts_tokens_split_cjk_into_unigrams_and_bigrams(self):
+        """Chinese text is indexed as unigrams + bigrams and queried by bigrams."""
+        from app.vendor.memobase_server.utils import fts_segment, fts_match_query
+
+        assert fts_segment("喜欢火锅 Hot-Pot") == "喜 欢 火 锅 喜欢 欢火 火锅 hot pot"
+        assert fts_match_query("火锅") == '"火锅"'
+        assert fts_match_query("吃 Python") == '"吃" OR "python"'
+        assert fts_match_query("？！") is None
+
+    def test_fts_rows_are_updated_and_deleted_by_rowid(self, tmp_path):
+        """Content updates rewrite the gist's FTS row in place and deletes remove it with its rowid mapping."""
+        from sqlalchemy import create_engine, text
+        from sqlalchemy.orm import sessionmaker
+        from app.vendor.memobase_server.controllers.event_gist_fts import ensure_event_gist_fts
+        from app.vendor.memobase_server.models.database import REG, User, UserEvent, UserEventGist
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'memobase.db'}")
+        REG.metadata.create_all(engine)
+        with engine.begin() as connection:
+            ensure_event_gist_fts(connection)
+        TestSession = sessionmaker(bind=engine)
+
+        user_id = uuid.uuid4()
+        with TestSession() as session:
+            user = User(project_id="space-1")
+            user.id = user_id
+            session.add(user)
+            gists = []
+            for content in ("User likes tea", "User plays chess"):
+                event = UserEvent(user_id=user_id, project_id="space-1", event_data={})
+                session.add(event)
+                session.flush()
+                gist = UserEventGist(user_id=user_id, project_id="space-1", event_id=event.id, gist_data={"content": content})
+                session.add(gist)
+                gists.append(gist)
+            session.commit()
+
+            gists[0].gist_data = {"content": "User likes coffee"}
+            session.commit()
+            session.delete(gists[1])
+            session.commit()
+
+            rows = session.execute(text(
+                "SELECT f.gist_id, f.tokens FROM user_event_gists_fts f "
+                "JOIN user_event_gists_fts_rowids m ON m.fts_rowid = f.rowid"
+            )).all()
+            assert rows == [(gists[0].id.hex, "user likes coffee")]
+            assert session.execute(text("SELECT count(*) FROM user_event_gists_fts")).scalar() == 1
+
+    def test_rrf_prefers_gists_ranked_by_both_paths(self):
+        """A gist found by both vector and BM25 outranks single-path hits."""
+        from app.services.memo.bridge import MemoService
+
+        vector = self._gists("a", "b")
+        lexical = self._gists("c", "b")
+        fused = MemoService._fuse_rrf([vector, lexical], topk=2)
+
+        assert [g.gist_data.content for g in fused.gists] == ["b", "a"]
+        assert fused.gists[0].score > fused.gists[1].score
+
+    @pytest.mark.asyncio
+    async def test_vector_failure_degrades_to_lexical_and_backs_off(self):
+        """When the embedding path fails, BM25 results are returned and vector search is skipped."""
+        from app.core.config import settings
+        from app.services.memo.bridge import MemoService
+
+        lexical = [self._gists("User likes Python")]
+        with patch.object(settings, "RECALL_SEARCH_MODE", "hybrid"), \
+                patch.object(MemoService, "_vector_backoff_until", 0.0), \
+                patch.object(MemoService, "_search_gists_lexical", return_value=lexical), \
+                patch.object(MemoService, "search_memories_with_tags", side_effect=Exception("provider down")) as mock_vector:
+            user_id = str(uuid.uuid4())
+            first = await MemoService.recall_memory(user_id, "space-1", "python", friend_id=1)
+            second = await MemoService.recall_memory(user_id, "space-1", "python", friend_id=1)
+
+        assert first["events"][0]["content"] == "User likes Python"
+        assert first["events"][0]["score"] > 0
+        assert second == first
+        assert mock_vector.call_count == 1
+
+
+
+class TestMemoServiceMemoryDeletion:
+    """Tests for chunked, set-based friend/session memory deletion."""
+
+    @pytest.mark.asyncio
+    async def test_delete_friend_memories_in_chunks(self, tmp_path):
+        """Events, gists, blobs and idle buffers of one friend go; others and in-flight buffers stay."""
+        from sqlalchemy import create_engine, func, select
+        from sqlalchemy.orm import sessionmaker
+        from app.core.config import settings
+        from app.services.memo.bridge import MemoService
+        from app.vendor.memobase_server.controllers import event_purge
+        from app.vendor.memobase_server.env import BufferStatus
+        from app.vendor.memobase_server.models.blob import BlobType
+        from app.vendor.memobase_server.models.database import (
+            REG, User, UserEvent, UserEventGist, GeneralBlob, BufferZone,
+        )
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'memobase.db'}")
+        REG.metadata.create_all(engine)
+        TestSession = sessionmaker(bind=engine)
+        user_id = uuid.uuid4()
+        with TestSession() as session:
+            user = User(project_id="space-1")
+            user.id = user_id
+            session.add(user)
+            for i in range(5):
+                friend_id = "1" if i < 4 else "2"
+                event = UserEvent(
+                    user_id=user_id,
+                    project_id="space-1",
+                    event_data={"event_tags": [{"tag": "friend_id", "value": friend_id}]},
+                )
+                session.add(event)
+                session.flush()
+                session.add(UserEventGist(
+                    user_id=user_id, project_id="space-1", event_id=event.id, gist_data={"content": f"gist {i}"},
+                ))
+            for status in (BufferStatus.idle, BufferStatus.processing):
+                blob = GeneralBlob(
+                    blob_type=BlobType.chat,
+                    blob_data={"messages": []},
+                    user_id=user_id,
+                    project_id="space-1",
+                    additional_fields={"friend_id": "1"},
+                )
+                session.add(blob)
+                session.flush()
+                session.add(BufferZone(
+                    blob_type=BlobType.chat, token_size=1, user_id=user_id,
+                    blob_id=blob.id, project_id="space-1", status=status,
+                ))
+            session.commit()
+
+        reports = []
+        with patch.object(event_purge, "Session", TestSession), \
+                patch.object(settings, "MEMORY_DELETE_CHUNK_SIZE", 3):
+            count = await MemoService.delete_friend_memories(
+                str(user_id), "space-1", 1, on_progress=lambda p: reports.append((p.events, p.blobs))
+            )
+
+        assert count == 4
+        assert reports == [(3, 0), (4, 0), (4, 1)]
+        with TestSession() as session:
+            assert session.scalar(select(func.count()).select_from(UserEvent)) == 1
+            assert session.scalar(select(func.count()).select_from(UserEventGist)) == 1
+            assert session.scalar(select(func.count()).select_from(GeneralBlob)) == 1
+            assert session.scalars(select(BufferZone.status)).all() == [BufferStatus.processing]
+
+
+class TestBufferWorker:
+    """Event-driven flushing of Memobase buffers."""
+
+    @pytest.fixture
+    def memobase_session(self, tmp_path):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.vendor.memobase_server.controllers import buffer, buffer_background
+        from app.vendor.memobase_server.models.database import REG
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'memobase.db'}")
+        REG.metadata.create_all(engine)
+        TestSession = sessionmaker(bind=engine)
+        flushes = []
+
+        async def _flush(user_id, project_id, blob_type, buffer_ids):
+            flushes.append((user_id, blob_type, sorted(buffer_ids)))
+
+        with patch.object(buffer, "Session", TestSession), \
+                patch.object(buffer_background, "Session", TestSession), \
+                patch.object(buffer_background, "flush_buffer_by_ids_in_background", _flush):
+            yield TestSession, flushes
+
+    @staticmethod
+    async def _insert(user_id, text):
+        from app.vendor.memobase_server.controllers.buffer import insert_blob_to_buffer
+        from app.vendor.memobase_server.models.blob import ChatBlob, OpenAICompatibleMessage
+
+        blob = ChatBlob(messages=[OpenAICompatibleMessage(role="user", content=text)])
+        await insert_blob_to_buffer(user_id, "space-1", str(uuid.uuid4()), blob)
+
+    @staticmethod
+    def _idle_ids(TestSession):
+        from app.vendor.memobase_server.models.database import BufferZone
+
+        with TestSession() as session:
+            return sorted(str(row.id) for row in session.query(BufferZone.id))
+
+    @pytest.mark.asyncio
+    async def test_inserts_are_debounced_into_one_flush(self, memobase_session):
+        import asyncio
+        from app.vendor.memobase_server.controllers.buffer_background import BufferWorker
+
+        TestSession, flushes = memobase_session
+        user_id = str(uuid.uuid4())
+        task = asyncio.create_task(BufferWorker(debounce_s=0.05, max_wait_s=5, sweep_interval_s=3600).run())
+        await asyncio.sleep(0.01)
+        await self._insert(user_id, "hello")
+        await asyncio.sleep(0.02)
+        await self._insert(user_id, "again")
+        assert flushes == []
+        await asyncio.sleep(0.15)
+        task.cancel()
+
+        assert flushes == [(user_id, "chat", self._idle_ids(TestSession))]
+
+    @pytest.mark.asyncio
+    async def test_token_threshold_flushes_without_waiting(self, memobase_session, monkeypatch):
+        import asyncio
+        from app.vendor.memobase_server.controllers.buffer_background import BufferWorker
+        from app.vendor.memobase_server.env import CONFIG
+
+        TestSession, flushes = memobase_session
+        monkeypatch.setattr(CONFIG, "max_chat_blob_buffer_token_size", 5)
+        task = asyncio.create_task(BufferWorker(debounce_s=60, max_wait_s=60, sweep_interval_s=3600).run())
+        await asyncio.sleep(0.01)
+        await self._insert(str(uuid.uuid4()), "a message that is clearly longer than five tokens")
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+        assert len(flushes) == 1
+
+    @pytest.mark.asyncio
+    async def test_sweep_picks_up_unsignalled_idle_buffers(self, memobase_session):
+        import asyncio
+        from app.vendor.memobase_server.controllers.buffer_background import BufferWorker
+
+        TestSession, flushes = memobase_session
+        user_id = str(uuid.uuid4())
+        # 模拟重启前遗留的 idle 行：写入时没有 worker 在监听
+        await self._insert(user_id, "left over")
+        task = asyncio.create_task(BufferWorker(debounce_s=60, max_wait_s=60, sweep_interval_s=3600).run())
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+        assert flushes == [(user_id, "chat", self._idle_ids(TestSession))]
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
 
+
+
+class TestGistCompaction:
+    """Per-friend consolidation of near-duplicate event gists."""
+
+    @pytest.fixture
+    def memobase_session(self, tmp_path):
+        """Friend 1: three near-duplicate old gists, one distinct old gist, one recent duplicate. Friend 2: a duplicate pair."""
+        from datetime import datetime, timedelta, timezone
+        import numpy as np
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.vendor.memobase_server.controllers import event_gist_compaction
+        from app.vendor.memobase_server.controllers.event_gist_fts import ensure_event_gist_fts
+        from app.vendor.memobase_server.env import CONFIG
+        from app.vendor.memobase_server.models.database import REG, User, UserEvent, UserEventGist
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'memobase.db'}")
+        REG.metadata.create_all(engine)
+        with engine.begin() as connection:
+            ensure_event_gist_fts(connection)
+        TestSession = sessionmaker(bind=engine)
+
+        rng = np.random.default_rng(7)
+        topics = rng.normal(size=(3, CONFIG.embedding_dim)).astype(np.float32)
+
+        def near(topic):
+            return (topics[topic] + rng.normal(scale=0.05, size=CONFIG.embedding_dim)).astype(np.float32).tobytes()
+
+        now = datetime.now(timezone.utc)
+        gists = [
+            # (friend, 内容, 主题, 距今天数)
+            ("1", "- User adopted a cat named Mochi", 0, 30),
+            ("1", "- User has a cat called Mochi", 0, 40),
+            ("1", "- User's cat is Mochi", 0, 50),
+            ("1", "- User is learning the guitar", 1, 35),
+            ("1", "- User talked about Mochi again", 0, 1),
+            ("2", "- User runs every morning", 2, 20),
+            ("2", "- User goes running each morning", 2, 25),
+        ]
+        user_id = uuid.uuid4()
+        ids = {}
+        with TestSession() as session:
+            user = User(project_id="space-1")
+            user.id = user_id
+            session.add(user)
+            for friend_id, content, topic, days in gists:
+                event = UserEvent(
+                    user_id=user_id,
+                    project_id="space-1",
+                    event_data={"event_tags": [{"tag": "friend_id", "value": friend_id}]},
+                )
+                event.created_at = now - timedelta(days=days)
+                session.add(event)
+                session.flush()
+                gist = UserEventGist(
+                    user_id=user_id, project_id="space-1", event_id=event.id,
+                    gist_data={"content": content}, embedding=near(topic),
+                )
+                gist.created_at = now - timedelta(days=days)
+                session.add(gist)
+                session.flush()
+                ids[content] = gist.id
+            session.commit()
+
+        with patch.object(event_gist_compaction, "Session", TestSession):
+            yield TestSession, user_id, ids
+
+    @pytest.mark.asyncio
+    async def test_dry_run_reports_without_writing(self, memobase_session):
+        from sqlalchemy import func, select
+        from app.services.memo.bridge import MemoService
+        from app.vendor.memobase_server.models.database import UserEventGist
+
+        TestSession, user_id, _ = memobase_session
+        reports = await MemoService.compact_event_gists(str(user_id), "space-1", dry_run=True)
+
+        by_friend = {r.friend_id: r for r in reports}
+        assert set(by_friend) == {"1", "2"}
+        assert (by_friend["1"].gists_before, by_friend["1"].gists_after, by_friend["1"].clusters) == (5, 3, 1)
+        assert (by_friend["2"].gists_before, by_friend["2"].gists_after) == (2, 1)
+        assert all(r.bytes_after < r.bytes_before and not r.applied for r in reports)
+        with TestSession() as session:
+            assert session.scalar(select(func.count()).select_from(UserEventGist)) == 7
+
+    @pytest.mark.asyncio
+    async def test_apply_keeps_newest_gist_with_provenance(self, memobase_session):
+        from sqlalchemy import select, text
+        from app.services.memo.bridge import MemoService
+        from app.vendor.memobase_server.models.database import UserEventGist
+
+        TestSession, user_id, ids = memobase_session
+        [report] = await MemoService.compact_event_gists(str(user_id), "space-1", friend_id=1, dry_run=False, summarize=False)
+
+        assert report.applied and report.merged == 2
+        with TestSession() as session:
+            remaining = {g.id: g for g in session.scalars(select(UserEventGist))}
+            keeper = remaining[ids["- User adopted a cat named Mochi"]]
+            sources = keeper.gist_data["consolidated_from"]
+            assert {s["content"] for s in sources} == {
+                "- User adopted a cat named Mochi", "- User has a cat called Mochi", "- User's cat is Mochi",
+            }
+            assert ids["- User has a cat called Mochi"] not in remaining
+            # 近期 gist 与其它好友不受影响
+            assert ids["- User talked about Mochi again"] in remaining
+            assert ids["- User goes running each morning"] in remaining
+            indexed = set(session.execute(text("SELECT gist_id FROM user_event_gists_fts")).scalars())
+            assert ids["- User has a cat called Mochi"].hex not in indexed
+
+    @pytest.mark.asyncio
+    async def test_summarize_merges_groups_in_one_call(self, memobase_session):
+        from sqlalchemy import select
+        from app.services.memo.bridge import MemoService
+        from app.vendor.memobase_server.controllers import event_gist_compaction
+        from app.vendor.memobase_server.env import CONFIG
+        from app.vendor.memobase_server.models.database import UserEventGist
+        from app.vendor.memobase_server.models.utils import Promise
+
+        TestSession, user_id, ids = memobase_session
+        sep = CONFIG.llm_tab_separator
+        llm = AsyncMock(return_value=Promise.resolve(f"- 1{sep}User has a cat named Mochi\n- 2{sep}User runs every morning"))
+        embed = AsyncMock(side_effect=lambda project_id, texts, **kw: Promise.resolve([[0.1] * CONFIG.embedding_dim for _ in texts]))
+        with patch.object(event_gist_compaction, "llm_complete", llm), \
+                patch.object(event_gist_compaction, "get_embedding", embed):
+            reports = await MemoService.compact_event_gists(str(user_id), "space-1", dry_run=False, summarize=True)
+
+        assert sum(r.summarized for r in reports) == 2
+        assert llm.await_count == 2  # 每个好友一次调用
+        with TestSession() as session:
+            keeper = session.get(UserEventGist, (ids["- User adopted a cat named Mochi"], "space-1"))
+            assert keeper.gist_data["content"] == "- User has a cat named Mochi"
+            assert len(keeper.gist_data["consolidated_from"]) == 3
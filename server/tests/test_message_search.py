@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.db.message_fts import ensure_message_fts, rebuild_message_fts
+from app.models.chat import ChatSession, Message
+from app.models.group import Group, GroupMessage, GroupSession
+from tests.conftest import engine
+
+BASE_TIME = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture(scope="module")
+def seeded(db: Session):
+    with engine.begin() as connection:
+        ensure_message_fts(connection)
+        rebuild_message_fts(connection)
+
+    session = ChatSession(friend_id=1, title="test")
+    group = Group(name="g", owner_id="user")
+    db.add_all([session, group])
+    db.flush()
+    group_session = GroupSession(group_id=group.id)
+    db.add(group_session)
+    db.flush()
+
+    contents = ["周末一起去吃火锅吧", "我更想吃烤肉", "hotpot in Chengdu", "火锅店排队太久了"]
+    messages = [
+        Message(
+            session_id=session.id,
+            friend_id=1,
+            role="user" if i % 2 == 0 else "assistant",
+            content=content,
+            create_time=BASE_TIME + timedelta(minutes=i),
+        )
+        for i, content in enumerate(contents)
+    ]
+    db.add_all(messages)
+    db.add(GroupMessage(
+        group_id=group.id,
+        session_id=group_session.id,
+        sender_id="2",
+        sender_type="friend",
+        content="大家晚上吃火锅",
+        create_time=BASE_TIME + timedelta(minutes=10),
+    ))
+    db.commit()
+    return {"messages": messages, "group_id": group.id}
+
+
+def test_search_matches_trigram_and_short_terms(client: TestClient, seeded):
+    resp = client.get("/api/chat/search", params={"q": "吃火锅", "friend_id": 1})
+    assert resp.status_code == 200
+    items = resp.json()["items"]
+    assert [item["id"] for item in items] == [seeded["messages"][0].id]
+    assert "【吃火锅】" in items[0]["snippet"]
+
+    # 两个字的词无法走 trigram，回退 LIKE
+    resp = client.get("/api/chat/search", params={"q": "火锅"})
+    kinds = [(item["kind"], item["snippet"]) for item in resp.json()["items"]]
+    assert kinds[0] == ("group", "大家晚上吃【火锅】")
+    assert len(kinds) == 3
+
+    resp = client.get("/api/chat/search", params={"q": "HOTPOT"})
+    assert resp.json()["items"][0]["snippet"] == "【hotpot】 in Chengdu"
+
+
+def test_search_keyset_pagination(client: TestClient, seeded):
+    seen = []
+    cursor = None
+    while True:
+        params = {"q": "火锅", "limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/api/chat/search", params=params).json()
+        seen += [(item["kind"], item["id"]) for item in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == 3
+
+    resp = client.get("/api/chat/search", params={"q": "火锅", "cursor": "bogus"})
+    assert resp.status_code == 400
+
+
+def test_deleted_and_recalled_messages_leave_the_index(client: TestClient, db: Session, seeded):
+    first, _, _, last = seeded["messages"]
+    first.role = "system"
+    first.content = "你撤回了一条消息"
+    db.query(Message).filter(Message.id == last.id).update({"deleted": True})
+    db.commit()
+
+    resp = client.get("/api/chat/search", params={"q": "火锅", "friend_id": 1})
+    assert resp.json()["items"] == []
+    with engine.connect() as connection:
+        indexed = connection.exec_driver_sql(
+            "SELECT rowid FROM messages_fts WHERE messages_fts MATCH '\"火锅店\" OR \"吃火锅\"'"
+        ).all()
+    assert indexed == []
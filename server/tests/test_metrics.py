@@ -0,0 +1,72 @@
+from app.core import metrics
+
+
+def _sample(name, labels=None):
+    from prometheus_client import REGISTRY
+
+    return REGISTRY.get_sample_value(name, labels or {})
+
+
+def test_metrics_endpoint_exposes_route_latency_and_scrape_gauges(client):
+    before = _sample(
+        "weagentchat_http_request_duration_seconds_count",
+        {"method": "GET", "route": "/api/health", "status": "200"},
+    ) or 0
+    assert client.get("/api/health").status_code == 200
+
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'weagentchat_http_request_duration_seconds_count{method="GET",route="/api/health",status="200"}' in body
+    assert "weagentchat_memory_queue_depth" in body
+    assert "weagentchat_db_statement_duration_seconds" in body
+    assert _sample(
+        "weagentchat_http_request_duration_seconds_count",
+        {"method": "GET", "route": "/api/health", "status": "200"},
+    ) == before + 1
+
+
+def test_generation_timings_are_observed_per_kind_and_provider():
+    labels = {"kind": "chat", "provider": "fake"}
+    before = _sample("weagentchat_stream_ttft_seconds_count", labels) or 0
+    metrics.observe_generation("chat", "fake", {
+        "ttft_ms": 250, "duration_ms": 1200, "recall_ms": 80, "recall_rounds": 2,
+    })
+    metrics.observe_generation("chat", "fake", {
+        "ttft_ms": None, "duration_ms": 10, "recall_ms": None, "recall_rounds": 0,
+    })
+    assert _sample("weagentchat_stream_ttft_seconds_count", labels) == before + 1
+    assert _sample("weagentchat_recall_rounds_sum", {"kind": "chat"}) >= 2
+
+
+def test_responses_carry_per_request_query_totals(client):
+    response = client.get("/api/health")
+    assert int(response.headers["x-db-queries"]) >= 1
+    assert float(response.headers["x-db-time-ms"]) >= 0
+    assert _sample("weagentchat_scope_db_queries_count", {"scope": "/api/health"}) >= 1
+
+
+def test_repeated_and_slow_statements_are_reported(monkeypatch, caplog):
+    from sqlalchemy import text
+
+    from app.core.config import settings
+    from app.core.query_stats import query_scope
+    from tests.conftest import engine
+
+    monkeypatch.setattr(settings, "DB_REPEATED_QUERY_THRESHOLD", 3)
+    monkeypatch.setattr(settings, "DB_SLOW_QUERY_MS", 0.000001)
+    before = _sample("weagentchat_db_repeated_statements_total", {"db": "memory"}) or 0
+
+    with caplog.at_level("WARNING", logger="app.core.query_stats"), query_scope("job") as stats:
+        with engine.connect() as conn:
+            for i in range(5):
+                conn.execute(text("SELECT :i"), {"i": i})
+
+    assert stats.count == 5
+    assert stats.shapes["SELECT ?"] == 5
+    repeated = [r.message for r in caplog.records if r.message.startswith("[RepeatedQuery]")]
+    assert len(repeated) == 1 and "scope=job" in repeated[0]
+    assert "tests/test_metrics.py" not in repeated[0]  # 只取 app/ 下的调用位置
+    assert any(r.message.startswith("[SlowQuery]") for r in caplog.records)
+    assert _sample("weagentchat_db_repeated_statements_total", {"db": "memory"}) == before + 1
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+from app.core.config import settings
+from app.services.prompt_layout import (
+    root_prompt_template,
+    turn_context_message,
+    usage_from_result,
+)
+
+
+class TestPromptLayout:
+    def test_static_root_prompt_has_no_volatile_placeholders(self, monkeypatch):
+        monkeypatch.setattr(settings, "PROMPT_CACHE_LAYOUT", True)
+        template = root_prompt_template()
+        assert "{{current-time}}" not in template
+        assert "{{user-profile}}" not in template
+        assert "{{role-play-prompt}}" in template
+
+        monkeypatch.setattr(settings, "PROMPT_CACHE_LAYOUT", False)
+        assert "{{current-time}}" in root_prompt_template()
+
+    def test_turn_context_message(self, monkeypatch):
+        monkeypatch.setattr(settings, "PROMPT_CACHE_LAYOUT", True)
+        msg = turn_context_message("- 喜欢喝咖啡", "2026-01-01 约10点 周四")
+        assert msg["role"] == "system"
+        assert msg["content"] == "【当前时间】\n2026-01-01 约10点 周四\n\n【用户信息】\n- 喜欢喝咖啡"
+
+        monkeypatch.setattr(settings, "PROMPT_CACHE_LAYOUT", False)
+        assert turn_context_message("- 喜欢喝咖啡", "now") is None
+
+    def test_fallback_system_prompt_leaves_time_to_turn_context(self, monkeypatch):
+        from app.services.group_chat_shared import build_system_prompt
+
+        # 模板不可用时走兜底拼接
+        monkeypatch.setattr(settings, "PROMPT_CACHE_LAYOUT", True)
+        assert build_system_prompt(None, "persona", "script", "- 喜欢喝咖啡", "", "now") == "persona\n\nscript"
+
+        monkeypatch.setattr(settings, "PROMPT_CACHE_LAYOUT", False)
+        assert build_system_prompt(None, "persona", "script", "", "", "now").endswith("now")
+
+    def test_usage_from_result_reads_cached_tokens(self):
+        usage = SimpleNamespace(
+            input_tokens=1200,
+            output_tokens=80,
+            total_tokens=1280,
+            input_tokens_details=SimpleNamespace(cached_tokens=1024),
+            output_tokens_details=SimpleNamespace(reasoning_tokens=30),
+        )
+        result = SimpleNamespace(context_wrapper=SimpleNamespace(usage=usage))
+        assert usage_from_result(result) == {
+            "prompt_tokens": 1200,
+            "completion_tokens": 80,
+            "total_tokens": 1280,
+            "cached_tokens": 1024,
+            "reasoning_tokens": 30,
+        }
+        assert usage_from_result(object())["total_tokens"] == 0
@@ -1,12 +1,15 @@
 import ast
 import asyncio
+import json
 from pathlib import Path
 from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
 
 import pytest
 
 from app.db.session import SessionLocal
 from app.models.llm import LLMConfig
+from app.services.memo.bridge import MemoService
 from app.services.memo.constants import DEFAULT_SPACE_ID, DEFAULT_USER_ID
 from app.services.recall_service import RecallService
 from agents import Agent, Runner
@@ -136,3 +139,83 @@ async def test_recall_service_returns_events_from_seed_data():
         assert life_events[2] in output_text
     finally:
         db.close()
+
+
+class TestRecallQueries:
+    def test_normalize_queries_dedupes_and_caps(self, monkeypatch):
+        from app.core.config import settings
+
+        monkeypatch.setattr(settings, "RECALL_MAX_QUERIES", 3)
+        assert RecallService._normalize_queries(["失眠", " 失眠 ", "", 1, "睡眠", "作息", "咖啡"]) == ["失眠", "睡眠", "作息"]
+        assert RecallService._normalize_queries("失眠") == ["失眠"]
+
+    def test_parse_planned_queries(self):
+        assert RecallService._parse_planned_queries('好的：["失眠", "睡眠质量"]') == ["失眠", "睡眠质量"]
+        assert RecallService._parse_planned_queries('{"queries": ["失眠"]}') == ["失眠"]
+        assert RecallService._parse_planned_queries("- 失眠\n- 睡眠质量") == ["失眠", "睡眠质量"]
+
+    @pytest.mark.asyncio
+    async def test_recall_queries_merges_outputs(self):
+        outputs = [
+            {"query": "失眠", "events": [
+                {"date": "d1", "content": "A", "similarity": 0.6},
+                {"date": "d2", "content": "B", "similarity": 0.9},
+            ]},
+            {"query": "睡眠", "events": [
+                {"date": "d1", "content": "A", "similarity": 0.8},
+            ]},
+        ]
+        with patch.object(MemoService, "recall_memories", AsyncMock(return_value=outputs)) as mock_recall:
+            result = await RecallService.recall_queries("u", "s", ["失眠", "睡眠", "失眠"], 1, 5, 0.5)
+
+        assert mock_recall.await_args.kwargs["queries"] == ["失眠", "睡眠"]
+        assert [(e["content"], e["similarity"]) for e in result["events"]] == [("B", 0.9), ("A", 0.8)]
+
+    @pytest.mark.asyncio
+    async def test_recall_queries_ranks_by_rrf_score(self):
+        outputs = [
+            {"query": "火锅", "events": [
+                {"date": "d1", "content": "weak vector", "similarity": 0.55, "score": 1 / 62},
+                {"date": "d2", "content": "fts only", "similarity": None, "score": 1 / 61},
+            ]},
+            {"query": "川菜", "events": [
+                {"date": "d1", "content": "weak vector", "similarity": 0.55, "score": 1 / 63},
+            ]},
+        ]
+        with patch.object(MemoService, "recall_memories", AsyncMock(return_value=outputs)):
+            result = await RecallService.recall_queries("u", "s", ["火锅", "川菜"], 1, 1, 0.5)
+
+        assert [e["content"] for e in result["events"]] == ["fts only"]
+
+    @pytest.mark.asyncio
+    async def test_single_shot_mode_plans_once_and_recalls_in_batch(self):
+        llm_config = SimpleNamespace(
+            model_name="gpt-4o-mini", base_url="http://localhost", api_key="test",
+            provider="openai", capability_reasoning=False,
+        )
+        settings_map = {"recall_mode": "single_shot", "event_topk": 5, "similarity_threshold": 0.5, "search_rounds": 3}
+        run = AsyncMock(return_value=SimpleNamespace(final_output='["失眠", "睡眠质量"]'))
+        recall = AsyncMock(return_value=[
+            {"query": "失眠", "events": [{"date": None, "content": "A", "similarity": 0.9}]},
+            {"query": "睡眠质量", "events": []},
+        ])
+        lease = SimpleNamespace(tokens=0, release=lambda actual_tokens=None: None)
+
+        with patch("app.services.recall_service.llm_service.get_active_config", return_value=llm_config), \
+             patch("app.services.recall_service.llm_service.acquire_slot", AsyncMock(return_value=lease)), \
+             patch("app.services.recall_service.SettingsService.get_setting",
+                   side_effect=lambda db, group, key, default=None: settings_map.get(key, default)), \
+             patch("app.services.recall_service.Runner.run", run), \
+             patch.object(MemoService, "recall_memories", recall):
+            result = await RecallService.perform_recall(
+                db=None, user_id="u", space_id="s",
+                messages=[{"role": "user", "content": "最近总是失眠"}], friend_id=1,
+            )
+
+        run.assert_awaited_once()
+        recall.assert_awaited_once()
+        assert recall.await_args.kwargs["queries"] == ["失眠", "睡眠质量"]
+        tool_call, tool_output = result["injected_messages"]
+        assert json.loads(tool_call["arguments"]) == {"queries": ["失眠", "睡眠质量"]}
+        assert json.loads(tool_output["output"])["events"][0]["content"] == "A"
+        assert [fp["type"] for fp in result["footprints"]] == ["tool_call", "tool_result"]
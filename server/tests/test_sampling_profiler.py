@@ -0,0 +1,84 @@
+import json
+import threading
+import time
+
+import pytest
+
+from app.core import sampling_profiler
+from app.core.config import settings
+from app.core.sampling_profiler import SamplingProfiler
+
+
+def _spin_until(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_profiler_aggregates_busy_thread_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=_spin_until, args=(stop,), name="busy worker")
+    worker.start()
+    profiler = SamplingProfiler(interval=0.002).start()
+    time.sleep(0.1)
+    profiler.stop()
+    stop.set()
+    worker.join()
+
+    assert profiler.samples > 5
+    collapsed = profiler.collapsed()
+    busy = [line for line in collapsed.splitlines() if line.startswith("busy_worker;")]
+    assert busy and "_spin_until (" in busy[0]
+    assert int(busy[0].rsplit(" ", 1)[1]) > 0
+
+    doc = profiler.speedscope()
+    names = {frame["name"] for frame in doc["shared"]["frames"]}
+    assert "_spin_until" in names
+    profile = next(p for p in doc["profiles"] if p["name"] == "busy worker")
+    assert len(profile["samples"]) == len(profile["weights"])
+    assert profile["endValue"] == pytest.approx(sum(profile["weights"]), abs=0.01)
+
+
+def test_only_one_profiler_runs_at_a_time():
+    first = SamplingProfiler().start()
+    try:
+        with pytest.raises(sampling_profiler.ProfilerBusy):
+            SamplingProfiler().start()
+    finally:
+        first.stop()
+    SamplingProfiler().start().stop()
+
+
+@pytest.fixture
+def profiler_enabled(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "PROFILER_ENABLED", True)
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(sampling_profiler, "LOCAL_HOSTS", sampling_profiler.LOCAL_HOSTS | {"testclient"})
+
+
+def test_profile_endpoint_is_disabled_by_default(client):
+    assert client.post("/api/diagnostics/profile", params={"seconds": 0.05}).status_code == 404
+
+
+def test_profile_endpoint_rejects_remote_clients(client, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILER_ENABLED", True)
+    assert client.post("/api/diagnostics/profile", params={"seconds": 0.05}).status_code == 403
+
+
+def test_profile_endpoint_returns_speedscope(client, profiler_enabled):
+    response = client.post(
+        "/api/diagnostics/profile",
+        params={"seconds": 0.05, "format": "speedscope", "include_idle": True},
+    )
+    assert response.status_code == 200
+    assert response.json()["$schema"].startswith("https://www.speedscope.app/")
+    assert int(response.headers["x-profile-samples"]) > 0
+
+
+def test_profile_header_saves_one_request(client, profiler_enabled):
+    response = client.get("/api/health", headers={"X-Profile": "1"})
+    profile_id = response.headers["x-profile-id"]
+
+    saved = client.get(f"/api/diagnostics/profiles/{profile_id}")
+    assert saved.status_code == 200
+    assert json.loads(saved.content)["name"] == "GET /api/health"
+    assert client.get("/api/diagnostics/profiles/..%2Fsecrets").status_code == 404
@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+import pytest
+
+from app.api.sse import KEEPALIVE_FRAME, encode_event, encode_stream
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+def _parse(frames):
+    events = []
+    for frame in frames:
+        if frame.startswith(b":"):
+            events.append(("comment", None))
+            continue
+        head, data = frame.decode("utf-8").strip().split("\n")
+        events.append((head[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+async def _collect(source, **kwargs):
+    return [frame async for frame in encode_stream(source, **kwargs)]
+
+
+class TestSSEEncoder:
+    def test_encode_event_keeps_unicode(self):
+        frame = encode_event("message", {"delta": "你好"})
+        assert frame.startswith(b"event: message\ndata: ") and frame.endswith(b"\n\n")
+        assert "你好".encode("utf-8") in frame
+        assert json.loads(frame.split(b"data: ")[1]) == {"delta": "你好"}
+
+    @pytest.mark.asyncio
+    async def test_coalesced_frame_carries_last_event_id(self):
+        async def source():
+            yield {"event": "start", "data": {"message_id": 1}}
+            for event_id, ch in enumerate("abc", start=1):
+                yield {"event": "message", "data": {"delta": ch}, "id": event_id}
+
+        frames = await _collect(source(), flush_interval=1.0, max_bytes=4096, keepalive=0)
+        assert frames[0].startswith(b"event: start")
+        assert frames[1].startswith(b"id: 3\nevent: message\n") and b'"abc"' in frames[1]
+
+    @pytest.mark.asyncio
+    async def test_message_deltas_are_coalesced(self):
+        async def source():
+            yield {"event": "start", "data": {"message_id": 1}}
+            for ch in "Hello world":
+                yield {"event": "message", "data": {"delta": ch}}
+            yield {"event": "done", "data": {"message_id": 1}}
+
+        events = _parse(await _collect(source(), flush_interval=1.0, max_bytes=4096, keepalive=0))
+        assert events == [
+            ("start", {"message_id": 1}),
+            ("message", {"delta": "Hello world"}),
+            ("done", {"message_id": 1}),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_deltas_of_different_senders_not_merged(self):
+        async def source():
+            yield {"event": "message", "data": {"sender_id": "1", "delta": "a", "message_id": 10}}
+            yield {"event": "message", "data": {"sender_id": "2", "delta": "b", "message_id": 11}}
+            yield {"event": "message", "data": {"sender_id": "2", "delta": "c", "message_id": 11}}
+
+        events = _parse(await _collect(source(), flush_interval=1.0, max_bytes=4096, keepalive=0))
+        assert [e[1]["delta"] for e in events] == ["a", "bc"]
+
+    @pytest.mark.asyncio
+    async def test_byte_budget_and_flush_interval(self):
+        async def source():
+            yield {"event": "message", "data": {"delta": "aaaa"}}
+            yield {"event": "message", "data": {"delta": "bbbb"}}
+            await asyncio.sleep(0.05)
+            yield {"event": "message", "data": {"delta": "cc"}}
+
+        events = _parse(await _collect(source(), flush_interval=0.01, max_bytes=6, keepalive=0))
+        assert [e[1]["delta"] for e in events] == ["aaaa", "bbbb", "cc"]
+
+    @pytest.mark.asyncio
+    async def test_keepalive_when_idle(self):
+        async def source():
+            await asyncio.sleep(0.05)
+            yield {"event": "done", "data": {}}
+
+        frames = await _collect(source(), flush_interval=0.01, keepalive=0.01)
+        assert KEEPALIVE_FRAME in frames
+        assert frames[-1] == encode_event("done", {})
@@ -0,0 +1,84 @@
+"""
+Startup path: Alembic head detection and time-to-healthy of the real server process.
+
+The time-to-healthy budget can be tightened with STARTUP_HEALTHY_BUDGET_S.
+"""
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+from app.db.init_db import database_revisions, script_heads
+
+SERVER_DIR = Path(__file__).resolve().parents[1]
+HEALTHY_BUDGET_S = float(os.getenv("STARTUP_HEALTHY_BUDGET_S", "30"))
+
+
+def test_script_heads_match_migration_chains():
+    main_heads = script_heads(str(SERVER_DIR / "alembic"))
+    memo_heads = script_heads(str(SERVER_DIR / "app" / "vendor" / "memobase_server" / "migrations"))
+    assert main_heads is not None and len(main_heads) == 1
+    assert memo_heads is not None and len(memo_heads) == 1
+
+
+def test_database_revisions(tmp_path):
+    db_path = tmp_path / "test.db"
+    url = f"sqlite:///{db_path}"
+    assert database_revisions(url) is None
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL)")
+    conn.execute("INSERT INTO alembic_version VALUES ('abc123')")
+    conn.commit()
+    conn.close()
+    assert database_revisions(url) == {"abc123"}
+    assert database_revisions("postgresql://localhost/db") is None
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _time_to_healthy(data_dir: Path) -> tuple[float, str]:
+    port = _free_port()
+    log_path = data_dir / f"server-{port}.out"
+    start = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "app.cli", "--port", str(port), "--data-dir", str(data_dir), "--profile-startup"],
+            cwd=SERVER_DIR,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    try:
+        while time.perf_counter() - start < HEALTHY_BUDGET_S:
+            if proc.poll() is not None:
+                pytest.fail(f"server exited with {proc.returncode}: {log_path.read_text(encoding='utf-8')[-2000:]}")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/api/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - start, (data_dir / "logs" / "app.log").read_text(encoding="utf-8")
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        pytest.fail(f"server not healthy within {HEALTHY_BUDGET_S}s")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def test_time_to_healthy_and_warm_start_skips_migrations(tmp_path):
+    cold, _ = _time_to_healthy(tmp_path)
+    warm, log = _time_to_healthy(tmp_path)
+    print(f"time-to-healthy: cold {cold:.2f}s, warm {warm:.2f}s")
+
+    assert "Database [main] already at head" in log
+    assert "Database [memobase] already at head" in log
+    assert "[startup] init_db:" in log
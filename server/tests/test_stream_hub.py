@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from app.services.stream_hub import StreamHub, parse_event_id
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+async def _collect(events):
+    return [event async for event in events]
+
+
+class TestStreamHub:
+    @pytest.mark.asyncio
+    async def test_subscribers_fan_out_and_resume_from_event_id(self):
+        hub = StreamHub()
+        stream = hub.open("chat:1")
+        writer = hub.writer(stream)
+        first = asyncio.create_task(_collect(hub.subscribe(stream)))
+        second = asyncio.create_task(_collect(hub.subscribe(stream)))
+        await asyncio.sleep(0)
+
+        for ch in "abc":
+            await writer.put({"event": "message", "data": {"delta": ch}})
+        await writer.put(None)
+
+        expected = [{"event": "message", "data": {"delta": ch}, "id": i} for i, ch in enumerate("abc", start=1)]
+        assert await first == expected
+        assert await second == expected
+        # 流结束后仍可在保留期内按 Last-Event-ID 重放
+        assert [e["id"] for e in await _collect(hub.replay("chat:1", 1))] == [2, 3]
+
+    @pytest.mark.asyncio
+    async def test_ring_buffer_is_bounded_and_old_ids_fall_back(self, monkeypatch):
+        monkeypatch.setattr("app.services.stream_hub.settings.STREAM_HUB_BUFFER_EVENTS", 3)
+        hub = StreamHub()
+        stream = hub.open("chat:2")
+        for i in range(5):
+            hub.publish(stream, {"event": "message", "data": {"delta": str(i)}})
+        hub.close(stream)
+
+        assert len(stream.events) == 3 and hub.stats() == (1, 3)
+        assert hub.replay("chat:2", 1) is None  # 第 2 条已被挤出缓冲
+        assert [e["id"] for e in await _collect(hub.replay("chat:2", 2))] == [3, 4, 5]
+        lagged = await _collect(hub.subscribe(stream, 0))
+        assert lagged[0]["data"]["code"] == "stream_lagged"
+
+    @pytest.mark.asyncio
+    async def test_stream_closes_after_every_producer_and_is_dropped(self, monkeypatch):
+        monkeypatch.setattr("app.services.stream_hub.settings.STREAM_HUB_RETENTION_SECONDS", 0.01)
+        hub = StreamHub()
+        stream = hub.open("group:7", producers=2, aliases=["group_message:8", "group_message:9"])
+        a, b = hub.writer(stream), hub.writer(stream)
+        await a.put({"event": "message", "data": {"message_id": 8, "delta": "x"}})
+        await a.put(None)
+        await a.put(None)  # 重复结束不影响另一个生产者
+        assert not stream.closed
+        await b.put({"event": "message", "data": {"message_id": 9, "delta": "y"}})
+        await b.put(None)
+        assert stream.closed
+
+        only_nine = hub.replay("group_message:9", 0, predicate=lambda e: e["data"]["message_id"] == 9)
+        assert [e["data"]["delta"] for e in await _collect(only_nine)] == ["y"]
+        await asyncio.sleep(0.05)
+        assert hub.get("group:7") is None and hub.get("group_message:8") is None
+
+    @pytest.mark.asyncio
+    async def test_slow_subscriber_while_producer_publishes(self):
+        """A consumer slower than the producer keeps receiving every event in order."""
+        from app.api.sse import encode_stream
+
+        hub = StreamHub()
+        stream = hub.open("chat:3")
+        writer = hub.writer(stream)
+
+        async def _produce():
+            for i in range(30):
+                await writer.put({"event": "status", "data": {"n": i}})
+                await asyncio.sleep(0.001)
+            await writer.put(None)
+
+        async def _consume():
+            frames = []
+            async for frame in encode_stream(hub.subscribe(stream), flush_interval=0, keepalive=0):
+                frames.append(frame)
+                await asyncio.sleep(0.003)  # 模拟较慢的 socket 写入
+            return frames
+
+        consumer = asyncio.create_task(_consume())
+        await asyncio.sleep(0)
+        await _produce()
+        frames = await asyncio.wait_for(consumer, 5)
+        assert len(frames) == 30
+        assert frames[-1].startswith(b"id: 30\n")
+
+    @pytest.mark.asyncio
+    async def test_reconnect_on_another_worker_replays_from_the_channel(self, tmp_path):
+        from app.core import coordination
+        from app.core.coordination import SqliteBackend, set_backend
+
+        set_backend(SqliteBackend(str(tmp_path / "coordination.db"), poll_interval=0.01))
+        try:
+            owner, other = StreamHub(), StreamHub()  # 两个 worker 各自的 hub
+            stream = owner.open("group:1", aliases=["group_message:7"])
+            for i in range(3):
+                owner.publish(stream, {"event": "message", "data": {"delta": str(i), "message_id": 7}})
+            await stream.channel.flush()
+            await coordination.live_keys.drain()
+
+            replay = await other.replay_remote("group_message:7", 1)
+            assert replay is not None
+            reader = asyncio.create_task(_collect(replay))
+            await asyncio.sleep(0.05)
+            owner.publish(stream, {"event": "message", "data": {"delta": "3", "message_id": 7}})
+            owner.close(stream)
+
+            events = await asyncio.wait_for(reader, timeout=2)
+            assert [(e["id"], e["data"]["delta"]) for e in events] == [(2, "1"), (3, "2"), (4, "3")]
+            await asyncio.sleep(0.05)
+            await coordination.live_keys.drain()
+            # 流结束后不再有 worker 持有，回退到持久化内容
+            assert await other.replay_remote("group_message:7", 1) is None
+        finally:
+            set_backend(None)
+
+    def test_parse_event_id(self):
+        assert parse_event_id(" 12 ") == 12
+        assert parse_event_id(None) is None
+        assert parse_event_id("abc") is None and parse_event_id("-1") is None
@@ -0,0 +1,172 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.models.chat import ChatSession, Message
+from app.models.friend import Friend
+from app.services.stream_persister import (
+    STATUS_COMPLETE,
+    STATUS_STREAMING,
+    StreamPersister,
+)
+
+pytest_plugins = ('pytest_asyncio',)
+
+
+@pytest.fixture
+def ai_msg(db):
+    friend = Friend(name="Stream Friend")
+    db.add(friend)
+    db.commit()
+    session = ChatSession(friend_id=friend.id, title="stream")
+    db.add(session)
+    db.commit()
+    msg = Message(session_id=session.id, role="assistant", content="")
+    db.add(msg)
+    db.commit()
+    db.refresh(msg)
+    return msg
+
+
+async def _collect(events):
+    return [event async for event in events]
+
+
+def _row(db, message_id):
+    db.expire_all()
+    return db.query(Message).filter(Message.id == message_id).first()
+
+
+class TestStreamPersister:
+    @pytest.mark.asyncio
+    async def test_checkpoint_writes_partial_content(self, db, ai_msg):
+        persister = StreamPersister()
+        reply = persister.begin(Message, ai_msg.id, db)
+        assert _row(db, ai_msg.id).status == STATUS_STREAMING
+
+        persister.append(reply, "你好，")
+        persister.append(reply, "世界")
+        assert persister.checkpoint() == 1
+        assert persister.checkpoint() == 0  # 没有新内容时不再写库
+
+        row = _row(db, ai_msg.id)
+        assert row.content == "你好，世界"
+        assert row.status == STATUS_STREAMING
+
+        persister.end(reply)
+        row = _row(db, ai_msg.id)
+        assert row.status == STATUS_COMPLETE
+        assert persister.get(Message, ai_msg.id) is None
+
+    @pytest.mark.asyncio
+    async def test_end_keeps_final_content(self, db, ai_msg):
+        persister = StreamPersister()
+        reply = persister.begin(Message, ai_msg.id, db)
+        persister.append(reply, "<message>partial")
+
+        row = _row(db, ai_msg.id)
+        row.content = "final"
+        row.status = STATUS_COMPLETE
+        db.commit()
+
+        persister.end(reply)
+        assert _row(db, ai_msg.id).content == "final"
+
+    @pytest.mark.asyncio
+    async def test_end_writes_final_content_once(self, db, ai_msg):
+        persister = StreamPersister()
+        reply = persister.begin(Message, ai_msg.id, db)
+        persister.append(reply, "abc")
+
+        async def collect():
+            return "".join([chunk async for chunk in persister.follow(reply)])
+
+        reader = asyncio.create_task(collect())
+        await asyncio.sleep(0)
+        persister.end(reply, "abcdef")
+        persister.end(reply)  # finally 中的再次调用不会覆盖最终内容
+
+        row = _row(db, ai_msg.id)
+        assert (row.content, row.status) == ("abcdef", STATUS_COMPLETE)
+        assert await asyncio.wait_for(reader, timeout=1) == "abcdef"
+
+    @pytest.mark.asyncio
+    async def test_follow_from_offset(self, db, ai_msg):
+        persister = StreamPersister()
+        reply = persister.begin(Message, ai_msg.id, db)
+        persister.append(reply, "abcdef")
+
+        async def collect():
+            return "".join([chunk async for chunk in persister.follow(reply, offset=3)])
+
+        reader = asyncio.create_task(collect())
+        await asyncio.sleep(0)
+        persister.append(reply, "ghi")
+        persister.end(reply)
+        assert await asyncio.wait_for(reader, timeout=1) == "defghi"
+
+    @pytest.mark.asyncio
+    async def test_resume_interrupted_row(self, db, ai_msg):
+        persister = StreamPersister()
+        row = _row(db, ai_msg.id)
+        row.content = "abcdef"
+        row.status = STATUS_STREAMING
+        db.commit()
+
+        events = [e async for e in persister.resume(db, Message, ai_msg.id, offset=2)]
+        assert events[0] == {"event": "message", "data": {"delta": "cdef"}}
+        assert events[-1]["data"]["finish_reason"] == "interrupted"
+
+    @pytest.mark.asyncio
+    async def test_background_checkpoint(self, db, ai_msg, monkeypatch):
+        from app.core.config import settings
+
+        monkeypatch.setattr(settings, "STREAM_CHECKPOINT_INTERVAL_MS", 10)
+        persister = StreamPersister()
+        reply = persister.begin(Message, ai_msg.id, db)
+        persister.append(reply, "tick")
+        await asyncio.sleep(0.05)
+        assert _row(db, ai_msg.id).content == "tick"
+        persister.end(reply)
+
+    @pytest.mark.asyncio
+    async def test_background_checkpoint_commits_off_the_loop(self, db, ai_msg, monkeypatch):
+        from app.core.config import settings
+
+        monkeypatch.setattr(settings, "STREAM_CHECKPOINT_INTERVAL_MS", 10)
+        persister = StreamPersister()
+        threads = []
+        write = persister._write
+        monkeypatch.setattr(persister, "_write", lambda by_bind: threads.append(threading.get_ident()) or write(by_bind))
+        reply = persister.begin(Message, ai_msg.id, db)
+        persister.append(reply, "tick")
+        await asyncio.sleep(0.05)
+        persister.end(reply)
+
+        assert threads and threading.get_ident() not in threads
+
+    @pytest.mark.asyncio
+    async def test_resume_on_another_worker_tails_the_live_reply(self, db, ai_msg, tmp_path):
+        from app.core import coordination
+        from app.core.coordination import SqliteBackend, set_backend
+
+        set_backend(SqliteBackend(str(tmp_path / "coordination.db"), poll_interval=0.01))
+        try:
+            owner, other = StreamPersister(), StreamPersister()  # 两个 worker 各自的 persister
+            reply = owner.begin(Message, ai_msg.id, db)
+            owner.append(reply, "abc")
+            owner.checkpoint()
+            await reply.channel.flush()
+            await coordination.live_keys.drain()
+
+            reader = asyncio.create_task(_collect(other.resume(db, Message, ai_msg.id, offset=1)))
+            await asyncio.sleep(0.05)
+            owner.append(reply, "def")
+            owner.end(reply)
+
+            events = await asyncio.wait_for(reader, timeout=2)
+            assert "".join(e["data"]["delta"] for e in events if e["event"] == "message") == "bcdef"
+            assert events[-1]["data"]["finish_reason"] == "stop"
+        finally:
+            set_backend(None)
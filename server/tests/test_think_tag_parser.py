@@ -0,0 +1,62 @@
+import time
+
+from app.services.think_tag_parser import ThinkTagParser, MESSAGE, THINKING
+
+
+def _run(chunks):
+    parser = ThinkTagParser()
+    spans = []
+    for chunk in chunks:
+        spans.extend(parser.feed(chunk))
+    spans.extend(parser.flush())
+    message = "".join(text for kind, text in spans if kind == MESSAGE)
+    thinking = "".join(text for kind, text in spans if kind == THINKING)
+    return message, thinking
+
+
+class TestThinkTagParser:
+    def test_split_tags(self):
+        chunks = ["<", "think", ">", "Thinking...", "</", "think", ">", "Result"]
+        assert _run(chunks) == ("Result", "Thinking...")
+
+    def test_every_split_point(self):
+        text = "前言<think>推理 a<b</think><message>你好</message><message>再见</message>"
+        for i in range(1, len(text)):
+            assert _run([text[:i], text[i:]]) == (
+                "前言<message>你好</message><message>再见</message>",
+                "推理 a<b",
+            )
+        assert _run(list(text)) == (
+            "前言<message>你好</message><message>再见</message>",
+            "推理 a<b",
+        )
+
+    def test_message_segments_not_held_back(self):
+        parser = ThinkTagParser()
+        assert parser.feed("<message>你好") == [(MESSAGE, "<message>你好")]
+        assert parser.feed("</message><mess") == [(MESSAGE, "</message><mess")]
+
+    def test_lookahead_is_bounded_by_tag_length(self):
+        parser = ThinkTagParser()
+        assert parser.feed("hello <thi") == [(MESSAGE, "hello ")]
+        assert parser.feed("s is fine") == [(MESSAGE, "<this is fine")]
+        assert parser.flush() == []
+
+    def test_unterminated_prefix_is_flushed(self):
+        parser = ThinkTagParser()
+        assert parser.feed("a <th") == [(MESSAGE, "a ")]
+        assert parser.flush() == [(MESSAGE, "<th")]
+
+    def test_benchmark_linear_in_stream_size(self):
+        """Micro-benchmark: token-sized deltas full of '<' should stay linear and fast."""
+        unit = "<message>今天天气不错 a<b</message><think>想一想</think>"
+        deltas = [unit[i:i + 3] for i in range(0, len(unit), 3)] * 2000
+
+        start = time.perf_counter()
+        message, thinking = _run(deltas)
+        elapsed = time.perf_counter() - start
+
+        assert thinking == "想一想" * 2000
+        assert message == "<message>今天天气不错 a<b</message>" * 2000
+        # ~30k deltas; the old find/slice loop went quadratic once '<' appeared
+        assert elapsed < 1.0, f"parser too slow: {elapsed:.3f}s"